@@ -9,20 +9,32 @@ import logging
 import re
 import shlex
 import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from time import perf_counter
-from typing import Dict, List, Any, Optional, Callable
+from typing import Dict, List, Any, Optional, Callable, Awaitable
 
 from decouple import config
 from groq import AsyncGroq
 
 # Importamos nuestro motor de prompts final del paso anterior
 from prompt import LlamaPromptEngine
-from weather_utils import get_cancun_weather
+from weather_utils import weather_provider
+from speech_chunker import SpeechChunker
+from tool_executor import tool_executor
+from calendar_async import CALENDAR_ASYNC_CONFIG
 
 # --- Configuración ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)5s | %(name)s: %(message)s", datefmt="%H:%M:%S")
 logger = logging.getLogger("aiagent")
 
+# Callback para segmentos hablables emitidos mientras Groq sigue generando
+SpeechChunkCallback = Callable[[str], Awaitable[None]]
+
+# Frases fijas (se pre-renderizan en la caché de audio)
+GROQ_ERROR_TEXT = "Lo siento, hay un problema con la conexión al asistente. Por favor, intente de nuevo."
+GENERIC_TOOL_RESPONSE_TEXT = "He procesado su solicitud."
+
 # --- Clientes y Gestores ---
 try:
     api_key = config("GROQ_API_KEY", default=None)
@@ -34,19 +46,65 @@ except Exception as e:
     logger.critical(f"No se pudo inicializar el cliente Groq. Verifica GROQ_API_KEY: {e}")
     client = None
 
+# Sesiones de agente sin actividad se descartan (llamadas que no cerraron bien)
+AGENT_SESSION_CONFIG = {
+    "IDLE_TTL": 2 * 3600,   # segundos
+}
+
+
+@dataclass
+class AgentSessionContext:
+    """
+    🧩 Lo que el agente sabe de UNA sesión
+
+    El cliente Groq, el motor de prompts y el de herramientas son
+    compartidos; el modo y los ganchos del flujo de la llamada no. El
+    estado de las herramientas (citas halladas, cita elegida) vive en
+    state_store, también por sesión.
+    """
+    session_id: str
+    mode: Optional[str] = None
+    conversation_flow: Optional[Any] = None   # ConversationFlow de la llamada (captura de teléfono)
+    last_used: float = field(default_factory=time.monotonic)
+
+
 class SessionManager:
-    """Gestiona el estado de la conversación para cada sesión única."""
+    """
+    Gestiona el contexto de cada sesión: tabla por session_id (O(1)) en
+    orden de último uso, así las inactivas se desalojan desde el frente.
+    """
     def __init__(self):
-        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.sessions: "OrderedDict[str, AgentSessionContext]" = OrderedDict()
+        self.evicted = 0
+
+    def get(self, session_id: str) -> AgentSessionContext:
+        now = time.monotonic()
+        self._evict_idle(now)
+        context = self.sessions.get(session_id)
+        if context is None:
+            context = self.sessions[session_id] = AgentSessionContext(session_id)
+        else:
+            self.sessions.move_to_end(session_id)
+        context.last_used = now
+        return context
 
     def get_state(self, session_id: str) -> Dict[str, Any]:
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {"mode": None}
-        return self.sessions[session_id]
+        return {"mode": self.get(session_id).mode}
 
     def set_mode(self, session_id: str, mode: str):
-        state = self.get_state(session_id)
-        state['mode'] = mode
+        self.get(session_id).mode = mode
+
+    def end(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+
+    def _evict_idle(self, now: float) -> None:
+        ttl = AGENT_SESSION_CONFIG["IDLE_TTL"]
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if now - oldest.last_used <= ttl:
+                break
+            self.sessions.popitem(last=False)
+            self.evicted += 1
 
 # --- Motor de Herramientas con Parsing Seguro ---
 class ToolEngine:
@@ -75,7 +133,7 @@ class ToolEngine:
         from utils import search_calendar_event_by_phone
         import buscarslot
 
-        return {
+        executors = {
             "registrar_lead": registrar_lead,
             "process_appointment_request": buscarslot.process_appointment_request,
             "create_calendar_event": create_calendar_event,
@@ -85,6 +143,21 @@ class ToolEngine:
             "end_call": self._handle_end_call,
         }
 
+        if CALENDAR_ASYNC_CONFIG["ENABLED"]:
+            # Cliente asíncrono de Calendar: sin hilos para las operaciones calientes
+            from crearcita import create_calendar_event_async
+            from editarcita import edit_calendar_event_async
+            from eliminarcita import delete_calendar_event_async
+            from utils import search_calendar_event_by_phone_async
+
+            executors.update({
+                "create_calendar_event": create_calendar_event_async,
+                "edit_calendar_event": edit_calendar_event_async,
+                "delete_calendar_event": delete_calendar_event_async,
+                "search_calendar_event_by_phone": search_calendar_event_by_phone_async,
+            })
+        return executors
+
     
     def _handle_end_call(self, reason: str = "user_request") -> Dict:
         """Marca que se debe terminar la llamada."""
@@ -209,15 +282,29 @@ class ToolEngine:
         t_start = perf_counter()
         try:
             logger.info(f"Ejecutando: {tool_name} con {arguments}")
-            if asyncio.iscoroutinefunction(executor):
-                result = await executor(**arguments)
-            else:
-                result = executor(**arguments)
+            if tool_name == "process_appointment_request" and CALENDAR_ASYNC_CONFIG["ENABLED"]:
+                # freebusy por el cliente asíncrono; la búsqueda de slots ya no espera a Google
+                import buscarslot
+                try:
+                    await asyncio.wait_for(buscarslot.ensure_cache_is_fresh_async(),
+                                           timeout=tool_executor.policy_for(tool_name).timeout)
+                except Exception as e:
+                    logger.warning(f"⚠️ Caché de slots no refrescada por vía async: {e}")
+            # Fuera del event loop: un viaje a Google no congela el audio de otras llamadas
+            result = await tool_executor.run(tool_name, executor, **arguments)
             
             t_end = perf_counter()
             logger.info(f"[PERF] Herramienta '{tool_name}' ejecutada en {(t_end - t_start) * 1000:.1f} ms")
             
             return result
+        except asyncio.TimeoutError:
+            timeout = tool_executor.policy_for(tool_name).timeout
+            logger.error(f"⏰ La herramienta '{tool_name}' excedió {timeout:.0f}s")
+            return {
+                "error": "timeout_exceeded",
+                "details": f"La operación {tool_name} tardó más de {timeout:.0f} segundos",
+                "arguments_used": arguments
+            }
         except Exception as e:
             logger.exception(f"La ejecución de la herramienta '{tool_name}' falló.")
             return {
@@ -247,66 +334,131 @@ class AIAgent:
         self.session_manager = SessionManager()
         self.model = "llama-3.3-70b-versatile"
 
+    def attach_conversation_flow(self, session_id: str, conversation_flow: Any) -> None:
+        """La llamada registra su ConversationFlow (p.ej. captura de teléfono de SU turno)."""
+        self.session_manager.get(session_id).conversation_flow = conversation_flow
+
+    def release_session(self, session_id: str) -> None:
+        """Fin de la llamada: se descarta su contexto."""
+        self.session_manager.end(session_id)
+
 
 
 
    
-    async def process_stream(self, session_id: str, history: List[Dict]) -> str:
-        """Orquesta el flujo completo en un solo pase de streaming."""
-        from state_store import emit_latency_event
-        
-        # Obtenemos el estado de la sesión, que puede contener el 'mode' (crear, editar, etc.)
-        session_state = self.session_manager.get_state(session_id)
-        current_mode = session_state.get("mode") # Esto será 'crear', 'editar', o None
-        
-        # Obtener clima de Cancún para el system message
-        clima = get_cancun_weather()
-        # Extraer y formatear datos del clima correctamente
-        if 'cancun_weather' in clima and 'current' in clima['cancun_weather']:
-            current = clima['cancun_weather']['current']
-            clima_contextual = f"""El clima en Cancún es:
-Temperatura: {current.get('temperature', 'N/A')}
-Sensación térmica: {current.get('feels_like', 'N/A')}
-Condición: {current.get('description', 'N/A')}
-Humedad: {current.get('humidity', 'N/A')}
-Velocidad del viento: {current.get('wind_speed', 'N/A')}"""
-        else:
-            # Si hay error, usar mensaje genérico
-            clima_contextual = "Información del clima no disponible en este momento."
-        # Generar el prompt pasándole el clima contextual
-        full_prompt = self.prompt_engine.generate_prompt(history, current_mode, clima_contextual=clima_contextual)
-        
-        emit_latency_event(session_id, "chunk_received")
+    async def process_stream(self, session_id: str, history: List[Dict],
+                             on_speech_chunk: Optional[SpeechChunkCallback] = None) -> str:
+        """
+        Orquesta el flujo completo en un solo pase de streaming.
 
-        # El resto de la función (el bloque 'try...except' para llamar a Groq) sigue igual...
+        Si se pasa on_speech_chunk, cada oración/cláusula completa se entrega
+        en cuanto Groq la genera (sin segmentos de herramientas), de modo que
+        el TTS arranca con el TTFT y no con el fin de la generación.
+        """
+        chunker = SpeechChunker() if on_speech_chunk else None
         try:
-            # Medición de latencia de la IA
-            logger.info(f"[PERF] Iniciando llamada a Groq (modelo: {self.model})")
-            t_start_llm = perf_counter()
-            first_chunk_time = None
-
-            if self.groq_client is None:
-                raise Exception("Cliente Groq no está inicializado")
-
-            stream = await self.groq_client.chat.completions.create(
-                model=self.model, 
-                messages=[{"role": "user", "content": full_prompt}],
-                temperature=0.7,  # Más conversacional
-                stream=True
-            )
-            full_response_text = ""
-            async for chunk in stream:
-                if first_chunk_time is None:
-                    first_chunk_time = perf_counter()
-                    ttft = (first_chunk_time - t_start_llm) * 1000
-                    logger.info(f"[PERF] IA (Groq) - Time To First Token: {ttft:.1f} ms")
-                
-                full_response_text += chunk.choices[0].delta.content or ""
+            full_response_text = await self.generate_raw(session_id, history, on_speech_chunk, chunker=chunker)
         except Exception as e:
             logger.error(f"Error en la llamada a Groq: {e}")
-            return "Lo siento, hay un problema con la conexión al asistente. Por favor, intente de nuevo."
+            apology = GROQ_ERROR_TEXT
+            if chunker and chunker.delivered_count and on_speech_chunk:
+                # Parte de la respuesta ya se está diciendo: la disculpa va por el mismo stream
+                await on_speech_chunk(apology)
+            return apology
+
+        return await self.finalize_response(session_id, history, full_response_text)
+
+    async def commit_raw_response(self, session_id: str, history: List[Dict], full_response_text: str,
+                                  on_speech_chunk: Optional[SpeechChunkCallback] = None) -> str:
+        """
+        Confirma un texto crudo generado por adelantado (generación especulativa).
+
+        Entrega los segmentos hablables de golpe y luego ejecuta herramientas
+        y actualiza el historial, igual que process_stream.
+        """
+        if on_speech_chunk:
+            chunker = SpeechChunker()
+            t_start = perf_counter()
+            for segment in chunker.feed(full_response_text) + chunker.flush():
+                await self._emit_speech_chunk(session_id, segment, on_speech_chunk, t_start, chunker)
+            if chunker.held_segments:
+                logger.info(f"[PERF] {chunker.held_segments} segmento(s) de herramienta retenidos del TTS")
+        return await self.finalize_response(session_id, history, full_response_text)
+
+    def _build_prompt(self, session_id: str, history: List[Dict]) -> str:
+        """Prompt completo: modo de la sesión + clima + historial."""
+        # El contexto de la sesión puede contener el 'mode' (crear, editar, etc.)
+        current_mode = self.session_manager.get(session_id).mode  # 'crear', 'editar', o None
+        
+        # Clima de Cancún pre-renderizado (solo memoria, nunca va a la red en el turno)
+        clima_contextual = weather_provider.get_clima_contextual()
+        # Generar el prompt pasándole el clima contextual
+        return self.prompt_engine.generate_prompt(history, current_mode, clima_contextual=clima_contextual)
+
+    async def generate_raw(self, session_id: str, history: List[Dict],
+                           on_speech_chunk: Optional[SpeechChunkCallback] = None, *,
+                           chunker: Optional[SpeechChunker] = None,
+                           speculative: bool = False) -> str:
+        """
+        Solo genera: llama a Groq en streaming y devuelve el texto crudo.
+
+        No ejecuta herramientas ni toca el historial, así que es seguro
+        lanzarla por adelantado y cancelarla. Los errores de Groq se propagan.
+        """
+        from state_store import emit_latency_event
+
+        full_prompt = self._build_prompt(session_id, history)
+        if not speculative:
+            emit_latency_event(session_id, "chunk_received")
+        if on_speech_chunk and chunker is None:
+            chunker = SpeechChunker()
+
+        # Medición de latencia de la IA
+        label = " especulativa" if speculative else ""
+        logger.info(f"[PERF] Iniciando llamada{label} a Groq (modelo: {self.model})")
+        t_start_llm = perf_counter()
+        first_chunk_time = None
+
+        if self.groq_client is None:
+            raise Exception("Cliente Groq no está inicializado")
+
+        stream = await self.groq_client.chat.completions.create(
+            model=self.model, 
+            messages=[{"role": "user", "content": full_prompt}],
+            temperature=0.7,  # Más conversacional
+            stream=True
+        )
+        full_response_text = ""
+        async for chunk in stream:
+            if first_chunk_time is None:
+                first_chunk_time = perf_counter()
+                ttft = (first_chunk_time - t_start_llm) * 1000
+                logger.info(f"[PERF] IA (Groq){label} - Time To First Token: {ttft:.1f} ms")
+            
+            delta = chunk.choices[0].delta.content or ""
+            full_response_text += delta
+            if chunker and on_speech_chunk and delta:
+                for segment in chunker.feed(delta):
+                    await self._emit_speech_chunk(session_id, segment, on_speech_chunk, t_start_llm, chunker)
+
+        if chunker and on_speech_chunk:
+            for segment in chunker.flush():
+                await self._emit_speech_chunk(session_id, segment, on_speech_chunk, t_start_llm, chunker)
+            if chunker.held_segments:
+                logger.info(f"[PERF] {chunker.held_segments} segmento(s) de herramienta retenidos del TTS")
+        return full_response_text
+
+    async def finalize_response(self, session_id: str, history: List[Dict], full_response_text: str) -> str:
+        """
+        Confirma el turno: parsea herramientas, las ejecuta y actualiza el historial.
+
+        Todos los efectos secundarios del turno viven aquí.
+        """
+        from state_store import current_session_id, emit_latency_event
 
         emit_latency_event(session_id, "parse_start")
+        # Las herramientas (en hilos) saben a qué llamada pertenecen (p.ej. apartados de slots)
+        current_session_id.set(session_id)
         
         # Parseo de la respuesta
         t_parse_start = perf_counter()
@@ -323,17 +475,19 @@ Velocidad del viento: {current.get('wind_speed', 'N/A')}"""
             "whatsapp",
             "contacto"
         ]
+        # El flujo de ESTA llamada (no el de la última que empezó)
+        conversation_flow = self.session_manager.get(session_id).conversation_flow
         if any(pattern in user_facing_text.lower() for pattern in phone_request_patterns):
             # Activar modo captura de teléfono
-            if hasattr(self, 'conversation_flow') and self.conversation_flow:
-                self.conversation_flow.set_phone_capture_mode(True)
+            if conversation_flow:
+                conversation_flow.set_phone_capture_mode(True)
                 logger.info("📞 Detectada solicitud de número telefónico - activando pausa extendida")
         # Detectar si ya se recibió un número (10 dígitos consecutivos)
         import re
         if re.search(r'\b\d{10}\b', " ".join([msg.get("content", "") for msg in history[-3:]])):
             # Desactivar modo captura
-            if hasattr(self, 'conversation_flow') and self.conversation_flow:
-                self.conversation_flow.set_phone_capture_mode(False)
+            if conversation_flow:
+                conversation_flow.set_phone_capture_mode(False)
                 logger.info("✅ Número telefónico capturado - restaurando pausa normal")
         # --- FIN: DETECCIÓN DE SOLICITUD DE TELÉFONO ---
 
@@ -386,7 +540,7 @@ Velocidad del viento: {current.get('wind_speed', 'N/A')}"""
                         )
                     logger.info(f"[HISTORIAL] Respuesta sintética generada: '{user_facing_text}'")
                 else:
-                    user_facing_text = "He procesado su solicitud."
+                    user_facing_text = GENERIC_TOOL_RESPONSE_TEXT
             
             # Agregar SOLO UNA VEZ la respuesta final de la IA
             history.append({"role": "assistant", "content": user_facing_text})
@@ -399,6 +553,22 @@ Velocidad del viento: {current.get('wind_speed', 'N/A')}"""
         emit_latency_event(session_id, "response_complete")
         return user_facing_text
 
+    async def _emit_speech_chunk(self, session_id: str, segment: str,
+                                 on_speech_chunk: SpeechChunkCallback,
+                                 t_start_llm: float, chunker: SpeechChunker) -> None:
+        """Entrega un segmento hablable al TTS y mide el primero del turno."""
+        from state_store import emit_latency_event
+
+        chunker.delivered_count += 1
+        if chunker.delivered_count == 1:
+            first_segment_ms = (perf_counter() - t_start_llm) * 1000
+            logger.info(f"[PERF] Primer segmento hablable listo a {first_segment_ms:.1f} ms del inicio de Groq")
+            emit_latency_event(session_id, "first_speech_chunk", {"ms": round(first_segment_ms, 1)})
+        try:
+            await on_speech_chunk(segment)
+        except Exception as e:
+            logger.error(f"❌ Error enviando segmento al TTS: {e}")
+
 
 # El resto del archivo no cambia, pero lo incluyo para que sea completo
 # --- Definiciones Completas de Herramientas ---
@@ -532,6 +702,16 @@ ALL_TOOLS = [
 # Instancia global del agente
 ai_agent = AIAgent(tool_definitions=ALL_TOOLS)
 
-async def generate_ai_response(session_id: str, history: List[Dict]) -> str:
+async def generate_ai_response(session_id: str, history: List[Dict],
+                               on_speech_chunk: Optional[SpeechChunkCallback] = None) -> str:
     """Función pública que será llamada desde tw_utils.py."""
-    return await ai_agent.process_stream(session_id, history)
\ No newline at end of file
+    return await ai_agent.process_stream(session_id, history, on_speech_chunk=on_speech_chunk)
+
+async def generate_raw_ai_response(session_id: str, history: List[Dict]) -> str:
+    """Generación especulativa: texto crudo de Groq, sin herramientas ni historial."""
+    return await ai_agent.generate_raw(session_id, history, speculative=True)
+
+async def commit_ai_response(session_id: str, history: List[Dict], raw_text: str,
+                             on_speech_chunk: Optional[SpeechChunkCallback] = None) -> str:
+    """Confirma una generación especulativa: TTS, herramientas e historial."""
+    return await ai_agent.commit_raw_response(session_id, history, raw_text, on_speech_chunk=on_speech_chunk)
\ No newline at end of file
@@ -1,8 +1,11 @@
 import os
 import json
-from typing import List, Dict, Optional, cast, Any
+import asyncio
+import re
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple, cast, Any
+import httpx
 from decouple import config
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 # Fix para config
 def get_api_key() -> str:
@@ -16,15 +19,39 @@ def get_api_key() -> str:
 from prompt_text import generate_openai_prompt
 
 # ----- Configuración del Cliente OpenAI y Modelo -----
+TEXT_AGENT_CONFIG = {
+    "MAX_CONCURRENCY": int(os.getenv("TEXT_AGENT_MAX_CONCURRENCY", "10")),  # llamadas simultáneas a OpenAI
+    "MAX_CONNECTIONS": 20,          # conexiones HTTP reutilizables
+    "REQUEST_TIMEOUT": 30.0,        # segundos por completion
+}
+
+# Callback para tokens de la respuesta mientras OpenAI genera
+TextDeltaCallback = Callable[[str], Awaitable[None]]
+# Callback para "descarta lo que llevas" (el texto previo a una tool no es la respuesta final)
+TextResetCallback = Callable[[], Awaitable[None]]
+
 CLIENT_INIT_ERROR = None
 client = None
 try:
     print("[aiagent_text.py] Intentando inicializar cliente OpenAI...")
-    client = OpenAI(api_key=get_api_key())
+    # Cliente asíncrono con pool de conexiones: no bloquea el event loop (audio de llamadas)
+    client = AsyncOpenAI(
+        api_key=get_api_key(),
+        timeout=TEXT_AGENT_CONFIG["REQUEST_TIMEOUT"],
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=TEXT_AGENT_CONFIG["MAX_CONNECTIONS"],
+                max_keepalive_connections=TEXT_AGENT_CONFIG["MAX_CONNECTIONS"],
+            ),
+        ),
+    )
 except Exception as e_client:
     CLIENT_INIT_ERROR = str(e_client)
     print(f"[aiagent_text.py] ERROR al inicializar OpenAI: {CLIENT_INIT_ERROR}")
 
+# Límite de completions simultáneas (las demás esperan turno sin bloquear el loop)
+_openai_semaphore = asyncio.Semaphore(TEXT_AGENT_CONFIG["MAX_CONCURRENCY"])
+
 # --- Modelo por defecto para texto ---
 MODEL_TO_USE = "gpt-4.1-mini"   # tu modelo rápido, ventana grande
 
@@ -37,6 +64,8 @@ from utils import search_calendar_event_by_phone
 from selectevent import select_calendar_event_by_index
 from consultarinfo import get_consultorio_data
 from weather_utils import get_cancun_weather
+from tool_executor import tool_executor
+from state_store import current_session_id
 
 def handle_detect_intent(**kwargs) -> Dict:
     return {"intent_detected": kwargs.get("intention")}
@@ -237,19 +266,134 @@ TOOLS = [
     }
 ]
 
+# ---------------- STREAMING ----------------
+# Marcadores de control que nunca deben llegar al cliente (se quitan también del texto final)
+END_CHAT_SENTINEL = "__end_chat__"
+END_TAG_OPEN = "[end_conversation("
+_END_MARKERS_RE = re.compile(r"__END_CHAT__|\s*\[end_conversation\(.*?\)\]", flags=re.IGNORECASE)
+
+
+class _StreamedReply:
+    """
+    Puente entre los tokens de OpenAI y on_delta:
+    - Retiene el texto que podría ser el inicio de un marcador de cierre
+      (__END_CHAT__, [end_conversation(...)]) y lo quita si se completa.
+    - Recuerda si ya mandó texto, para pedir un reset cuando esa pasada
+      resulta ser la previa a una tool.
+    """
+
+    def __init__(self, on_delta: TextDeltaCallback, on_reset: Optional[TextResetCallback] = None):
+        self.on_delta = on_delta
+        self.on_reset = on_reset
+        self._buffer = ""
+        self._emitted = False
+
+    def _holdback_start(self) -> int:
+        lower = self._buffer.lower()
+        open_tag = lower.find(END_TAG_OPEN)
+        if open_tag != -1:
+            return open_tag   # etiqueta abierta: esperar el ")]"
+        longest = max(len(END_TAG_OPEN), len(END_CHAT_SENTINEL))
+        for start in range(max(0, len(lower) - longest), len(lower)):
+            tail = lower[start:]
+            if END_TAG_OPEN.startswith(tail) or END_CHAT_SENTINEL.startswith(tail):
+                return start
+        return len(lower)
+
+    async def _emit(self, text: str) -> None:
+        if text:
+            self._emitted = True
+            await self.on_delta(text)
+
+    async def feed(self, text: str) -> None:
+        self._buffer = _END_MARKERS_RE.sub("", self._buffer + text)
+        cut = self._holdback_start()
+        ready, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        await self._emit(ready)
+
+    async def flush(self) -> None:
+        """Fin de la respuesta final: lo retenido que no resultó marcador se entrega."""
+        ready, self._buffer = self._buffer, ""
+        await self._emit(ready)
+
+    async def reset(self) -> None:
+        """La pasada terminó en tool: se descarta lo retenido y, si ya salió texto, se avisa."""
+        self._buffer = ""
+        if self._emitted and self.on_reset:
+            await self.on_reset()
+        self._emitted = False
+
+
+async def _stream_completion(
+    messages: List[Dict],
+    on_delta: Optional[TextDeltaCallback] = None,
+    **params: Any,
+) -> Tuple[str, List[Dict]]:
+    """
+    Llama a OpenAI en streaming y reensambla la respuesta.
+    Los tokens de texto se entregan a on_delta según llegan.
+    Retorna (contenido, tool_calls) con tool_calls en formato de historial.
+    """
+    if not client:
+        raise ValueError("Cliente OpenAI no inicializado")
+
+    content_parts: List[str] = []
+    tool_calls: Dict[int, Dict] = {}
+    async with _openai_semaphore:
+        stream = await client.chat.completions.create(
+            model=MODEL_TO_USE,
+            messages=messages,  # type: ignore
+            stream=True,
+            **params,
+        )
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    if on_delta:
+                        await on_delta(delta.content)
+                for tc in delta.tool_calls or []:
+                    entry = tool_calls.setdefault(tc.index, {
+                        "id": "",
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""},
+                    })
+                    if tc.id:
+                        entry["id"] = tc.id
+                    if tc.function and tc.function.name:
+                        entry["function"]["name"] += tc.function.name
+                    if tc.function and tc.function.arguments:
+                        entry["function"]["arguments"] += tc.function.arguments
+        finally:
+            # Cancelación (cliente desconectado): cerrar la conexión de streaming
+            await stream.close()
+
+    return "".join(content_parts), [tool_calls[i] for i in sorted(tool_calls)]
+
+
 # ---------------- FUNCIÓN PRINCIPAL ----------------
 async def process_text_message(
     user_id: str,
     current_user_message: str,
     history: List[Dict],
     client_info: Optional[Dict] = None,
+    on_delta: Optional[TextDeltaCallback] = None,
+    on_reset: Optional[TextResetCallback] = None,
 ) -> Dict:
     """
     Procesa un mensaje de texto usando GPT-4.1-mini + tool-calling nativo.
+    Si se pasa on_delta, el texto de la respuesta se entrega en streaming (sin
+    marcadores de cierre). Si la 1ª pasada habló antes de pedir una tool, se
+    llama on_reset antes de la 2ª: el cliente debe descartar lo recibido.
     Retorna un dict {reply_text:str, status:str}
     """
 
     conv_id_for_logs = f"conv:{user_id[:4]}…"  # para logs cortos
+    # Las herramientas saben a qué conversación pertenecen (apartados de slots)
+    current_session_id.set(f"text:{user_id}")
 
     if CLIENT_INIT_ERROR:
         print(f"[{conv_id_for_logs}] Cliente OpenAI no iniciado: {CLIENT_INIT_ERROR}")
@@ -265,6 +409,7 @@ async def process_text_message(
     ) + [
         {"role": "user", "content": current_user_message}
     ]
+    streamed = _StreamedReply(on_delta, on_reset) if on_delta else None
 
     try:
         print(
@@ -272,14 +417,10 @@ async def process_text_message(
             f"Mensajes: {len(messages_for_api)}"
         )
 
-        # Validar que el cliente esté disponible
-        if not client:
-            raise ValueError("Cliente OpenAI no inicializado")
-
-        chat_completion = client.chat.completions.create(
-            model=MODEL_TO_USE,
-            messages=messages_for_api,  # type: ignore
-            tools=TOOLS,  # type: ignore
+        first_content, tool_calls = await _stream_completion(
+            messages_for_api,
+            on_delta=streamed.feed if streamed else None,
+            tools=TOOLS,
             tool_choice="auto",
             temperature=0.4,        # 0-1 (0 = ultra-determinista)
             max_tokens=512,         # tope de la respuesta
@@ -288,34 +429,24 @@ async def process_text_message(
             frequency_penalty=0.2,  # evita repeticiones
         )
 
-        response_message = chat_completion.choices[0].message
-        tool_calls = response_message.tool_calls
-
         # 2) ¿Invocó alguna tool?
         if tool_calls:
+            if streamed:
+                await streamed.reset()   # lo previo a la tool no es la respuesta final
             print(
                 f"[{conv_id_for_logs}] GPT solicitó {len(tool_calls)} tool_call(s): {tool_calls}"
             )
 
-            # Convertir ChatCompletionMessage a dict para el historial
+            # Respuesta con tool_calls en formato de historial
             response_dict = {
                 "role": "assistant",
-                "content": response_message.content,
-                "tool_calls": [
-                    {
-                        "id": tool_call.id,
-                        "type": "function",
-                        "function": {
-                            "name": tool_call.function.name,
-                            "arguments": tool_call.function.arguments
-                        }
-                    } for tool_call in response_message.tool_calls or []
-                ]
+                "content": first_content or None,
+                "tool_calls": tool_calls,
             }
             messages_for_api.append(response_dict)  # tool_call en historial
             tool_call = tool_calls[0]
-            func_name = tool_call.function.name
-            func_args = json.loads(tool_call.function.arguments or "{}")
+            func_name = tool_call["function"]["name"]
+            func_args = json.loads(tool_call["function"]["arguments"] or "{}")
 
             # Detectar petición de finalizar conversación vía tool virtual end_conversation
             if func_name == "end_conversation":
@@ -332,15 +463,12 @@ async def process_text_message(
             # Ejecutamos la función real con timeout
             if func_name in tool_functions_map:
                 try:
-                    import asyncio
-                    tool_result = await asyncio.wait_for(
-                        asyncio.to_thread(tool_functions_map[func_name], **func_args),
-                        timeout=10.0
-                    )
+                    tool_result = await tool_executor.run(func_name, tool_functions_map[func_name], **func_args)
                 except asyncio.TimeoutError:
+                    timeout = tool_executor.policy_for(func_name).timeout
                     tool_result = {
                         "error": f"timeout_exceeded",
-                        "message": f"La operación {func_name} tardó más de 10 segundos"
+                        "message": f"La operación {func_name} tardó más de {timeout:.0f} segundos"
                     }
                     print(f"[{conv_id_for_logs}] ⏰ TIMEOUT en tool {func_name}")
                 except Exception as e_tool:
@@ -357,39 +485,33 @@ async def process_text_message(
             messages_for_api.append(
                 {
                     "role": "tool",
-                    "tool_call_id": tool_call.id,
+                    "tool_call_id": tool_call["id"],
                     "name": func_name,
                     "content": json.dumps(tool_result),
                 }
             )
 
             # 3) Segunda pasada para respuesta final
-            # Validar que el cliente esté disponible
-            if not client:
-                raise ValueError("Cliente OpenAI no inicializado")
-
             # Segunda llamada al LLM para que formule la respuesta final
-            second_chat_completion = client.chat.completions.create(
-                model=MODEL_TO_USE,
-                messages=messages_for_api,  # type: ignore
+            content, _ = await _stream_completion(
+                messages_for_api,
+                on_delta=streamed.feed if streamed else None,
                 temperature=0.4,
                 max_tokens=512,
                 top_p=0.9,
             )
-
-            content = second_chat_completion.choices[0].message.content
             ai_final_response_content = (content or "").strip()
             status_message = "success_with_tool"
         else:
-            content = response_message.content
-            ai_final_response_content = (content or "").strip()
+            ai_final_response_content = (first_content or "").strip()
             status_message = "success_no_tool"
+        if streamed:
+            await streamed.flush()
 
         # Detección de final de conversación por marcador explícito del asistente
         end_chat = False
         end_reason = None
         if ai_final_response_content:
-            import re
             # Detectar marcador de cierre por texto especial o tool inline
             if ai_final_response_content.strip() == "__END_CHAT__":
                 end_chat = True
@@ -414,8 +536,8 @@ async def process_text_message(
         tools_used = []
         if tool_calls:
             for tool_call in tool_calls:
-                if hasattr(tool_call, 'function') and tool_call.function:
-                    tools_used.append(tool_call.function.name)
+                if tool_call.get("function", {}).get("name"):
+                    tools_used.append(tool_call["function"]["name"])
         
         result: Dict[str, Any] = {
             "reply_text": ai_final_response_content,
@@ -14,17 +14,21 @@ Este módulo se encarga de:
 """
 
 import asyncio
-import base64
-import json
 import logging
 import time
+from contextlib import aclosing
 from typing import Optional, List, Callable, Awaitable
 from dataclasses import dataclass
 from datetime import datetime
 
 from deepgram_stt_streamer import DeepgramSTTStreamer
 from eleven_ws_tts_client import ElevenLabsWSClient
-from eleven_http_client import send_tts_http_to_twilio
+from eleven_ws_pool import eleven_ws_pool
+from stt_preconnect import stt_preconnect
+from eleven_http_client import iter_tts_http_audio
+from outbound_audio import OutboundAudioScheduler
+from barge_in import BargeInDetector
+from tts_cache import phrase_cache
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +43,7 @@ AUDIO_CONFIG = {
 
 # ===== CALLBACKS =====
 TranscriptCallback = Callable[[str, bool], None]
+TurnSignalCallback = Callable[[str, dict], None]
 AudioChunkCallback = Callable[[bytes], Awaitable[None]]
 
 
@@ -87,6 +92,7 @@ class AudioManager:
         
         # === Callbacks ===
         self.on_transcript: Optional[TranscriptCallback] = None
+        self.on_turn_signal: Optional[TurnSignalCallback] = None
         self.on_tts_complete: Optional[Callable] = None
         
         # === Control de tiempo ===
@@ -97,18 +103,44 @@ class AudioManager:
         self.tts_lock = asyncio.Lock()
         self.current_tts_text: Optional[str] = None
         
+        # === TTS incremental (segmentos del LLM en streaming) ===
+        self.speech_stream_active = False
+        self._stream_fallback = False
+        self._stream_unsent: List[str] = []
+        self._stream_sent: List[str] = []      # segmentos aceptados por EL WS en este turno
+        self._stream_audio_bytes = 0           # audio WS recibido en este turno
+        self._stream_started_at: Optional[float] = None
+        
+        # === Cola única de audio saliente (pacing en tiempo real) ===
+        self.outbound = OutboundAudioScheduler(stream_sid, websocket_send)
+        
+        # === Reproducción de audio pre-renderizado (caché) ===
+        self.playback_task: Optional[asyncio.Task] = None
+        self.http_tts_task: Optional[asyncio.Task] = None  # descarga HTTP de fallback en curso
+        
+        # === Interrupciones del usuario (barge-in) ===
+        self.barge_in = BargeInDetector()
+        self.on_barge_in: Optional[Callable] = None
+        self._interrupted = False
+        
+        # === Captura de audio WS para la caché de frases ===
+        self._capture_text: Optional[str] = None
+        self._capture_chunks: List[bytes] = []
+        
         logger.info(f"🎵 AudioManager creado para stream: {stream_sid}")
     
     # ========== INICIALIZACIÓN DE SERVICIOS ==========
     
     async def initialize_stt(self, on_transcript: TranscriptCallback, 
-                           on_disconnect: Optional[Callable] = None) -> bool:
+                           on_disconnect: Optional[Callable] = None,
+                           call_sid: Optional[str] = None) -> bool:
         """
         🎤 Inicializa Deepgram STT (Speech-to-Text)
         
         Args:
             on_transcript: Callback cuando hay transcripción
             on_disconnect: Callback si Deepgram se desconecta
+            call_sid: Si se indica, reutiliza la sesión abierta en /twilio-voice
             
         Returns:
             bool: True si se inició correctamente
@@ -117,10 +149,25 @@ class AudioManager:
             logger.info("🎤 Iniciando Deepgram STT...")
             
             self.on_transcript = on_transcript
+            
+            # Sesión ya abierta por el webhook de voz (sin handshake aquí)
+            preconnected = await stt_preconnect.claim(
+                call_sid,
+                callback=self._handle_transcript,
+                on_disconnect=on_disconnect
+            )
+            if preconnected:
+                self.stt_streamer = preconnected
+                self.stt_streamer.turn_signal_callback = self._handle_turn_signal
+                logger.info("✅ Deepgram STT pre-conectado listo")
+                await self._flush_audio_buffer()
+                return True
+            
             self.stt_streamer = DeepgramSTTStreamer(
                 callback=self._handle_transcript,
                 on_disconnect_callback=on_disconnect
             )
+            self.stt_streamer.turn_signal_callback = self._handle_turn_signal
             
             await self.stt_streamer.start_streaming()
             
@@ -147,17 +194,20 @@ class AudioManager:
         try:
             logger.info("🔊 Iniciando ElevenLabs TTS...")
             
-            self.tts_client = ElevenLabsWSClient()
-            # Esperar conexión (máximo 2 segundos)
-            await asyncio.wait_for(self.tts_client._ws_open.wait(), timeout=2.0)
+            # Devolver el socket anterior (ya usado o caído) antes de pedir otro
+            if self.tts_client:
+                await eleven_ws_pool.release(self.tts_client)
+                self.tts_client = None
+            
+            # Socket pre-conectado del pool (o uno nuevo si el pool está vacío)
+            self.tts_client = await eleven_ws_pool.acquire(timeout=2.0)
+            if not self.tts_client:
+                logger.error("⏰ No se pudo obtener socket de ElevenLabs")
+                return False
             
             logger.info("✅ ElevenLabs TTS conectado")
             return True
             
-        except asyncio.TimeoutError:
-            logger.error("⏰ Timeout conectando a ElevenLabs")
-            self.tts_client = None
-            return False
         except Exception as e:
             logger.error(f"❌ Error iniciando ElevenLabs: {e}", exc_info=True)
             self.tts_client = None
@@ -175,10 +225,18 @@ class AudioManager:
         Este método:
         1. Si STT activo y no ignorando → envía a Deepgram
         2. Si STT inactivo → guarda en buffer
-        3. Si ignorando (IA hablando) → descarta
+        3. Si la IA habla y hay barge-in → sigue enviando a Deepgram y mide energía
+        4. Si ignorando sin barge-in → descarta
         """
-        # Si estamos ignorando (IA está hablando), descartar
         if self.state.ignore_stt:
+            if not self._barge_in_listening():
+                return
+            # La IA está hablando: escuchar por si el usuario la interrumpe
+            self.barge_in.process_frame(audio_bytes)
+            try:
+                await self.stt_streamer.send_audio(audio_bytes)
+            except Exception as e:
+                logger.error(f"❌ Error enviando audio a Deepgram durante TTS: {e}")
             return
         
         # Actualizar timestamp de actividad
@@ -245,15 +303,94 @@ class AudioManager:
             transcript: Texto transcrito
             is_final: True si es transcripción final, False si es parcial
         """
-        # Ignorar si estamos en modo silencio
         if self.state.ignore_stt:
-            logger.debug(f"🚫 Transcripción ignorada (IA hablando): '{transcript[:50]}...'")
+            if self._barge_in_listening() and self.barge_in.should_interrupt(transcript):
+                # El usuario interrumpe: lo que dijo pasa a ser su siguiente turno
+                self.state.ignore_stt = False
+                asyncio.create_task(self.interrupt_speech("barge_in"))
+            else:
+                logger.debug(f"🚫 Transcripción ignorada (IA hablando): '{transcript[:50]}...'")
+                return
+        elif transcript and self.barge_in.is_echo_tail(transcript):
+            logger.debug(f"🔁 Eco del TTS descartado tras hablar: '{transcript[:50]}...'")
             return
         
         # Pasar al callback externo
         if self.on_transcript:
             self.on_transcript(transcript, is_final)
     
+    def _handle_turn_signal(self, kind: str, data: dict) -> None:
+        """
+        🏁 Señales de fin de turno de Deepgram (speech_final, UtteranceEnd)
+        """
+        if self.state.ignore_stt:
+            return
+        if self.on_turn_signal:
+            self.on_turn_signal(kind, data)
+    
+    # ========== BARGE-IN (usuario interrumpe a la IA) ==========
+    
+    def _barge_in_listening(self) -> bool:
+        """True si la IA está sonando y se debe escuchar por interrupciones."""
+        return (
+            self.barge_in.enabled
+            and self.state.is_speaking
+            and self.stt_streamer is not None
+            and self.stt_streamer._started
+        )
+    
+    async def interrupt_speech(self, reason: str = "barge_in") -> bool:
+        """
+        ✋ Corta el TTS en curso al instante
+        
+        1. Cancela el turno de ElevenLabs (el socket se descarta)
+        2. Descarta el audio pendiente y envía 'clear' a Twilio
+        3. Cierra el turno de TTS como si hubiera terminado
+        
+        Returns:
+            bool: True si había algo que interrumpir
+        """
+        if not (self.state.tts_in_progress or self.state.is_speaking or self.speech_stream_active):
+            return False
+        
+        t0 = time.perf_counter()
+        self._interrupted = True
+        self.speech_stream_active = False
+        self._stream_unsent = []
+        self._stream_sent = []
+        
+        if self.playback_task and not self.playback_task.done():
+            self.playback_task.cancel()
+            self.playback_task = None
+        
+        if self.http_tts_task and not self.http_tts_task.done():
+            self.http_tts_task.cancel()
+        
+        if self.tts_client:
+            try:
+                await self.tts_client.cancel_turn()
+            except Exception as e:
+                logger.debug(f"Error cancelando turno de ElevenLabs: {e}")
+        
+        self.outbound.truncate()
+        await self._on_tts_complete()
+        
+        logger.info(f"[LATENCIA] TTS interrumpido ({reason}) en {1000*(time.perf_counter()-t0):.1f} ms")
+        if self.on_barge_in:
+            try:
+                if asyncio.iscoroutinefunction(self.on_barge_in):
+                    await self.on_barge_in()
+                else:
+                    self.on_barge_in()
+            except Exception as e:
+                logger.error(f"❌ Error en callback de barge-in: {e}")
+        return True
+    
+    def _begin_playback(self, text: str = "") -> None:
+        """Nuevo turno de TTS: referencia para eco y limpia la marca de interrupción."""
+        self._interrupted = False
+        self.barge_in.start_playback(text)
+    
     # ========== MANEJO DE AUDIO SALIENTE (IA → Usuario) ==========
     
     async def prepare_tts_ws(self) -> bool:
@@ -265,7 +402,7 @@ class AudioManager:
         """
         t0 = time.perf_counter()
         logger.info("[LATENCIA] Iniciando preparación de WebSocket ElevenLabs para TTS...")
-        if not self.tts_client or not hasattr(self.tts_client, '_ws') or not self.tts_client._ws or getattr(self.tts_client._ws, "closed", False):
+        if not self.tts_client or not self.tts_client.is_fresh():
             logger.info("🔄 WebSocket de ElevenLabs no disponible, intentando abrir...")
             ok = await self.initialize_tts()
             if not ok:
@@ -278,11 +415,8 @@ class AudioManager:
             # Si está abierto, enviar keepalive si han pasado >10s desde el último uso
             now = time.perf_counter()
             if self.last_chunk_time and (now - self.last_chunk_time) > 10:
-                try:
-                    await self.tts_client._ws.send(json.dumps({"text": " "}))
+                if await self.tts_client.send_keepalive():
                     logger.debug("💓 Keepalive enviado a ElevenLabs (por inactividad)")
-                except Exception as e:
-                    logger.warning(f"⚠️ Error enviando keepalive a ElevenLabs: {e}")
             logger.info(f"[LATENCIA] WebSocket ElevenLabs ya estaba abierto, preparación en {1000*(time.perf_counter()-t0):.1f} ms")
             return True
 
@@ -314,6 +448,12 @@ class AudioManager:
             logger.warning("⚠️ Texto vacío para TTS")
             return False
         
+        # Frase en caché: se reproduce sin ida y vuelta a ElevenLabs
+        cached_audio = phrase_cache.get(text)
+        if cached_audio is not None:
+            logger.info(f"💾 Frase en caché ({len(cached_audio)} bytes): '{text[:50]}...'")
+            return await self.play_cached_audio(cached_audio, on_complete, label="frase", text=text)
+        
         # NUEVO: Usar lock para evitar duplicación de TTS
         async with self.tts_lock:
             # Si ya estamos procesando este texto, ignorar
@@ -341,6 +481,10 @@ class AudioManager:
         # FIX: Limpiar buffer de Twilio ANTES de cualquier intento
         await self._clear_twilio_buffer()
         
+        # Capturar el audio de frases cortas para reutilizarlo después
+        self._start_capture(text)
+        self._begin_playback(text)
+        
         # Intentar WebSocket primero (baja latencia)
         ws_success = await self._try_websocket_tts(text)
         
@@ -363,8 +507,8 @@ class AudioManager:
         Returns:
             bool: True si funcionó, False si falló
         """
-        if not self.tts_client:
-            # Intentar crear cliente si no existe
+        if not self.tts_client or not self.tts_client.is_fresh():
+            # Socket ausente, caído o ya usado en un turno anterior
             logger.info("🔄 Intentando inicializar TTS WebSocket...")
             await self.initialize_tts()
             
@@ -378,16 +522,11 @@ class AudioManager:
             logger.info(f"[DIAGNÓSTICO] TTS WebSocket - Intentos: {diagnostics['connection_attempts']}, "
                        f"Errores: {diagnostics['total_errors']}, Conectado: {diagnostics['is_connected']}")
             
-            # Callback para enviar chunks
-            async def send_chunk(chunk: bytes):
-                await self._send_audio_to_twilio(chunk)
-                self.last_chunk_time = time.perf_counter()
-            
             # Hablar con timeout más generoso para el primer chunk
             ok = await self.tts_client.speak(
                 text,
-                on_chunk=send_chunk,
-                on_end=self._on_tts_complete,
+                on_chunk=self._on_ws_audio_chunk,
+                on_end=self._on_ws_tts_end,
                 timeout_first_chunk=2.0  # Aumentar a 2.0s para mayor estabilidad
             )
             
@@ -414,6 +553,253 @@ class AudioManager:
                 logger.error(f"[DIAGNÓSTICO] Error TTS - Último error: {diagnostics['last_error']}")
             return False
     
+    async def play_cached_audio(self, audio: bytes, on_complete: Optional[Callable] = None,
+                                label: str = "cache", text: str = "") -> bool:
+        """
+        💾 Reproduce audio μ-law ya renderizado (sin ida y vuelta a ElevenLabs)
+        
+        Args:
+            audio: Audio μ-law 8kHz completo
+            on_complete: Callback cuando termina
+            label: Nombre para logs (saludo, frase, etc.)
+            text: Texto del audio (referencia para descartar eco)
+            
+        Returns:
+            bool: True si la reproducción arrancó
+        """
+        if not audio:
+            return False
+        
+        async with self.tts_lock:
+            if self.state.tts_in_progress or self.speech_stream_active:
+                logger.warning(f"⚠️ TTS en progreso, no se reproduce audio '{label}'")
+                return False
+            self.current_tts_text = None
+        
+        self.on_tts_complete = on_complete
+        self.state.tts_in_progress = True
+        self.state.is_speaking = True
+        self.state.ignore_stt = True
+        
+        await self._clear_twilio_buffer()
+        self._begin_playback(text)
+        self.playback_task = asyncio.create_task(
+            self._play_audio_bytes(audio, label),
+            name=f"Playback_{label}_{self.stream_sid}"
+        )
+        return True
+    
+    async def _play_audio_bytes(self, audio: bytes, label: str) -> None:
+        """
+        📤 Envía a Twilio audio completo con pacing y cierra el turno de TTS
+        """
+        t0 = time.perf_counter()
+        logger.info(f"💾 Reproduciendo audio '{label}' desde caché ({len(audio)} bytes)")
+        try:
+            self.outbound.enqueue(audio)
+            self.outbound.flush_partial()
+            sent = self.outbound.mark(f"end_of_{label}")
+            await self.outbound.wait_drained()
+            if not sent.done() or not sent.result():
+                logger.warning(f"⚠️ Reproducción de '{label}' interrumpida")
+            logger.info(f"[LATENCIA] Audio '{label}' enviado desde caché en {1000*(time.perf_counter()-t0):.1f} ms")
+        except asyncio.CancelledError:
+            logger.info(f"🛑 Reproducción de '{label}' cancelada")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error reproduciendo audio '{label}': {e}")
+        await self._on_tts_complete()
+    
+    async def _on_ws_audio_chunk(self, chunk: bytes) -> None:
+        """
+        📤 Callback de ElevenLabs WS: encola el chunk hacia Twilio
+        """
+        await self._send_audio_to_twilio(chunk)
+        self._stream_audio_bytes += len(chunk)
+        self.last_chunk_time = time.perf_counter()
+        if self._capture_text is not None:
+            self._capture_chunks.append(chunk)
+    
+    async def _on_ws_tts_end(self) -> None:
+        """
+        🏁 Fin natural del audio WS: guarda la frase capturada y cierra el turno
+        """
+        if self._interrupted:
+            return
+        if self._capture_text and self._capture_chunks:
+            phrase_cache.put(self._capture_text, b"".join(self._capture_chunks), dynamic=True)
+        # EL genera más rápido que tiempo real: esperar a que la cola salga a Twilio
+        self.outbound.flush_partial()
+        await self.outbound.wait_drained(timeout=60.0)
+        await self._on_tts_complete()
+    
+    def _start_capture(self, text: str) -> None:
+        """Empieza a capturar audio WS solo si el texto es candidato a caché."""
+        self._capture_text = text if phrase_cache.accepts_dynamic(text) else None
+        self._capture_chunks = []
+    
+    def _stop_capture(self) -> None:
+        self._capture_text = None
+        self._capture_chunks = []
+    
+    # ========== TTS INCREMENTAL (LLM → ElevenLabs en streaming) ==========
+    
+    async def begin_speech_stream(self, on_complete: Optional[Callable] = None) -> bool:
+        """
+        🌊 Abre un turno de TTS incremental
+        
+        Los segmentos llegan con stream_speech_chunk() conforme el LLM
+        los genera y el turno se cierra con finish_speech_stream().
+        Si el WebSocket no está disponible, los segmentos se acumulan
+        y se sintetizan por HTTP al finalizar.
+        
+        Returns:
+            bool: True si el turno quedó abierto
+        """
+        async with self.tts_lock:
+            if self.state.tts_in_progress or self.speech_stream_active:
+                logger.warning("⚠️ TTS en progreso, no se abre stream incremental")
+                return False
+            self.current_tts_text = None
+            self.speech_stream_active = True
+        
+        t0 = time.perf_counter()
+        self._stream_started_at = t0
+        self._stream_fallback = False
+        self._stream_unsent = []
+        self._stream_sent = []
+        self._stream_audio_bytes = 0
+        self._capture_text = ""
+        self._capture_chunks = []
+        self._begin_playback()
+        
+        self.on_tts_complete = on_complete
+        self.state.tts_in_progress = True
+        self.state.is_speaking = True
+        self.state.ignore_stt = True
+        
+        await self._clear_twilio_buffer()
+        
+        if not self.tts_client or not self.tts_client.is_fresh():
+            await self.initialize_tts()
+        
+        ok = False
+        if self.tts_client:
+            try:
+                ok = await self.tts_client.begin_stream(
+                    on_chunk=self._on_ws_audio_chunk,
+                    on_end=self._on_ws_tts_end
+                )
+            except Exception as e:
+                logger.error(f"❌ Error abriendo stream TTS: {e}")
+                ok = False
+        
+        if not ok:
+            logger.warning("⚠️ Stream WS no disponible, se acumulará texto para fallback HTTP")
+            self._stream_fallback = True
+        
+        logger.info(f"[LATENCIA] Stream TTS incremental abierto en {1000*(time.perf_counter()-t0):.1f} ms")
+        return True
+    
+    async def stream_speech_chunk(self, text: str) -> bool:
+        """
+        ➕ Envía un segmento hablable al turno incremental en curso
+        """
+        if not self.speech_stream_active or not text.strip():
+            return False
+        
+        if self._stream_fallback or not self.tts_client:
+            self._stream_unsent.append(text)
+            return True
+        
+        self.barge_in.add_reference(text)
+        if self._capture_text is not None:
+            captured = f"{self._capture_text} {text.strip()}".strip()
+            if phrase_cache.accepts_dynamic(captured):
+                self._capture_text = captured
+            else:
+                self._stop_capture()
+        
+        ok = await self.tts_client.add_text_chunk(text)
+        if not ok:
+            logger.warning("⚠️ Falló envío de segmento a EL WS, pasando a fallback HTTP")
+            self._stream_fallback = True
+            self._stream_unsent.append(text)
+        else:
+            self._stream_sent.append(text)
+        if ok and self._stream_started_at:
+            logger.debug(f"📤 Segmento TTS enviado a +{1000*(time.perf_counter()-self._stream_started_at):.1f} ms")
+        return True
+    
+    async def finish_speech_stream(self) -> None:
+        """
+        🏁 Cierra el turno incremental (EOS) o sintetiza por HTTP lo pendiente
+        """
+        if not self.speech_stream_active:
+            return
+        self.speech_stream_active = False
+        
+        if self._stream_fallback:
+            segments = self._stream_segments_without_audio() + self._stream_unsent
+            pending = " ".join(s.strip() for s in segments).strip()
+            self._stream_unsent = []
+            self._stream_sent = []
+            if not pending:
+                await self._on_tts_complete()
+                return
+            if self._stream_audio_bytes:
+                # Falló a medio turno: lo que ya llegó se escucha completo, sin cortes
+                if self.tts_client:
+                    await self.tts_client.cancel_turn()   # que no se cuele audio tardío del WS
+                self.outbound.flush_partial()
+                await self.outbound.wait_drained()
+                if self._interrupted:
+                    return
+            else:
+                await self._clear_twilio_buffer()
+            await self._http_fallback_tts(pending)
+            return
+        
+        ok = await self.tts_client.finalize_stream() if self.tts_client else False
+        if not ok:
+            logger.error("❌ No se pudo finalizar stream TTS, reactivando STT")
+            await self._on_tts_complete()
+            return
+        
+        # El stall monitor cuenta desde el cierre del turno, no desde el primer segmento
+        self.last_chunk_time = time.perf_counter()
+        if self.stall_detector_task:
+            self.stall_detector_task.cancel()
+        self.stall_detector_task = asyncio.create_task(self._monitor_tts_stall())
+    
+    def _stream_segments_without_audio(self) -> List[str]:
+        """
+        Segmentos enviados a EL WS cuyo audio no llegó completo (se re-sintetizan por HTTP).
+        
+        Con el alignment de EL se sabe cuántos caracteres ya tienen audio; sin él,
+        solo se repite todo si no llegó nada de audio en el turno.
+        """
+        aligned = self.tts_client.aligned_chars if self.tts_client else None
+        if aligned is None:
+            return [] if self._stream_audio_bytes else list(self._stream_sent)
+        missing, covered = [], 0
+        for segment in self._stream_sent:
+            covered += len(segment.strip()) + 1   # EL recibe cada segmento con un espacio final
+            if covered > aligned:
+                missing.append(segment)
+        return missing
+    
+    async def wait_until_idle(self, timeout: float = 10.0) -> bool:
+        """
+        ⏳ Espera a que termine el TTS en curso (útil antes de la despedida)
+        """
+        deadline = time.perf_counter() + timeout
+        while self.state.tts_in_progress or self.speech_stream_active:
+            if time.perf_counter() >= deadline:
+                return False
+            await asyncio.sleep(0.1)
+        return True
+    
     async def _http_fallback_tts(self, text: str) -> None:
         """
         🔄 Fallback a ElevenLabs HTTP (más lento pero confiable)
@@ -422,11 +808,26 @@ class AudioManager:
         logger.info("🔄 Usando fallback HTTP TTS...")
         
         try:
-            await send_tts_http_to_twilio(
-                text=text,
-                stream_sid=self.stream_sid,
-                websocket_send=self.websocket_send
-            )
+            # Descarga en su propia tarea: interrupt_speech() puede cancelarla
+            self.http_tts_task = asyncio.create_task(self._stream_http_audio(text, t0))
+            try:
+                received = await self.http_tts_task
+            except asyncio.CancelledError:
+                if not self._interrupted:
+                    raise
+                received = 0
+            finally:
+                self.http_tts_task = None
+            if self._interrupted:
+                # El usuario interrumpió mientras se descargaba o enviaba el audio
+                return
+            if received:
+                self.outbound.flush_partial()
+                await self.outbound.wait_drained()
+                if self._interrupted:
+                    return
+            else:
+                self.outbound.mark("error")
             # Llamar callback de finalización
             await self._on_tts_complete()
             logger.info(f"[LATENCIA] HTTP fallback TTS completado en {1000*(time.perf_counter()-t0):.1f} ms")
@@ -435,35 +836,38 @@ class AudioManager:
             # Aún así llamar callback para reactivar STT
             await self._on_tts_complete()
     
+    async def _stream_http_audio(self, text: str, t0: float) -> int:
+        """
+        📥 Encola cada chunk HTTP en cuanto llega (sin esperar el clip completo)
+        
+        Returns:
+            int: Bytes de audio recibidos
+        """
+        received = 0
+        async with aclosing(iter_tts_http_audio(text)) as chunks:
+            async for chunk in chunks:
+                if self._interrupted:
+                    break
+                if not received:
+                    logger.info(f"[LATENCIA] HTTP TTS primer audio a Twilio en {1000*(time.perf_counter()-t0):.1f} ms")
+                received += len(chunk)
+                self.outbound.enqueue(chunk)
+        return received
+    
     async def _send_audio_to_twilio(self, audio_chunk: bytes) -> None:
         """
-        📤 Envía chunk de audio a Twilio
+        📤 Encola un chunk de audio hacia Twilio (el planificador lo envía con pacing)
         
         Args:
             audio_chunk: Audio μ-law 8kHz
         """
-        try:
-            payload = base64.b64encode(audio_chunk).decode("ascii")
-            await self.websocket_send(json.dumps({
-                "event": "media",
-                "streamSid": self.stream_sid,
-                "media": {"payload": payload}
-            }))
-        except Exception as e:
-            logger.error(f"❌ Error enviando audio a Twilio: {e}")
+        self.outbound.enqueue(audio_chunk)
     
     async def _clear_twilio_buffer(self) -> None:
         """
-        🧹 Limpia el buffer de Twilio antes de hablar
+        🧹 Descarta el audio pendiente (local y en Twilio) antes de hablar
         """
-        try:
-            await self.websocket_send(json.dumps({
-                "event": "clear",
-                "streamSid": self.stream_sid
-            }))
-            logger.debug("🧹 Buffer de Twilio limpiado")
-        except Exception as e:
-            logger.error(f"❌ Error limpiando buffer Twilio: {e}")
+        self.outbound.truncate()
     
     async def _on_tts_complete(self) -> None:
         """
@@ -482,6 +886,9 @@ class AudioManager:
         # Limpiar el texto actual del lock
         async with self.tts_lock:
             self.current_tts_text = None
+            self.speech_stream_active = False
+        self._stop_capture()
+        self.barge_in.end_playback()
         
         # Cancelar detector de stalls
         if self.stall_detector_task:
@@ -514,7 +921,8 @@ class AudioManager:
         while self.state.tts_in_progress:
             if self.last_chunk_time:
                 elapsed = time.perf_counter() - self.last_chunk_time
-                if elapsed > stall_threshold:
+                # Si aún hay audio en la cola saliente, EL ya entregó: no es stall
+                if elapsed > stall_threshold and self.outbound.is_idle():
                     stall_count += 1
                     logger.warning(f"🚨 TTS stall #{stall_count} detectado! ({elapsed*1000:.1f}ms sin chunks)")
                     if stall_count >= max_stalls:  # Cambiar de 2 a 3
@@ -548,15 +956,8 @@ class AudioManager:
         self.state.tts_in_progress = False
         self.state.is_speaking = False
         
-        # Notificar a Twilio
-        try:
-            await self.websocket_send(json.dumps({
-                "event": "mark",
-                "streamSid": self.stream_sid,
-                "mark": {"name": "end_of_tts"}
-            }))
-        except Exception as e:
-            logger.debug(f"No se pudo enviar mark end_of_tts: {e}")
+        # Notificar a Twilio (en orden, detrás del audio ya encolado)
+        self.outbound.mark("end_of_tts")
     
     async def on_audio_received(self):
         """
@@ -575,6 +976,17 @@ class AudioManager:
         """
         logger.info("🔌 Cerrando AudioManager...")
         
+        # Detener reproducción de audio en caché
+        if self.playback_task and not self.playback_task.done():
+            self.playback_task.cancel()
+            self.playback_task = None
+        if self.http_tts_task and not self.http_tts_task.done():
+            self.http_tts_task.cancel()
+            self.http_tts_task = None
+        
+        # Descartar audio saliente pendiente
+        await self.outbound.close()
+        
         # Cerrar STT
         if self.stt_streamer:
             try:
@@ -585,11 +997,11 @@ class AudioManager:
             finally:
                 self.stt_streamer = None
         
-        # Cerrar TTS
+        # Devolver TTS al pool (se cierra allí si ya se usó)
         if self.tts_client:
             try:
-                await self.tts_client.close()
-                logger.info("✅ ElevenLabs TTS cerrado")
+                await eleven_ws_pool.release(self.tts_client)
+                logger.info("✅ ElevenLabs TTS devuelto al pool")
             except Exception as e:
                 logger.error(f"❌ Error cerrando ElevenLabs: {e}")
             finally:
@@ -638,4 +1050,7 @@ class AudioManager:
             tts_diagnostics = self.tts_client.get_diagnostics()
             diagnostics["tts_diagnostics"] = tts_diagnostics
         
+        diagnostics["outbound_audio"] = self.outbound.get_stats()
+        diagnostics["barge_in"] = self.barge_in.get_stats()
+        diagnostics["phrase_cache"] = phrase_cache.get_stats()
         return diagnostics
\ No newline at end of file
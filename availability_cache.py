@@ -0,0 +1,492 @@
+# availability_cache.py
+# -*- coding: utf-8 -*-
+"""
+📆 CACHÉ COMPARTIDA DE DISPONIBILIDAD (SLOTS LIBRES)
+=====================================================
+Antes, cada llamada entrante recargaba 90 días de freebusy y
+reconstruía todos los días; llamadas simultáneas competían por
+cache_lock haciendo la misma consulta.
+
+Ahora:
+- Single-flight: una sola recarga a la vez; quien llega mientras hay
+  una en curso (hilo o corrutina) espera a esa misma.
+- Se construye un diccionario nuevo y se publica de golpe
+  (buscarslot.install_free_slots_cache); un fallo no borra la caché buena.
+- Refresco periódico en segundo plano; con AVAILABILITY_SYNC_MODE=incremental
+  solo se piden los cambios (syncToken, ver calendar_sync.py).
+- Las llamadas no pagan la recarga: si la caché está vencida se sirve
+  y se pide un refresco; solo se espera si no hay caché o es muy vieja.
+- Métricas: edad de la caché, duración de recargas, esperas unidas.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+import buscarslot
+from calendar_async import CALENDAR_ASYNC_CONFIG
+from calendar_sync import CALENDAR_SYNC_CONFIG, calendar_event_index, day_keys, event_interval
+from utils import get_cancun_time
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN =====
+AVAILABILITY_CACHE_CONFIG = {
+    "DAYS_AHEAD": 90,
+    "TTL": buscarslot.CACHE_VALID_MINUTES * 60,   # caché fresca
+    # Con sync incremental (syncToken) refrescar cada minuto es barato
+    "REFRESH_INTERVAL": int(os.getenv(
+        "AVAILABILITY_REFRESH_SECONDS",
+        "60" if CALENDAR_SYNC_CONFIG["MODE"] == "incremental" else "300",
+    )),
+    "ERROR_RETRY": 60,              # reintento tras un fallo
+    "MAX_STALE": 3600,              # más vieja que esto → se espera una recarga
+    "WAIT_TIMEOUT": 20.0,           # espera máxima al unirse a una recarga en curso
+    "LATENCY_HISTORY": 50,
+    # Apartado provisional de un slot ofrecido a una sesión
+    "HOLD_SECONDS": int(os.getenv("SLOT_HOLD_SECONDS", "300")),
+}
+
+
+class _Flight:
+    """✈️ Recarga en curso compartida por todos los que la esperan"""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        self.event = threading.Event()
+        self.ok = False
+
+
+class AvailabilityCache:
+    """
+    🎯 Dueña de la recarga de buscarslot.free_slots_cache
+
+    Uso:
+        availability_cache.ensure_fresh()            # desde herramientas (hilos)
+        await availability_cache.ensure_fresh_async()
+        await availability_cache.refresh_async("admin")
+    """
+
+    def __init__(self):
+        self._state_lock = threading.Lock()
+        self._write_lock = threading.Lock()   # índice + publicación de la caché
+        # Escrituras directas aplicadas mientras una recarga trae datos de Google:
+        # su foto puede ser anterior a ellas, así que se reaplican al instalarla
+        self._writes_during_refresh: Optional[List[Tuple[Dict[str, Any], bool]]] = None
+        self._flight: Optional[_Flight] = None
+        self._updated_at: Optional[float] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Un cambio pidió refresco mientras otro estaba en curso (su foto puede ser anterior)
+        self._refresh_dirty = False
+
+        # Métricas
+        self.refreshes = 0
+        self.failures = 0
+        self.coalesced = 0           # esperas que se unieron a una recarga en curso
+        self.blocking_refreshes = 0  # veces que alguien tuvo que esperar (sin caché / muy vieja)
+        self.stale_served = 0
+        self.write_throughs = 0
+        self.refresh_ms: Deque[float] = deque(maxlen=AVAILABILITY_CACHE_CONFIG["LATENCY_HISTORY"])
+        self._last_reason: Optional[str] = None
+        self._last_error: Optional[str] = None
+
+    @property
+    def age(self) -> Optional[float]:
+        return time.time() - self._updated_at if self._updated_at else None
+
+    # ========== SINGLE-FLIGHT ==========
+
+    def _join_or_lead(self, reason: str) -> Tuple[_Flight, bool]:
+        """Devuelve (recarga, soy_líder). Si ya hay una en curso, se une a ella."""
+        with self._state_lock:
+            if self._flight is not None:
+                self.coalesced += 1
+                return self._flight, False
+            self._flight = _Flight(reason)
+            return self._flight, True
+
+    def _complete(self, flight: _Flight, t0: float, days_installed: Optional[int], error: Optional[BaseException]) -> None:
+        elapsed_ms = 1000 * (time.perf_counter() - t0)
+        self.refresh_ms.append(elapsed_ms)
+        self._last_reason = flight.reason
+        if days_installed is not None:
+            self._updated_at = time.time()
+            self._last_error = None
+            self.refreshes += 1
+            flight.ok = True
+            logger.info(f"[LATENCIA] Slots libres recargados ({flight.reason}) en {elapsed_ms:.1f} ms, {days_installed} días")
+        else:
+            self.failures += 1
+            self._last_error = str(error) if error else "cancelada"
+            logger.warning(f"⚠️ Recarga de slots fallida ({flight.reason}): {self._last_error}; se mantiene la caché anterior")
+        with self._write_lock:
+            self._writes_during_refresh = None
+        with self._state_lock:
+            self._flight = None
+        flight.event.set()
+        if self._refresh_dirty:
+            self._request_refresh(after_change=True)
+
+    def _begin_refresh(self) -> None:
+        """Desde aquí se anotan las escrituras directas (antes de pedir nada a Google)."""
+        with self._write_lock:
+            self._writes_during_refresh = []
+
+    def _install(self, now, days: int, fetched: Any) -> int:
+        """
+        Construye y publica la caché con lo traído de Google, bajo el lock de
+        escritura. Las escrituras directas que llegaron mientras se consultaba
+        Google se reaplican sobre la foto nueva: una cita recién agendada no
+        reaparece como libre aunque la foto sea anterior a ella.
+        """
+        with self._write_lock:
+            if CALENDAR_SYNC_CONFIG["MODE"] == "incremental":
+                new_cache = calendar_event_index.finish(*fetched, now, days, buscarslot.free_slots_cache)
+            else:
+                new_cache = buscarslot.build_free_slots_cache(now, days, fetched)
+            replayed = self._writes_during_refresh or []
+            for event, replaces_existing in replayed:
+                changed = self._apply_to_cache(event, replaces_existing, new_cache, now, days)
+                if changed is not None:
+                    new_cache = changed[0]
+            if replayed:
+                logger.info(f"✍️ {len(replayed)} cambio(s) de cita reaplicados sobre la recarga")
+            self._writes_during_refresh = None
+            buscarslot.install_free_slots_cache(new_cache, now)
+            return len(new_cache)
+
+    def refresh(self, reason: str = "manual", days_ahead: Optional[int] = None) -> bool:
+        """🔄 Recarga bloqueante (desde hilos). Devuelve True si hay caché nueva."""
+        flight, leader = self._join_or_lead(reason)
+        if not leader:
+            flight.event.wait(AVAILABILITY_CACHE_CONFIG["WAIT_TIMEOUT"])
+            return flight.ok
+
+        days = days_ahead or AVAILABILITY_CACHE_CONFIG["DAYS_AHEAD"]
+        t0 = time.perf_counter()
+        now = get_cancun_time()
+        installed, error = None, None
+        try:
+            self._begin_refresh()
+            if CALENDAR_SYNC_CONFIG["MODE"] == "incremental":
+                fetched = calendar_event_index.collect(now)
+            else:
+                fetched = buscarslot.fetch_busy_intervals(now, days)
+            installed = self._install(now, days, fetched)
+        except Exception as e:
+            error = e
+        finally:
+            self._complete(flight, t0, installed, error)
+        return flight.ok
+
+    async def refresh_async(self, reason: str = "manual", days_ahead: Optional[int] = None) -> bool:
+        """🔄 Recarga sin bloquear el event loop. Devuelve True si hay caché nueva."""
+        flight, leader = self._join_or_lead(reason)
+        if not leader:
+            await asyncio.to_thread(flight.event.wait, AVAILABILITY_CACHE_CONFIG["WAIT_TIMEOUT"])
+            return flight.ok
+
+        days = days_ahead or AVAILABILITY_CACHE_CONFIG["DAYS_AHEAD"]
+        t0 = time.perf_counter()
+        now = get_cancun_time()
+        installed, error = None, None
+        try:
+            self._begin_refresh()
+            incremental = CALENDAR_SYNC_CONFIG["MODE"] == "incremental"
+            if CALENDAR_ASYNC_CONFIG["ENABLED"] and incremental:
+                fetched = await calendar_event_index.collect_async(now)
+            elif CALENDAR_ASYNC_CONFIG["ENABLED"]:
+                fetched = await buscarslot.fetch_busy_intervals_async(now, days)
+            elif incremental:
+                fetched = await asyncio.to_thread(calendar_event_index.collect, now)
+            else:
+                fetched = await asyncio.to_thread(buscarslot.fetch_busy_intervals, now, days)
+            installed = await asyncio.to_thread(self._install, now, days, fetched)
+        except Exception as e:
+            error = e
+        finally:
+            self._complete(flight, t0, installed, error)
+        return flight.ok
+
+    # ========== ESCRITURA DIRECTA (write-through) ==========
+
+    def apply_event_change(self, event: Dict[str, Any], *, replaces_existing: bool = False) -> None:
+        """
+        ✍️ Refleja al instante una cita creada, editada o cancelada por nosotros
+
+        Con el índice incremental se recalculan solo los días tocados (también
+        el día anterior de una cita movida). Sin índice se quitan los slots
+        que ocupa el evento; lo que se libera (cancelación o el horario
+        anterior de una cita editada) llega con un refresco en segundo plano.
+        """
+        t0 = time.perf_counter()
+        now = get_cancun_time()
+        days = AVAILABILITY_CACHE_CONFIG["DAYS_AHEAD"]
+        with self._write_lock:
+            if self._writes_during_refresh is not None:
+                self._writes_during_refresh.append((event, replaces_existing))
+            changed = self._apply_to_cache(event, replaces_existing, buscarslot.free_slots_cache, now, days)
+            if changed is None:
+                return
+            new_cache, touched = changed
+            buscarslot.install_free_slots_cache(new_cache, buscarslot.last_cache_update or now)
+        self.write_throughs += 1
+        logger.info(f"[PERF] Caché de slots actualizada al instante ({', '.join(sorted(touched))}) en {1000*(time.perf_counter()-t0):.1f} ms")
+
+    def _apply_to_cache(self, event: Dict[str, Any], replaces_existing: bool, current: Dict[str, List[str]],
+                        now, days: int) -> Optional[Tuple[Dict[str, List[str]], Set[str]]]:
+        """(caché nueva, días tocados) con el evento aplicado, o None si no cambia nada. Bajo _write_lock."""
+        if CALENDAR_SYNC_CONFIG["MODE"] == "incremental" and calendar_event_index.sync_token:
+            touched = calendar_event_index.apply([event])
+            if not touched:
+                return None
+            return calendar_event_index.build_days(now, days, current, touched=touched), touched
+        interval = event_interval(event)
+        if interval is None:
+            # Cancelación sin índice: no sabemos qué liberar sin consultar
+            self._request_refresh(after_change=True)
+            return None
+        touched = set(day_keys(interval))
+        new_cache = dict(current)
+        for key in touched & current.keys():
+            day = datetime.strptime(key, "%Y-%m-%d").date()
+            still_free = set(buscarslot._build_free_slots_for_day(day, [interval]))
+            new_cache[key] = [slot for slot in current[key] if slot in still_free]
+        if replaces_existing:
+            self._request_refresh(after_change=True)
+        return new_cache, touched
+
+    # ========== LECTURA ==========
+
+    def _needs_blocking_refresh(self) -> bool:
+        """True si hay que esperar; si solo está vencida pide refresco en segundo plano."""
+        age = self.age
+        if age is None or age > AVAILABILITY_CACHE_CONFIG["MAX_STALE"]:
+            self.blocking_refreshes += 1
+            return True
+        if age > AVAILABILITY_CACHE_CONFIG["TTL"]:
+            self.stale_served += 1
+            self._request_refresh()
+        return False
+
+    def ensure_fresh(self) -> None:
+        """Caché utilizable para una herramienta (hilo del pool)."""
+        if self._needs_blocking_refresh():
+            self.refresh(reason="sin caché" if self._updated_at is None else "caché muy vieja")
+
+    async def ensure_fresh_async(self) -> None:
+        """Caché utilizable sin bloquear el event loop."""
+        if self._needs_blocking_refresh():
+            await self.refresh_async(reason="sin caché" if self._updated_at is None else "caché muy vieja")
+
+    def ensure_fresh_nowait(self) -> None:
+        """Nunca espera: si la caché falta o venció, solo pide refresco en segundo plano."""
+        age = self.age
+        if age is None or age > AVAILABILITY_CACHE_CONFIG["TTL"]:
+            self._request_refresh()
+
+    # ========== SEGUNDO PLANO ==========
+
+    def _request_refresh(self, after_change: bool = False) -> None:
+        """
+        Dispara un refresco en segundo plano si no hay uno en curso.
+
+        after_change: lo pide una cita cancelada/editada. Si ya hay una recarga
+        en curso, su foto puede ser anterior al cambio: se marca como sucia y
+        al terminar corre una recarga más.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._schedule_refresh(after_change)
+        else:
+            # Llamado desde un hilo (herramienta en el pool): pasar al loop
+            loop.call_soon_threadsafe(self._schedule_refresh, after_change)
+
+    def _schedule_refresh(self, after_change: bool = False) -> None:
+        busy = self._refresh_task is not None and not self._refresh_task.done()
+        if busy or (after_change and self._flight is not None):
+            if after_change:
+                self._refresh_dirty = True
+            return
+        self._refresh_dirty = False
+        self._refresh_task = asyncio.create_task(self.refresh_async("segundo plano"), name="AvailabilityRefresh")
+        self._refresh_task.add_done_callback(self._after_refresh)
+
+    def _after_refresh(self, task: asyncio.Task) -> None:
+        """Si un cambio llegó durante la recarga, corre una más (ya sin recarga en curso)."""
+        if self._refresh_dirty and not task.cancelled():
+            logger.info("🔄 Recarga adicional: hubo cambios de cita durante la anterior")
+            self._schedule_refresh(after_change=True)
+
+    async def start(self) -> None:
+        """🚀 Primera carga y refresco periódico (llamar en el startup del servidor)"""
+        if self._loop_task and not self._loop_task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_task = asyncio.create_task(self._refresh_loop(), name="AvailabilityRefreshLoop")
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            self._schedule_refresh()
+            try:
+                ok = await asyncio.shield(self._refresh_task)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error refrescando slots libres: {e}")
+                ok = False
+            await asyncio.sleep(
+                AVAILABILITY_CACHE_CONFIG["REFRESH_INTERVAL"] if ok else AVAILABILITY_CACHE_CONFIG["ERROR_RETRY"]
+            )
+
+    async def stop(self) -> None:
+        """🔌 Detiene el refresco en segundo plano"""
+        for task in (self._loop_task, self._refresh_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._loop_task = None
+        self._refresh_task = None
+
+    # ========== MÉTRICAS ==========
+
+    def get_stats(self) -> Dict[str, Any]:
+        age = self.age
+        samples = self.refresh_ms
+        return {
+            "has_data": self._updated_at is not None,
+            "days_cached": len(buscarslot.free_slots_cache),
+            "age_seconds": round(age, 1) if age is not None else None,
+            "fresh": age is not None and age <= AVAILABILITY_CACHE_CONFIG["TTL"],
+            "refreshing": self._flight is not None,
+            "refresh_interval_s": AVAILABILITY_CACHE_CONFIG["REFRESH_INTERVAL"],
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "coalesced_waiters": self.coalesced,
+            "blocking_refreshes": self.blocking_refreshes,
+            "stale_served": self.stale_served,
+            "write_throughs": self.write_throughs,
+            "last_refresh_ms": round(samples[-1], 1) if samples else None,
+            "avg_refresh_ms": round(sum(samples) / len(samples), 1) if samples else None,
+            "max_refresh_ms": round(max(samples), 1) if samples else None,
+            "last_reason": self._last_reason,
+            "last_error": self._last_error,
+            "sync": calendar_event_index.get_stats(),
+        }
+
+
+class SlotHolds:
+    """
+    🔒 Apartados provisionales (con TTL) de slots ofrecidos
+
+    Cuando process_appointment_request ofrece horarios a una sesión, se
+    apartan por HOLD_SECONDS; otras sesiones no los ven mientras tanto.
+    Se liberan al agendar, al terminar la llamada o al vencer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._holds: Dict[Tuple[str, str], Tuple[str, float]] = {}   # (día, HH:MM) → (sesión, vence)
+
+        # Métricas
+        self.placed = 0
+        self.conflicts_avoided = 0
+        self.released = 0
+        self.expired = 0
+
+    def _purge(self, now: float) -> None:
+        expired = [key for key, (_, expires_at) in self._holds.items() if expires_at <= now]
+        for key in expired:
+            del self._holds[key]
+        self.expired += len(expired)
+
+    def hold(self, day_key: str, slots: List[str], session_id: Optional[str]) -> None:
+        """Aparta los slots ofrecidos a session_id (sin sesión no se aparta nada)."""
+        if not session_id or not slots:
+            return
+        now = time.monotonic()
+        expires_at = now + AVAILABILITY_CACHE_CONFIG["HOLD_SECONDS"]
+        with self._lock:
+            self._purge(now)
+            for slot in slots:
+                owner = self._holds.get((day_key, slot))
+                if owner is None or owner[0] == session_id:
+                    self._holds[(day_key, slot)] = (session_id, expires_at)
+                    self.placed += 1
+
+    def held_by_others(self, session_id: Optional[str]) -> Dict[str, Set[str]]:
+        """Slots apartados por OTRAS sesiones, por día (una sola pasada por búsqueda)."""
+        if not self._holds:
+            return {}
+        held: Dict[str, Set[str]] = {}
+        with self._lock:
+            self._purge(time.monotonic())
+            for (day_key, slot), (owner, _) in self._holds.items():
+                if owner != session_id:
+                    held.setdefault(day_key, set()).add(slot)
+        return held
+
+    def note_conflicts(self, count: int) -> None:
+        """Cuenta slots libres que no se ofrecieron por estar apartados."""
+        self.conflicts_avoided += count
+
+    def release_session(self, session_id: Optional[str]) -> None:
+        """Libera todos los apartados de una sesión (agendó o colgó)."""
+        if not session_id:
+            return
+        with self._lock:
+            keys = [key for key, (owner, _) in self._holds.items() if owner == session_id]
+            for key in keys:
+                del self._holds[key]
+        self.released += len(keys)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._purge(time.monotonic())
+            active = len(self._holds)
+        return {
+            "active": active,
+            "hold_seconds": AVAILABILITY_CACHE_CONFIG["HOLD_SECONDS"],
+            "placed": self.placed,
+            "conflicts_avoided": self.conflicts_avoided,
+            "released": self.released,
+            "expired": self.expired,
+        }
+
+
+# ===== INSTANCIA GLOBAL =====
+availability_cache = AvailabilityCache()
+slot_holds = SlotHolds()
+
+
+def record_calendar_change(event: Dict[str, Any], *, replaces_existing: bool = False,
+                           release_holds: bool = False) -> None:
+    """
+    ✍️ Write-through desde crear/editar/eliminar cita
+
+    La cita ya quedó en Google: un fallo aquí solo se registra y la
+    siguiente sincronización lo corrige.
+    """
+    try:
+        availability_cache.apply_event_change(event, replaces_existing=replaces_existing)
+        if release_holds:
+            from state_store import current_session_id
+            slot_holds.release_session(current_session_id.get())
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo actualizar la caché de slots tras el cambio de cita: {e}")
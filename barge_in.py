@@ -0,0 +1,170 @@
+# barge_in.py
+# -*- coding: utf-8 -*-
+"""
+✋ DETECCIÓN DE INTERRUPCIONES (BARGE-IN)
+=========================================
+Permite que el usuario interrumpa a la IA mientras habla.
+
+Dos condiciones para cortar el TTS:
+1. Energía: voz sostenida en el audio entrante (umbral en dBFS configurable).
+2. Texto: Deepgram transcribe palabras que NO son eco de lo que la IA
+   está diciendo (comparación de palabras contra el texto del TTS).
+
+Además, tras terminar de hablar, se descartan durante un breve periodo
+las transcripciones que son eco del último texto dicho.
+"""
+
+import logging
+import os
+import re
+import time
+import unicodedata
+from typing import Any, Dict, Optional, Set
+
+from ulaw_utils import frame_dbfs
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN DE BARGE-IN =====
+BARGE_IN_CONFIG = {
+    "ENABLED": os.getenv("BARGE_IN_ENABLED", "true").lower() == "true",
+    "ENERGY_THRESHOLD_DBFS": float(os.getenv("BARGE_IN_THRESHOLD_DBFS", "-35")),  # sensibilidad
+    "MIN_SPEECH_MS": int(os.getenv("BARGE_IN_MIN_SPEECH_MS", "300")),  # voz sostenida mínima
+    "REQUIRE_ENERGY": True,         # exigir energía además de transcripción
+    "GRACE_MS": 400,                # ignorar el arranque del TTS (eco inicial)
+    "MIN_WORDS": 2,                 # palabras mínimas no-eco para interrumpir
+    "ECHO_OVERLAP": 0.6,            # ≥60% de palabras del TTS = eco
+    "ECHO_TAIL_MS": 1500,           # descartar eco tras terminar de hablar
+    "FRAME_MS": 20,
+}
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _normalize_words(text: str) -> list:
+    """Palabras en minúsculas y sin acentos, para comparar eco."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _WORD.findall(text)
+
+
+class BargeInDetector:
+    """
+    🎯 Decide si el audio/transcripción entrante durante el TTS es una
+    interrupción real del usuario o eco de la propia IA
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = dict(BARGE_IN_CONFIG, **(config or {}))
+        self._reference_words: Set[str] = set()
+        self._playback_started_at: Optional[float] = None
+        self._playback_ended_at: Optional[float] = None
+        self._voiced_ms = 0
+
+        # Métricas
+        self.triggers = 0
+        self.echo_rejections = 0
+        self.energy_rejections = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.config["ENABLED"]
+
+    # ========== CICLO DE REPRODUCCIÓN ==========
+
+    def start_playback(self, text: str = "") -> None:
+        """🔊 La IA empieza a hablar: reinicia el detector con el texto de referencia"""
+        self._reference_words = set(_normalize_words(text))
+        self._playback_started_at = time.perf_counter()
+        self._playback_ended_at = None
+        self._voiced_ms = 0
+
+    def add_reference(self, text: str) -> None:
+        """➕ Segmento adicional del TTS incremental"""
+        self._reference_words.update(_normalize_words(text))
+
+    def end_playback(self) -> None:
+        """🔇 La IA terminó (o fue interrumpida)"""
+        self._playback_ended_at = time.perf_counter()
+        self._voiced_ms = 0
+
+    # ========== ENERGÍA ==========
+
+    def process_frame(self, audio: bytes) -> None:
+        """🎚️ Acumula voz sostenida a partir de la energía del audio entrante"""
+        if not audio:
+            return
+        frame_ms = len(audio) * 1000 // 8000 or self.config["FRAME_MS"]
+        if frame_dbfs(audio) >= self.config["ENERGY_THRESHOLD_DBFS"]:
+            self._voiced_ms += frame_ms
+        else:
+            # Decae más lento de lo que sube: tolera micro-pausas entre sílabas
+            self._voiced_ms = max(0, self._voiced_ms - frame_ms // 2)
+
+    @property
+    def speech_sustained(self) -> bool:
+        return self._voiced_ms >= self.config["MIN_SPEECH_MS"]
+
+    # ========== DECISIÓN ==========
+
+    def is_echo(self, transcript: str) -> bool:
+        """¿La transcripción repite mayormente lo que la IA está diciendo?"""
+        words = _normalize_words(transcript)
+        if not words or not self._reference_words:
+            return False
+        overlap = sum(1 for w in words if w in self._reference_words) / len(words)
+        return overlap >= self.config["ECHO_OVERLAP"]
+
+    def should_interrupt(self, transcript: str) -> bool:
+        """
+        ✋ ¿Cortar el TTS por esta transcripción recibida mientras la IA habla?
+        """
+        if not self.enabled or not transcript or not transcript.strip():
+            return False
+
+        if self._playback_started_at is not None:
+            elapsed_ms = 1000 * (time.perf_counter() - self._playback_started_at)
+            if elapsed_ms < self.config["GRACE_MS"]:
+                return False
+
+        words = _normalize_words(transcript)
+        if len(words) < self.config["MIN_WORDS"]:
+            return False
+
+        if self.is_echo(transcript):
+            self.echo_rejections += 1
+            logger.debug(f"🔁 Barge-in descartado (eco del TTS): '{transcript[:50]}'")
+            return False
+
+        if self.config["REQUIRE_ENERGY"] and not self.speech_sustained:
+            self.energy_rejections += 1
+            logger.debug(f"🔈 Barge-in descartado (sin voz sostenida, {self._voiced_ms} ms): '{transcript[:50]}'")
+            return False
+
+        self.triggers += 1
+        logger.info(f"✋ Barge-in detectado ({self._voiced_ms} ms de voz): '{transcript[:50]}'")
+        return True
+
+    def is_echo_tail(self, transcript: str) -> bool:
+        """
+        🔁 Justo después de hablar, ¿esta transcripción es eco del último TTS?
+        """
+        if not self.enabled or self._playback_ended_at is None:
+            return False
+        elapsed_ms = 1000 * (time.perf_counter() - self._playback_ended_at)
+        if elapsed_ms > self.config["ECHO_TAIL_MS"]:
+            return False
+        if self.is_echo(transcript):
+            self.echo_rejections += 1
+            return True
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold_dbfs": self.config["ENERGY_THRESHOLD_DBFS"],
+            "min_speech_ms": self.config["MIN_SPEECH_MS"],
+            "triggers": self.triggers,
+            "echo_rejections": self.echo_rejections,
+            "energy_rejections": self.energy_rejections,
+        }
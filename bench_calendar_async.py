@@ -0,0 +1,130 @@
+# bench_calendar_async.py
+# -*- coding: utf-8 -*-
+"""
+📏 BENCHMARK: GOOGLE CALENDAR EN HILOS vs CLIENTE ASÍNCRONO
+=============================================================
+Contra el servidor falso local (fake_calendar_server.py), lanza N
+peticiones concurrentes (mezcla de events.list?q= y freebusy.query):
+
+- "threads": googleapiclient (httplib2, un cliente por hilo) en un pool
+  del tamaño del pool "calendar" de tool_executor.
+- "async":   calendar_async.GoogleCalendarAsyncClient sobre httpx.
+
+Con --fail-rate > 0 también muestra cuántos reintentos (429/503) hizo
+el cliente asíncrono.
+
+Uso:
+    python bench_calendar_async.py --requests 200 --latency 0.15 --fail-rate 0.05
+"""
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_calendar_server import API_PREFIX, start_fake_calendar_server
+
+CALENDAR_ID = "bench@calendar"
+FREEBUSY_BODY = {
+    "timeMin": "2025-01-01T00:00:00-05:00",
+    "timeMax": "2025-03-31T00:00:00-05:00",
+    "timeZone": "America/Cancun",
+    "items": [{"id": CALENDAR_ID}],
+}
+
+
+def _summary(latencies_ms, wall_s):
+    ordered = sorted(latencies_ms)
+    return {
+        "ok": len(ordered),
+        "wall_s": round(wall_s, 2),
+        "p50_ms": round(statistics.median(ordered), 1) if ordered else None,
+        "p99_ms": round(ordered[int(0.99 * (len(ordered) - 1))], 1) if ordered else None,
+        "req_per_s": round(len(ordered) / wall_s, 1) if wall_s else None,
+    }
+
+
+def run_threads(root_url: str, total: int, workers: int) -> dict:
+    import httplib2
+    from googleapiclient.discovery import build
+
+    local = threading.local()
+
+    def service():
+        if getattr(local, "service", None) is None:
+            local.service = build("calendar", "v3", http=httplib2.Http(timeout=15),
+                                  static_discovery=True, cache_discovery=False,
+                                  client_options={"api_endpoint": root_url})
+        return local.service
+
+    def one(i: int) -> float:
+        t0 = time.perf_counter()
+        if i % 2:
+            service().freebusy().query(body=FREEBUSY_BODY).execute(num_retries=4)
+        else:
+            service().events().list(calendarId=CALENDAR_ID, q="998", singleEvents=True).execute(num_retries=4)
+        return 1000 * (time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    latencies = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(one, i) for i in range(total)]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                pass
+    return _summary(latencies, time.perf_counter() - t0)
+
+
+async def run_async(base_url: str, total: int) -> dict:
+    from calendar_async import GoogleCalendarAsyncClient, StaticTokenProvider
+
+    client = GoogleCalendarAsyncClient(base_url=base_url, token_provider=StaticTokenProvider())
+
+    async def one(i: int) -> float:
+        t0 = time.perf_counter()
+        if i % 2:
+            await client.freebusy_query(FREEBUSY_BODY)
+        else:
+            await client.events_list(CALENDAR_ID, q="998", singleEvents=True)
+        return 1000 * (time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*[one(i) for i in range(total)], return_exceptions=True)
+    stats = _summary([r for r in results if isinstance(r, float)], time.perf_counter() - t0)
+    stats["retries"] = sum(op["retries"] for op in client.get_stats()["operations"].values())
+    await client.close()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.15, help="segundos por petición del servidor falso")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=8, help="hilos del modo 'threads' (pool calendar)")
+    args = parser.parse_args()
+
+    server = start_fake_calendar_server(0, args.latency, args.fail_rate)
+    root_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    base_url = f"{root_url.rstrip('/')}{API_PREFIX}"
+
+    # Un par de eventos para que events.list/freebusy devuelvan algo
+    from fake_calendar_server import _FakeCalendarHandler
+    for hour in (9, 10, 11):
+        _FakeCalendarHandler.store.insert(CALENDAR_ID, {
+            "summary": "Paciente Bench", "description": "📞 Teléfono: 9981234567",
+            "start": {"dateTime": f"2025-01-15T{hour:02d}:00:00-05:00"},
+            "end": {"dateTime": f"2025-01-15T{hour:02d}:45:00-05:00"},
+        })
+
+    print(f"📅 {args.requests} peticiones, {args.latency}s de latencia, {args.fail_rate:.0%} fallos")
+    print(f"  threads  {run_threads(root_url, args.requests, args.workers)}")
+    print(f"  async    {asyncio.run(run_async(base_url, args.requests))}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bench_conversation_store.py
+# -*- coding: utf-8 -*-
+"""
+📏 BENCHMARK: THROUGHPUT DEL ALMACÉN DE CONVERSACIONES POR BACKEND
+====================================================================
+Simula turnos de chat como los de main._process_n8n_message:
+recent(20) → append(usuario) → append(asistente), repartidos entre
+varios hilos y conversaciones. Reporta mensajes/s y latencia de append.
+
+- memory: siempre.
+- sqlite: archivo temporal en modo WAL.
+- redis:  solo si hay un servidor RESP en --redis-url (si no, se omite).
+
+Uso:
+    python bench_conversation_store.py --conversations 200 --turns 20 --threads 8 \\
+        --redis-url redis://127.0.0.1:6379/15
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from conversation_store import (
+    ConversationStore,
+    MemoryConversationStore,
+    RedisConversationStore,
+    SQLiteConversationStore,
+)
+
+HISTORY_WINDOW = 20
+
+
+def run(store: ConversationStore, conversations: int, turns: int, threads: int) -> Dict:
+    ids = [f"bench-{store.backend}-{i}" for i in range(conversations)]
+    for cid in ids:
+        store.delete(cid)
+        store.create(cid, {"ended": False, "pulse_sent": False,
+                           "message_count": {"user": 0, "assistant": 0},
+                           "word_count": {"user": 0, "assistant": 0}})
+
+    def chat(cid: str) -> List[float]:
+        latencies = []
+        for turn in range(turns):
+            store.recent(cid, HISTORY_WINDOW)
+            for role in ("user", "assistant"):
+                t0 = time.perf_counter()
+                store.append(cid, {"role": role, "content": f"mensaje {turn} de prueba para {role}"}, count=True)
+                latencies.append(1000 * (time.perf_counter() - t0))
+        return latencies
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(l for chunk in pool.map(chat, ids) for l in chunk)
+    wall = time.perf_counter() - t0
+
+    # Verificación: nada se perdió con escrituras concurrentes
+    expected = 2 * turns
+    lost = sum(1 for cid in ids if len(store.history(cid)) != expected
+               or (store.get_state(cid) or {}).get("message_count", {}).get("user") != turns)
+    for cid in ids:
+        store.delete(cid)
+    return {
+        "messages": len(latencies),
+        "wall_s": round(wall, 2),
+        "msgs_per_s": round(len(latencies) / wall, 1),
+        "append_p50_ms": round(statistics.median(latencies), 3),
+        "append_p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))], 3),
+        "inconsistent_conversations": lost,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--redis-url", default=None, help="servidor RESP (opcional)")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="conv_bench_")
+    stores = [MemoryConversationStore(), SQLiteConversationStore(os.path.join(tmpdir, "conversations.db"))]
+    if args.redis_url:
+        redis_store = RedisConversationStore(args.redis_url, prefix="bench:conv:")
+        try:
+            redis_store.client.execute("PING")
+            stores.append(redis_store)
+        except OSError as e:
+            print(f"⚠️ Sin servidor RESP en {args.redis_url} ({e}); se omite redis")
+
+    print(f"💬 {args.conversations} conversaciones x {args.turns} turnos, {args.threads} hilos")
+    for store in stores:
+        print(f"  {store.backend:<7} {run(store, args.conversations, args.turns, args.threads)}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# bench_slot_index.py
+# -*- coding: utf-8 -*-
+"""
+📏 BENCHMARK: BÚSQUEDA DE SLOTS CON LISTAS vs ÍNDICE DE BITS
+=============================================================
+Sobre la MISMA caché sintética (91 días, ocupación aleatoria, rachas de
+días llenos) compara:
+
+- "legacy": el bucle anterior de process_appointment_request (listas de
+  "HH:MM", strptime por slot, día por día hasta 120).
+- "index":  buscarslot._search_slots sobre free_slots_index (slot_index.py).
+
+Primero verifica que ambas den exactamente la misma respuesta para todas
+las consultas; después mide el tiempo por consulta.
+
+Uso:
+    python bench_slot_index.py --queries 2000 --occupancy 0.7 --seed 7
+"""
+
+import argparse
+import logging
+import random
+import time
+from datetime import date, datetime, timedelta, time as dt_time
+from typing import Dict, List, Optional
+
+import pytz
+
+import buscarslot
+from buscarslot import (
+    MIN_ADVANCE_BOOKING_HOURS,
+    SINONIMOS_MANANA,
+    SINONIMOS_SEMANA,
+    SLOT_TIMES,
+    _format_time_for_text,
+    _pretty_hhmm,
+    _slots_for_franja,
+)
+
+CANCUN_TZ = pytz.timezone("America/Cancun")
+QUERIES = ["hoy", "mañana", "esta semana", "para el martes", "lo antes posible", "el 19", "la próxima semana"]
+PREFERENCES = [None, "mañana", "mediodia", "tarde"]
+
+
+def legacy_search(
+    now: datetime,
+    target_date: date,
+    query_lower: str,
+    original_time_preference: Optional[str],
+    more_late_param: bool,
+    more_early_param: bool,
+    requested_date_iso: str,
+    time_kw: Optional[str],
+    is_urgent_param: bool,
+) -> Dict:
+    """Bucle anterior (sin apartados), tal cual, leyendo buscarslot.free_slots_cache."""
+    today = now.date()
+    is_this_week = any(p in query_lower for p in SINONIMOS_SEMANA)
+    days_until_saturday = (5 - today.weekday()) % 7
+    is_today_request = target_date == today and "hoy" in query_lower
+    is_tomorrow_request = (
+        target_date == today + timedelta(days=1)
+        and any(kw in query_lower for kw in SINONIMOS_MANANA)
+    )
+    is_sunday_request = target_date.weekday() == 6
+
+    for day_offset in range(0, 120):
+        chk_date = target_date + timedelta(days=day_offset)
+        if chk_date.weekday() == 6:
+            continue
+
+        day_key = chk_date.strftime("%Y-%m-%d")
+        free_slots_for_day = buscarslot.free_slots_cache.get(day_key, []).copy()
+        current_time_preference_for_search = original_time_preference
+        current_day_available_slots: List[str] = []
+
+        if current_time_preference_for_search:
+            slots_in_preferred_franja = _slots_for_franja(free_slots_for_day, current_time_preference_for_search)
+            if chk_date == today:
+                future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
+                if future_dt.date() != today or now.time() >= dt_time(14, 0):
+                    slots_in_preferred_franja = []
+                else:
+                    limit = future_dt.time()
+                    slots_in_preferred_franja = [
+                        s for s in slots_in_preferred_franja
+                        if datetime.strptime(s, "%H:%M").time() >= limit
+                    ]
+            current_day_available_slots = slots_in_preferred_franja
+            if current_day_available_slots and (more_late_param or more_early_param):
+                if more_late_param:
+                    current_day_available_slots = current_day_available_slots[1:5]
+                if more_early_param:
+                    current_day_available_slots = current_day_available_slots[-5:-1]
+                if not current_day_available_slots:
+                    continue
+        else:
+            current_day_available_slots = free_slots_for_day.copy()
+            if chk_date == today:
+                future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
+                if future_dt.date() != today or now.time() >= dt_time(14, 0):
+                    current_day_available_slots = []
+                else:
+                    limit = future_dt.time()
+                    current_day_available_slots = [
+                        s for s in current_day_available_slots
+                        if datetime.strptime(s, "%H:%M").time() >= limit
+                    ]
+
+        if not current_day_available_slots and original_time_preference:
+            alternative_franjas = [f for f in ["mañana", "mediodia", "tarde"] if f != original_time_preference]
+            for alt_franja in alternative_franjas:
+                slots_in_alt_franja = _slots_for_franja(free_slots_for_day, alt_franja)
+                if chk_date == today:
+                    future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
+                    if future_dt.date() != today or now.time() >= dt_time(14, 0):
+                        slots_in_alt_franja = []
+                    else:
+                        limit = future_dt.time()
+                        slots_in_alt_franja = [
+                            s for s in slots_in_alt_franja
+                            if datetime.strptime(s, "%H:%M").time() >= limit
+                        ]
+                if slots_in_alt_franja:
+                    current_day_available_slots = slots_in_alt_franja
+                    current_time_preference_for_search = alt_franja
+                    break
+
+        if not current_day_available_slots:
+            continue
+
+        available = current_day_available_slots[:4]
+        result = {
+            "available_slots": available,
+            "available_pretty": [_pretty_hhmm(h) for h in available],
+            "available_text_format": [_format_time_for_text(h) for h in available],
+            "requested_time_kw": current_time_preference_for_search,
+        }
+        if (is_this_week and day_offset > days_until_saturday) or (
+            (is_today_request or is_tomorrow_request or is_sunday_request) and day_offset > 0
+        ):
+            return {"status": "SLOT_FOUND_LATER", "requested_date_iso": requested_date_iso,
+                    "suggested_date_iso": chk_date.isoformat(), **result}
+        return {"status": "SLOT_LIST", "date_iso": chk_date.isoformat(), **result}
+
+    return {
+        "status": "NO_SLOT",
+        "message": "sin_disponibilidad",
+        "requested_date_iso": requested_date_iso,
+        "requested_time_kw": time_kw,
+        "is_urgent": is_urgent_param,
+    }
+
+
+def build_cache(now: datetime, occupancy: float, rng: random.Random) -> Dict[str, List[str]]:
+    """91 días como los de build_free_slots_cache: domingos vacíos, rachas de días llenos."""
+    cache: Dict[str, List[str]] = {}
+    full_until = -1
+    for offset in range(91):
+        d = now.date() + timedelta(days=offset)
+        if offset > full_until and rng.random() < 0.05:
+            full_until = offset + rng.randint(3, 15)   # agenda llena varios días seguidos
+        if d.weekday() == 6 or offset <= full_until:
+            cache[d.strftime("%Y-%m-%d")] = []
+            continue
+        cache[d.strftime("%Y-%m-%d")] = [s["start"] for s in SLOT_TIMES if rng.random() >= occupancy]
+    return cache
+
+
+def make_queries(now: datetime, total: int, rng: random.Random) -> List[Dict]:
+    queries = []
+    for _ in range(total):
+        target = now.date() + timedelta(days=rng.randint(-2, 95))
+        preference = rng.choice(PREFERENCES)
+        direction = rng.choice([None, None, "late", "early"])
+        queries.append({
+            "now": now,
+            "target_date": target,
+            "query_lower": rng.choice(QUERIES),
+            "original_time_preference": preference,
+            "more_late_param": direction == "late",
+            "more_early_param": direction == "early",
+            "requested_date_iso": target.isoformat(),
+            "time_kw": preference,
+            "is_urgent_param": False,
+        })
+    return queries
+
+
+def _per_query_us(fn, queries: List[Dict], repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for q in queries:
+            fn(**q)
+    return 1e6 * (time.perf_counter() - t0) / (repeat * len(queries))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--occupancy", type=float, default=0.7, help="fracción de slots ocupados por día")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    rng = random.Random(args.seed)
+
+    # Tres "ahoras": antes de la regla de 6 h, a media mañana (con segundos) y después del cierre
+    for hhmmss in ((7, 0, 0), (9, 17, 30), (15, 0, 0)):
+        now = CANCUN_TZ.localize(datetime(2025, 3, 3, *hhmmss))   # lunes
+        buscarslot.install_free_slots_cache(build_cache(now, args.occupancy, rng), now)
+        queries = make_queries(now, args.queries, rng)
+
+        def index_search(**q):
+            return buscarslot._search_slots(index=buscarslot.free_slots_index, held={}, session_id=None, **q)
+
+        mismatches = [q for q in queries if legacy_search(**q) != index_search(**q)]
+        if mismatches:
+            q = mismatches[0]
+            raise SystemExit(f"❌ {len(mismatches)} respuestas distintas; ej. {q}:\n"
+                             f"  legacy {legacy_search(**q)}\n  index  {index_search(**q)}")
+
+        legacy_us = _per_query_us(legacy_search, queries, args.repeat)
+        index_us = _per_query_us(index_search, queries, args.repeat)
+        print(f"⏱️ now={now.strftime('%H:%M:%S')} {len(queries)} consultas idénticas | "
+              f"legacy {legacy_us:.1f} µs | index {index_us:.1f} µs | x{legacy_us / index_us:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# bench_text_jitter.py
+# -*- coding: utf-8 -*-
+"""
+📏 BENCHMARK: JITTER DEL AUDIO DE VOZ CON SESIONES DE TEXTO EN CURSO
+=====================================================================
+Mide cuánto se desvía el envío de paquetes de audio a Twilio (cada
+100 ms vía OutboundAudioScheduler) mientras N sesiones de texto
+esperan respuesta del modelo.
+
+Modos:
+- "blocking": cliente OpenAI síncrono llamado desde el event loop
+  (comportamiento anterior de aiagent_text.py).
+- "async":    _stream_completion de aiagent_text.py (AsyncOpenAI en streaming).
+
+El modelo se simula con un servidor local compatible con la API de
+OpenAI (latencia configurable), así el benchmark no gasta tokens.
+Requiere el mismo entorno (.env) que el servidor, porque aiagent_text
+importa las herramientas.
+
+Uso:
+    python bench_text_jitter.py --sessions 20 --latency 1.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_REPLY = "Claro, con gusto le ayudo a agendar su cita. ¿Qué día le acomoda?"
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Responde /chat/completions como OpenAI (JSON o SSE) tras una latencia fija."""
+
+    latency = 1.0
+
+    def log_message(self, *args):  # silencio
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        words = FAKE_REPLY.split(" ")
+        if not body.get("stream"):
+            time.sleep(self.latency)
+            payload = json.dumps({
+                "id": "bench", "object": "chat.completion", "created": 0, "model": body.get("model", "bench"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": FAKE_REPLY}, "finish_reason": "stop"}],
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        # Primer token tras la mitad de la latencia, el resto repartido
+        time.sleep(self.latency / 2)
+        for i, word in enumerate(words):
+            chunk = {
+                "id": "bench", "object": "chat.completion.chunk", "created": 0, "model": body.get("model", "bench"),
+                "choices": [{"index": 0, "delta": {"content": word + (" " if i < len(words) - 1 else "")}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.latency / 2 / len(words))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_fake_server(latency: float) -> ThreadingHTTPServer:
+    _FakeOpenAIHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def measure_voice_jitter(duration: float, work) -> dict:
+    """Envía audio por OutboundAudioScheduler (hasta `duration` s) mientras corre `work`."""
+    from outbound_audio import OutboundAudioScheduler
+
+    sent_at = []
+
+    async def websocket_send(message: str) -> None:
+        if '"media"' in message:
+            sent_at.append(time.perf_counter())
+
+    scheduler = OutboundAudioScheduler("bench", websocket_send)
+    scheduler.enqueue(b"\xFF" * int(8000 * duration))
+    await asyncio.sleep(0.3)  # dejar estabilizar el pacing
+    await work()
+    await asyncio.sleep(0.5)
+    await scheduler.close()
+
+    gaps_ms = [1000 * (b - a) for a, b in zip(sent_at, sent_at[1:])]
+    expected = 100.0  # 5 frames de 20 ms por paquete
+    deviations = sorted(abs(g - expected) for g in gaps_ms)
+    return {
+        "packets": len(sent_at),
+        "max_gap_ms": round(max(gaps_ms), 1) if gaps_ms else None,
+        "p50_jitter_ms": round(statistics.median(deviations), 1) if deviations else None,
+        "p99_jitter_ms": round(deviations[int(0.99 * (len(deviations) - 1))], 1) if deviations else None,
+    }
+
+
+async def run_blocking(sessions: int) -> None:
+    from openai import OpenAI
+
+    client = OpenAI(api_key="bench")
+    for _ in range(sessions):
+        # Cada webhook de texto hacía esto en el loop: todo se serializa y bloquea
+        client.chat.completions.create(model="bench", messages=[{"role": "user", "content": "hola"}])
+        await asyncio.sleep(0)
+
+
+async def run_async(sessions: int) -> None:
+    from aiagent_text import _stream_completion
+
+    await asyncio.gather(*[
+        _stream_completion([{"role": "user", "content": "hola"}], on_delta=None)
+        for _ in range(sessions)
+    ])
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=1.5, help="segundos por respuesta del modelo")
+    args = parser.parse_args()
+
+    server = start_fake_server(args.latency)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.setdefault("CHATGPT_SECRET_KEY", "bench")
+
+    duration = args.sessions * args.latency + 2
+    print(f"🎙️ {args.sessions} sesiones de texto, {args.latency}s por respuesta, {duration:.0f}s de audio")
+    for mode, work in (("blocking", run_blocking), ("async", run_async)):
+        t0 = time.perf_counter()
+        stats = await measure_voice_jitter(duration, lambda: work(args.sessions))
+        print(f"  {mode:9s} {stats}  ({time.perf_counter() - t0:.1f}s)")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
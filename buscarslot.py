@@ -8,11 +8,13 @@ Reemplaza íntegramente tu archivo original por este.
 import logging
 import re
 from datetime import datetime, timedelta, time as dt_time, date
-from typing import Dict, Optional, Tuple, Union, List
+from typing import Dict, Optional, Set, Tuple, Union, List
 from dateutil.relativedelta import relativedelta as rd
 import pytz
 import threading
 
+from slot_index import SlotIndex
+
 from utils import (
     initialize_google_calendar,
     get_cancun_time,
@@ -75,6 +77,10 @@ MIN_ADVANCE_BOOKING_HOURS = 6
 free_slots_cache: Dict[str, List[str]] = {}
 last_cache_update: Optional[datetime] = None
 CACHE_VALID_MINUTES = 15
+MAX_BATCH_QUERIES = 50   # process_appointment_request_batch
+
+# Índice compacto (bits por día) de free_slots_cache; se reconstruye al publicar
+free_slots_index: SlotIndex = SlotIndex.build({}, [s["start"] for s in SLOT_TIMES])
 
 # Cache lock local (ya no importado de utils)
 cache_lock = threading.Lock()
@@ -169,50 +175,78 @@ def parse_relative_date(q: str, today: date) -> Optional[date]:
 
 # ──────────── CACHÉ DE SLOTS ───────────────────────────────────────────────
 def load_free_slots_to_cache(days_ahead: int = 90) -> None:
-    """Precarga en memoria los slots libres de los próximos *days_ahead* días."""
-    global free_slots_cache, last_cache_update
-    with cache_lock:
-        logger.info("⏳ Cargando slots libres desde Google Calendar…")
-        free_slots_cache.clear()
-
-        service = initialize_google_calendar()
-        now = get_cancun_time()
-        body = {
-            "timeMin": now.isoformat(),
-            "timeMax": (now + timedelta(days=days_ahead)).isoformat(),
-            "timeZone": "America/Cancun",
-            "items": [{"id": GOOGLE_CALENDAR_ID}],
-        }
+    """
+    Recarga en memoria los slots libres de los próximos *days_ahead* días.
+    Una sola carga a la vez: si ya hay una en curso se espera a esa (availability_cache).
+    """
+    from availability_cache import availability_cache
+    availability_cache.refresh(reason="manual", days_ahead=days_ahead)
 
-        try:
-            result = service.freebusy().query(body=body).execute()
-            busy_raw = result["calendars"][GOOGLE_CALENDAR_ID]["busy"]
-        except Exception as e:
-            logger.error(f"Error freebusy: {e}")
-            last_cache_update = get_cancun_time()
-            return
-
-        busy_by_day: Dict[str, List[Tuple[datetime, datetime]]] = {}
-        for b in busy_raw:
-            start_l = convert_utc_to_cancun(b["start"])
-            end_l = convert_utc_to_cancun(b["end"])
-            key = start_l.strftime("%Y-%m-%d")
-            busy_by_day.setdefault(key, []).append((start_l, end_l))
-
-        for offset in range(days_ahead + 1):
-            d = now.date() + timedelta(days=offset)
-            key = d.strftime("%Y-%m-%d")
-
-            # Domingo sin citas
-            if d.weekday() == 6:
-                free_slots_cache[key] = []
-                continue
 
-            busy_intervals = busy_by_day.get(key, [])
-            free_slots_cache[key] = _build_free_slots_for_day(d, busy_intervals)
+async def load_free_slots_to_cache_async(days_ahead: int = 90) -> None:
+    """Igual que load_free_slots_to_cache, sin bloquear el event loop."""
+    from availability_cache import availability_cache
+    await availability_cache.refresh_async(reason="manual", days_ahead=days_ahead)
+
+
+def _freebusy_body(now: datetime, days_ahead: int) -> Dict:
+    return {
+        "timeMin": now.isoformat(),
+        "timeMax": (now + timedelta(days=days_ahead)).isoformat(),
+        "timeZone": "America/Cancun",
+        "items": [{"id": GOOGLE_CALENDAR_ID}],
+    }
+
+
+def fetch_busy_intervals(now: datetime, days_ahead: int) -> List[Dict]:
+    """Consulta freebusy (bloqueante) y devuelve los intervalos ocupados crudos."""
+    service = initialize_google_calendar()
+    result = service.freebusy().query(body=_freebusy_body(now, days_ahead)).execute()
+    return result["calendars"][GOOGLE_CALENDAR_ID]["busy"]
+
+
+async def fetch_busy_intervals_async(now: datetime, days_ahead: int) -> List[Dict]:
+    """Igual que fetch_busy_intervals, con el cliente asíncrono (calendar_async)."""
+    from calendar_async import calendar_async
+    result = await calendar_async.freebusy_query(_freebusy_body(now, days_ahead))
+    return result["calendars"][GOOGLE_CALENDAR_ID]["busy"]
+
+
+def build_free_slots_cache(now: datetime, days_ahead: int, busy_raw: List[Dict]) -> Dict[str, List[str]]:
+    """Arma un diccionario NUEVO día → slots libres a partir de los intervalos ocupados."""
+    busy_by_day: Dict[str, List[Tuple[datetime, datetime]]] = {}
+    for b in busy_raw:
+        start_l = convert_utc_to_cancun(b["start"])
+        end_l = convert_utc_to_cancun(b["end"])
+        key = start_l.strftime("%Y-%m-%d")
+        busy_by_day.setdefault(key, []).append((start_l, end_l))
+
+    new_cache: Dict[str, List[str]] = {}
+    for offset in range(days_ahead + 1):
+        d = now.date() + timedelta(days=offset)
+        key = d.strftime("%Y-%m-%d")
+
+        # Domingo sin citas
+        if d.weekday() == 6:
+            new_cache[key] = []
+            continue
+
+        busy_intervals = busy_by_day.get(key, [])
+        new_cache[key] = _build_free_slots_for_day(d, busy_intervals)
+    return new_cache
+
 
-        last_cache_update = get_cancun_time()
-        logger.info(f"✅ Slots libres precargados ({days_ahead} días)")
+def install_free_slots_cache(new_cache: Dict[str, List[str]], updated_at: datetime) -> None:
+    """
+    Publica una caché ya construida. Se reemplaza la referencia completa
+    (no clear+update), así quien lee nunca ve la caché a medio llenar.
+    """
+    global free_slots_cache, free_slots_index, last_cache_update
+    new_index = SlotIndex.build(new_cache, [s["start"] for s in SLOT_TIMES])
+    with cache_lock:
+        free_slots_cache = new_cache
+        free_slots_index = new_index
+        last_cache_update = updated_at
 
 
 def _build_free_slots_for_day(
@@ -236,13 +270,19 @@ def _build_free_slots_for_day(
 
 
 def ensure_cache_is_fresh() -> None:
-    """Recarga la caché si lleva más de CACHE_VALID_MINUTES sin actualizarse."""
-    global last_cache_update
-    if (
-        last_cache_update is None
-        or (get_cancun_time() - last_cache_update).total_seconds() > CACHE_VALID_MINUTES * 60
-    ):
-        load_free_slots_to_cache()
+    """
+    Garantiza caché utilizable sin pagar la recarga en la llamada:
+    si está vencida se sirve la actual y se refresca en segundo plano;
+    solo se espera si no hay caché o es demasiado vieja.
+    """
+    from availability_cache import availability_cache
+    availability_cache.ensure_fresh()
+
+
+async def ensure_cache_is_fresh_async() -> None:
+    """Versión asíncrona de ensure_cache_is_fresh (no bloquea el event loop)."""
+    from availability_cache import availability_cache
+    await availability_cache.ensure_fresh_async()
 
 
 
@@ -316,7 +356,74 @@ def process_appointment_request(
       is_urgent
     """
     ensure_cache_is_fresh()
+    from availability_cache import slot_holds
+    from state_store import current_session_id
+    session_id = current_session_id.get()  # slots apartados por otras sesiones no se ofrecen
+    return _answer_appointment_query(
+        get_cancun_time(),
+        free_slots_index,
+        slot_holds.held_by_others(session_id),
+        session_id,
+        user_query_for_date_time=user_query_for_date_time,
+        day_param=day_param,
+        month_param=month_param,
+        year_param=year_param,
+        fixed_weekday_param=fixed_weekday_param,
+        explicit_time_preference_param=explicit_time_preference_param,
+        is_urgent_param=is_urgent_param,
+        more_late_param=more_late_param,
+        more_early_param=more_early_param,
+    )
+
+
+def process_appointment_request_batch(queries: List[Dict]) -> List[Dict]:
+    """
+    📦 Varias consultas de disponibilidad en una sola llamada
+
+    Cada elemento de `queries` lleva los mismos parámetros que
+    process_appointment_request. La frescura de la caché se revisa una
+    vez y todas se evalúan contra la MISMA instantánea del índice (y la
+    misma hora), así que las respuestas son coherentes entre sí.
+    Devuelve los resultados en el mismo orden; una consulta inválida da
+    {"status": "ERROR", ...} sin tumbar a las demás.
+    """
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise ValueError(f"Máximo {MAX_BATCH_QUERIES} consultas por lote (llegaron {len(queries)})")
+
+    ensure_cache_is_fresh()
+    from availability_cache import slot_holds
+    from state_store import current_session_id
+    session_id = current_session_id.get()
+    index = free_slots_index   # instantánea: install_free_slots_cache reemplaza la referencia
     now = get_cancun_time()
+    held = slot_holds.held_by_others(session_id)
+
+    results: List[Dict] = []
+    for position, params in enumerate(queries):
+        try:
+            results.append(_answer_appointment_query(now, index, held, session_id, **params))
+        except Exception as e:
+            logger.warning(f"[APPT] Consulta {position} del lote inválida: {e}")
+            results.append({"status": "ERROR", "message": str(e)})
+    return results
+
+
+def _answer_appointment_query(
+    now: datetime,
+    index: SlotIndex,
+    held: Dict[str, Set[str]],
+    session_id: Optional[str],
+    user_query_for_date_time: str,
+    day_param: Optional[int] = None,
+    month_param: Optional[Union[str, int]] = None,
+    year_param: Optional[int] = None,
+    fixed_weekday_param: Optional[str] = None,
+    explicit_time_preference_param: Optional[str] = None,
+    is_urgent_param: bool = False,
+    more_late_param: bool = False,
+    more_early_param: bool = False
+) -> Dict:
+    """Interpreta la consulta y busca sobre la instantánea `index` (sin tocar la caché)."""
     today = now.date()
 
     # --- NORMALIZACIÓN / VALIDACIÓN BÁSICA ------------------------------
@@ -386,170 +493,154 @@ def process_appointment_request(
 
     requested_date_iso = target_date.isoformat()
 
-    def _filter_by_kw(slots: List[str]) -> List[str]:
-        if time_kw == "mañana":
-            return [s for s in slots if datetime.strptime(s, "%H:%M").time() <= dt_time(11, 45)]
-        if time_kw == "tarde":
-            return [s for s in slots if datetime.strptime(s, "%H:%M").time() >= dt_time(12, 30)]
-        if time_kw == "mediodia":
-            return [s for s in slots if dt_time(11, 0) <= datetime.strptime(s, "%H:%M").time() <= dt_time(13, 15)]
-        return slots
+    return _search_slots(
+        now=now,
+        target_date=target_date,
+        query_lower=user_query_for_date_time.lower(),
+        original_time_preference=explicit_time_preference_param,
+        more_late_param=more_late_param,
+        more_early_param=more_early_param,
+        requested_date_iso=requested_date_iso,
+        time_kw=time_kw,
+        is_urgent_param=is_urgent_param,
+        index=index,
+        held=held,
+        session_id=session_id,
+    )
 
 
+def _slot_list_result(fields: Dict, slots: List[str], time_kw_for_search: Optional[str]) -> Dict:
+    """Respuesta SLOT_LIST / SLOT_FOUND_LATER con los formatos de voz y texto."""
+    available = slots[:4]
+    return {
+        **fields,
+        "available_slots": available,
+        "available_pretty": [_pretty_hhmm(h) for h in available],            # Para la voz
+        "available_text_format": [_format_time_for_text(h) for h in available],  # Para el texto
+        "requested_time_kw": time_kw_for_search,
+    }
+
+
+def _search_slots(
+    now: datetime,
+    target_date: date,
+    query_lower: str,
+    original_time_preference: Optional[str],
+    more_late_param: bool,
+    more_early_param: bool,
+    requested_date_iso: str,
+    time_kw: Optional[str],
+    is_urgent_param: bool,
+    index: SlotIndex,
+    held: Dict[str, Set[str]],
+    session_id: Optional[str],
+) -> Dict:
+    """
+    🔎 Búsqueda de slot (máx 120 días) sobre una instantánea de free_slots_index
 
+    Mismas reglas que antes (franja preferida, franjas alternativas, regla
+    de 6 h, "más tarde / más temprano"), pero cada día es un AND de
+    máscaras y los días sin disponibilidad se saltan con next_available_day.
+    """
+    from availability_cache import slot_holds
 
-    # —— búsqueda de slot —— (máx 120 días) ────────────────────────────────
-    is_this_week = any(p in user_query_for_date_time.lower() for p in SINONIMOS_SEMANA)
-    days_until_saturday = (5 - today.weekday()) % 7  # 0=Lun … 5=Sáb
-    is_today_request = target_date == today and "hoy" in user_query_for_date_time.lower()
+    today = now.date()
 
+    # —— banderas de la consulta ——
+    is_this_week = any(p in query_lower for p in SINONIMOS_SEMANA)
+    days_until_saturday = (5 - today.weekday()) % 7  # 0=Lun … 5=Sáb
+    is_today_request = target_date == today and "hoy" in query_lower
     is_tomorrow_request = (
         target_date == today + timedelta(days=1)
-        and any(kw in user_query_for_date_time.lower() for kw in SINONIMOS_MANANA)
+        and any(kw in query_lower for kw in SINONIMOS_MANANA)
     )
     is_sunday_request = target_date.weekday() == 6  # domingo
-    
-    # Guardar la preferencia original de la franja del usuario
-    original_time_preference = explicit_time_preference_param
 
-    for day_offset in range(0, 120):
-        chk_date = target_date + timedelta(days=day_offset)
+    # Regla de "6 h antes" y cierre diario: slots de hoy que aún se pueden ofrecer
+    future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
+    if future_dt.date() != today or now.time() >= dt_time(14, 0):
+        today_mask = 0
+    else:
+        limit = future_dt.time()
+        limit_minutes = limit.hour * 60 + limit.minute + (1 if limit.second or limit.microsecond else 0)
+        today_mask = index.minutes_mask(limit_minutes)
+
+    last_date = target_date + timedelta(days=119)
+    chk_date: Optional[date] = target_date
+    while chk_date is not None and chk_date <= last_date:
+        # Saltar de golpe los días sin ningún slot libre
+        chk_date = index.next_available_day(chk_date)
+        if chk_date is None or chk_date > last_date:
+            break
+        next_date = chk_date + timedelta(days=1)
         if chk_date.weekday() == 6:  # domingo
+            chk_date = next_date
             continue
 
         day_key = chk_date.strftime("%Y-%m-%d")
-        free_slots_for_day = free_slots_cache.get(day_key, []).copy()
+        day_offset = (chk_date - target_date).days
+        free_mask = index.day_mask(chk_date)
+        held_mask = index.mask_of(held.get(day_key, ())) & free_mask
+        if held_mask:
+            slot_holds.note_conflicts(bin(held_mask).count("1"))
+        free_mask &= ~held_mask
+        if chk_date == today:
+            free_mask &= today_mask
 
-        # Reiniciar la franja de búsqueda para cada nuevo día al inicio de la iteración
-        # Esto asegura que siempre se intente la preferencia original primero en un nuevo día.
         current_time_preference_for_search = original_time_preference
-        
-        # Lista para guardar los slots encontrados en el día actual
-        current_day_available_slots: List[str] = []
-
-        # --- Intento 1: Buscar en la franja original del usuario (si la hay) ---
-        if current_time_preference_for_search:
-            slots_in_preferred_franja = _slots_for_franja(free_slots_for_day, current_time_preference_for_search)
-            
-            # Aplicar regla de "6 h antes" y cierre diario
-            if chk_date == today:
-                future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
-                if future_dt.date() != today or now.time() >= dt_time(14, 0):
-                    slots_in_preferred_franja = []
-                else:
-                    limit = future_dt.time()
-                    slots_in_preferred_franja = [
-                        s for s in slots_in_preferred_franja
-                        if datetime.strptime(s, "%H:%M").time() >= limit
-                    ]
-            
-            current_day_available_slots = slots_in_preferred_franja
-            
-            # Regla "más tarde / más temprano" solo para la primera franja intentada
-            if current_day_available_slots and (more_late_param or more_early_param):
-                if more_late_param:
-                    current_day_available_slots = current_day_available_slots[1:5] # siguientes 4
-                if more_early_param:
-                    current_day_available_slots = current_day_available_slots[-5:-1] # anteriores 4
-                if not current_day_available_slots:
-                    # Si no hay más slots en la dirección pedida en la franja preferida,
-                    # y el usuario pidió 'más tarde'/'más temprano', no intentamos otras franjas para ESE día.
-                    # Pasamos directamente al siguiente día.
-                    continue # Continúa al siguiente día en el bucle principal.
-
-        else: # Si no hay preferencia de franja original, todos los slots libres del día son el primer intento
-            current_day_available_slots = free_slots_for_day.copy()
-            # Aplicar regla de "6 h antes" y cierre diario (replicado para este caso)
-            if chk_date == today:
-                future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
-                if future_dt.date() != today or now.time() >= dt_time(14, 0):
-                    current_day_available_slots = []
-                else:
-                    limit = future_dt.time()
-                    current_day_available_slots = [
-                        s for s in current_day_available_slots
-                        if datetime.strptime(s, "%H:%M").time() >= limit
-                    ]
-
-
-        # --- Intento 2: Si no hay slots en la franja preferida, buscar en las otras del mismo día ---
-        found_alternative_franja = False
-        if not current_day_available_slots and original_time_preference: # Solo si hubo una preferencia original y no se encontró
+
+        # --- Intento 1: la franja original del usuario (o todo el día si no hay) ---
+        current_day_available_slots = index.slots(free_mask & index.franja_masks[original_time_preference])
+        if original_time_preference and current_day_available_slots and (more_late_param or more_early_param):
+            if more_late_param:
+                current_day_available_slots = current_day_available_slots[1:5]  # siguientes 4
+            if more_early_param:
+                current_day_available_slots = current_day_available_slots[-5:-1]  # anteriores 4
+            if not current_day_available_slots:
+                # Se agotó la dirección pedida en la franja preferida: no se prueban
+                # otras franjas de ESE día, se pasa al siguiente.
+                chk_date = next_date
+                continue
+
+        # --- Intento 2: otras franjas del mismo día ---
+        if not current_day_available_slots and original_time_preference:
             logger.info(f"No hay slots en la franja original '{original_time_preference}' para {day_key}. Buscando en otras franjas del mismo día.")
-            all_franjas = ["mañana", "mediodia", "tarde"]
-            alternative_franjas = [f for f in all_franjas if f != original_time_preference]
-
-            for alt_franja in alternative_franjas:
-                slots_in_alt_franja = _slots_for_franja(free_slots_for_day, alt_franja)
-                
-                # Aplicar regla de "6 h antes" y cierre diario (necesario replicar aquí)
-                if chk_date == today:
-                    future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
-                    if future_dt.date() != today or now.time() >= dt_time(14, 0):
-                        slots_in_alt_franja = []
-                    else:
-                        limit = future_dt.time()
-                        slots_in_alt_franja = [
-                            s for s in slots_in_alt_franja
-                            if datetime.strptime(s, "%H:%M").time() >= limit
-                        ]
-
-                if slots_in_alt_franja:
-                    current_day_available_slots = slots_in_alt_franja # Encontramos slots en una franja alternativa
-                    current_time_preference_for_search = alt_franja # Actualizamos la franja para el mensaje
-                    found_alternative_franja = True
-                    break # Salimos del bucle de franjas alternativas
-
-        # Si aún después de todos los intentos para el día actual no hay slots,
-        # o si la preferencia 'más tarde/temprano' agotó los slots, pasamos al siguiente día.
+            for alt_franja in ("mañana", "mediodia", "tarde"):
+                if alt_franja == original_time_preference:
+                    continue
+                alt_mask = free_mask & index.franja_masks[alt_franja]
+                if alt_mask:
+                    current_day_available_slots = index.slots(alt_mask)
+                    current_time_preference_for_search = alt_franja
+                    break
+
         if not current_day_available_slots:
+            chk_date = next_date
             continue
 
-        # ─ Si la consulta era "esta semana" y el hueco es > sábado, avisa ──
-        if is_this_week and day_offset > days_until_saturday:
-            available = current_day_available_slots[:4]
-            # Generamos las dos listas de formatos
-            available_slots_for_voice = [_pretty_hhmm(h) for h in available]
-            available_slots_for_text = [_format_time_for_text(h) for h in available]
-            return {
-                "status": "SLOT_FOUND_LATER",
-                "requested_date_iso": requested_date_iso,
-                "suggested_date_iso": chk_date.isoformat(),
-                "available_slots": available,
-                "available_pretty": available_slots_for_voice,      # Para la voz
-                "available_text_format": available_slots_for_text,  # NUEVO: para el texto
-                "requested_time_kw": current_time_preference_for_search
-            }
-        # ─ Si la consulta era "hoy" o "mañana" y el hueco cae otro día, avisa ─────────
-        # Y si se encontró un slot en el día actual pero no el día original de la consulta
-        if (is_today_request or is_tomorrow_request or is_sunday_request) and day_offset > 0:
-            available = current_day_available_slots[:4]
-            # Generamos las dos listas de formatos
-            available_slots_for_voice = [_pretty_hhmm(h) for h in available]
-            available_slots_for_text = [_format_time_for_text(h) for h in available]
-            return {
-                "status": "SLOT_FOUND_LATER",
-                "requested_date_iso": requested_date_iso,
-                "suggested_date_iso": chk_date.isoformat(),
-                "available_slots": available,
-                "available_pretty": available_slots_for_voice,      # Para la voz
-                "available_text_format": available_slots_for_text,  # NUEVO: para el texto
-                "requested_time_kw": current_time_preference_for_search
-            }
+        slot_holds.hold(day_key, current_day_available_slots[:4], session_id)
+
+        # ─ "esta semana" con hueco después del sábado, u "hoy"/"mañana"/domingo
+        #   con hueco otro día: se avisa que es más adelante ──────────────────
+        if (is_this_week and day_offset > days_until_saturday) or (
+            (is_today_request or is_tomorrow_request or is_sunday_request) and day_offset > 0
+        ):
+            return _slot_list_result(
+                {
+                    "status": "SLOT_FOUND_LATER",
+                    "requested_date_iso": requested_date_iso,
+                    "suggested_date_iso": chk_date.isoformat(),
+                },
+                current_day_available_slots,
+                current_time_preference_for_search,
+            )
 
         # ─ Devolver los horarios del día hallado ──────────────────────────
-        available = current_day_available_slots[:4]
-        # Generamos las dos listas de formatos
-        available_slots_for_voice = [_pretty_hhmm(h) for h in available]
-        available_slots_for_text = [_format_time_for_text(h) for h in available]
-        return {
-            "status": "SLOT_LIST",
-            "date_iso": chk_date.isoformat(),
-            "available_slots": available,
-            "available_pretty": available_slots_for_voice,      # Para la voz
-            "available_text_format": available_slots_for_text,  # NUEVO: para el texto
-            "requested_time_kw": current_time_preference_for_search
-        }
+        return _slot_list_result(
+            {"status": "SLOT_LIST", "date_iso": chk_date.isoformat()},
+            current_day_available_slots,
+            current_time_preference_for_search,
+        )
 
     # ─ Si no se encontró nada en 120 días ─────────────────────────────────
     return {
@@ -558,4 +649,4 @@ def process_appointment_request(
         "requested_date_iso": requested_date_iso,
         "requested_time_kw": time_kw,
         "is_urgent": is_urgent_param,
-    }
\ No newline at end of file
+    }
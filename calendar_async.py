@@ -0,0 +1,356 @@
+# calendar_async.py
+# -*- coding: utf-8 -*-
+"""
+⚡ CLIENTE ASÍNCRONO DE GOOGLE CALENDAR
+========================================
+Cliente mínimo sobre httpx.AsyncClient (HTTP/2 si `h2` está instalado)
+para las operaciones calientes:
+
+- freebusy.query
+- events.list (q=...)
+- events.get / events.insert / events.patch / events.delete
+
+Características:
+- Autenticación de service account con JWT (RS256) → token en caché,
+  renovado antes de expirar (una sola renovación a la vez).
+- Reintentos con backoff exponencial + jitter en 429/5xx y errores de red
+  (respeta Retry-After). events.insert manda un id propio: si un reintento
+  recibe 409, el primer POST sí se aplicó y se devuelve ese evento; igual
+  un 404/410 en el reintento de events.delete cuenta como borrado.
+- Hooks de tiempos por petición y métricas por operación.
+- Apuntable a un servidor falso local (fake_calendar_server.py) con
+  GOOGLE_CALENDAR_API_URL / GOOGLE_CALENDAR_TOKEN_URI.
+
+Las variantes *_async de buscarslot, crearcita, editarcita, eliminarcita
+y utils lo usan; se activan en el agente con CALENDAR_ASYNC_ENABLED=true.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Union
+from urllib.parse import quote
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN =====
+CALENDAR_ASYNC_CONFIG = {
+    "ENABLED": os.getenv("CALENDAR_ASYNC_ENABLED", "false").lower() == "true",
+    "BASE_URL": os.getenv("GOOGLE_CALENDAR_API_URL", "https://www.googleapis.com/calendar/v3"),
+    "TOKEN_URI": os.getenv("GOOGLE_CALENDAR_TOKEN_URI", "https://oauth2.googleapis.com/token"),
+    "SCOPE": "https://www.googleapis.com/auth/calendar",
+    "TIMEOUT": 10.0,
+    "MAX_CONNECTIONS": 20,
+    "MAX_RETRIES": 4,
+    "BACKOFF_BASE": 0.25,           # segundos, se duplica en cada intento
+    "BACKOFF_MAX": 4.0,
+    "TOKEN_REFRESH_MARGIN": 300,    # renovar si quedan < 5 min
+    "LATENCY_HISTORY": 100,
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# hook(operación, status, ms, intentos)
+TimingHook = Callable[[str, int, float, int], Union[None, Awaitable[None]]]
+
+
+class CalendarAPIError(Exception):
+    """❌ Error de la API de Calendar (status HTTP + mensaje de Google)"""
+
+    def __init__(self, status: int, message: str, operation: str = "", attempts: int = 1):
+        self.status = status
+        self.operation = operation
+        self.attempts = attempts
+        super().__init__(f"{operation} HTTP {status}: {message}")
+
+
+# ========== TOKENS ==========
+
+class ServiceAccountTokenProvider:
+    """
+    🔑 Token OAuth de la service account vía JWT bearer (sin googleapiclient)
+    """
+
+    def __init__(self, service_account_info: Optional[Dict[str, Any]] = None,
+                 token_uri: Optional[str] = None):
+        self._info = service_account_info
+        self.token_uri = token_uri or CALENDAR_ASYNC_CONFIG["TOKEN_URI"]
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self.refreshes = 0
+
+    def _service_account_info(self) -> Dict[str, Any]:
+        if self._info is None:
+            # Mismas variables de entorno que utils.initialize_google_calendar
+            from utils import GOOGLE_CLIENT_EMAIL, GOOGLE_PRIVATE_KEY, GOOGLE_PRIVATE_KEY_ID
+            self._info = {
+                "client_email": GOOGLE_CLIENT_EMAIL,
+                "private_key": GOOGLE_PRIVATE_KEY,
+                "private_key_id": GOOGLE_PRIVATE_KEY_ID,
+            }
+        return self._info
+
+    def _signed_assertion(self) -> str:
+        from google.auth import crypt, jwt
+
+        info = self._service_account_info()
+        signer = crypt.RSASigner.from_service_account_info(info)
+        now = int(time.time())
+        payload = {
+            "iss": info["client_email"],
+            "scope": CALENDAR_ASYNC_CONFIG["SCOPE"],
+            "aud": self.token_uri,
+            "iat": now,
+            "exp": now + 3600,
+        }
+        assertion = jwt.encode(signer, payload)
+        return assertion.decode("utf-8") if isinstance(assertion, bytes) else assertion
+
+    def _expiring(self) -> bool:
+        return not self._token or time.time() > self._expires_at - CALENDAR_ASYNC_CONFIG["TOKEN_REFRESH_MARGIN"]
+
+    async def get_token(self, http: httpx.AsyncClient, *, force: bool = False) -> str:
+        """Token vigente; renueva antes de expirar (una sola renovación concurrente)."""
+        if not force and not self._expiring():
+            return self._token  # type: ignore[return-value]
+        async with self._lock:
+            if force or self._expiring():
+                t0 = time.perf_counter()
+                try:
+                    response = await http.post(self.token_uri, data={
+                        "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+                        "assertion": self._signed_assertion(),
+                    })
+                except httpx.TransportError as e:
+                    raise CalendarAPIError(0, str(e), "token") from e
+                if response.status_code != 200:
+                    raise CalendarAPIError(response.status_code, response.text[:200], "token")
+                data = response.json()
+                self._token = data["access_token"]
+                self._expires_at = time.time() + int(data.get("expires_in", 3600))
+                self.refreshes += 1
+                logger.info(f"[LATENCIA] Token de Calendar (JWT) obtenido en {1000*(time.perf_counter()-t0):.1f} ms")
+        return self._token  # type: ignore[return-value]
+
+
+class StaticTokenProvider:
+    """🔑 Token fijo (servidor falso local / pruebas)"""
+
+    def __init__(self, token: str = "fake-token"):
+        self.token = token
+        self.refreshes = 0
+
+    async def get_token(self, http: httpx.AsyncClient, *, force: bool = False) -> str:
+        return self.token
+
+
+# ========== CLIENTE ==========
+
+class GoogleCalendarAsyncClient:
+    """
+    🎯 Operaciones calientes de Google Calendar sin bloquear el event loop
+    """
+
+    def __init__(self, base_url: Optional[str] = None, token_provider=None):
+        self.base_url = (base_url or CALENDAR_ASYNC_CONFIG["BASE_URL"]).rstrip("/")
+        self.token_provider = token_provider or ServiceAccountTokenProvider()
+        self._http: Optional[httpx.AsyncClient] = None
+        self._hooks: List[TimingHook] = []
+
+        # Métricas por operación
+        self._calls: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._retries: Dict[str, int] = {}
+        self._latency_ms: Dict[str, Deque[float]] = {}
+
+    # ----- HTTP -----
+
+    @staticmethod
+    def _http2_available() -> bool:
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                http2=self._http2_available(),
+                timeout=CALENDAR_ASYNC_CONFIG["TIMEOUT"],
+                limits=httpx.Limits(
+                    max_connections=CALENDAR_ASYNC_CONFIG["MAX_CONNECTIONS"],
+                    max_keepalive_connections=CALENDAR_ASYNC_CONFIG["MAX_CONNECTIONS"],
+                ),
+            )
+        return self._http
+
+    async def close(self) -> None:
+        """🔌 Cierra el cliente HTTP compartido"""
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+
+    def add_timing_hook(self, hook: TimingHook) -> None:
+        """⏱️ Registra hook(operación, status, ms, intentos) para cada petición"""
+        self._hooks.append(hook)
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), CALENDAR_ASYNC_CONFIG["BACKOFF_MAX"])
+            except ValueError:
+                pass
+        base = CALENDAR_ASYNC_CONFIG["BACKOFF_BASE"] * (2 ** attempt)
+        return min(CALENDAR_ASYNC_CONFIG["BACKOFF_MAX"], base) * random.uniform(0.5, 1.0)
+
+    async def _request(self, operation: str, method: str, path: str, *,
+                       params: Optional[Dict[str, Any]] = None,
+                       json_body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        🌐 Petición con token, reintentos y métricas
+
+        Returns:
+            JSON de la respuesta ({} si no hay cuerpo, p.ej. DELETE)
+        """
+        http = self._client()
+        url = f"{self.base_url}{path}"
+        t0 = time.perf_counter()
+        attempt = 0
+        auth_retried = False
+        status = 0
+        self._calls[operation] = self._calls.get(operation, 0) + 1
+
+        try:
+            while True:
+                token = await self.token_provider.get_token(http)
+                try:
+                    response = await http.request(
+                        method, url, params=params, json=json_body,
+                        headers={"Authorization": f"Bearer {token}"},
+                    )
+                    status = response.status_code
+                except httpx.TransportError as e:
+                    status = 0
+                    if attempt >= CALENDAR_ASYNC_CONFIG["MAX_RETRIES"]:
+                        raise CalendarAPIError(0, str(e), operation, attempt + 1) from e
+                    response = None
+
+                if response is not None:
+                    if status == 401 and not auth_retried:
+                        # Token revocado/expirado antes de tiempo: renovar una vez
+                        auth_retried = True
+                        await self.token_provider.get_token(http, force=True)
+                        continue
+                    if status < 400:
+                        return response.json() if response.content else {}
+                    if status not in RETRY_STATUSES or attempt >= CALENDAR_ASYNC_CONFIG["MAX_RETRIES"]:
+                        raise CalendarAPIError(status, response.text[:300], operation, attempt + 1)
+
+                delay = self._backoff(attempt, response.headers.get("Retry-After") if response is not None else None)
+                attempt += 1
+                self._retries[operation] = self._retries.get(operation, 0) + 1
+                logger.warning(f"🔁 Calendar {operation}: HTTP {status or 'red'}, reintento {attempt} en {delay*1000:.0f} ms")
+                await asyncio.sleep(delay)
+        except CalendarAPIError:
+            self._errors[operation] = self._errors.get(operation, 0) + 1
+            raise
+        finally:
+            elapsed_ms = 1000 * (time.perf_counter() - t0)
+            self._latency_ms.setdefault(
+                operation, deque(maxlen=CALENDAR_ASYNC_CONFIG["LATENCY_HISTORY"])
+            ).append(elapsed_ms)
+            logger.debug(f"[PERF] Calendar {operation} HTTP {status} en {elapsed_ms:.1f} ms ({attempt + 1} intento(s))")
+            for hook in self._hooks:
+                try:
+                    result = hook(operation, status, elapsed_ms, attempt + 1)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.debug(f"Error en hook de tiempos de Calendar: {e}")
+
+    @staticmethod
+    def _cal(calendar_id: str) -> str:
+        return quote(calendar_id, safe="")
+
+    # ----- Operaciones -----
+
+    async def freebusy_query(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._request("freebusy.query", "POST", "/freeBusy", json_body=body)
+
+    async def events_list(self, calendar_id: str, **params: Any) -> Dict[str, Any]:
+        params = {k: (str(v).lower() if isinstance(v, bool) else v) for k, v in params.items() if v is not None}
+        return await self._request("events.list", "GET", f"/calendars/{self._cal(calendar_id)}/events", params=params)
+
+    async def events_get(self, calendar_id: str, event_id: str) -> Dict[str, Any]:
+        return await self._request("events.get", "GET",
+                                   f"/calendars/{self._cal(calendar_id)}/events/{quote(event_id, safe='')}")
+
+    async def events_insert(self, calendar_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        ➕ Inserta con id generado aquí (base32hex): el POST no es idempotente,
+        así que si un reintento choca con 409 es porque el primer intento sí
+        llegó a Google y solo se perdió la respuesta → se devuelve ese evento.
+        """
+        body = dict(body)
+        body.setdefault("id", uuid.uuid4().hex)   # [0-9a-f] ⊂ base32hex, 32 caracteres
+        try:
+            return await self._request("events.insert", "POST", f"/calendars/{self._cal(calendar_id)}/events",
+                                       json_body=body)
+        except CalendarAPIError as e:
+            if e.status != 409 or e.attempts < 2:
+                raise
+            logger.warning(f"🔁 Calendar events.insert: 409 en reintento, el evento {body['id']} ya existía")
+            return await self.events_get(calendar_id, body["id"])
+
+    async def events_patch(self, calendar_id: str, event_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._request("events.patch", "PATCH",
+                                   f"/calendars/{self._cal(calendar_id)}/events/{quote(event_id, safe='')}",
+                                   json_body=body)
+
+    async def events_delete(self, calendar_id: str, event_id: str) -> Dict[str, Any]:
+        """
+        🗑️ Borra un evento. Un 404/410 en un reintento significa que el primer
+        DELETE sí se aplicó y solo se perdió la respuesta → se toma como éxito.
+        """
+        try:
+            return await self._request("events.delete", "DELETE",
+                                       f"/calendars/{self._cal(calendar_id)}/events/{quote(event_id, safe='')}")
+        except CalendarAPIError as e:
+            if e.status not in (404, 410) or e.attempts < 2:
+                raise
+            logger.warning(f"🔁 Calendar events.delete: {e.status} en reintento, el evento {event_id} ya estaba borrado")
+            return {}
+
+    # ----- Métricas -----
+
+    def get_stats(self) -> Dict[str, Any]:
+        operations = {}
+        for operation, calls in self._calls.items():
+            samples = sorted(self._latency_ms.get(operation, ()))
+            operations[operation] = {
+                "calls": calls,
+                "errors": self._errors.get(operation, 0),
+                "retries": self._retries.get(operation, 0),
+                "p50_ms": round(samples[len(samples) // 2], 1) if samples else None,
+                "max_ms": round(samples[-1], 1) if samples else None,
+            }
+        return {
+            "enabled": CALENDAR_ASYNC_CONFIG["ENABLED"],
+            "base_url": self.base_url,
+            "http2": self._http2_available(),
+            "token_refreshes": getattr(self.token_provider, "refreshes", 0),
+            "operations": operations,
+        }
+
+
+# ===== INSTANCIA GLOBAL =====
+calendar_async = GoogleCalendarAsyncClient()
@@ -0,0 +1,285 @@
+# calendar_sync.py
+# -*- coding: utf-8 -*-
+"""
+🔁 SINCRONIZACIÓN INCREMENTAL DE DISPONIBILIDAD (syncToken)
+=============================================================
+En vez de volver a pedir freebusy de 90 días y reconstruir todos los
+días, se mantiene un índice local de eventos:
+
+1. Sincronización completa: events.list (singleEvents, desde hoy) →
+   índice evento → intervalo ocupado, y nextSyncToken.
+2. Incremental: events.list?syncToken=... devuelve SOLO lo que cambió
+   (altas, cambios y cancelaciones). Se recalculan únicamente los días
+   tocados por esos eventos; el costo escala con los cambios, no con
+   el horizonte.
+3. Si Google responde 410 (token vencido) → sincronización completa.
+
+Lo usa availability_cache cuando AVAILABILITY_SYNC_MODE=incremental.
+"""
+
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import pytz
+
+import buscarslot
+from utils import GOOGLE_CALENDAR_ID, convert_utc_to_cancun, initialize_google_calendar
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN =====
+CALENDAR_SYNC_CONFIG = {
+    "MODE": os.getenv("AVAILABILITY_SYNC_MODE", "incremental").lower(),  # "incremental" | "freebusy"
+    "FULL_RESYNC_INTERVAL": 6 * 3600,   # red de seguridad: completa cada 6 h
+    "PAGE_SIZE": 250,
+}
+
+CANCUN_TZ = pytz.timezone("America/Cancun")
+
+Interval = Tuple[datetime, datetime]
+
+
+class SyncTokenExpired(Exception):
+    """⌛ Google invalidó el syncToken (HTTP 410): hay que sincronizar completo"""
+
+
+def _is_gone(error: Exception) -> bool:
+    """410 tanto de googleapiclient (HttpError.resp.status) como de calendar_async (status)."""
+    status = getattr(error, "status", None) or getattr(getattr(error, "resp", None), "status", None)
+    return str(status) == "410"
+
+
+def event_interval(event: Dict[str, Any]) -> Optional[Interval]:
+    """Intervalo ocupado del evento en hora de Cancún (None si no ocupa agenda)."""
+    if event.get("status") == "cancelled" or event.get("transparency") == "transparent":
+        return None
+    start, end = event.get("start", {}), event.get("end", {})
+    if start.get("dateTime") and end.get("dateTime"):
+        return convert_utc_to_cancun(start["dateTime"]), convert_utc_to_cancun(end["dateTime"])
+    if start.get("date") and end.get("date"):
+        # Evento de día completo: ocupa desde las 00:00 hasta el día final (exclusivo)
+        s = CANCUN_TZ.localize(datetime.fromisoformat(start["date"]))
+        e = CANCUN_TZ.localize(datetime.fromisoformat(end["date"]))
+        return s, e
+    return None
+
+
+def day_keys(interval: Interval) -> List[str]:
+    """Días (YYYY-MM-DD) que toca un intervalo."""
+    start, end = interval
+    last = (end - timedelta(seconds=1)).date() if end > start else start.date()
+    keys, d = [], start.date()
+    while d <= last:
+        keys.append(d.strftime("%Y-%m-%d"))
+        d += timedelta(days=1)
+    return keys
+
+
+class CalendarEventIndex:
+    """
+    🗂️ Índice local de eventos ocupados, mantenido con syncToken
+
+    Las lecturas de red (collect) no tocan el índice; lo modifican
+    finish() y las escrituras directas de availability_cache, siempre
+    bajo el lock de escritura de availability_cache.
+    """
+
+    def __init__(self):
+        self.intervals: Dict[str, Interval] = {}       # event_id → intervalo
+        self.by_day: Dict[str, Set[str]] = {}          # día → event_ids
+        self.sync_token: Optional[str] = None
+        self.last_full_sync: Optional[float] = None
+
+        # Métricas
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.tokens_expired = 0
+        self.last_changes = 0
+        self.last_days_recomputed = 0
+
+    # ========== ÍNDICE ==========
+
+    def needs_full_sync(self) -> bool:
+        return (
+            self.sync_token is None
+            or self.last_full_sync is None
+            or time.time() - self.last_full_sync > CALENDAR_SYNC_CONFIG["FULL_RESYNC_INTERVAL"]
+        )
+
+    def _remove(self, event_id: str, touched: Set[str]) -> None:
+        interval = self.intervals.pop(event_id, None)
+        if interval is None:
+            return
+        for key in day_keys(interval):
+            touched.add(key)
+            ids = self.by_day.get(key)
+            if ids:
+                ids.discard(event_id)
+                if not ids:
+                    del self.by_day[key]
+
+    def apply(self, events: List[Dict[str, Any]]) -> Set[str]:
+        """Aplica eventos nuevos/cambiados/cancelados. Devuelve los días tocados."""
+        touched: Set[str] = set()
+        for event in events:
+            event_id = event.get("id")
+            if not event_id:
+                continue
+            self._remove(event_id, touched)
+            interval = event_interval(event)
+            if interval is None:
+                continue
+            self.intervals[event_id] = interval
+            for key in day_keys(interval):
+                touched.add(key)
+                self.by_day.setdefault(key, set()).add(event_id)
+        return touched
+
+    def busy_for_day(self, key: str) -> List[Interval]:
+        return [self.intervals[event_id] for event_id in self.by_day.get(key, ())]
+
+    def _reset(self) -> None:
+        self.intervals.clear()
+        self.by_day.clear()
+        self.sync_token = None
+
+    # ========== CONSTRUCCIÓN DE LA CACHÉ ==========
+
+    def build_days(self, now: datetime, days_ahead: int, current: Dict[str, List[str]],
+                   touched: Optional[Set[str]] = None) -> Dict[str, List[str]]:
+        """
+        Caché nueva para el horizonte. Con `touched` solo se recalculan esos
+        días (y los que entraron al horizonte); el resto se reutiliza.
+        """
+        new_cache: Dict[str, List[str]] = {}
+        recomputed = 0
+        for offset in range(days_ahead + 1):
+            d: date = now.date() + timedelta(days=offset)
+            key = d.strftime("%Y-%m-%d")
+            if touched is not None and key not in touched and key in current:
+                new_cache[key] = current[key]
+                continue
+            # Domingo sin citas
+            new_cache[key] = [] if d.weekday() == 6 else buscarslot._build_free_slots_for_day(d, self.busy_for_day(key))
+            recomputed += 1
+        self.last_days_recomputed = recomputed
+        return new_cache
+
+    # ========== SINCRONIZACIÓN ==========
+
+    @staticmethod
+    def _full_params(now: datetime) -> Dict[str, Any]:
+        start_of_today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        # Sin timeMax: el token sigue sirviendo cuando el horizonte avanza
+        return {"timeMin": start_of_today.isoformat(), "singleEvents": True, "showDeleted": False,
+                "maxResults": CALENDAR_SYNC_CONFIG["PAGE_SIZE"]}
+
+    def _incremental_params(self) -> Dict[str, Any]:
+        return {"syncToken": self.sync_token, "singleEvents": True,
+                "maxResults": CALENDAR_SYNC_CONFIG["PAGE_SIZE"]}
+
+    def finish(self, full: bool, events: List[Dict[str, Any]], next_sync_token: Optional[str],
+               now: datetime, days_ahead: int, current: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Aplica lo traído por collect/collect_async y devuelve la caché nueva (sin red)."""
+        if full:
+            self._reset()
+            self.apply(events)
+            self.full_syncs += 1
+            self.last_full_sync = time.time()
+            new_cache = self.build_days(now, days_ahead, current, touched=None)
+        else:
+            touched = self.apply(events)
+            self.incremental_syncs += 1
+            new_cache = self.build_days(now, days_ahead, current, touched=touched)
+        self.sync_token = next_sync_token
+        self.last_changes = len(events)
+        logger.info(
+            f"[PERF] Sync {'completa' if full else 'incremental'} de Calendar: "
+            f"{len(events)} eventos, {self.last_days_recomputed} días recalculados"
+        )
+        return new_cache
+
+    def collect(self, now: datetime) -> Tuple[bool, List[Dict[str, Any]], Optional[str]]:
+        """🔄 Trae los cambios (bloqueante, googleapiclient): (completa, eventos, token)."""
+        service = initialize_google_calendar()
+
+        def list_page(params: Dict[str, Any]) -> Dict[str, Any]:
+            return service.events().list(calendarId=GOOGLE_CALENDAR_ID, **params).execute()
+
+        full = self.needs_full_sync()
+        try:
+            events, token = self._collect(list_page, self._full_params(now) if full else self._incremental_params())
+        except SyncTokenExpired:
+            full = True
+            events, token = self._collect(list_page, self._full_params(now))
+        return full, events, token
+
+    async def collect_async(self, now: datetime) -> Tuple[bool, List[Dict[str, Any]], Optional[str]]:
+        """🔄 Igual que collect, con el cliente asíncrono (calendar_async)."""
+        from calendar_async import calendar_async
+
+        async def list_page(params: Dict[str, Any]) -> Dict[str, Any]:
+            return await calendar_async.events_list(GOOGLE_CALENDAR_ID, **params)
+
+        full = self.needs_full_sync()
+        try:
+            events, token = await self._collect_async(list_page, self._full_params(now) if full else self._incremental_params())
+        except SyncTokenExpired:
+            full = True
+            events, token = await self._collect_async(list_page, self._full_params(now))
+        return full, events, token
+
+    def _expired(self) -> SyncTokenExpired:
+        self.tokens_expired += 1
+        logger.warning("⌛ syncToken de Calendar vencido (410): sincronización completa")
+        return SyncTokenExpired()
+
+    def _collect(self, list_page: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 params: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        events: List[Dict[str, Any]] = []
+        while True:
+            try:
+                page = list_page(params)
+            except Exception as e:
+                if "syncToken" in params and _is_gone(e):
+                    raise self._expired() from e
+                raise
+            events.extend(page.get("items", []))
+            if not page.get("nextPageToken"):
+                return events, page.get("nextSyncToken")
+            params = dict(params, pageToken=page["nextPageToken"])
+
+    async def _collect_async(self, list_page: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                             params: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        events: List[Dict[str, Any]] = []
+        while True:
+            try:
+                page = await list_page(params)
+            except Exception as e:
+                if "syncToken" in params and _is_gone(e):
+                    raise self._expired() from e
+                raise
+            events.extend(page.get("items", []))
+            if not page.get("nextPageToken"):
+                return events, page.get("nextSyncToken")
+            params = dict(params, pageToken=page["nextPageToken"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": CALENDAR_SYNC_CONFIG["MODE"],
+            "has_sync_token": self.sync_token is not None,
+            "indexed_events": len(self.intervals),
+            "full_syncs": self.full_syncs,
+            "incremental_syncs": self.incremental_syncs,
+            "tokens_expired": self.tokens_expired,
+            "last_changes": self.last_changes,
+            "last_days_recomputed": self.last_days_recomputed,
+            "last_full_sync_age_s": round(time.time() - self.last_full_sync, 1) if self.last_full_sync else None,
+        }
+
+
+# ===== INSTANCIA GLOBAL =====
+calendar_event_index = CalendarEventIndex()
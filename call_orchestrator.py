@@ -27,9 +27,10 @@ from twilio_handler import TwilioHandler
 from audio_manager import AudioManager
 from conversation_flow import ConversationFlow
 from integration_manager import IntegrationManager
-from buscarslot import load_free_slots_to_cache
+from availability_cache import availability_cache, slot_holds
 from utils import get_cancun_time, cierre_con_despedida, terminar_llamada_twilio
-from state_store import session_state
+from state_store import current_session_id, session_store
+from tts_cache import greeting_cache
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +44,9 @@ CALL_CONFIG = {
     "LATENCY_THRESHOLD": 0.05,     # 50ms para mensaje de espera
 }
 
+# Saludo fijo (se pre-renderiza una vez y se reproduce desde caché)
+GREETING_TEXT = "Hola, gracias por comunicarte con I-A Factory Cancún. Mi nombre es Alex, ¿con quién tengo el gusto?. For English say 'English please'"
+
 
 @dataclass
 class CallState:
@@ -130,14 +134,12 @@ class CallOrchestrator:
         """
         📦 Pre-carga datos necesarios para la llamada
         """
-        logger.info("📦 Pre-cargando datos...")
-        
+        # Los slots libres los mantiene availability_cache en segundo plano:
+        # la llamada no recarga freebusy, solo pide refresco si la caché venció
+        t0 = time.perf_counter()
         try:
-            await asyncio.gather(
-                asyncio.to_thread(load_free_slots_to_cache, 90),
-                return_exceptions=True
-            )
-            logger.info("✅ Datos pre-cargados")
+            availability_cache.ensure_fresh_nowait()
+            logger.info(f"[LATENCIA] Pre-carga de datos en {1000*(time.perf_counter()-t0):.1f} ms")
         except Exception as e:
             logger.warning(f"⚠️ Error pre-cargando datos: {e}")
     
@@ -174,11 +176,19 @@ class CallOrchestrator:
             f"StreamSID: {self.call_state.stream_sid}"
         )
         
-        # Inicializar sesión en state_store
-        session_state[self.call_state.call_sid or "unknown_call_sid"] = {
-            "start_time": datetime.now().isoformat(),
-            "events": []
-        }
+        # Inicializar sesión en state_store; las tareas creadas desde aquí heredan la sesión
+        current_session_id.set(self.call_state.call_sid)
+        session_store.get(self.call_state.call_sid or "unknown_call_sid").update(
+            start_time=datetime.now().isoformat(),
+            events=[],
+        )
+        
+        # Crear AudioManager YA para poder saludar mientras se conectan STT/TTS
+        self.audio_manager = AudioManager(
+            stream_sid=self.call_state.stream_sid or "unknown",
+            websocket_send=self.twilio_handler.send_json
+        )
+        greeting_started = await self._play_cached_greeting()
         
         # Inicializar componentes de audio y conversación
         await self._initialize_components()
@@ -189,8 +199,9 @@ class CallOrchestrator:
             name=f"Monitor_{self.call_state.call_sid}"
         )
         
-        # Enviar saludo inicial
-        await self._send_greeting()
+        # Saludo en vivo solo si no estaba en caché
+        if not greeting_started:
+            await self._send_greeting()
     
     async def _handle_audio_chunk(self, audio_bytes: bytes) -> None:
         """
@@ -225,6 +236,13 @@ class CallOrchestrator:
         if self.conversation_flow and not self.call_state.ended:
             self.conversation_flow.process_transcript(transcript, is_final)
     
+    def _handle_turn_signal(self, kind: str, data: dict) -> None:
+        """
+        🏁 Reenvía señales de fin de turno de Deepgram a ConversationFlow
+        """
+        if self.conversation_flow and not self.call_state.ended:
+            self.conversation_flow.on_turn_signal(kind, data)
+    
     async def _initialize_components(self) -> None:
         """
         🔧 Inicializa todos los componentes de la llamada
@@ -240,11 +258,12 @@ class CallOrchestrator:
             # === PASO 1: AUDIO MANAGER ===
             logger.info("🎵 Inicializando AudioManager...")
             
-            # Crear AudioManager
-            self.audio_manager = AudioManager(
-                stream_sid=self.call_state.stream_sid or "unknown",
-                websocket_send=self.twilio_handler.send_json
-            )
+            # Crear AudioManager (si el saludo en caché no lo creó ya)
+            if not self.audio_manager:
+                self.audio_manager = AudioManager(
+                    stream_sid=self.call_state.stream_sid or "unknown",
+                    websocket_send=self.twilio_handler.send_json
+                )
             
             # === PASO 2: CONVERSATION FLOW ===
             logger.info("🗣️ Inicializando ConversationFlow...")
@@ -255,33 +274,38 @@ class CallOrchestrator:
                 response_handler=self._handle_ai_response,
                 audio_manager=self.audio_manager
             )
-            # Pasar la referencia a AIAgent
-            if hasattr(self, 'conversation_flow'):
-                from aiagent import ai_agent
-                ai_agent.conversation_flow = self.conversation_flow
+            # Registrar el flujo en el contexto de ESTA sesión del agente
+            from aiagent import ai_agent
+            ai_agent.attach_conversation_flow(self.conversation_flow.session_id, self.conversation_flow)
             
             # NUEVO: Establecer referencia al manager en ConversationFlow
             setattr(self.conversation_flow, '_manager_reference', self)
             
-            logger.info("✅ ConversationFlow inicializado")
+            # Interrupciones del usuario mientras la IA habla
+            self.audio_manager.on_barge_in = self.conversation_flow.on_barge_in
+            # Señales de fin de turno de Deepgram (speech_final / UtteranceEnd)
+            self.audio_manager.on_turn_signal = self._handle_turn_signal
             
-            # === PASO 3: INICIALIZAR STT ===
-            logger.info("🎤 Inicializando STT...")
+            logger.info("✅ ConversationFlow inicializado")
             
-            stt_success = await self.audio_manager.initialize_stt(
-                on_transcript=self._handle_transcript,
-                on_disconnect=self._handle_deepgram_disconnect
+            # === PASOS 3 y 4: INICIALIZAR STT Y TTS EN PARALELO ===
+            logger.info("🎤🔊 Inicializando STT y TTS en paralelo...")
+            t_init = time.perf_counter()
+            
+            stt_success, tts_success = await asyncio.gather(
+                self.audio_manager.initialize_stt(
+                    on_transcript=self._handle_transcript,
+                    on_disconnect=self._handle_deepgram_disconnect,
+                    call_sid=self.call_state.call_sid
+                ),
+                self.audio_manager.initialize_tts()
             )
+            logger.info(f"[LATENCIA] STT + TTS inicializados en {1000*(time.perf_counter()-t_init):.1f} ms")
             
             if not stt_success:
                 logger.error("❌ No se pudo inicializar STT")
                 return
             
-            # === PASO 4: INICIALIZAR TTS ===
-            logger.info("🔊 Inicializando TTS...")
-            
-            tts_success = await self.audio_manager.initialize_tts()
-            
             if not tts_success:
                 logger.warning("⚠️ No se pudo inicializar TTS WebSocket, usará fallback HTTP")
             
@@ -306,6 +330,31 @@ class CallOrchestrator:
     
     # ========== FLUJO DE CONVERSACIÓN ==========
     
+    async def _play_cached_greeting(self) -> bool:
+        """
+        💾 Reproduce el saludo pre-renderizado en cuanto llega el evento start
+        
+        Returns:
+            bool: True si el saludo salió desde caché
+        """
+        greeting = self._generate_greeting()
+        audio = greeting_cache.get(greeting)
+        if audio is None:
+            logger.info("💾 Saludo no está en caché, se usará TTS en vivo")
+            # Renderizar en segundo plano para las siguientes llamadas
+            asyncio.create_task(greeting_cache.get_or_render(greeting))
+            return False
+        
+        started = await self.audio_manager.play_cached_audio(
+            audio,
+            on_complete=self._on_greeting_complete,
+            label="saludo",
+            text=greeting
+        )
+        if started:
+            logger.info(f"[LATENCIA] Saludo desde caché iniciado a {1000*(time.perf_counter()-self.call_state.start_time):.1f} ms del inicio de la llamada")
+        return started
+    
     async def _send_greeting(self) -> None:
         """
         👋 Envía el saludo inicial
@@ -327,7 +376,7 @@ class CallOrchestrator:
         🎨 Genera el saludo inicial.
         """
         # El saludo es ahora fijo y no depende de la hora del día.
-        return "Hola, gracias por comunicarte con I-A Factory Cancún. Mi nombre es Alex, ¿con quién tengo el gusto?. For English say 'English please'"
+        return GREETING_TEXT
     
     async def _on_greeting_complete(self) -> None:
         """
@@ -575,9 +624,17 @@ class CallOrchestrator:
             # === PASO 4: LIMPIEZA FINAL ===
             logger.info("🧹 Limpieza final...")
             
-            # Limpiar session_state
+            # Liberar slots apartados para esta llamada
+            slot_holds.release_session(self.call_state.call_sid)
+
+            # Contexto del agente de esta llamada
+            if self.conversation_flow:
+                from aiagent import ai_agent
+                ai_agent.release_session(self.conversation_flow.session_id)
+            
+            # Descartar el estado de ESTA llamada (no el de las demás)
             try:
-                session_state.clear()
+                session_store.end(self.call_state.call_sid)
                 logger.info("✅ Session state limpiado")
             except Exception as e:
                 logger.error(f"❌ Error limpiando session state: {e}")
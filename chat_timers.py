@@ -0,0 +1,207 @@
+# chat_timers.py
+# -*- coding: utf-8 -*-
+"""
+⏲️ TEMPORIZADORES DE CHATS DE TEXTO (PULSO Y CIERRE)
+=====================================================
+Antes un monitor despertaba cada 60 s y recorría TODAS las
+conversaciones: el costo crecía con las sesiones y un pulso o cierre
+podía llegar hasta un minuto tarde.
+
+Ahora cada conversación tiene su siguiente vencimiento en un min-heap:
+- Pulso a los 20 min sin actividad, cierre a los 60 min.
+- Cada mensaje reprograma en O(log n): se sube una generación y las
+  entradas viejas del heap se descartan al salir (borrado perezoso).
+- Una sola tarea duerme exactamente hasta el vencimiento más próximo y
+  dispara de golpe todo lo vencido (expiración en bloque).
+- Los vencimientos salen de last_activity_ts/pulse_sent del almacén de
+  conversaciones: al arrancar se reconstruye el heap desde ahí, así que
+  con SQLite/Redis los temporizadores sobreviven a reinicios.
+
+El manejador recibe (conversation_id, tipo) y debe revalidar contra el
+almacén: con varios workers otro pudo haber recibido mensajes después.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN =====
+CHAT_TIMERS_CONFIG = {
+    "PULSE_AFTER": 20 * 60,   # segundos sin actividad → pulso
+    "CLOSE_AFTER": 60 * 60,   # segundos sin actividad → cierre
+    "COMPACT_MIN": 256,       # entradas viejas toleradas antes de compactar el heap
+}
+
+PULSE = "pulse"
+CLOSE = "close"
+
+TimerHandler = Callable[[str, str], Awaitable[None]]
+
+
+class ChatTimerScheduler:
+    """
+    🗓️ Min-heap de vencimientos (pulso / cierre) por conversación
+
+    Uso:
+        await chat_timers.start(handler, conversation_store_async)
+        chat_timers.touch(conversation_id, last_activity_ts)   # en cada mensaje
+        chat_timers.cancel(conversation_id)                     # al cerrar
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, str, str, int]] = []   # (vence, orden, conversación, tipo, generación)
+        self._generation: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._handler: Optional[TimerHandler] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+        # Métricas
+        self.scheduled = 0
+        self.fired = 0
+        self.stale_skipped = 0
+        self.compactions = 0
+        self.last_lateness_ms = 0.0
+        self.max_lateness_ms = 0.0
+
+    # ========== PROGRAMACIÓN ==========
+
+    def touch(self, conversation_id: str, last_activity_ts: float, pulse_sent: bool = False) -> None:
+        """Reprograma pulso y cierre a partir de la última actividad (O(log n))."""
+        generation = self._generation.get(conversation_id, 0) + 1
+        self._generation[conversation_id] = generation
+        if not pulse_sent:
+            self._push(last_activity_ts + CHAT_TIMERS_CONFIG["PULSE_AFTER"], conversation_id, PULSE, generation)
+        self._push(last_activity_ts + CHAT_TIMERS_CONFIG["CLOSE_AFTER"], conversation_id, CLOSE, generation)
+        self._maybe_compact()
+
+    def cancel(self, conversation_id: str) -> None:
+        """Olvida la conversación; sus entradas en el heap quedan viejas."""
+        self._generation.pop(conversation_id, None)
+        self._maybe_compact()
+
+    def _push(self, deadline: float, conversation_id: str, kind: str, generation: int) -> None:
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (deadline, next(self._seq), conversation_id, kind, generation))
+        self.scheduled += 1
+        if self._wakeup is not None and (earliest is None or deadline < earliest):
+            self._wakeup.set()   # nuevo vencimiento más próximo: re-calcular el sueño
+
+    def _is_live(self, conversation_id: str, generation: int) -> bool:
+        return self._generation.get(conversation_id) == generation
+
+    def _maybe_compact(self) -> None:
+        live = 2 * len(self._generation)
+        if len(self._heap) - live > max(CHAT_TIMERS_CONFIG["COMPACT_MIN"], live):
+            self._heap = [entry for entry in self._heap if self._is_live(entry[2], entry[4])]
+            heapq.heapify(self._heap)
+            self.compactions += 1
+
+    def pop_due(self, now: float) -> List[Tuple[str, str]]:
+        """Saca TODO lo vencido en una pasada (expiración en bloque)."""
+        due: List[Tuple[str, str]] = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, conversation_id, kind, generation = heapq.heappop(self._heap)
+            if not self._is_live(conversation_id, generation):
+                self.stale_skipped += 1
+                continue
+            lateness_ms = 1000 * (now - deadline)
+            self.last_lateness_ms = lateness_ms
+            self.max_lateness_ms = max(self.max_lateness_ms, lateness_ms)
+            if kind == CLOSE:
+                self._generation.pop(conversation_id, None)   # nada más que disparar
+            due.append((conversation_id, kind))
+        return due
+
+    # ========== CICLO DE VIDA ==========
+
+    async def start(self, handler: TimerHandler, store: Any = None) -> None:
+        """Arranca la tarea; si se pasa el almacén, reconstruye los vencimientos desde él."""
+        if self._task is not None:
+            return
+        self._handler = handler
+        self._wakeup = asyncio.Event()
+        if store is not None:
+            await self.rebuild(store)
+        self._task = asyncio.create_task(self._run(), name="ChatTimers")
+
+    async def rebuild(self, store: Any) -> int:
+        """Reprograma desde el almacén persistente (fachada async; arranque / reinicio del worker)."""
+        restored = 0
+        for conversation_id in await store.conversation_ids():
+            state = await store.get_state(conversation_id) or {}
+            if state.get("ended") or not state.get("last_activity_ts"):
+                continue
+            self.touch(conversation_id, state["last_activity_ts"], pulse_sent=bool(state.get("pulse_sent")))
+            restored += 1
+        if restored:
+            logger.info(f"⏲️ {restored} temporizadores de chat restaurados desde el almacén")
+        return restored
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # Se limpia ANTES de revisar: un touch posterior vuelve a despertar
+                self._wakeup.clear()
+                for conversation_id, kind in self.pop_due(time.time()):
+                    self._fire(conversation_id, kind)
+                delay = self._heap[0][0] - time.time() if self._heap else None
+                if delay is None or delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                logger.info("Temporizadores de chats de texto detenidos")
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error en temporizadores de chat: {e}")
+                await asyncio.sleep(1.0)
+
+    def _fire(self, conversation_id: str, kind: str) -> None:
+        self.fired += 1
+        task = asyncio.create_task(self._handle(conversation_id, kind), name=f"ChatTimer_{kind}_{conversation_id}")
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _handle(self, conversation_id: str, kind: str) -> None:
+        try:
+            await self._handler(conversation_id, kind)
+        except Exception as e:
+            logger.error(f"❌ Error en temporizador '{kind}' de {conversation_id}: {e}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self._generation),
+            "heap_entries": len(self._heap),
+            "next_deadline_in_s": round(self._heap[0][0] - time.time(), 1) if self._heap else None,
+            "scheduled": self.scheduled,
+            "fired": self.fired,
+            "stale_skipped": self.stale_skipped,
+            "compactions": self.compactions,
+            "last_lateness_ms": round(self.last_lateness_ms, 1),
+            "max_lateness_ms": round(self.max_lateness_ms, 1),
+            "pulse_after_s": CHAT_TIMERS_CONFIG["PULSE_AFTER"],
+            "close_after_s": CHAT_TIMERS_CONFIG["CLOSE_AFTER"],
+        }
+
+
+# ===== INSTANCIA GLOBAL =====
+chat_timers = ChatTimerScheduler()
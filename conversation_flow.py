@@ -14,30 +14,63 @@ Este módulo controla CUÁNDO y CÓMO fluye la conversación:
 
 import asyncio
 import logging
+import os
+import re
 import time
 from typing import List, Dict, Optional, Callable, Awaitable
 from dataclasses import dataclass, field
 from datetime import datetime
 
 from state_store import emit_latency_event
-from aiagent import generate_ai_response
+from aiagent import generate_ai_response, generate_raw_ai_response, commit_ai_response
+from turn_detector import TurnDetector
 
 logger = logging.getLogger(__name__)
 
 # ===== CONFIGURACIÓN DE TIEMPOS =====
 TIMING_CONFIG = {
     # ⏱️ CRÍTICO: No cambiar sin pruebas exhaustivas
-    "PAUSE_DETECTION": 1.0,        # Reducido de 1.0 a 0.8 segundos
+    "PAUSE_DETECTION": 1.0,        # Respaldo fijo si Deepgram no da señales de fin de turno
     "PAUSE_DETECTION_FOR_PHONE": 1.5,  # Pausa extendida para números telefónicos
     "MAX_WAIT_TIME": 15.0,          # Máximo espera antes de forzar envío
     "MIN_TEXT_LENGTH": 2,          # Mínimo de caracteres para procesar
     "LATENCY_THRESHOLD": 0.05,     # 50ms para mensaje de espera
+    "STREAM_TTS": True,            # Enviar oraciones a ElevenLabs mientras Groq genera
+    "END_CALL_TTS_WAIT": 10.0,     # Espera máxima del audio en curso antes de despedirse
+    "BARGE_IN_AI_WAIT": 10.0,      # Espera máxima a que termine la IA interrumpida
+    # Generación especulativa: lanzar Groq con texto estable antes del fin de turno
+    "SPECULATIVE_LLM": os.getenv("SPECULATIVE_LLM_ENABLED", "false").lower() == "true",
+    "SPECULATION_STABLE_MS": int(os.getenv("SPECULATION_STABLE_MS", "250")),
+    "SPECULATION_MIN_CHARS": 8,    # no especular con "sí", "eh"...
 }
 
+_SPECULATION_NORMALIZE = re.compile(r"[^\w]+", re.UNICODE)
+
+# Disculpa fija cuando falla la IA (se pre-renderiza en la caché de audio)
+TECHNICAL_ERROR_TEXT = "Disculpe, tuve un problema técnico. ¿Podría repetir?"
+
 # ===== TIPOS =====
 ResponseHandler = Callable[[str, Optional[Callable]], Awaitable[None]]
 
 
+def _speculation_key(text: str) -> str:
+    """Texto comparable entre parcial y final (sin puntuación ni mayúsculas)."""
+    return " ".join(_SPECULATION_NORMALIZE.sub(" ", text.casefold()).split())
+
+
+@dataclass
+class Speculation:
+    """
+    🔮 Generación de Groq lanzada antes de confirmar el turno
+    """
+    text: str
+    key: str
+    history_len: int
+    task: asyncio.Task
+    started_at: float
+    finished_at: Optional[float] = None
+
+
 @dataclass
 class ConversationState:
     """
@@ -68,6 +101,12 @@ class ConversationState:
     # NUEVO: Tracking de actividad de audio
     last_audio_chunk_time: float = 0.0
     audio_chunks_since_last_transcript: int = 0
+    # Fin de turno adaptativo
+    pause_deadline: Optional[float] = None      # cuándo vence el timer actual
+    resume_wait_since: Optional[float] = None   # final recibido, esperando si sigue hablando
+    # Barge-in: el usuario interrumpió la última respuesta
+    interrupted: bool = False
+    barge_in_count: int = 0
 
 
 class ConversationFlow:
@@ -96,6 +135,13 @@ class ConversationFlow:
         self.state = ConversationState()
         self.current_ai_task: Optional[asyncio.Task] = None
         self.audio_manager = audio_manager
+        self.turn_detector = TurnDetector()
+        
+        # Generación especulativa
+        self.speculation: Optional[Speculation] = None
+        self._speculation_timer: Optional[asyncio.Task] = None
+        self._speculation_candidate = ""
+        self.speculation_stats = {"started": 0, "hits": 0, "misses": 0, "cancelled": 0, "saved_ms": 0.0}
         
         logger.info(f"🗣️ ConversationFlow creado para sesión: {session_id}")
     
@@ -132,36 +178,95 @@ class ConversationFlow:
         if transcript and transcript.strip():
             logger.debug(f"📝 Transcript: final={is_final}, text='{transcript[:60]}...'")
             
+            # Pausa intra-turno: desde el último final hasta que vuelve a hablar
+            if self.state.resume_wait_since is not None and self.state.pending_finals:
+                self.turn_detector.observe_gap(now - self.state.resume_wait_since)
+            self.state.resume_wait_since = now if is_final else None
+            
             if is_final:
                 # Transcripción final → acumular
                 self.state.last_final_time = now
                 self.state.last_stt_timestamp = now
                 self.state.pending_finals.append(transcript.strip())
                 logger.info(f"📥 Final recibido: '{transcript.strip()}'")
+            
+            if TIMING_CONFIG["SPECULATIVE_LLM"]:
+                candidate = " ".join(self.state.pending_finals + ([] if is_final else [transcript.strip()]))
+                self._on_speculation_candidate(candidate)
                 
         # Marcar si el último parcial fue vacío (para debugging)
         self.state.last_partial_was_empty = not is_final and not transcript.strip()
     
-    def _restart_pause_timer(self) -> None:
+    def _fallback_pause_duration(self) -> float:
+        """Espera fija de respaldo según contexto."""
+        return (
+            TIMING_CONFIG["PAUSE_DETECTION_FOR_PHONE"]
+            if self.state.expecting_phone_number
+            else TIMING_CONFIG["PAUSE_DETECTION"]
+        )
+    
+    def _restart_pause_timer(self, duration: Optional[float] = None, reason: str = "respaldo") -> None:
         """
         ⏲️ Reinicia el temporizador de detección de pausa
         
         Cada vez que el usuario habla, cancelamos el timer anterior
         y empezamos uno nuevo. Si el timer completa → usuario pausó.
+        
+        Args:
+            duration: Espera en segundos (None = respaldo fijo)
+            reason: Qué originó el timer (respaldo, speech_final, utterance_end)
         """
+        if duration is None:
+            duration = self._fallback_pause_duration()
+        
         # Cancelar timer existente
         if self.state.pause_timer and not self.state.pause_timer.done():
             self.state.pause_timer.cancel()
             logger.debug("⏲️ Timer de pausa cancelado")
         
         # Crear nuevo timer
+        self.state.pause_deadline = time.perf_counter() + duration
         self.state.pause_timer = asyncio.create_task(
-            self._wait_for_pause(),
+            self._wait_for_pause(duration, reason),
             name=f"PauseTimer_{self.session_id}"
         )
-        logger.debug(f"⏲️ Timer de pausa iniciado ({TIMING_CONFIG['PAUSE_DETECTION']}s)")
+        logger.debug(f"⏲️ Timer de pausa iniciado ({duration:.2f}s, {reason})")
     
-    async def _wait_for_pause(self) -> None:
+    def on_turn_signal(self, kind: str, data: dict) -> None:
+        """
+        🏁 Señal de Deepgram que puede adelantar el fin de turno
+        
+        Args:
+            kind: "final" (con speech_final) o "utterance_end"
+            data: Datos de la señal (transcript, duration, speech_final)
+        """
+        if kind == "final":
+            self.turn_detector.observe_final(data.get("transcript", ""), data.get("duration"))
+            if not data.get("speech_final"):
+                return
+            signal = "speech_final"
+        elif kind == "utterance_end":
+            signal = "utterance_end"
+        else:
+            return
+        
+        if not self.state.pending_finals:
+            return
+        
+        delay = self.turn_detector.commit_delay(
+            signal,
+            " ".join(self.state.pending_finals),
+            phone_mode=self.state.expecting_phone_number
+        )
+        if delay is None:
+            return
+        
+        # Solo adelantar: nunca alargar un timer que vence antes
+        if self.state.pause_deadline and time.perf_counter() + delay >= self.state.pause_deadline:
+            return
+        self._restart_pause_timer(delay, signal)
+    
+    async def _wait_for_pause(self, pause_duration: Optional[float] = None, reason: str = "respaldo") -> None:
         """
         ⏳ Espera a que el usuario haga pausa
         
@@ -169,21 +274,24 @@ class ConversationFlow:
         Si se cancela → el usuario sigue hablando
         """
         try:
-            # Seleccionar tiempo de pausa según contexto
-            pause_duration = (
-                TIMING_CONFIG["PAUSE_DETECTION_FOR_PHONE"] 
-                if self.state.expecting_phone_number 
-                else TIMING_CONFIG["PAUSE_DETECTION"]
-            )
+            if pause_duration is None:
+                pause_duration = self._fallback_pause_duration()
             # LOG MEJORADO
             pending_count = len(self.state.pending_finals)
             pending_text = " ".join(self.state.pending_finals)[:50] + "..." if self.state.pending_finals else "NADA"
             logger.debug(f"⏲️ Timer iniciado ({pause_duration}s) - Acumulados: {pending_count} finales - Preview: '{pending_text}'")
             
             await asyncio.sleep(pause_duration)
+            self.state.pause_deadline = None
             
             # LOG AL COMPLETAR
-            logger.info(f"⏸️ PAUSA DETECTADA - Procesando {len(self.state.pending_finals)} finales acumulados")
+            logger.info(f"⏸️ PAUSA DETECTADA ({reason}) - Procesando {len(self.state.pending_finals)} finales acumulados")
+            if self.state.pending_finals and self.state.last_final_time:
+                commit_ms = 1000 * (time.perf_counter() - self.state.last_final_time)
+                self.turn_detector.record_commit(reason, commit_ms)
+                emit_latency_event(self.session_id, "turn_commit", {"reason": reason, "latency_ms": round(commit_ms, 1)})
+                logger.info(f"⏱️ [PERF] Fin de turno confirmado por {reason} a {commit_ms:.0f} ms del último final "
+                            f"(respaldo fijo: {1000*self._fallback_pause_duration():.0f} ms)")
             t0 = time.perf_counter()
             await self._process_accumulated_text()
             logger.debug(f"[LATENCIA] Proceso completado en {1000*(time.perf_counter()-t0):.1f} ms")
@@ -191,6 +299,128 @@ class ConversationFlow:
         except asyncio.CancelledError:
             logger.debug(f"⏲️ Timer cancelado - Usuario sigue hablando (había {len(self.state.pending_finals)} finales acumulados)")
     
+    # ========== GENERACIÓN ESPECULATIVA ==========
+    
+    def _on_speculation_candidate(self, text: str) -> None:
+        """
+        🔮 Nuevo texto (finales + parcial): reinicia la ventana de estabilidad
+        
+        Si ya hay una especulación con otro texto, el usuario siguió hablando → cancelarla.
+        """
+        key = _speculation_key(text)
+        if key == _speculation_key(self._speculation_candidate):
+            return
+        self._speculation_candidate = text
+        
+        if self.speculation and self.speculation.key != key:
+            self._cancel_speculation("el usuario siguió hablando")
+        
+        if self._speculation_timer and not self._speculation_timer.done():
+            self._speculation_timer.cancel()
+        if len(key) < TIMING_CONFIG["SPECULATION_MIN_CHARS"] or self.state.ai_task_active:
+            return
+        self._speculation_timer = asyncio.create_task(
+            self._wait_stable_then_speculate(text),
+            name=f"SpeculationTimer_{self.session_id}"
+        )
+    
+    async def _wait_stable_then_speculate(self, text: str) -> None:
+        """⏳ Si el texto no cambia en SPECULATION_STABLE_MS, lanzar Groq en segundo plano"""
+        try:
+            await asyncio.sleep(TIMING_CONFIG["SPECULATION_STABLE_MS"] / 1000)
+        except asyncio.CancelledError:
+            return
+        if self.speculation or self.state.ai_task_active:
+            return
+        
+        # Copia del historial: la especulación nunca toca el historial real
+        history = list(self.state.history) + [{"role": "user", "content": text}]
+        task = asyncio.create_task(
+            generate_raw_ai_response(self.session_id, history),
+            name=f"Speculation_{self.session_id}"
+        )
+        spec = Speculation(
+            text=text,
+            key=_speculation_key(text),
+            history_len=len(self.state.history),
+            task=task,
+            started_at=time.perf_counter(),
+        )
+        task.add_done_callback(lambda _t, spec=spec: setattr(spec, "finished_at", time.perf_counter()))
+        self.speculation = spec
+        self.speculation_stats["started"] += 1
+        logger.info(f"🔮 Especulación iniciada tras {TIMING_CONFIG['SPECULATION_STABLE_MS']} ms estables: '{text[:60]}'")
+    
+    def _cancel_speculation(self, reason: str) -> None:
+        """🗑️ Descarta la especulación en curso (no tiene efectos secundarios)"""
+        spec = self.speculation
+        self.speculation = None
+        if not spec:
+            return
+        if not spec.task.done():
+            spec.task.cancel()
+        self.speculation_stats["cancelled"] += 1
+        logger.debug(f"🗑️ Especulación descartada ({reason}): '{spec.text[:60]}'")
+    
+    def _take_speculation(self, full_message: str) -> Optional[Speculation]:
+        """
+        🎯 Al confirmar el turno: devuelve la especulación si coincide con el texto final
+        """
+        if self._speculation_timer and not self._speculation_timer.done():
+            self._speculation_timer.cancel()
+        self._speculation_candidate = ""
+        
+        spec = self.speculation
+        self.speculation = None
+        if not spec:
+            return None
+        
+        if spec.key == _speculation_key(full_message) and spec.history_len == len(self.state.history):
+            self.speculation_stats["hits"] += 1
+            return spec
+        
+        self.speculation_stats["misses"] += 1
+        if not spec.task.done():
+            spec.task.cancel()
+        logger.info(f"🔮 Especulación fallida: '{spec.text[:40]}' ≠ '{full_message[:40]}'")
+        return None
+    
+    async def _collect_speculation(self, spec: Speculation, committed_at: float) -> Optional[str]:
+        """
+        📥 Espera el texto crudo especulado y registra la latencia ahorrada
+        
+        Returns:
+            Texto crudo de Groq, o None si la especulación falló
+        """
+        try:
+            raw_text = await spec.task
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Especulación con error, regenerando: {e}")
+            return None
+        
+        finished_at = spec.finished_at or time.perf_counter()
+        saved_ms = 1000 * max(0.0, min(committed_at, finished_at) - spec.started_at)
+        self.speculation_stats["saved_ms"] += saved_ms
+        emit_latency_event(self.session_id, "speculation_hit", {"saved_ms": round(saved_ms, 1)})
+        logger.info(f"⏱️ [PERF] Especulación acertada - {saved_ms:.0f} ms de Groq adelantados al fin de turno")
+        return raw_text
+    
+    def get_speculation_stats(self) -> Dict:
+        """📊 Tasa de acierto y latencia ahorrada de la generación especulativa"""
+        stats = self.speculation_stats
+        decided = stats["hits"] + stats["misses"]
+        return {
+            "enabled": TIMING_CONFIG["SPECULATIVE_LLM"],
+            "started": stats["started"],
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "cancelled": stats["cancelled"],
+            "hit_rate": round(stats["hits"] / decided, 3) if decided else None,
+            "avg_saved_ms": round(stats["saved_ms"] / stats["hits"], 1) if stats["hits"] else None,
+        }
+    
     async def prepare_tts_ws(self):
         """
         Prepara el WebSocket de ElevenLabs antes de enviar el texto al LLM.
@@ -217,6 +447,16 @@ class ConversationFlow:
             logger.debug("📭 No hay texto acumulado para procesar")
             return
         
+        # Tras un barge-in la respuesta anterior puede seguir generándose
+        # (p.ej. ejecutando una herramienta): esperar a que cierre su turno
+        if self.state.ai_task_active and self.state.interrupted and self.current_ai_task:
+            try:
+                await asyncio.wait_for(asyncio.shield(self.current_ai_task), TIMING_CONFIG["BARGE_IN_AI_WAIT"])
+            except asyncio.TimeoutError:
+                logger.warning("⏰ La respuesta interrumpida sigue en curso")
+            except Exception:
+                pass
+        
         # Si ya hay una tarea de IA activa, no iniciar otra
         if self.state.ai_task_active:
             logger.warning("⚠️ IA ya está procesando, ignorando")
@@ -233,9 +473,11 @@ class ConversationFlow:
         
         # Limpiar acumuladores
         self.state.pending_finals.clear()
+        self.state.interrupted = False
         
         # Marcar inicio de turno
         self.state.turn_start_time = time.perf_counter()
+        speculation = self._take_speculation(full_message)
         logger.info(f"🎯 [PERF] INICIO DE TURNO - Usuario dijo: '{full_message}'")
         
         # Preparar TTS antes de enviar a la IA
@@ -244,17 +486,19 @@ class ConversationFlow:
         # Iniciar procesamiento con IA
         self.state.ai_task_active = True
         self.current_ai_task = asyncio.create_task(
-            self._handle_ai_response(full_message),
+            self._handle_ai_response(full_message, speculation=speculation),
             name=f"AITask_{self.session_id}"
         )
         logger.info(f"[LATENCIA] Preparación de TTS + lanzamiento de LLM en {1000*(t_llm-self.state.turn_start_time):.1f} ms")
     
-    async def _handle_ai_response(self, user_message: str, on_complete=None) -> None:
+    async def _handle_ai_response(self, user_message: str, on_complete=None,
+                                  speculation: Optional[Speculation] = None) -> None:
         """
         🤖 Maneja la interacción con la IA
         Args:
             user_message: Mensaje del usuario para la IA
             on_complete: Callback opcional para ejecutar al terminar el TTS (solo para despedida)
+            speculation: Generación especulativa que coincide con este turno (opcional)
         """
         try:
             t0 = time.perf_counter()
@@ -264,16 +508,52 @@ class ConversationFlow:
             })
             logger.info(f"[HISTORIAL] Usuario: '{user_message}'")
             emit_latency_event(self.session_id, "ai_request_start")
+            speech_stream = {"attempted": False, "active": False}
+            
+            async def on_speech_chunk(segment: str) -> None:
+                # Primer segmento: abrir el turno incremental en ElevenLabs
+                if not speech_stream["attempted"]:
+                    speech_stream["attempted"] = True
+                    speech_stream["active"] = await self.audio_manager.begin_speech_stream()
+                    if speech_stream["active"] and self.state.turn_start_time:
+                        logger.info(f"[LATENCIA] Primer segmento a TTS a {1000*(time.perf_counter()-self.state.turn_start_time):.1f} ms del fin de turno")
+                if speech_stream["active"]:
+                    await self.audio_manager.stream_speech_chunk(segment)
+            
+            use_streaming = TIMING_CONFIG["STREAM_TTS"] and self.audio_manager is not None and on_complete is None
             try:
-                ai_response = await generate_ai_response(
-                    session_id=self.session_id,
-                    history=self.state.history
-                )
+                raw_text = None
+                if speculation:
+                    raw_text = await self._collect_speculation(speculation, t0)
+                if raw_text is not None:
+                    # Herramientas e historial se aplican solo ahora, al confirmar
+                    ai_response = await commit_ai_response(
+                        self.session_id,
+                        self.state.history,
+                        raw_text,
+                        on_speech_chunk=on_speech_chunk if use_streaming else None
+                    )
+                else:
+                    ai_response = await generate_ai_response(
+                        session_id=self.session_id,
+                        history=self.state.history,
+                        on_speech_chunk=on_speech_chunk if use_streaming else None
+                    )
             except Exception as e:
                 logger.error(f"❌ Error llamando a IA: {e}", exc_info=True)
-                ai_response = "Disculpe, tuve un problema técnico. ¿Podría repetir?"
+                ai_response = TECHNICAL_ERROR_TEXT
+                if speech_stream["active"]:
+                    await self.audio_manager.stream_speech_chunk(ai_response)
+            
+            # Si la respuesta ya se dijo en streaming, solo cerrar el turno de TTS
+            if speech_stream["active"]:
+                await self.audio_manager.finish_speech_stream()
+            
             if ai_response == "__END_CALL__":
                 logger.info("🔚 IA solicitó terminar la llamada")
+                if speech_stream["active"]:
+                    # Dejar terminar lo que ya se está diciendo antes de la despedida
+                    await self.audio_manager.wait_until_idle(TIMING_CONFIG["END_CALL_TTS_WAIT"])
                 if hasattr(self, 'response_handler') and self.response_handler:
                     try:
                         await self._execute_end_call()
@@ -283,7 +563,9 @@ class ConversationFlow:
             # NO agregar al historial aquí - ya se hace en aiagent.py
             logger.info(f"[HISTORIAL] Respuesta de IA recibida: '{ai_response}'")
             # Enviar respuesta como audio, pasando on_complete si está presente
-            if on_complete:
+            if speech_stream["active"]:
+                logger.info("🌊 Respuesta enviada a TTS en streaming durante la generación")
+            elif on_complete:
                 await self.response_handler(ai_response, on_complete)
             else:
                 await self.response_handler(ai_response, None)
@@ -419,6 +701,11 @@ class ConversationFlow:
             except asyncio.CancelledError:
                 pass
         
+        # Descartar especulación pendiente
+        if self._speculation_timer and not self._speculation_timer.done():
+            self._speculation_timer.cancel()
+        self._cancel_speculation("fin de llamada")
+        
         # Cancelar tarea de IA si está activa
         if self.current_ai_task and not self.current_ai_task.done():
             logger.warning("⚠️ Cancelando tarea de IA activa...")
@@ -489,6 +776,9 @@ class ConversationFlow:
             "assistant_messages": sum(1 for m in self.state.history if m["role"] == "assistant"),
             "pending_text_length": len(self.get_pending_text()),
             "is_processing": self.is_processing(),
+            "barge_ins": self.state.barge_in_count,
+            "turn_detection": self.turn_detector.get_stats(),
+            "speculation": self.get_speculation_stats(),
             "session_id": self.session_id
         }
 
@@ -504,6 +794,16 @@ class ConversationFlow:
         if self.state.pause_timer and not self.state.pause_timer.done():
             self._restart_pause_timer()
 
+    def on_barge_in(self) -> None:
+        """
+        ✋ El usuario interrumpió a la IA: lo que diga ahora es el siguiente turno
+        """
+        self.state.interrupted = True
+        self.state.barge_in_count += 1
+        emit_latency_event(self.session_id, "barge_in")
+        logger.info(f"✋ Barge-in #{self.state.barge_in_count}: escuchando al usuario")
+        self._restart_pause_timer()
+
     def on_audio_activity(self) -> None:
         """
         📊 Notificación de que llegó audio del usuario
@@ -0,0 +1,769 @@
+# conversation_store.py
+# -*- coding: utf-8 -*-
+"""
+💬 ALMACÉN DE CONVERSACIONES DEL CANAL DE TEXTO
+================================================
+Antes el historial y el estado de cada chat vivían en dicts del proceso
+(main.py): con más de un worker de uvicorn cada uno veía chats
+distintos, y un reinicio tiraba todas las conversaciones abiertas.
+
+Interfaz única (ConversationStore) con tres backends:
+- "memory": dicts del proceso (comportamiento anterior).
+- "sqlite": archivo en modo WAL; un renglón por mensaje (solo se
+  agregan) y el estado del chat en JSON. Lo comparten los workers.
+- "redis":  cualquier servidor que hable RESP (Redis, Valkey, KeyDB...),
+  con un cliente mínimo sin dependencias.
+
+Todos ofrecen append atómico (mensaje + contadores), lectura acotada de
+los últimos N mensajes y expiración por TTL (cada escritura la renueva).
+
+Los handlers async usan conversation_store_async: SQLite y Redis hacen
+I/O bloqueante (BEGIN IMMEDIATE con busy_timeout, sockets) y corren en un
+hilo para no congelar el audio de las llamadas que comparten el event
+loop; memoria se queda en línea.
+
+Configuración por entorno:
+    CONVERSATION_STORE_BACKEND=memory|sqlite|redis
+    CONVERSATION_STORE_SQLITE_PATH=conversations.db
+    CONVERSATION_STORE_REDIS_URL=redis://127.0.0.1:6379/0
+    CONVERSATION_TTL_SECONDS=86400
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import os
+import select
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN =====
+CONVERSATION_STORE_CONFIG = {
+    "BACKEND": os.getenv("CONVERSATION_STORE_BACKEND", "memory").lower(),
+    "SQLITE_PATH": os.getenv("CONVERSATION_STORE_SQLITE_PATH", "conversations.db"),
+    "REDIS_URL": os.getenv("CONVERSATION_STORE_REDIS_URL", "redis://127.0.0.1:6379/0"),
+    "REDIS_TIMEOUT": 2.0,          # segundos por operación
+    "KEY_PREFIX": "conv:",
+    "TTL": int(os.getenv("CONVERSATION_TTL_SECONDS", str(24 * 3600))),  # el monitor cierra a los 60 min; esto es la red de seguridad
+}
+
+# Contadores por rol que se actualizan junto con el mensaje (append(count=True))
+COUNTERS = ("message_count", "word_count")
+
+
+def _count_increments(message: Dict[str, Any]) -> Tuple[str, int]:
+    """(rol, palabras) de un mensaje para los contadores."""
+    return message.get("role", "user"), len(str(message.get("content", "")).split())
+
+
+class ConversationStore(ABC):
+    """
+    🗂️ Historial (solo se agrega) + estado de cada conversación de texto
+
+    El estado es un dict JSON. Las banderas de un solo uso (pulse_sent,
+    ended) se reclaman con claim_flag, que es atómico: con varios workers
+    solo uno manda el pulso o cierra el chat.
+    """
+
+    backend = "base"
+    blocking = True   # hace I/O: desde async se llama en un hilo (ver AsyncConversationStore)
+
+    def __init__(self, ttl: Optional[int] = None):
+        self.ttl = ttl or CONVERSATION_STORE_CONFIG["TTL"]
+        self.appends = 0
+        self.reads = 0
+        self.expired = 0
+
+    @abstractmethod
+    def create(self, conversation_id: str, state: Dict[str, Any]) -> bool:
+        """Crea la conversación si no existe. True si la creó esta llamada."""
+
+    @abstractmethod
+    def get_state(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Copia del estado (None si no existe o expiró)."""
+
+    @abstractmethod
+    def update_state(self, conversation_id: str, fields: Dict[str, Any]) -> None:
+        """Sobrescribe campos de primer nivel del estado."""
+
+    @abstractmethod
+    def claim_flag(self, conversation_id: str, flag: str) -> bool:
+        """Pone state[flag]=True. True solo para quien la puso primero."""
+
+    @abstractmethod
+    def append(self, conversation_id: str, message: Dict[str, Any], count: bool = False) -> None:
+        """Agrega un mensaje (y si count, suma message_count/word_count del rol) atómicamente."""
+
+    @abstractmethod
+    def recent(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Últimos `limit` mensajes, en orden."""
+
+    @abstractmethod
+    def history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Historial completo, en orden."""
+
+    @abstractmethod
+    def conversation_ids(self) -> List[str]:
+        """Conversaciones vigentes (para el monitor de inactividad)."""
+
+    @abstractmethod
+    def delete(self, conversation_id: str) -> None:
+        ...
+
+    def exists(self, conversation_id: str) -> bool:
+        return self.get_state(conversation_id) is not None
+
+    def purge_expired(self) -> int:
+        """Borra lo vencido (los backends con TTL nativo no necesitan hacer nada)."""
+        return 0
+
+    def close(self) -> None:
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "ttl_s": self.ttl,
+            "appends": self.appends,
+            "reads": self.reads,
+            "expired": self.expired,
+        }
+
+
+# ========== MEMORIA ==========
+
+class MemoryConversationStore(ConversationStore):
+    """🧠 Dicts del proceso (un solo worker; se pierde al reiniciar)"""
+
+    backend = "memory"
+    blocking = False
+
+    def __init__(self, ttl: Optional[int] = None):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._messages: Dict[str, List[Dict[str, Any]]] = {}
+        self._expires: Dict[str, float] = {}
+
+    def _alive(self, conversation_id: str, now: float) -> bool:
+        expires_at = self._expires.get(conversation_id)
+        if expires_at is None:
+            return False
+        if expires_at <= now:
+            self._drop(conversation_id)
+            self.expired += 1
+            return False
+        return True
+
+    def _drop(self, conversation_id: str) -> None:
+        self._states.pop(conversation_id, None)
+        self._messages.pop(conversation_id, None)
+        self._expires.pop(conversation_id, None)
+
+    def create(self, conversation_id: str, state: Dict[str, Any]) -> bool:
+        now = time.time()
+        with self._lock:
+            if self._alive(conversation_id, now):
+                return False
+            self._states[conversation_id] = copy.deepcopy(state)
+            self._messages[conversation_id] = []
+            self._expires[conversation_id] = now + self.ttl
+            return True
+
+    def get_state(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if not self._alive(conversation_id, time.time()):
+                return None
+            return copy.deepcopy(self._states[conversation_id])
+
+    def update_state(self, conversation_id: str, fields: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            if self._alive(conversation_id, now):
+                self._states[conversation_id].update(copy.deepcopy(fields))
+                self._expires[conversation_id] = now + self.ttl
+
+    def claim_flag(self, conversation_id: str, flag: str) -> bool:
+        with self._lock:
+            if not self._alive(conversation_id, time.time()):
+                return False
+            state = self._states[conversation_id]
+            if state.get(flag):
+                return False
+            state[flag] = True
+            return True
+
+    def append(self, conversation_id: str, message: Dict[str, Any], count: bool = False) -> None:
+        now = time.time()
+        with self._lock:
+            if not self._alive(conversation_id, now):
+                return
+            self._messages[conversation_id].append(dict(message))
+            if count:
+                role, words = _count_increments(message)
+                state = self._states[conversation_id]
+                for counter, amount in zip(COUNTERS, (1, words)):
+                    values = state.setdefault(counter, {})
+                    values[role] = values.get(role, 0) + amount
+            self._expires[conversation_id] = now + self.ttl
+            self.appends += 1
+
+    def recent(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            self.reads += 1
+            if not self._alive(conversation_id, time.time()):
+                return []
+            return [dict(m) for m in self._messages[conversation_id][-limit:]] if limit > 0 else []
+
+    def history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            self.reads += 1
+            if not self._alive(conversation_id, time.time()):
+                return []
+            return [dict(m) for m in self._messages[conversation_id]]
+
+    def conversation_ids(self) -> List[str]:
+        now = time.time()
+        with self._lock:
+            return [cid for cid in list(self._expires) if self._alive(cid, now)]
+
+    def delete(self, conversation_id: str) -> None:
+        with self._lock:
+            self._drop(conversation_id)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            before = self.expired
+            for cid in list(self._expires):
+                self._alive(cid, now)
+            return self.expired - before
+
+
+# ========== SQLITE (WAL) ==========
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    🗄️ SQLite en modo WAL, compartido entre workers del mismo equipo
+
+    messages: un renglón por mensaje (solo INSERT). El append y sus
+    contadores van en una transacción BEGIN IMMEDIATE: ningún otro
+    proceso escribe en medio.
+    """
+
+    backend = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id         TEXT PRIMARY KEY,
+            state      TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            conversation_id TEXT    NOT NULL,
+            seq             INTEGER NOT NULL,
+            body            TEXT    NOT NULL,
+            created_at      REAL    NOT NULL,
+            PRIMARY KEY (conversation_id, seq)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS conversations_expires ON conversations (expires_at);
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[int] = None):
+        super().__init__(ttl)
+        self.path = path or CONVERSATION_STORE_CONFIG["SQLITE_PATH"]
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        with self._connection() as db:
+            db.executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Una conexión por hilo (sqlite3 no se comparte entre hilos)."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")   # con WAL: durable ante caída del proceso
+            db.execute("PRAGMA busy_timeout=10000")
+            self._local.db = db
+            with self._connections_lock:
+                self._connections.append(db)
+        return db
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """Transacción de escritura que toma el lock de SQLite desde el inicio."""
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @staticmethod
+    def _live_state(db: sqlite3.Connection, conversation_id: str, now: float) -> Optional[Dict[str, Any]]:
+        row = db.execute(
+            "SELECT state FROM conversations WHERE id = ? AND expires_at > ?", (conversation_id, now)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def create(self, conversation_id: str, state: Dict[str, Any]) -> bool:
+        now = time.time()
+        with self._write() as db:
+            if self._live_state(db, conversation_id, now) is not None:
+                return False
+            # Restos vencidos de una conversación anterior con el mismo id
+            db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            db.execute(
+                "INSERT OR REPLACE INTO conversations (id, state, expires_at) VALUES (?, ?, ?)",
+                (conversation_id, json.dumps(state, ensure_ascii=False), now + self.ttl),
+            )
+            return True
+
+    def get_state(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        return self._live_state(self._connection(), conversation_id, time.time())
+
+    def _modify_state(self, conversation_id: str, change) -> Any:
+        now = time.time()
+        with self._write() as db:
+            state = self._live_state(db, conversation_id, now)
+            if state is None:
+                return None
+            result = change(state)
+            db.execute(
+                "UPDATE conversations SET state = ?, expires_at = ? WHERE id = ?",
+                (json.dumps(state, ensure_ascii=False), now + self.ttl, conversation_id),
+            )
+            return result
+
+    def update_state(self, conversation_id: str, fields: Dict[str, Any]) -> None:
+        self._modify_state(conversation_id, lambda state: state.update(fields))
+
+    def claim_flag(self, conversation_id: str, flag: str) -> bool:
+        def claim(state: Dict[str, Any]) -> bool:
+            if state.get(flag):
+                return False
+            state[flag] = True
+            return True
+
+        return bool(self._modify_state(conversation_id, claim))
+
+    def append(self, conversation_id: str, message: Dict[str, Any], count: bool = False) -> None:
+        now = time.time()
+        with self._write() as db:
+            state = self._live_state(db, conversation_id, now)
+            if state is None:
+                return
+            db.execute(
+                "INSERT INTO messages (conversation_id, seq, body, created_at) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM messages WHERE conversation_id = ?",
+                (conversation_id, json.dumps(message, ensure_ascii=False), now, conversation_id),
+            )
+            if count:
+                role, words = _count_increments(message)
+                for counter, amount in zip(COUNTERS, (1, words)):
+                    values = state.setdefault(counter, {})
+                    values[role] = values.get(role, 0) + amount
+            db.execute(
+                "UPDATE conversations SET state = ?, expires_at = ? WHERE id = ?",
+                (json.dumps(state, ensure_ascii=False), now + self.ttl, conversation_id),
+            )
+        self.appends += 1
+
+    def _messages(self, conversation_id: str, limit: Optional[int]) -> List[Dict[str, Any]]:
+        self.reads += 1
+        db = self._connection()
+        if db.execute("SELECT 1 FROM conversations WHERE id = ? AND expires_at > ?",
+                      (conversation_id, time.time())).fetchone() is None:
+            return []
+        if limit is None:
+            rows = db.execute("SELECT body FROM messages WHERE conversation_id = ? ORDER BY seq",
+                              (conversation_id,)).fetchall()
+        else:
+            rows = db.execute("SELECT body FROM messages WHERE conversation_id = ? ORDER BY seq DESC LIMIT ?",
+                              (conversation_id, limit)).fetchall()[::-1]
+        return [json.loads(body) for (body,) in rows]
+
+    def recent(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        return self._messages(conversation_id, limit) if limit > 0 else []
+
+    def history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        return self._messages(conversation_id, None)
+
+    def conversation_ids(self) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT id FROM conversations WHERE expires_at > ?", (time.time(),)
+        ).fetchall()
+        return [cid for (cid,) in rows]
+
+    def delete(self, conversation_id: str) -> None:
+        with self._write() as db:
+            db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def purge_expired(self) -> int:
+        with self._write() as db:
+            expired = [cid for (cid,) in db.execute(
+                "SELECT id FROM conversations WHERE expires_at <= ?", (time.time(),)).fetchall()]
+            for cid in expired:
+                db.execute("DELETE FROM messages WHERE conversation_id = ?", (cid,))
+                db.execute("DELETE FROM conversations WHERE id = ?", (cid,))
+        self.expired += len(expired)
+        return len(expired)
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for db in self._connections:
+                try:
+                    db.close()
+                except Exception:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+
+# ========== PROTOCOLO REDIS (RESP) ==========
+
+class RESPError(Exception):
+    """❌ Error devuelto por el servidor (-ERR ...)"""
+
+
+class RESPClient:
+    """
+    🔌 Cliente RESP2 mínimo: una conexión, pipelines, reconexión perezosa
+
+    Suficiente para los comandos que usa RedisConversationStore. Es
+    bloqueante y protegido con un lock (operaciones de < 1 ms en red local).
+    """
+
+    def __init__(self, url: str, timeout: float):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encode(args: Tuple[Any, ...]) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("conexión RESP cerrada por el servidor")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RESPError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"respuesta RESP inesperada: {line[:40]!r}")
+
+    def _connect(self) -> None:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock, self._reader = sock, sock.makefile("rb")
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            self._roundtrip(setup)
+
+    def _roundtrip(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        self._sock.sendall(b"".join(self._encode(cmd) for cmd in commands))
+        return [self._read_reply() for _ in commands]
+
+    def _stale(self) -> bool:
+        """True si el servidor ya cerró la conexión ociosa (legible con 0 bytes)."""
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            return bool(readable) and not self._sock.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def pipeline(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        """
+        Envía todos los comandos de una vez y devuelve las respuestas en orden.
+
+        Solo se reintenta la CONEXIÓN: si falla después de sendall, el
+        servidor pudo haber aplicado el lote (p.ej. MULTI/EXEC con la
+        respuesta perdida) y reenviarlo duplicaría mensajes y contadores.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None or self._stale():
+                        self.close_unlocked()
+                        self._connect()
+                    break
+                except (OSError, ConnectionError):
+                    self.close_unlocked()
+                    if attempt == 2:
+                        raise
+            try:
+                replies = self._roundtrip(commands)
+            except (OSError, ConnectionError):
+                self.close_unlocked()
+                raise
+        for reply in replies:
+            if isinstance(reply, RESPError):
+                raise reply
+        return replies
+
+    def execute(self, *args: Any) -> Any:
+        return self.pipeline([args])[0]
+
+    def transaction(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        """MULTI ... EXEC en un solo viaje: se aplican todos o ninguno."""
+        replies = self.pipeline([("MULTI",), *commands, ("EXEC",)])
+        return replies[-1] or []
+
+    def close_unlocked(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    def close(self) -> None:
+        with self._lock:
+            self.close_unlocked()
+
+
+class RedisConversationStore(ConversationStore):
+    """
+    🟥 Backend RESP (Redis/Valkey/KeyDB), compartido entre workers y equipos
+
+    Claves por conversación (todas con EXPIRE renovado en cada escritura):
+      {prefix}{id}:state → hash (campo → JSON; contadores "message_count.user";
+                            banderas reclamadas "!pulse_sent")
+      {prefix}{id}:msgs  → lista de mensajes JSON (RPUSH / LRANGE)
+      {prefix}index      → set de ids vigentes (para el monitor)
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: Optional[str] = None, ttl: Optional[int] = None, prefix: Optional[str] = None):
+        super().__init__(ttl)
+        self.client = RESPClient(url or CONVERSATION_STORE_CONFIG["REDIS_URL"], CONVERSATION_STORE_CONFIG["REDIS_TIMEOUT"])
+        self.prefix = prefix or CONVERSATION_STORE_CONFIG["KEY_PREFIX"]
+        self.client.execute("PING")   # falla aquí (→ memoria) si Redis no responde
+
+    def _keys(self, conversation_id: str) -> Tuple[str, str]:
+        base = f"{self.prefix}{conversation_id}"
+        return f"{base}:state", f"{base}:msgs"
+
+    @property
+    def _index(self) -> str:
+        return f"{self.prefix}index"
+
+    @staticmethod
+    def _flatten(state: Dict[str, Any]) -> List[Any]:
+        fields: List[Any] = []
+        for key, value in state.items():
+            if key in COUNTERS and isinstance(value, dict):
+                for role, amount in value.items():
+                    fields += [f"{key}.{role}", int(amount)]
+            else:
+                fields += [key, json.dumps(value, ensure_ascii=False)]
+        return fields
+
+    @staticmethod
+    def _unflatten(raw: List[str]) -> Dict[str, Any]:
+        state: Dict[str, Any] = {}
+        claimed = []
+        for field, value in zip(raw[::2], raw[1::2]):
+            if field.startswith("!"):
+                claimed.append(field[1:])
+            elif "." in field and field.split(".", 1)[0] in COUNTERS:
+                counter, role = field.split(".", 1)
+                state.setdefault(counter, {})[role] = int(value)
+            elif field != "__created__":
+                state[field] = json.loads(value)
+        for flag in claimed:
+            state[flag] = True
+        return state
+
+    def _expire(self, conversation_id: str) -> List[Tuple[Any, ...]]:
+        state_key, msgs_key = self._keys(conversation_id)
+        return [("EXPIRE", state_key, self.ttl), ("EXPIRE", msgs_key, self.ttl)]
+
+    # Crear es UN solo comando atómico: si la respuesta se pierde no queda
+    # una conversación a medias (sin estado ni TTL) que bloquee el id
+    CREATE_SCRIPT = """
+        if redis.call('HSETNX', KEYS[1], '__created__', ARGV[1]) == 0 then
+            return 0
+        end
+        redis.call('DEL', KEYS[2])
+        if #ARGV > 3 then
+            redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+        end
+        redis.call('SADD', KEYS[3], ARGV[2])
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        redis.call('EXPIRE', KEYS[2], ARGV[3])
+        return 1
+    """
+
+    def create(self, conversation_id: str, state: Dict[str, Any]) -> bool:
+        state_key, msgs_key = self._keys(conversation_id)
+        created = self.client.execute(
+            "EVAL", self.CREATE_SCRIPT, 3, state_key, msgs_key, self._index,
+            int(time.time()), conversation_id, self.ttl, *self._flatten(state),
+        )
+        return bool(created)
+
+    def get_state(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.execute("HGETALL", self._keys(conversation_id)[0])
+        return self._unflatten(raw) if raw else None
+
+    def update_state(self, conversation_id: str, fields: Dict[str, Any]) -> None:
+        state_key, _ = self._keys(conversation_id)
+        if not fields or not self.client.execute("EXISTS", state_key):
+            return
+        self.client.transaction([("HSET", state_key, *self._flatten(fields)), *self._expire(conversation_id)])
+
+    def claim_flag(self, conversation_id: str, flag: str) -> bool:
+        state_key, _ = self._keys(conversation_id)
+        if not self.client.execute("EXISTS", state_key):
+            return False
+        state = self.get_state(conversation_id) or {}
+        if state.get(flag):
+            return False
+        return bool(self.client.execute("HSETNX", state_key, f"!{flag}", 1))
+
+    def append(self, conversation_id: str, message: Dict[str, Any], count: bool = False) -> None:
+        state_key, msgs_key = self._keys(conversation_id)
+        if not self.client.execute("EXISTS", state_key):
+            return
+        commands: List[Tuple[Any, ...]] = [("RPUSH", msgs_key, json.dumps(message, ensure_ascii=False))]
+        if count:
+            role, words = _count_increments(message)
+            commands += [("HINCRBY", state_key, f"{COUNTERS[0]}.{role}", 1),
+                         ("HINCRBY", state_key, f"{COUNTERS[1]}.{role}", words)]
+        self.client.transaction(commands + self._expire(conversation_id))
+        self.appends += 1
+
+    def recent(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        self.reads += 1
+        if limit <= 0:
+            return []
+        return [json.loads(m) for m in self.client.execute("LRANGE", self._keys(conversation_id)[1], -limit, -1)]
+
+    def history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        self.reads += 1
+        return [json.loads(m) for m in self.client.execute("LRANGE", self._keys(conversation_id)[1], 0, -1)]
+
+    def conversation_ids(self) -> List[str]:
+        ids = self.client.execute("SMEMBERS", self._index) or []
+        if not ids:
+            return []
+        alive = self.client.pipeline([("EXISTS", self._keys(cid)[0]) for cid in ids])
+        gone = [cid for cid, exists in zip(ids, alive) if not exists]
+        if gone:
+            # Expiraron por TTL: se sacan del índice
+            self.client.execute("SREM", self._index, *gone)
+            self.expired += len(gone)
+        return [cid for cid, exists in zip(ids, alive) if exists]
+
+    def delete(self, conversation_id: str) -> None:
+        state_key, msgs_key = self._keys(conversation_id)
+        self.client.transaction([("DEL", state_key, msgs_key), ("SREM", self._index, conversation_id)])
+
+    def purge_expired(self) -> int:
+        before = self.expired
+        self.conversation_ids()
+        return self.expired - before
+
+    def close(self) -> None:
+        self.client.close()
+
+
+# ========== FACHADA ASYNC ==========
+
+class AsyncConversationStore:
+    """
+    ⚡ La misma interfaz en corrutinas, para los handlers de FastAPI
+
+    Backends con I/O (SQLite, Redis) → asyncio.to_thread; memoria → en línea.
+
+    Uso:
+        state = await conversation_store_async.get_state(conversation_id)
+    """
+
+    METHODS = frozenset({
+        "create", "get_state", "update_state", "claim_flag", "append", "recent",
+        "history", "conversation_ids", "delete", "exists", "purge_expired",
+    })
+
+    def __init__(self, store: ConversationStore):
+        self.store = store
+
+    def __getattr__(self, name: str):
+        if name not in self.METHODS:
+            raise AttributeError(name)
+        method = getattr(self.store, name)
+
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            if not self.store.blocking:
+                return method(*args, **kwargs)
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+
+# ========== FÁBRICA ==========
+
+def create_conversation_store(backend: Optional[str] = None) -> ConversationStore:
+    """Crea el backend configurado; si falla, se usa memoria (el chat sigue funcionando)."""
+    backend = (backend or CONVERSATION_STORE_CONFIG["BACKEND"]).lower()
+    try:
+        if backend == "sqlite":
+            store: ConversationStore = SQLiteConversationStore()
+        elif backend == "redis":
+            store = RedisConversationStore()
+        else:
+            store = MemoryConversationStore()
+        logger.info(f"💬 Almacén de conversaciones: {store.backend}")
+        return store
+    except Exception as e:
+        logger.error(f"❌ No se pudo iniciar el almacén '{backend}' de conversaciones: {e}. Se usa memoria.")
+        return MemoryConversationStore()
+
+
+# ===== INSTANCIA GLOBAL =====
+conversation_store = create_conversation_store()
+conversation_store_async = AsyncConversationStore(conversation_store)
@@ -10,6 +10,7 @@ from datetime import datetime
 import pytz
 from fastapi import APIRouter, HTTPException
 from utils import initialize_google_calendar, GOOGLE_CALENDAR_ID, get_cancun_time, normalizar_telefono
+from availability_cache import record_calendar_change
 
 
 logging.basicConfig(level=logging.INFO)
@@ -45,60 +46,82 @@ def validate_iso_datetime(dt_str: str):
                 detail="Formato datetime inválido. Se esperaba ISO8601 (con o sin zona horaria, ej: 2025-07-08T10:15:00-05:00 o 2025-07-08T10:15:00)"
             )
 
+def _build_event_body(name: str, phone: str, reason: str, start_time: str, end_time: str) -> dict:
+    """Valida los datos de la cita y arma el cuerpo del evento (lanza ValueError)."""
+    # Normalización estricta de teléfono
+    phone = normalizar_telefono(phone)
+    if len(phone) != 10 or not phone.isdigit():
+        raise ValueError("Teléfono debe tener 10 dígitos numéricos")
+
+    # Conversión y validación de tiempos
+    start_dt = validate_iso_datetime(start_time)
+    end_dt = validate_iso_datetime(end_time)
+
+    # Verificar que la cita no sea en el pasado
+    if start_dt < get_cancun_time():
+        raise ValueError("No se pueden agendar citas en el pasado")
+    
+    if not name or not phone:
+        raise ValueError("Faltan datos obligatorios para crear la cita.")
+
+    return {
+        "summary": name,
+        "description": f"📞 Teléfono: {phone}\n📝 Motivo: {reason or 'No especificado'}",
+        "start": {"dateTime": start_dt.isoformat(), "timeZone": "America/Cancun"},
+        "end": {"dateTime": end_dt.isoformat(), "timeZone": "America/Cancun"},
+    }
+
+
+def _created_result(created_event: dict) -> dict:
+    return {
+        "id": created_event["id"],
+        "start": created_event["start"]["dateTime"],
+        "end": created_event["end"]["dateTime"]
+    }
+
+
+def _error_result(error: Exception) -> dict:
+    if isinstance(error, ValueError):
+        logger.error(f"❌ Error de validación: {str(error)}")
+        if "Teléfono" in str(error):
+            return {
+                "error": str(error),
+                "status": "invalid_phone"
+            }
+        return {
+            "error": str(error),
+            "status": "validation_error"
+        }
+    logger.error(f"❌ Error en Google Calendar: {str(error)}")
+    return {"error": "CALENDAR_UNAVAILABLE"}
+
+
 def create_calendar_event(name: str, phone: str, reason: str, start_time: str, end_time: str):
     try:
-        # Normalización estricta de teléfono
-        phone = normalizar_telefono(phone)
-        if len(phone) != 10 or not phone.isdigit():
-            raise ValueError("Teléfono debe tener 10 dígitos numéricos")
-        
+        event_body = _build_event_body(name, phone, reason, start_time, end_time)
         service = initialize_google_calendar()
-        tz = pytz.timezone("America/Cancun")
-
-        # Conversión y validación de tiempos
-        start_dt = validate_iso_datetime(start_time)
-        end_dt = validate_iso_datetime(end_time)
-
-        # Verificar que la cita no sea en el pasado
-        if start_dt < get_cancun_time():
-            raise ValueError("No se pueden agendar citas en el pasado")
-        
-        if not name or not phone:
-            raise ValueError("Faltan datos obligatorios para crear la cita.")
-
-
-        event_body = {
-            "summary": name,
-            "description": f"📞 Teléfono: {phone}\n📝 Motivo: {reason or 'No especificado'}",
-            "start": {"dateTime": start_dt.isoformat(), "timeZone": "America/Cancun"},
-            "end": {"dateTime": end_dt.isoformat(), "timeZone": "America/Cancun"},
-        }
 
         created_event = service.events().insert(
             calendarId=GOOGLE_CALENDAR_ID,
             body=event_body
         ).execute()
 
-        return {
-            "id": created_event["id"],
-            "start": created_event["start"]["dateTime"],
-            "end": created_event["end"]["dateTime"]
-        }
-
-    except ValueError as ve:
-        logger.error(f"❌ Error de validación: {str(ve)}")
-        if "Teléfono" in str(ve):
-            return {
-                "error": str(ve),
-                "status": "invalid_phone"
-            }
-        return {
-            "error": str(ve),
-            "status": "validation_error"
-        }
+        record_calendar_change(created_event, release_holds=True)
+        return _created_result(created_event)
 
     except Exception as e:
-        logger.error(f"❌ Error en Google Calendar: {str(e)}")
-        return {"error": "CALENDAR_UNAVAILABLE"}
+        return _error_result(e)
+
 
+async def create_calendar_event_async(name: str, phone: str, reason: str, start_time: str, end_time: str):
+    """Igual que create_calendar_event, pero con el cliente asíncrono (calendar_async)."""
+    from calendar_async import calendar_async
 
+    try:
+        event_body = _build_event_body(name, phone, reason, start_time, end_time)
+        created_event = await calendar_async.events_insert(GOOGLE_CALENDAR_ID, event_body)
+        record_calendar_change(created_event, release_holds=True)
+        return _created_result(created_event)
+
+    except Exception as e:
+        return _error_result(e)
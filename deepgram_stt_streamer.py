@@ -31,6 +31,9 @@ class DeepgramSTTStreamer:
         """
         self.callback = callback
         self.on_disconnect_callback = on_disconnect_callback 
+        # Señales de fin de turno: turn_signal_callback(tipo, datos)
+        # tipos: "final" (transcript, duration, speech_final) y "utterance_end"
+        self.turn_signal_callback = None
         self.deepgram = None
         if DEEPGRAM_KEY:
             try:
@@ -90,7 +93,7 @@ class DeepgramSTTStreamer:
                 channels=1,
                 smart_format=True,
                 interim_results=True,
-                endpointing=False,
+                endpointing=300,           # ms de silencio para marcar speech_final
                 utterance_end_ms="1000",  # REDUCIDO de 2500 a 1000
                 vad_events=True,           # CAMBIAR a True para recibir eventos VAD
                 filler_words=True,         # AGREGAR para mejor detección
@@ -98,6 +101,8 @@ class DeepgramSTTStreamer:
             )
             # Agregar handler para SpeechStarted
             self.dg_connection.on(LiveTranscriptionEvents.SpeechStarted, self._on_speech_started)
+            # Fin de enunciado (utterance_end_ms sin palabras nuevas)
+            self.dg_connection.on(LiveTranscriptionEvents.UtteranceEnd, self._on_utterance_end)
 
             await self.dg_connection.start(options)
           
@@ -197,6 +202,12 @@ class DeepgramSTTStreamer:
         if transcript: # Asegurarse que el transcript no sea una cadena vacía
             # logger.debug(f"Transcript recibido: '{transcript}', is_final: {result.is_final}")
             self.callback(transcript, result.is_final)
+            if result.is_final and self.turn_signal_callback:
+                self.turn_signal_callback("final", {
+                    "transcript": transcript,
+                    "duration": getattr(result, "duration", None),
+                    "speech_final": bool(getattr(result, "speech_final", False)),
+                })
         # else:
             # logger.debug(f"Transcript vacío recibido. is_final: {result.is_final}")
 
@@ -246,4 +257,12 @@ class DeepgramSTTStreamer:
         logger.debug("🎤 VAD: Habla detectada por Deepgram")
         # Notificar al callback con una señal especial
         if self.callback:
-            self.callback("", False)  # Transcript vacío = señal de actividad
\ No newline at end of file
+            self.callback("", False)  # Transcript vacío = señal de actividad
+
+    async def _on_utterance_end(self, _connection, utterance_end, *args, **kwargs):
+        """Deepgram no detectó palabras nuevas durante utterance_end_ms"""
+        logger.debug("🔚 UtteranceEnd recibido de Deepgram")
+        if self.turn_signal_callback:
+            self.turn_signal_callback("utterance_end", {
+                "last_word_end": getattr(utterance_end, "last_word_end", None),
+            })
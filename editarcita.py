@@ -19,6 +19,7 @@ from utils import (
     GOOGLE_CALENDAR_ID,
     normalizar_telefono
 )
+from availability_cache import record_calendar_change
 
 logging.basicConfig(level=logging.INFO) # Ajusta el nivel según necesites
 logger = logging.getLogger(__name__)
@@ -71,11 +72,7 @@ def edit_calendar_event(
         Un diccionario con los detalles del evento actualizado o un diccionario con una clave "error".
     """
 
-    # ─── Parche: si la IA mandó un ID vacío o de ejemplo, usamos el seleccionado ───
-    current_id = session_state.get("current_event_id")  # type: ignore
-    if current_id:
-        event_id = current_id
-
+    event_id = _resolve_event_id(event_id)
     logger.info(f"Intentando editar evento ID: {event_id} para nuevo horario: {new_start_time_iso}")
     try:
         service = initialize_google_calendar()
@@ -87,56 +84,13 @@ def edit_calendar_event(
             logger.error(f"Error al obtener el evento original ({event_id}) para editar: {e_get}")
             return {"error": f"No se pudo encontrar la cita original con ID {event_id} para modificar."}
 
-        # 2. Validar formato de los nuevos tiempos (básico, `process_appointment_request` hizo el trabajo duro)
-        try:
-            datetime.fromisoformat(new_start_time_iso)
-            datetime.fromisoformat(new_end_time_iso)
-        except ValueError:
-            logger.error(f"Formato ISO inválido para new_start_time_iso ('{new_start_time_iso}') o new_end_time_iso ('{new_end_time_iso}').")
-            return {"error": "El nuevo formato de hora para la cita es inválido."}
-
-        # 3. Preparar el cuerpo del evento para la actualización (patch)
-        updated_body: Dict[str, Any] = {
-            "start": {"dateTime": new_start_time_iso, "timeZone": "America/Cancun"}, # Google Calendar maneja la zona horaria
-            "end": {"dateTime": new_end_time_iso, "timeZone": "America/Cancun"}
-        }
-
-        # Actualizar summary (nombre) si se provee uno nuevo
-        if new_name:
-            updated_body["summary"] = new_name
-        else:
-            updated_body["summary"] = original_event.get("summary", "Cita") # Mantener original si no hay nuevo
-
-        # Reconstruir la descripción si se actualiza el motivo o el teléfono
-        original_description = original_event.get("description", "")
-        
-        # Extraer teléfono y motivo actuales de la descripción original
-        current_phone_in_desc = _parse_field_from_description(original_description, "Teléfono", is_phone=True)
-        current_reason_in_desc = _parse_field_from_description(original_description, "Motivo")
-
-        # Usar los nuevos valores si se proveen, si no, los actuales de la descripción
-        phone_to_write = new_phone_for_description if new_phone_for_description else current_phone_in_desc
-        reason_to_write = new_reason if new_reason else current_reason_in_desc
-        
-        new_description_parts = []
-        if phone_to_write:
-            new_description_parts.append(f"📞 Teléfono: {phone_to_write}")
-        if reason_to_write:
-            new_description_parts.append(f"📝 Motivo: {reason_to_write}")
-        
-        if new_description_parts: # Si hay teléfono o motivo para escribir
-            updated_body["description"] = "\n".join(new_description_parts)
-        elif original_description: # Si no hay nuevos pero había descripción original
-            updated_body["description"] = original_description
-        # Si no hay nuevos y no había descripción original, no se añade campo description.
-
-        # Normalizar teléfono si se provee uno nuevo
-        if new_phone_for_description:
-            try:
-                new_phone_for_description = normalizar_telefono(new_phone_for_description)
-            except Exception as e:
-                logger.error(f"Error normalizando teléfono: {e}")
-                return {"error": str(e), "status": "invalid_phone"}
+        # 2-3. Validar tiempos y preparar el cuerpo del patch
+        updated_body, error = _build_patch_body(
+            original_event, new_start_time_iso, new_end_time_iso,
+            new_name, new_reason, new_phone_for_description
+        )
+        if error:
+            return error
 
         # 4. Realizar la actualización (patch)
         updated_event = service.events().patch(
@@ -145,19 +99,131 @@ def edit_calendar_event(
             body=updated_body
         ).execute()
 
-        logger.info(f"✅ Cita editada exitosamente. Evento ID: {updated_event.get('id')}")
-        
-        # Devolver la información clave del evento actualizado
-        return {
-            "id": updated_event.get("id"),
-            "name": updated_event.get("summary"),
-            "start_time_iso": updated_event.get("start", {}).get("dateTime"),
-            "end_time_iso": updated_event.get("end", {}).get("dateTime"),
-            "reason": _parse_field_from_description(updated_event.get("description", ""), "Motivo"),
-            "phone_in_description": _parse_field_from_description(updated_event.get("description", ""), "Teléfono", is_phone=True),
-            "message": "Cita actualizada exitosamente."
-        }
+        record_calendar_change(updated_event, replaces_existing=True)
+        return _edited_result(updated_event)
 
     except Exception as e:
         logger.error(f"❌ Error general en la función edit_calendar_event: {str(e)}", exc_info=True)
-        return {"error": f"Ocurrió un error en el servidor al intentar editar la cita: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Ocurrió un error en el servidor al intentar editar la cita: {str(e)}"}
+
+
+async def edit_calendar_event_async(
+    event_id: str,
+    new_start_time_iso: str,
+    new_end_time_iso: str,
+    new_name: str | None = None,
+    new_reason: str | None = None,
+    new_phone_for_description: str | None = None
+):
+    """Igual que edit_calendar_event, pero con el cliente asíncrono (calendar_async)."""
+    from calendar_async import calendar_async
+
+    event_id = _resolve_event_id(event_id)
+    logger.info(f"Intentando editar evento ID: {event_id} para nuevo horario: {new_start_time_iso}")
+    try:
+        try:
+            original_event = await calendar_async.events_get(GOOGLE_CALENDAR_ID, event_id)
+        except Exception as e_get:
+            logger.error(f"Error al obtener el evento original ({event_id}) para editar: {e_get}")
+            return {"error": f"No se pudo encontrar la cita original con ID {event_id} para modificar."}
+
+        updated_body, error = _build_patch_body(
+            original_event, new_start_time_iso, new_end_time_iso,
+            new_name, new_reason, new_phone_for_description
+        )
+        if error:
+            return error
+
+        updated_event = await calendar_async.events_patch(GOOGLE_CALENDAR_ID, event_id, updated_body)
+        record_calendar_change(updated_event, replaces_existing=True)
+        return _edited_result(updated_event)
+
+    except Exception as e:
+        logger.error(f"❌ Error general en la función edit_calendar_event_async: {str(e)}", exc_info=True)
+        return {"error": f"Ocurrió un error en el servidor al intentar editar la cita: {str(e)}"}
+
+
+def _resolve_event_id(event_id: str) -> str:
+    # ─── Parche: si la IA mandó un ID vacío o de ejemplo, usamos el seleccionado ───
+    current_id = session_state.get("current_event_id")  # type: ignore
+    return current_id or event_id
+
+
+def _build_patch_body(
+    original_event: Dict[str, Any],
+    new_start_time_iso: str,
+    new_end_time_iso: str,
+    new_name: str | None,
+    new_reason: str | None,
+    new_phone_for_description: str | None
+) -> tuple[Dict[str, Any] | None, Dict[str, Any] | None]:
+    """
+    Valida los nuevos tiempos y arma el cuerpo del patch a partir del evento original.
+    Retorna (cuerpo, None) o (None, diccionario de error).
+    """
+    # Validar formato de los nuevos tiempos (básico, `process_appointment_request` hizo el trabajo duro)
+    try:
+        datetime.fromisoformat(new_start_time_iso)
+        datetime.fromisoformat(new_end_time_iso)
+    except ValueError:
+        logger.error(f"Formato ISO inválido para new_start_time_iso ('{new_start_time_iso}') o new_end_time_iso ('{new_end_time_iso}').")
+        return None, {"error": "El nuevo formato de hora para la cita es inválido."}
+
+    updated_body: Dict[str, Any] = {
+        "start": {"dateTime": new_start_time_iso, "timeZone": "America/Cancun"}, # Google Calendar maneja la zona horaria
+        "end": {"dateTime": new_end_time_iso, "timeZone": "America/Cancun"}
+    }
+
+    # Actualizar summary (nombre) si se provee uno nuevo
+    if new_name:
+        updated_body["summary"] = new_name
+    else:
+        updated_body["summary"] = original_event.get("summary", "Cita") # Mantener original si no hay nuevo
+
+    # Reconstruir la descripción si se actualiza el motivo o el teléfono
+    original_description = original_event.get("description", "")
+    
+    # Extraer teléfono y motivo actuales de la descripción original
+    current_phone_in_desc = _parse_field_from_description(original_description, "Teléfono", is_phone=True)
+    current_reason_in_desc = _parse_field_from_description(original_description, "Motivo")
+
+    # Usar los nuevos valores si se proveen, si no, los actuales de la descripción
+    phone_to_write = new_phone_for_description if new_phone_for_description else current_phone_in_desc
+    reason_to_write = new_reason if new_reason else current_reason_in_desc
+    
+    new_description_parts = []
+    if phone_to_write:
+        new_description_parts.append(f"📞 Teléfono: {phone_to_write}")
+    if reason_to_write:
+        new_description_parts.append(f"📝 Motivo: {reason_to_write}")
+    
+    if new_description_parts: # Si hay teléfono o motivo para escribir
+        updated_body["description"] = "\n".join(new_description_parts)
+    elif original_description: # Si no hay nuevos pero había descripción original
+        updated_body["description"] = original_description
+    # Si no hay nuevos y no había descripción original, no se añade campo description.
+
+    # Normalizar teléfono si se provee uno nuevo
+    if new_phone_for_description:
+        try:
+            new_phone_for_description = normalizar_telefono(new_phone_for_description)
+        except Exception as e:
+            logger.error(f"Error normalizando teléfono: {e}")
+            return None, {"error": str(e), "status": "invalid_phone"}
+
+    return updated_body, None
+
+
+def _edited_result(updated_event: Dict[str, Any]) -> Dict[str, Any]:
+    logger.info(f"✅ Cita editada exitosamente. Evento ID: {updated_event.get('id')}")
+    
+    # Devolver la información clave del evento actualizado
+    return {
+        "id": updated_event.get("id"),
+        "name": updated_event.get("summary"),
+        "start_time_iso": updated_event.get("start", {}).get("dateTime"),
+        "end_time_iso": updated_event.get("end", {}).get("dateTime"),
+        "reason": _parse_field_from_description(updated_event.get("description", ""), "Motivo"),
+        "phone_in_description": _parse_field_from_description(updated_event.get("description", ""), "Teléfono", is_phone=True),
+        "message": "Cita actualizada exitosamente."
+    }
@@ -14,23 +14,25 @@
 • **Credenciales** se toman de variables de entorno (Render / Docker
   secrets).  Nunca las pongas en el repositorio ;)
 
-Requiere: `requests`, `audioop`, `asyncio`, `logging`.
+Requiere: `httpx`, `requests` (solo pre‑render), `asyncio`, `logging`.
 """
 
 from __future__ import annotations
 
 import os
-import base64
 import time
 import json
 import asyncio
 import logging
-from io import BytesIO
-from typing import Callable, Awaitable
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Awaitable
 
-import audioop  # type: ignore
+import httpx
 import requests
 
+from outbound_audio import OutboundAudioScheduler
+from ulaw_utils import apply_ulaw_gain
+
 # --------------------------------------------------------------------------
 #  Credenciales y configuración (obligatorio en entorno, p.e. Render / .env)
 # --------------------------------------------------------------------------
@@ -45,12 +47,34 @@ GROUP_FRAMES       = 5            # máx. 100 ms por paquete (1‑5 frames)
 MAX_AHEAD_MS       = 200          # no enviar >200 ms adelantado al tiempo real
 GAIN               = 1         # Ganancia de audio (multiplicador)
 
+# Cliente HTTP compartido (keep‑alive entre llamadas)
+HTTP_TIMEOUT = httpx.Timeout(connect=5.0, read=30.0, write=10.0, pool=5.0)
+HTTP_LIMITS  = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120)
+
 logger = logging.getLogger("eleven_http_client")
 
+_http_client: httpx.AsyncClient | None = None
+
 # Type alias para la función que envía texto a Twilio
 WebSocketSend = Callable[[str], Awaitable[None]]
 
 
+def get_http_client() -> httpx.AsyncClient:
+    """Cliente ``httpx`` compartido por todas las llamadas (se crea al primer uso)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Cierra el cliente compartido (apagado del servidor)."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
 async def send_tts_http_to_twilio(
     text: str,
     stream_sid: str,
@@ -60,16 +84,58 @@ async def send_tts_http_to_twilio(
     max_ahead_ms: int = MAX_AHEAD_MS,
     gain: float = GAIN,
 ) -> None:
-    """Genera TTS en ElevenLabs y lo *gotea* hacia Twilio.
+    """Genera TTS en ElevenLabs y lo *gotea* hacia Twilio mientras llega.
 
     Args:
         text: Texto que se convertirá a voz.
         stream_sid: SID del *Media Stream* de Twilio.
         websocket_send: `await`‑able que envía mensajes JSON al WS.
-        group_frames: Cuántos frames (20 ms c/u) incluir en cada paquete.
+        group_frames: Cuántos frames (20 ms c/u) incluir en cada paquete.
         max_ahead_ms: Cuánto audio máximo adelantado permitimos (jitter
             buffer de Twilio).
         gain: Factor multiplicador de amplitud μ‑law (1.0 = sin cambio).
+
+    Si la tarea se cancela, se descarta el audio pendiente y se limpia
+    el buffer de Twilio.
+    """
+    t0 = time.perf_counter()
+    scheduler = OutboundAudioScheduler(
+        stream_sid, websocket_send, group_frames=group_frames, max_ahead_ms=max_ahead_ms
+    )
+    received = 0
+    try:
+        async with aclosing(iter_tts_http_audio(text, gain=gain)) as chunks:
+            async for chunk in chunks:
+                received += len(chunk)
+                scheduler.enqueue(chunk)
+
+        if not received:
+            await _safe_send_mark(websocket_send, stream_sid, "error")
+            return
+
+        logger.info("✅ Audio TTS recibido (%d bytes → %d frames)", received, (received + FRAME_SIZE - 1) // FRAME_SIZE)
+        scheduler.flush_partial()
+        logger.info("[FUNCIONALIDAD] Enviando mark de fin a Twilio (end_of_tts)...")
+        sent_ok = await scheduler.mark("end_of_tts")
+        logger.info(f"[LATENCIA] Envío total de audio a Twilio completado en {1000*(time.perf_counter()-t0):.1f} ms")
+        if not sent_ok:
+            await _safe_send_mark(websocket_send, stream_sid, "error")
+            return
+        logger.info("🏁 Audio completo enviado a Twilio.")
+    except asyncio.CancelledError:
+        scheduler.truncate()
+        raise
+    finally:
+        await scheduler.close()
+
+
+async def iter_tts_http_audio(text: str, *, gain: float = GAIN) -> AsyncIterator[bytes]:
+    """Solicita TTS a ElevenLabs por HTTP y entrega el audio μ‑law según llega.
+
+    Sin bloquear el event loop (``httpx`` asíncrono con conexión reutilizada).
+    Quita la cabecera WAV si la hubiera y aplica la ganancia por chunk.
+    Los errores se registran y terminan la iteración; cerrar el iterador
+    (o cancelar la tarea) aborta la descarga.
     """
     t0 = time.perf_counter()
     logger.info(f"[FUNCIONALIDAD] Iniciando solicitud HTTP TTS a ElevenLabs para texto de {len(text)} caracteres...")
@@ -93,109 +159,84 @@ async def send_tts_http_to_twilio(
         },
     }
 
-    # 1️⃣ Descargar audio de ElevenLabs
+    first_chunk_at: float | None = None
+    header = b""          # primeros bytes, para detectar WAV
+    header_checked = False
+    total = 0
     try:
-        t_request = time.perf_counter()
-        response = requests.post(url, json=payload, headers=headers, stream=True, timeout=120)
-        response.raise_for_status()
-
-        first_chunk_at: float | None = None
-        buffer = BytesIO()
-
-        for chunk in response.iter_content(chunk_size=4096):
-            if not chunk:
-                continue  # Ignora keep‑alive vacíos
-            if first_chunk_at is None:
-                first_chunk_at = time.perf_counter()
-                logger.info("⏱️ ElevenLabs primer chunk tras %.1f ms", (first_chunk_at - t_request) * 1000)
-            buffer.write(chunk)
-
-        audio_raw: bytes = buffer.getvalue()
-        logger.info(f"[LATENCIA] Audio recibido de ElevenLabs en {1000*(time.perf_counter()-t0):.1f} ms, tamaño: {len(audio_raw)} bytes")
+        async with get_http_client().stream("POST", url, json=payload, headers=headers) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(4096):
+                if not chunk:
+                    continue  # Ignora keep‑alive vacíos
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                    logger.info("⏱️ ElevenLabs primer chunk tras %.1f ms", (first_chunk_at - t0) * 1000)
+
+                # WAV → μ‑law crudo (por si acaso)
+                if not header_checked:
+                    header += chunk
+                    if len(header) < 44:
+                        continue
+                    header_checked = True
+                    if header.startswith(b"RIFF"):
+                        logger.warning("⚠️ ElevenLabs devolvió WAV; quitando cabecera de 44 bytes")
+                        header = header[44:]
+                    chunk, header = header, b""
+                    if not chunk:
+                        continue
+
+                total += len(chunk)
+                yield apply_ulaw_gain(chunk, gain)
+
+        # Clip más corto que una cabecera WAV
+        if header:
+            total += len(header)
+            yield apply_ulaw_gain(header, gain)
     except Exception as exc:
         logger.error("🚨 Error solicitando TTS: %s", exc)
-        await _safe_send_mark(websocket_send, stream_sid, "error")
         return
 
-    # 2️⃣ WAV → μ‑law crudo (por si acaso)
-    if audio_raw.startswith(b"RIFF"):
-        logger.warning("⚠️ ElevenLabs devolvió WAV; quitando cabecera de 44 bytes")
-        audio_raw = audio_raw[44:]
-
-    # 3️⃣ Ganancia
-    try:
-        if gain != 1.0:
-            audio_raw = audioop.mul(audio_raw, 1, gain)
-            #logger.info("🔊 Audio amplificado x%.2f", gain)
-    except Exception as exc:
-        logger.warning("❌ Error al amplificar audio: %s", exc)
-
-    if not audio_raw:
+    if total:
+        logger.info(f"[LATENCIA] Audio recibido de ElevenLabs en {1000*(time.perf_counter()-t0):.1f} ms, tamaño: {total} bytes")
+    else:
         logger.error("🚨 ElevenLabs devolvió audio vacío")
-        await _safe_send_mark(websocket_send, stream_sid, "error")
-        return
 
-    total_frames = (len(audio_raw) + FRAME_SIZE - 1) // FRAME_SIZE
-    logger.info("✅ Audio TTS recibido (%d bytes → %d frames)", len(audio_raw), total_frames)
 
-    # 4️⃣ Envío *pacing* a Twilio
-    start_t = time.perf_counter()
-    ts_send_start = start_t
-
-    frame_len = FRAME_SIZE
-    idx = 0
-    try:
-        while idx < total_frames:
-            # Agrupa hasta `group_frames`, respetando longitud real
-            frames_left = total_frames - idx
-            frames_this_round = min(group_frames, frames_left)
-
-            start = idx * frame_len
-            end = min(len(audio_raw), start + frames_this_round * frame_len)
-            chunk = audio_raw[start:end]
-
-            # Padding si último paquete incompleto
-            if len(chunk) % frame_len:
-                pad = frame_len - (len(chunk) % frame_len)
-                chunk += b"\xFF" * pad  # 0xFF = silencio μ‑law
-
-            # Control de pre‑buffer ------------------------------------------
-            now          = time.perf_counter()
-            elapsed_ms   = (now - start_t) * 1000
-            audio_time_ms = idx * 20  # 20 ms por frame ya enviado
-            ahead_ms      = audio_time_ms - elapsed_ms
-            if ahead_ms > max_ahead_ms:
-                sleep_needed = (ahead_ms - max_ahead_ms) / 1000
-                if sleep_needed > 0:
-                    await asyncio.sleep(sleep_needed)
-
-            # Serializar + enviar
-            payload64 = base64.b64encode(chunk).decode("ascii")
-            try:
-                await websocket_send(json.dumps({
-                    "event": "media",
-                    "streamSid": stream_sid,
-                    "media": {"payload": payload64},
-                }))
-            except Exception as ws_exc:
-                logger.warning("⚠️ websocket_send falló: %s", ws_exc)
-                await _safe_send_mark(websocket_send, stream_sid, "error")
-                return
-
-            idx += frames_this_round
-
-            # Pacing para siguiente grupo
-            await asyncio.sleep(0)  # cede control al loop
+def fetch_tts_audio(
+    text: str,
+    *,
+    voice_id: str | None = None,
+    model_id: str = "eleven_multilingual_v2",
+    voice_settings: dict | None = None,
+    timeout: float = 30.0,
+) -> bytes:
+    """Descarga el audio μ‑law 8 kHz completo de un texto (bloqueante).
+
+    Pensado para pre‑renderizar frases fijas fuera del camino crítico
+    (ejecutar con ``asyncio.to_thread``). Lanza excepción si falla.
+    """
+    t0 = time.perf_counter()
+    url = (
+        f"https://api.elevenlabs.io/v1/text-to-speech/"
+        f"{voice_id or ELEVEN_LABS_VOICE_ID}/stream?output_format=ulaw_8000"
+    )
+    headers = {
+        "xi-api-key": ELEVEN_LABS_API_KEY,
+        "Accept": "audio/mulaw",
+    }
+    payload = {"text": text, "model_id": model_id}
+    if voice_settings:
+        payload["voice_settings"] = voice_settings
 
-    finally:
-        envio_ms = (time.perf_counter() - ts_send_start) * 1000
-        logger.info("📶 Audio enviado a Twilio en %.1f ms", envio_ms)
-        logger.info(f"[LATENCIA] Envío total de audio a Twilio completado en {1000*(time.perf_counter()-t0):.1f} ms")
+    response = requests.post(url, json=payload, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    audio_raw = response.content
+    if audio_raw.startswith(b"RIFF"):
+        audio_raw = audio_raw[44:]
 
-    # 5️⃣ Marca de fin
-    logger.info("[FUNCIONALIDAD] Enviando mark de fin a Twilio (end_of_tts)...")
-    await _safe_send_mark(websocket_send, stream_sid, "end_of_tts")
-    logger.info("🏁 Audio completo enviado a Twilio.")
+    logger.info(f"[LATENCIA] Audio pre‑renderizado ({len(text)} chars → {len(audio_raw)} bytes) en {1000*(time.perf_counter()-t0):.1f} ms")
+    return audio_raw
 
 
 # ---------------------------------------------------------------------------
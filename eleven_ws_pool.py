@@ -0,0 +1,274 @@
+# eleven_ws_pool.py
+# -*- coding: utf-8 -*-
+"""
+🏊 POOL DE WEBSOCKETS DE ELEVENLABS
+====================================
+Mantiene sockets de ElevenLabs ya conectados (TLS + config auto_mode)
+para que el TTS esté listo desde que empieza la llamada.
+
+- Un pool por (voice_id, model_id).
+- Las llamadas toman un socket con acquire() y lo devuelven con release().
+- Los sockets usados para hablar no se reutilizan (EL los cierra tras el EOS);
+  el pool repone en segundo plano y descarta los que no estén sanos.
+- Los sockets en espera reciben keepalive para no cerrarse por inactividad.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+from eleven_ws_tts_client import DEFAULT_MODEL_ID, ElevenLabsWSClient
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN DEL POOL =====
+POOL_CONFIG = {
+    "SIZE": int(os.getenv("ELEVEN_WS_POOL_SIZE", "2")),   # sockets calientes por voz/modelo
+    "OPEN_TIMEOUT": 3.0,            # segundos para abrir un socket nuevo
+    "INACTIVITY_TIMEOUT": 180,      # segundos que EL tolera sin texto (máximo permitido)
+    "KEEPALIVE_INTERVAL": 60.0,     # keepalive a sockets en espera
+    "MAX_IDLE_AGE": 600.0,          # reciclar sockets en espera más viejos que esto
+    "MAINTENANCE_INTERVAL": 5.0,    # frecuencia del ciclo de mantenimiento
+}
+
+PoolKey = Tuple[str, str]
+
+
+class ElevenLabsWSPool:
+    """
+    🎯 Pool de clientes ElevenLabsWSClient pre-conectados
+
+    Uso:
+        client = await eleven_ws_pool.acquire()
+        ...
+        await eleven_ws_pool.release(client)
+    """
+
+    def __init__(self, size: int = POOL_CONFIG["SIZE"]):
+        self.size = size
+        self._idle: Dict[PoolKey, Deque[Tuple[ElevenLabsWSClient, float]]] = {}
+        self._in_use: Set[ElevenLabsWSClient] = set()
+        self._pending: Dict[PoolKey, int] = {}
+        self._keys: Set[PoolKey] = set()
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.leases = 0
+        self.warm_leases = 0
+        self.cold_leases = 0
+        self.failed_leases = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.evictions = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    # ========== CICLO DE VIDA ==========
+
+    async def start(self, voice_id: Optional[str] = None, model_id: str = DEFAULT_MODEL_ID) -> None:
+        """
+        🚀 Llena el pool de la voz por defecto y arranca el mantenimiento
+        """
+        if self.size <= 0:
+            logger.info("🏊 Pool de WebSockets ElevenLabs desactivado (SIZE=0)")
+            return
+        self._keys.add(self._key(voice_id, model_id))
+        if not self._maintenance_task or self._maintenance_task.done():
+            self._maintenance_task = asyncio.create_task(
+                self._maintenance_loop(), name="ElevenLabsWSPoolMaintenance"
+            )
+        await self._replenish()
+
+    async def close(self) -> None:
+        """
+        🔌 Detiene el mantenimiento y cierra todos los sockets en espera
+        """
+        if self._maintenance_task:
+            self._maintenance_task.cancel()
+            self._maintenance_task = None
+        idle = [client for queue in self._idle.values() for client, _ in queue]
+        self._idle.clear()
+        await asyncio.gather(*[self._close_client(client) for client in idle], return_exceptions=True)
+        logger.info(f"🏊 Pool ElevenLabs cerrado ({len(idle)} sockets en espera)")
+
+    # ========== PRÉSTAMO ==========
+
+    async def acquire(self, voice_id: Optional[str] = None, model_id: str = DEFAULT_MODEL_ID,
+                      timeout: float = POOL_CONFIG["OPEN_TIMEOUT"]) -> Optional[ElevenLabsWSClient]:
+        """
+        📥 Presta un socket listo; si no hay ninguno caliente, abre uno nuevo
+
+        Returns:
+            Cliente conectado o None si no se pudo conectar
+        """
+        t0 = time.perf_counter()
+        key = self._key(voice_id, model_id)
+        self._keys.add(key)
+        self.leases += 1
+
+        client = self._pop_healthy(key)
+        warm = client is not None
+        if warm:
+            self.warm_leases += 1
+        else:
+            client = await self._connect(key, timeout)
+            if client:
+                self.cold_leases += 1
+
+        wait_ms = 1000 * (time.perf_counter() - t0)
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+        # Reponer en segundo plano lo que se acaba de prestar
+        if self.size > 0:
+            asyncio.create_task(self._replenish())
+
+        if not client:
+            self.failed_leases += 1
+            logger.error(f"❌ Pool ElevenLabs sin socket disponible tras {wait_ms:.1f} ms")
+            return None
+
+        self._in_use.add(client)
+        logger.info(f"[LATENCIA] Socket ElevenLabs prestado en {wait_ms:.1f} ms "
+                    f"({'caliente' if warm else 'nuevo'})")
+        return client
+
+    async def release(self, client: Optional[ElevenLabsWSClient]) -> None:
+        """
+        📤 Devuelve un socket; si ya se usó o no está sano se cierra
+        """
+        if client is None:
+            return
+        self._in_use.discard(client)
+        key = self._key(client.voice_id, client.model_id)
+        queue = self._idle.setdefault(key, deque())
+        if self.size > 0 and client.is_fresh() and len(queue) < self.size:
+            queue.append((client, time.perf_counter()))
+            logger.debug("🏊 Socket ElevenLabs sin usar devuelto al pool")
+            return
+        asyncio.create_task(self._close_client(client))
+
+    # ========== INTERNOS ==========
+
+    @staticmethod
+    def _key(voice_id: Optional[str], model_id: str) -> PoolKey:
+        return (voice_id or os.getenv("ELEVEN_LABS_VOICE_ID", ""), model_id)
+
+    def _pop_healthy(self, key: PoolKey) -> Optional[ElevenLabsWSClient]:
+        queue = self._idle.get(key)
+        while queue:
+            client, _ = queue.popleft()
+            if client.is_fresh():
+                return client
+            self.evictions += 1
+            asyncio.create_task(self._close_client(client))
+        return None
+
+    async def _connect(self, key: PoolKey, timeout: float) -> Optional[ElevenLabsWSClient]:
+        """Abre un socket nuevo y espera a que termine el handshake + config."""
+        voice_id, model_id = key
+        t0 = time.perf_counter()
+        try:
+            client = ElevenLabsWSClient(
+                voice_id=voice_id or None,
+                model_id=model_id,
+                inactivity_timeout=POOL_CONFIG["INACTIVITY_TIMEOUT"],
+            )
+        except Exception as e:
+            self.connect_failures += 1
+            logger.error(f"❌ No se pudo crear cliente ElevenLabs: {e}")
+            return None
+
+        try:
+            await asyncio.wait_for(client._ws_open.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.connect_failures += 1
+            logger.error(f"⏰ Timeout abriendo socket ElevenLabs para el pool ({timeout}s)")
+            asyncio.create_task(self._close_client(client))
+            return None
+
+        if not client.is_healthy():
+            self.connect_failures += 1
+            asyncio.create_task(self._close_client(client))
+            return None
+
+        self.connects += 1
+        logger.debug(f"🏊 Socket ElevenLabs abierto en {1000*(time.perf_counter()-t0):.1f} ms")
+        return client
+
+    async def _replenish(self) -> None:
+        """Abre sockets hasta tener SIZE en espera por cada voz/modelo conocido."""
+        for key in list(self._keys):
+            queue = self._idle.setdefault(key, deque())
+            missing = self.size - len(queue) - self._pending.get(key, 0)
+            if missing <= 0:
+                continue
+            self._pending[key] = self._pending.get(key, 0) + missing
+            try:
+                clients = await asyncio.gather(
+                    *[self._connect(key, POOL_CONFIG["OPEN_TIMEOUT"]) for _ in range(missing)]
+                )
+            finally:
+                self._pending[key] -= missing
+            for client in clients:
+                if client is None:
+                    continue
+                if len(queue) < self.size:
+                    queue.append((client, time.perf_counter()))
+                else:
+                    asyncio.create_task(self._close_client(client))
+
+    async def _maintenance_loop(self) -> None:
+        """Descarta sockets caídos o viejos, envía keepalive y repone."""
+        while True:
+            try:
+                await asyncio.sleep(POOL_CONFIG["MAINTENANCE_INTERVAL"])
+                now = time.perf_counter()
+                for queue in self._idle.values():
+                    for entry in list(queue):
+                        client, idle_since = entry
+                        if not client.is_fresh() or now - idle_since > POOL_CONFIG["MAX_IDLE_AGE"]:
+                            queue.remove(entry)
+                            self.evictions += 1
+                            asyncio.create_task(self._close_client(client))
+                        elif now - client._last_keepalive > POOL_CONFIG["KEEPALIVE_INTERVAL"]:
+                            await client.send_keepalive()
+                await self._replenish()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"❌ Error en mantenimiento del pool ElevenLabs: {e}")
+
+    @staticmethod
+    async def _close_client(client: ElevenLabsWSClient) -> None:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.debug(f"Error cerrando socket del pool: {e}")
+
+    # ========== MÉTRICAS ==========
+
+    def get_stats(self) -> Dict[str, Any]:
+        """📊 Tamaño del pool, tiempos de espera y reconexiones"""
+        return {
+            "target_size": self.size,
+            "idle": {f"{voice}:{model}": len(queue) for (voice, model), queue in self._idle.items()},
+            "in_use": len(self._in_use),
+            "pending_connects": sum(self._pending.values()),
+            "leases": self.leases,
+            "warm_leases": self.warm_leases,
+            "cold_leases": self.cold_leases,
+            "failed_leases": self.failed_leases,
+            "avg_wait_ms": round(self.total_wait_ms / self.leases, 1) if self.leases else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 1),
+            "connects": self.connects,
+            "connect_failures": self.connect_failures,
+            "evictions": self.evictions,
+        }
+
+
+# Instancia global del proceso (compartida por todas las llamadas)
+eleven_ws_pool = ElevenLabsWSPool()
@@ -27,6 +27,16 @@ logger = logging.getLogger(__name__)
 ChunkCallback = Callable[[bytes], Awaitable[None]]
 EndCallback = Callable[[], Awaitable[None]]
 
+# Voz por defecto de las llamadas (compartida con la caché de audio pre-renderizado)
+DEFAULT_MODEL_ID = "eleven_multilingual_v2"
+DEFAULT_VOICE_SETTINGS = {
+    "stability": 0.2,
+    "style": 0.0,
+    #"similarity_boost": 0.4,
+    "use_speaker_boost": False,
+    "speed": 1.0,
+}
+
 
 class ElevenLabsWSClient:
     """Cliente optimizado para TTS streaming con latencia mínima usando auto_mode."""
@@ -36,7 +46,8 @@ class ElevenLabsWSClient:
         *,
         api_key: str | None = None,
         voice_id: str | None = None,
-        model_id: str = "eleven_multilingual_v2",  
+        model_id: str = DEFAULT_MODEL_ID,
+        inactivity_timeout: int | None = None,
     ) -> None:
         # API key: ELEVEN_LABS_API_KEY > parámetro
         self.api_key = api_key or os.getenv("ELEVEN_LABS_API_KEY")
@@ -49,6 +60,8 @@ class ElevenLabsWSClient:
             raise RuntimeError("ElevenLabs Voice ID no encontrado (ELEVEN_LABS_VOICE_ID)")
 
         self.model_id = model_id
+        # Segundos que EL mantiene abierto un socket sin texto (default EL: 20, máx: 180)
+        self.inactivity_timeout = inactivity_timeout
 
         # Loop principal donde despacharemos callbacks
         self._loop = asyncio.get_running_loop()
@@ -71,6 +84,8 @@ class ElevenLabsWSClient:
         self._should_close = False
         self._chunk_counter = 0
         self._send_time = 0.0
+        # Caracteres del turno que ya tienen audio (alignment de EL); None = EL no lo reportó
+        self.aligned_chars: Optional[int] = None
 
         # Nueva bandera para control de cierre
         self._closing = False
@@ -83,14 +98,9 @@ class ElevenLabsWSClient:
         self._connection_start_time = 0.0
         self._total_audio_chunks = 0
         self._total_errors = 0
+        self._last_keepalive = time.perf_counter()
        
-        self.voice_settings = {
-            "stability": 0.2,
-            "style": 0.0,
-            #"similarity_boost": 0.4,
-            "use_speaker_boost": False,
-            "speed": 1.0,
-        }
+        self.voice_settings = dict(DEFAULT_VOICE_SETTINGS)
 
         # Iniciar conexión WebSocket REUTILIZABLE
         self._start_connection()
@@ -131,6 +141,8 @@ class ElevenLabsWSClient:
         """Intenta establecer una conexión WebSocket individual"""
         # ✅ URL optimizada con parámetros de latencia máxima
         url = f"wss://api.elevenlabs.io/v1/text-to-speech/{self.voice_id}/stream-input?model_id={self.model_id}&output_format=ulaw_8000&optimize_streaming_latency=4"
+        if self.inactivity_timeout:
+            url += f"&inactivity_timeout={self.inactivity_timeout}"
         headers = {"xi-api-key": self.api_key}
 
         try:
@@ -243,6 +255,11 @@ class ElevenLabsWSClient:
             logger.warning("⚠️ Mensaje None recibido del WebSocket")
             return
         
+        # Caracteres cubiertos por este audio (para saber qué texto ya se habló)
+        alignment = data.get("alignment") or data.get("normalizedAlignment")
+        if isinstance(alignment, dict) and isinstance(alignment.get("chars"), list):
+            self.aligned_chars = (self.aligned_chars or 0) + len(alignment["chars"])
+
         # Mensaje de audio
         if "audio" in data:
             audio_b64 = data["audio"]
@@ -289,13 +306,12 @@ class ElevenLabsWSClient:
                         logger.info(f"[DIAGNÓSTICO] Primer chunk recibido tras {self._total_audio_chunks} intentos")
                     self._loop.call_soon_threadsafe(self._first_chunk.set)
                 
-                # Enviar chunk al callback con validación adicional
+                # Enviar chunk al callback con validación adicional.
+                # Se espera directamente (mismo loop) para conservar el orden de los chunks.
                 if self._user_chunk:
                     try:
                         if asyncio.iscoroutinefunction(self._user_chunk):
-                            asyncio.run_coroutine_threadsafe(
-                                self._user_chunk(audio_bytes), self._loop
-                            )
+                            await self._user_chunk(audio_bytes)
                         else:
                             self._loop.call_soon_threadsafe(self._user_chunk, audio_bytes)
                     except Exception as e:
@@ -353,11 +369,14 @@ class ElevenLabsWSClient:
             return False
             
         try:
-            message = {"text": text_chunk.strip()}
+            # EL concatena los chunks tal cual: el espacio final evita pegar oraciones
+            message = {"text": text_chunk.strip() + " "}
             
             logger.info(f"📤 Chunk directo a EL: '{text_chunk.strip()[:40]}...' ({len(text_chunk.strip())} chars)")
             
-            self._send_time = time.perf_counter()
+            # La latencia al primer audio se mide desde el PRIMER chunk del turno
+            if not self._send_time:
+                self._send_time = time.perf_counter()
             await self._ws.send(json.dumps(message))
             
             return True
@@ -387,6 +406,36 @@ class ElevenLabsWSClient:
             self._total_errors += 1
             return False
 
+    async def begin_stream(
+        self,
+        on_chunk: ChunkCallback,
+        *,
+        on_end: Optional[EndCallback] = None,
+        timeout_open: float = 3.0,
+    ) -> bool:
+        """
+        Prepara un turno de streaming incremental: registra callbacks y deja
+        el socket listo para recibir add_text_chunk() + finalize_stream().
+        """
+        try:
+            await asyncio.wait_for(self._ws_open.wait(), timeout=timeout_open)
+        except asyncio.TimeoutError:
+            logger.error("❌ Timeout esperando conexión ElevenLabs (streaming)")
+            return False
+
+        if not self._ws:
+            logger.error("❌ WebSocket no disponible para streaming")
+            return False
+
+        self._first_chunk = asyncio.Event()
+        self._user_chunk = on_chunk
+        self._user_end = on_end
+        self._is_speaking = True
+        self._send_time = 0.0
+        self.aligned_chars = None
+        logger.info("⏱️ [LATENCIA-4-START] EL WS listo para streaming incremental")
+        return True
+
     async def speak(
         self,
         text: str,
@@ -397,7 +446,7 @@ class ElevenLabsWSClient:
     ) -> bool:
         """
         API compatible con versión anterior para texto completo.
-        Para streaming real usar add_text_chunk() + finalize_stream()
+        Para streaming real usar begin_stream() + add_text_chunk() + finalize_stream()
         """
         t0 = time.perf_counter()
         # Esperar conexión con timeout más agresivo
@@ -446,6 +495,18 @@ class ElevenLabsWSClient:
             self._total_errors += 1
             return False
 
+    async def cancel_turn(self) -> None:
+        """
+        Descarta el turno en curso (barge-in): deja de entregar audio y
+        cierra el socket, que ya no sirve para otro turno.
+        """
+        self._user_chunk = None
+        self._user_end = None
+        self._is_speaking = True  # ya no está "fresco": el pool no lo reutiliza
+        if self._first_chunk and not self._first_chunk.is_set():
+            self._first_chunk.set()
+        asyncio.create_task(self.close())
+
     async def close(self):
         """Cierra la conexión WebSocket"""
         logger.info("🔒 Cerrando ElevenLabs WebSocket...")
@@ -485,6 +546,32 @@ class ElevenLabsWSClient:
 
         logger.info("✅ ElevenLabs WebSocket cerrado")
 
+    def is_healthy(self) -> bool:
+        """True si el socket está abierto y no está cerrándose."""
+        return (
+            self._ws_open.is_set()
+            and self._ws is not None
+            and not self._closing
+            and not getattr(self._ws, "closed", False)
+        )
+
+    def is_fresh(self) -> bool:
+        """True si el socket está sano y aún no se ha usado para hablar."""
+        return self.is_healthy() and not self._is_speaking
+
+    async def send_keepalive(self) -> bool:
+        """Envía un espacio para que EL no cierre el socket por inactividad."""
+        if not self._ws:
+            return False
+        try:
+            await self._ws.send(json.dumps({"text": " "}))
+            self._last_keepalive = time.perf_counter()
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Error enviando keepalive a ElevenLabs: {e}")
+            self._total_errors += 1
+            return False
+
     def get_diagnostics(self) -> dict:
         """Retorna métricas de diagnóstico del cliente"""
         return {
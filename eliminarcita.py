@@ -19,6 +19,7 @@ from utils import (
     normalizar_telefono
     # search_calendar_event_by_phone, # Es llamado por la IA antes de llamar a esta función
 )
+from availability_cache import record_calendar_change
 
 logging.basicConfig(level=logging.INFO) # Ajusta el nivel según necesites
 logger = logging.getLogger(__name__)
@@ -43,23 +44,10 @@ def delete_calendar_event(event_id: str, original_start_time_iso: str | None = N
     Retorna:
         Un diccionario con un mensaje de éxito o un diccionario con una clave "error".
     """
-  # ─── Parche: si la IA mandó un ID vacío o de ejemplo, usamos el seleccionado ───
-    current_id = session_state.get("current_event_id")
-    if current_id:
-        event_id = current_id
-
-
-    logger.info(f"Intentando eliminar evento ID: {event_id}"
-                f"{f' (hora original confirmada: {original_start_time_iso})' if original_start_time_iso else ''}")
-
-    if not event_id:
-        logger.error("No se proporcionó event_id para eliminar la cita.")
-        return {"error": "No se especificó el ID de la cita a eliminar."}
-
-    # Validación opcional del formato de original_start_time_iso si se usa
-    if original_start_time_iso and not _validate_iso_datetime_string_simple(original_start_time_iso):
-        logger.warning(f"El formato de original_start_time_iso ('{original_start_time_iso}') parece inválido, pero se procederá con la eliminación por ID.")
-        # No es un error fatal ya que el event_id es lo principal.
+    event_id = _resolve_event_id(event_id)
+    error = _validate_delete_request(event_id, original_start_time_iso)
+    if error:
+        return error
 
     try:
         service = initialize_google_calendar()
@@ -78,17 +66,72 @@ def delete_calendar_event(event_id: str, original_start_time_iso: str | None = N
 
 
         service.events().delete(calendarId=GOOGLE_CALENDAR_ID, eventId=event_id).execute()
-        
-        logger.info(f"✅ Cita eliminada exitosamente. Evento ID: {event_id}, Resumen: {event_summary}")
-        return {
-            "message": f"La cita para '{event_summary}' ha sido eliminada con éxito.",
-            "deleted_event_id": event_id
-        }
+        record_calendar_change({"id": event_id, "status": "cancelled"})
+        return _deleted_result(event_id, event_summary)
 
     except Exception as e:
-        logger.error(f"❌ Error en la función delete_calendar_event al intentar eliminar ID {event_id}: {str(e)}", exc_info=True)
-        # Si el error es por no encontrado, intenta detectar por mensaje
-        if "notFound" in str(e) or "404" in str(e):
-             logger.warning(f"El evento con ID {event_id} no fue encontrado. Es posible que ya haya sido eliminado.")
-             return {"error": f"La cita con ID {event_id} no fue encontrada. Es posible que ya haya sido eliminada."}
-        return {"error": f"Ocurrió un error en el servidor al intentar eliminar la cita: {str(e)}"}
\ No newline at end of file
+        return _delete_error_result(event_id, e)
+
+
+async def delete_calendar_event_async(event_id: str, original_start_time_iso: str | None = None):
+    """Igual que delete_calendar_event, pero con el cliente asíncrono (calendar_async)."""
+    from calendar_async import calendar_async
+
+    event_id = _resolve_event_id(event_id)
+    error = _validate_delete_request(event_id, original_start_time_iso)
+    if error:
+        return error
+
+    try:
+        try:
+            event_to_delete = await calendar_async.events_get(GOOGLE_CALENDAR_ID, event_id)
+            event_summary = event_to_delete.get('summary', '(cita sin título)')
+            logger.info(f"Se procederá a eliminar la cita: '{event_summary}' (ID: {event_id})")
+        except Exception as e_get:
+            logger.warning(f"No se pudo obtener el evento {event_id} antes de eliminar (puede que ya no exista o ID incorrecto): {e_get}")
+            event_summary = "(no se pudo obtener resumen)"
+
+        await calendar_async.events_delete(GOOGLE_CALENDAR_ID, event_id)
+        record_calendar_change({"id": event_id, "status": "cancelled"})
+        return _deleted_result(event_id, event_summary)
+
+    except Exception as e:
+        return _delete_error_result(event_id, e)
+
+
+def _resolve_event_id(event_id: str) -> str:
+    # ─── Parche: si la IA mandó un ID vacío o de ejemplo, usamos el seleccionado ───
+    current_id = session_state.get("current_event_id")
+    return current_id or event_id
+
+
+def _validate_delete_request(event_id: str, original_start_time_iso: str | None) -> dict | None:
+    logger.info(f"Intentando eliminar evento ID: {event_id}"
+                f"{f' (hora original confirmada: {original_start_time_iso})' if original_start_time_iso else ''}")
+
+    if not event_id:
+        logger.error("No se proporcionó event_id para eliminar la cita.")
+        return {"error": "No se especificó el ID de la cita a eliminar."}
+
+    # Validación opcional del formato de original_start_time_iso si se usa
+    if original_start_time_iso and not _validate_iso_datetime_string_simple(original_start_time_iso):
+        logger.warning(f"El formato de original_start_time_iso ('{original_start_time_iso}') parece inválido, pero se procederá con la eliminación por ID.")
+        # No es un error fatal ya que el event_id es lo principal.
+    return None
+
+
+def _deleted_result(event_id: str, event_summary: str) -> dict:
+    logger.info(f"✅ Cita eliminada exitosamente. Evento ID: {event_id}, Resumen: {event_summary}")
+    return {
+        "message": f"La cita para '{event_summary}' ha sido eliminada con éxito.",
+        "deleted_event_id": event_id
+    }
+
+
+def _delete_error_result(event_id: str, e: Exception) -> dict:
+    logger.error(f"❌ Error en la función delete_calendar_event al intentar eliminar ID {event_id}: {str(e)}", exc_info=True)
+    # Si el error es por no encontrado, intenta detectar por mensaje
+    if "notFound" in str(e) or "404" in str(e):
+         logger.warning(f"El evento con ID {event_id} no fue encontrado. Es posible que ya haya sido eliminado.")
+         return {"error": f"La cita con ID {event_id} no fue encontrada. Es posible que ya haya sido eliminada."}
+    return {"error": f"Ocurrió un error en el servidor al intentar eliminar la cita: {str(e)}"}
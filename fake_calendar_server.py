@@ -0,0 +1,265 @@
+# fake_calendar_server.py
+# -*- coding: utf-8 -*-
+"""
+🧪 SERVIDOR FALSO DE GOOGLE CALENDAR (LOCAL)
+=============================================
+Implementa en memoria lo que usa el asistente:
+
+- POST   /token                                   (OAuth JWT bearer, acepta cualquier assertion)
+- POST   /calendar/v3/freeBusy
+- GET    /calendar/v3/calendars/{id}/events        (q, timeMin, syncToken → 410 si venció)
+- POST   /calendar/v3/calendars/{id}/events
+- GET    /calendar/v3/calendars/{id}/events/{eventId}
+- PATCH  /calendar/v3/calendars/{id}/events/{eventId}
+- DELETE /calendar/v3/calendars/{id}/events/{eventId}
+
+Sirve tanto al cliente asíncrono (calendar_async.py) como a
+googleapiclient (client_options={"api_endpoint": url}), con latencia y
+tasa de fallos (429/503) configurables para probar reintentos.
+
+Uso:
+    python fake_calendar_server.py --port 8765 --latency 0.15 --fail-rate 0.05
+    GOOGLE_CALENDAR_API_URL=http://127.0.0.1:8765/calendar/v3 \\
+    GOOGLE_CALENDAR_TOKEN_URI=http://127.0.0.1:8765/token CALENDAR_ASYNC_ENABLED=true ...
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+API_PREFIX = "/calendar/v3"
+
+
+class FakeCalendarStore:
+    """📅 Eventos en memoria, por calendario"""
+
+    def __init__(self):
+        self.events = {}   # calendar_id -> {event_id: evento} (cancelados quedan como lápida)
+        self.versions = {}  # event_id -> versión del último cambio
+        self.version = 0
+        self.min_sync_token = 0   # tokens menores responden 410 (simula expiración)
+        self.lock = threading.Lock()
+
+    def _calendar(self, calendar_id):
+        return self.events.setdefault(calendar_id, {})
+
+    def _touch(self, event_id):
+        self.version += 1
+        self.versions[event_id] = self.version
+
+    def _live(self, calendar_id, event_id):
+        event = self._calendar(calendar_id).get(event_id)
+        return event if event and event.get("status") != "cancelled" else None
+
+    def insert(self, calendar_id, body):
+        """Evento creado, o None si el id del cliente ya existe (Google responde 409)."""
+        with self.lock:
+            event_id = body.get("id") or uuid.uuid4().hex
+            if event_id in self._calendar(calendar_id):
+                return None
+            event = dict(body, id=event_id, status="confirmed")
+            self._calendar(calendar_id)[event["id"]] = event
+            self._touch(event["id"])
+            return event
+
+    def get(self, calendar_id, event_id):
+        with self.lock:
+            return self._live(calendar_id, event_id)
+
+    def patch(self, calendar_id, event_id, body):
+        with self.lock:
+            event = self._live(calendar_id, event_id)
+            if event is not None:
+                event.update(body)
+                self._touch(event_id)
+            return event
+
+    def delete(self, calendar_id, event_id):
+        with self.lock:
+            event = self._live(calendar_id, event_id)
+            if event is None:
+                return False
+            self._calendar(calendar_id)[event_id] = {"id": event_id, "status": "cancelled"}
+            self._touch(event_id)
+            return True
+
+    def expire_sync_tokens(self):
+        """Invalida los syncToken emitidos hasta ahora (el siguiente incremental recibe 410)."""
+        with self.lock:
+            self.min_sync_token = self.version + 1
+
+    def changes_since(self, calendar_id, sync_token):
+        """(eventos cambiados incl. cancelados, token nuevo) o None si el token venció."""
+        with self.lock:
+            try:
+                since = int(sync_token)
+            except ValueError:
+                return None
+            if since < self.min_sync_token:
+                return None
+            items = [e for eid, e in self._calendar(calendar_id).items() if self.versions.get(eid, 0) > since]
+            return items, str(self.version)
+
+    def search(self, calendar_id, q=None, time_min=None):
+        with self.lock:
+            items = [e for e in self._calendar(calendar_id).values() if e.get("status") != "cancelled"]
+        if q:
+            items = [e for e in items if q in e.get("summary", "") or q in e.get("description", "")]
+        if time_min:
+            items = [e for e in items if e.get("start", {}).get("dateTime", "") >= time_min[:19]]
+        return sorted(items, key=lambda e: e.get("start", {}).get("dateTime", ""))
+
+    def busy(self, calendar_id):
+        with self.lock:
+            events = [e for e in self._calendar(calendar_id).values() if e.get("status") != "cancelled"]
+        return [{"start": e["start"]["dateTime"], "end": e["end"]["dateTime"]} for e in events]
+
+
+class _FakeCalendarHandler(BaseHTTPRequestHandler):
+    store = FakeCalendarStore()
+    latency = 0.0
+    fail_rate = 0.0
+    requests_served = 0
+
+    def log_message(self, *args):  # silencio
+        pass
+
+    # ----- utilidades -----
+
+    def _json_body(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw and self.headers.get("Content-Type", "").startswith("application/json") else raw
+
+    def _send(self, status, payload=None, headers=None):
+        data = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self):
+        self._send(404, {"error": {"code": 404, "message": "Not Found", "errors": [{"reason": "notFound"}]}})
+
+    def _simulate_network(self):
+        """Latencia + fallos transitorios. Devuelve True si ya respondió con error."""
+        type(self).requests_served += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            if random.random() < 0.5:
+                self._send(429, {"error": {"code": 429, "message": "Rate Limit Exceeded"}}, {"Retry-After": "0"})
+            else:
+                self._send(503, {"error": {"code": 503, "message": "Backend Error"}})
+            return True
+        return False
+
+    def _route(self):
+        """(calendar_id, event_id) a partir de la ruta, o None si no es de eventos."""
+        parts = [unquote(p) for p in urlparse(self.path).path[len(API_PREFIX):].strip("/").split("/")]
+        if len(parts) >= 3 and parts[0] == "calendars" and parts[2] == "events":
+            return parts[1], parts[3] if len(parts) > 3 else None
+        return None
+
+    # ----- verbos -----
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path == "/token":
+            self._json_body()
+            self._send(200, {"access_token": f"fake-{uuid.uuid4().hex[:8]}", "expires_in": 3600, "token_type": "Bearer"})
+            return
+        body = self._json_body()
+        if self._simulate_network():
+            return
+        if path == f"{API_PREFIX}/freeBusy":
+            calendars = {item["id"]: {"busy": self.store.busy(item["id"])} for item in body.get("items", [])}
+            self._send(200, {"kind": "calendar#freeBusy", "calendars": calendars})
+            return
+        route = self._route()
+        if route and route[1] is None:
+            event = self.store.insert(route[0], body)
+            if event is None:
+                self._send(409, {"error": {"code": 409, "message": "The requested identifier already exists.",
+                                           "errors": [{"reason": "duplicate"}]}})
+                return
+            self._send(200, event)
+            return
+        self._not_found()
+
+    def do_GET(self):
+        if self._simulate_network():
+            return
+        route = self._route()
+        if not route:
+            self._not_found()
+            return
+        calendar_id, event_id = route
+        if event_id is None:
+            query = parse_qs(urlparse(self.path).query)
+            if "syncToken" in query:
+                changes = self.store.changes_since(calendar_id, query["syncToken"][0])
+                if changes is None:
+                    self._send(410, {"error": {"code": 410, "message": "Sync token is no longer valid",
+                                               "errors": [{"reason": "fullSyncRequired"}]}})
+                    return
+                items, token = changes
+            else:
+                items = self.store.search(calendar_id, query.get("q", [None])[0], query.get("timeMin", [None])[0])
+                token = str(self.store.version)
+            self._send(200, {"kind": "calendar#events", "items": items, "nextSyncToken": token})
+            return
+        event = self.store.get(calendar_id, event_id)
+        self._send(200, event) if event else self._not_found()
+
+    def do_PATCH(self):
+        body = self._json_body()
+        if self._simulate_network():
+            return
+        route = self._route()
+        event = self.store.patch(route[0], route[1], body) if route and route[1] else None
+        self._send(200, event) if event else self._not_found()
+
+    def do_DELETE(self):
+        if self._simulate_network():
+            return
+        route = self._route()
+        if route and route[1] and self.store.delete(route[0], route[1]):
+            self._send(204)
+        else:
+            self._not_found()
+
+
+def start_fake_calendar_server(port: int = 0, latency: float = 0.0, fail_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Arranca el servidor en un hilo; la URL base es http://127.0.0.1:{port}/calendar/v3"""
+    _FakeCalendarHandler.latency = latency
+    _FakeCalendarHandler.fail_rate = fail_rate
+    server = ThreadingHTTPServer(("127.0.0.1", port), _FakeCalendarHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.15, help="segundos por petición")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fracción de respuestas 429/503")
+    args = parser.parse_args()
+
+    srv = start_fake_calendar_server(args.port, args.latency, args.fail_rate)
+    print(f"📅 Calendar falso en http://127.0.0.1:{srv.server_address[1]}{API_PREFIX} (token: /token)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -0,0 +1,187 @@
+# google_calendar_service.py
+# -*- coding: utf-8 -*-
+"""
+📅 SERVICIO COMPARTIDO DE GOOGLE CALENDAR
+==========================================
+Antes, cada herramienta (crear/editar/eliminar/buscar cita, caché de
+slots) reconstruía credenciales, pedía un token nuevo y parseaba el
+documento de discovery en cada llamada.
+
+Ahora:
+- Credenciales de la service account: una sola vez por proceso.
+- Token de acceso en caché, renovado ANTES de expirar (con lock).
+- Documento de discovery estático (incluido en google-api-python-client).
+- Un cliente por hilo (httplib2 no es thread-safe) que reutiliza su
+  conexión keep-alive entre llamadas.
+- Métricas: tiempo de construcción en frío vs reutilización, y el
+  ahorro estimado por llamada.
+"""
+
+import datetime
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import google_auth_httplib2
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.service_account import Credentials
+from googleapiclient.discovery import build
+
+from utils import (
+    GOOGLE_CLIENT_CERT_URL,
+    GOOGLE_CLIENT_EMAIL,
+    GOOGLE_CLIENT_ID,
+    GOOGLE_PRIVATE_KEY,
+    GOOGLE_PRIVATE_KEY_ID,
+    GOOGLE_PROJECT_ID,
+)
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN =====
+CALENDAR_SERVICE_CONFIG = {
+    "SCOPES": ["https://www.googleapis.com/auth/calendar"],
+    "TOKEN_REFRESH_MARGIN": 300,    # renovar si quedan < 5 min de token
+    "HTTP_TIMEOUT": 15,             # segundos por petición a Google
+    "LATENCY_HISTORY": 100,
+}
+
+
+class CalendarServiceProvider:
+    """
+    🎯 Entrega un cliente de Google Calendar listo para usar, por hilo
+
+    Uso:
+        service = calendar_service.get_service()
+        service.events().list(...).execute()
+    """
+
+    def __init__(self):
+        self._credentials: Optional[Credentials] = None
+        self._credentials_lock = threading.Lock()
+        self._token_lock = threading.Lock()
+        self._local = threading.local()
+
+        # Métricas
+        self.cold_builds = 0
+        self.reuses = 0
+        self.token_refreshes = 0
+        self.cold_ms: Deque[float] = deque(maxlen=CALENDAR_SERVICE_CONFIG["LATENCY_HISTORY"])
+        self.warm_ms: Deque[float] = deque(maxlen=CALENDAR_SERVICE_CONFIG["LATENCY_HISTORY"])
+        self.first_init_ms: Optional[float] = None   # credenciales + token + discovery (como antes)
+
+    # ========== CREDENCIALES ==========
+
+    def _get_credentials(self) -> Credentials:
+        """Credenciales de la service account (una sola vez por proceso)."""
+        if self._credentials is None:
+            with self._credentials_lock:
+                if self._credentials is None:
+                    credentials_info = {
+                        "type": "service_account",
+                        "project_id": GOOGLE_PROJECT_ID,
+                        "private_key_id": GOOGLE_PRIVATE_KEY_ID,
+                        "private_key": GOOGLE_PRIVATE_KEY,
+                        "client_email": GOOGLE_CLIENT_EMAIL,
+                        "client_id": GOOGLE_CLIENT_ID,
+                        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+                        "token_uri": "https://oauth2.googleapis.com/token",
+                        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+                        "client_x509_cert_url": GOOGLE_CLIENT_CERT_URL
+                    }
+                    self._credentials = Credentials.from_service_account_info(
+                        credentials_info,
+                        scopes=CALENDAR_SERVICE_CONFIG["SCOPES"]
+                    )
+        return self._credentials
+
+    def _token_expiring(self, credentials: Credentials) -> bool:
+        if not credentials.token or not credentials.expiry:
+            return True
+        margin = datetime.timedelta(seconds=CALENDAR_SERVICE_CONFIG["TOKEN_REFRESH_MARGIN"])
+        # google-auth usa expiry en UTC sin zona horaria
+        return credentials.expiry - datetime.datetime.utcnow() < margin
+
+    def _ensure_token(self) -> Credentials:
+        """
+        🔑 Token vigente compartido por todos los hilos
+
+        Se renueva antes de expirar y bajo lock, así ningún hilo lo
+        refresca a mitad de una petición de otro.
+        """
+        credentials = self._get_credentials()
+        if self._token_expiring(credentials):
+            with self._token_lock:
+                if self._token_expiring(credentials):
+                    t0 = time.perf_counter()
+                    credentials.refresh(Request())
+                    self.token_refreshes += 1
+                    logger.info(f"[LATENCIA] Token de Google Calendar renovado en {1000*(time.perf_counter()-t0):.1f} ms")
+        return credentials
+
+    # ========== SERVICIO ==========
+
+    def get_service(self):
+        """
+        📅 Cliente de Calendar para el hilo actual (se construye solo la primera vez)
+        """
+        t0 = time.perf_counter()
+        credentials = self._ensure_token()
+
+        service = getattr(self._local, "service", None)
+        if service is not None:
+            elapsed_ms = 1000 * (time.perf_counter() - t0)
+            self.reuses += 1
+            self.warm_ms.append(elapsed_ms)
+            return service
+
+        logger.info("🔍 Inicializando Google Calendar (cliente para este hilo)...")
+        authed_http = google_auth_httplib2.AuthorizedHttp(
+            credentials,
+            http=httplib2.Http(timeout=CALENDAR_SERVICE_CONFIG["HTTP_TIMEOUT"])
+        )
+        service = build(
+            "calendar", "v3",
+            http=authed_http,
+            static_discovery=True,
+            cache_discovery=False,
+        )
+        self._local.service = service
+
+        elapsed_ms = 1000 * (time.perf_counter() - t0)
+        self.cold_builds += 1
+        self.cold_ms.append(elapsed_ms)
+        if self.first_init_ms is None:
+            self.first_init_ms = elapsed_ms
+        logger.info(f"[LATENCIA] Cliente de Google Calendar construido en {elapsed_ms:.1f} ms")
+        return service
+
+    # ========== MÉTRICAS ==========
+
+    def get_stats(self) -> Dict[str, Any]:
+        def avg(samples: Deque[float]) -> Optional[float]:
+            return round(sum(samples) / len(samples), 2) if samples else None
+
+        cold = self.first_init_ms
+        warm = avg(self.warm_ms)
+        saved_per_call = round(cold - warm, 1) if cold is not None and warm is not None else None
+        credentials = self._credentials
+        return {
+            "cold_builds": self.cold_builds,
+            "reuses": self.reuses,
+            "token_refreshes": self.token_refreshes,
+            "token_expiry": credentials.expiry.isoformat() if credentials and credentials.expiry else None,
+            "first_init_ms": round(cold, 1) if cold is not None else None,
+            "avg_cold_build_ms": avg(self.cold_ms),
+            "avg_reuse_ms": warm,
+            # Lo que costaba antes cada llamada (init completo) menos lo que cuesta ahora
+            "estimated_saved_ms_per_call": saved_per_call,
+            "estimated_saved_ms_total": round(saved_per_call * self.reuses, 1) if saved_per_call is not None else None,
+        }
+
+
+# ===== INSTANCIA GLOBAL =====
+calendar_service = CalendarServiceProvider()
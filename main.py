@@ -19,16 +19,29 @@ import traceback
 from typing import Optional, Union, List, Dict, Any
 from fastapi import FastAPI, Response, WebSocket, Body, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import time
-import httpx
 from datetime import datetime
+from urllib.parse import parse_qs
 
 # === TWILIO IMPORTS ===
 from twilio.jwt.client import ClientCapabilityToken
 
 # === NUEVA ARQUITECTURA ===
-from call_orchestrator import CallOrchestrator
+from call_orchestrator import CallOrchestrator, GREETING_TEXT
+from tts_cache import greeting_cache, phrase_cache, get_static_phrases
+from eleven_ws_pool import eleven_ws_pool
+from stt_preconnect import stt_preconnect
+from eleven_http_client import close_http_client
+from tool_executor import tool_executor
+from calendar_async import calendar_async
+from availability_cache import availability_cache, slot_holds
+from state_store import session_store
+from conversation_store import conversation_store, conversation_store_async
+from chat_timers import CHAT_TIMERS_CONFIG, PULSE, chat_timers
+from webhook_dispatcher import webhook_dispatcher
+from weather_utils import weather_provider
 
 # === MÓDULOS EXISTENTES ===
 from consultarinfo import router as consultorio_router
@@ -98,12 +111,10 @@ global_call_limiter = {
     "last_reset": None
 }
 
-# ===== ESTADO GLOBAL =====
-conversation_histories: Dict[str, List[Dict]] = {}
-full_conversation_histories: Dict[str, List[Dict]] = {}
-
-# ===== ESTADO DE CHATS DE TEXTO (TIMEOUTS/PULSOS) =====
-TEXT_CHAT_STATE: Dict[str, Dict[str, Any]] = {}
+# ===== ESTADO DE CHATS DE TEXTO =====
+# Historial y estado (timeouts/pulsos) viven en conversation_store
+# (memoria, SQLite o Redis según CONVERSATION_STORE_BACKEND)
+TEXT_HISTORY_WINDOW = 20   # mensajes previos que ve la IA
 
 # ===== RUTAS =====
 app.include_router(consultorio_router, prefix="/api_v1")
@@ -119,21 +130,88 @@ async def startup_event():
     os.makedirs("audio", exist_ok=True)
     os.makedirs("audio_debug", exist_ok=True)
     
-    # Pre-cargar datos en caché
+    # Slots libres: primera carga y refresco periódico en segundo plano
     try:
-        buscarslot.load_free_slots_to_cache()
+        await availability_cache.start()
     except Exception as e:
         logger.warning(f"Error pre-cargando datos: {e}")
     
+    # Pre-renderizar el saludo (en segundo plano, no bloquea el arranque)
+    try:
+        asyncio.create_task(greeting_cache.warm([GREETING_TEXT]))
+        logger.info("💾 Pre-renderizado del saludo en curso")
+    except Exception as e:
+        logger.warning(f"No se pudo iniciar el pre-renderizado del saludo: {e}")
+    
+    # Abrir sockets de ElevenLabs por adelantado (TTS listo al empezar la llamada)
+    try:
+        asyncio.create_task(eleven_ws_pool.start())
+        logger.info("🏊 Pool de WebSockets ElevenLabs calentándose")
+    except Exception as e:
+        logger.warning(f"No se pudo iniciar el pool de WebSockets ElevenLabs: {e}")
+    
+    # Clima en memoria con refresco en segundo plano (el turno de voz no espera a OpenWeatherMap)
+    try:
+        await weather_provider.start()
+        logger.info("🌤️ Refresco de clima en segundo plano iniciado")
+    except Exception as e:
+        logger.warning(f"No se pudo iniciar el refresco de clima: {e}")
+    
+    # Calentar la caché de frases fijas (despedida, disculpas, respuestas sintéticas)
+    try:
+        asyncio.create_task(phrase_cache.warm(get_static_phrases()))
+        logger.info("💾 Calentamiento de la caché de frases en curso")
+    except Exception as e:
+        logger.warning(f"No se pudo iniciar el calentamiento de la caché de frases: {e}")
+    
     logger.info("🚀 Backend iniciado - Nueva arquitectura modular activa")
     logger.info(f"[LATENCIA] Backend startup completado en {1000*(time.perf_counter()-t0):.1f} ms")
 
-    # Iniciar monitor de chats de texto (pulsos a 20 min, cierre a 60 min)
+    # Webhooks salientes a n8n (cliente compartido, cola y reintentos)
     try:
-        asyncio.create_task(_background_text_chat_monitor())
-        logger.info("💬 Monitor de chats de texto iniciado")
+        await webhook_dispatcher.start()
+        logger.info("📮 Despachador de webhooks iniciado")
     except Exception as e:
-        logger.error(f"No se pudo iniciar el monitor de chats de texto: {e}")
+        logger.error(f"No se pudo iniciar el despachador de webhooks: {e}")
+
+    # Temporizadores de chats de texto (pulsos a 20 min, cierre a 60 min), restaurados del almacén
+    try:
+        await chat_timers.start(_on_chat_timer, conversation_store_async)
+        logger.info("💬 Temporizadores de chats de texto iniciados")
+    except Exception as e:
+        logger.error(f"No se pudo iniciar los temporizadores de chats de texto: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    🔌 Cierre ordenado del servidor
+    """
+    try:
+        await eleven_ws_pool.close()
+    except Exception as e:
+        logger.warning(f"Error cerrando el pool de WebSockets ElevenLabs: {e}")
+    try:
+        await stt_preconnect.close_all()
+    except Exception as e:
+        logger.warning(f"Error cerrando sesiones Deepgram pre-conectadas: {e}")
+    try:
+        await close_http_client()
+    except Exception as e:
+        logger.warning(f"Error cerrando el cliente HTTP de ElevenLabs: {e}")
+    await weather_provider.stop()
+    await availability_cache.stop()
+    try:
+        await calendar_async.close()
+    except Exception as e:
+        logger.warning(f"Error cerrando el cliente asíncrono de Google Calendar: {e}")
+    await chat_timers.stop()
+    try:
+        await webhook_dispatcher.stop()   # intenta vaciar los resúmenes pendientes
+    except Exception as e:
+        logger.warning(f"Error cerrando el despachador de webhooks: {e}")
+    conversation_store.close()
+    tool_executor.shutdown()
 
 
 @app.get("/")
@@ -149,15 +227,26 @@ async def root():
 # ========== ENDPOINTS DE VOZ (TWILIO) ==========
 
 @app.post("/twilio-voice")
-async def twilio_voice():
+async def twilio_voice(request: Request):
     """
     📞 Endpoint que Twilio llama cuando entra una llamada
     
-    Responde con TwiML que abre un Stream hacia nuestro WebSocket
+    Responde con TwiML que abre un Stream hacia nuestro WebSocket.
+    Mientras Twilio abre el Stream, ya se está conectando Deepgram.
     """
     logger.info("[FUNCIONALIDAD] Nueva llamada entrante (POST /twilio-voice)")
     t0 = time.perf_counter()
     
+    # Pre-conectar Deepgram con el CallSid del formulario de Twilio (no bloquea)
+    try:
+        form = parse_qs((await request.body()).decode("utf-8", errors="ignore"))
+        call_sid = (form.get("CallSid") or [None])[0]
+        if call_sid:
+            stt_preconnect.open(call_sid)
+            logger.info(f"🎤 Pre-conexión de Deepgram iniciada para {call_sid}")
+    except Exception as e:
+        logger.warning(f"No se pudo iniciar la pre-conexión de Deepgram: {e}")
+    
     # TwiML para iniciar streaming
     twiml_response = """<?xml version="1.0" encoding="UTF-8"?>
 <Response>
@@ -310,10 +399,83 @@ def clean_null_values(data: Dict[str, Any]) -> Dict[str, Any]:
     return cleaned
 
 
+TEXT_WEBHOOK_CONFIG = {
+    "DISCONNECT_POLL": 0.25,        # segundos entre chequeos de desconexión del cliente
+}
+
+
 @app.post("/webhook/n8n_message")
-async def receive_n8n_message(message_data: N8NMessage):
+async def receive_n8n_message(message_data: N8NMessage, request: Request):
     """
     💬 Webhook para mensajes de texto desde n8n - VERSIÓN ACTUALIZADA
+    
+    Si el cliente se desconecta antes de la respuesta, se cancela el procesamiento.
+    """
+    task = asyncio.create_task(_process_n8n_message(message_data))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=TEXT_WEBHOOK_CONFIG["DISCONNECT_POLL"])
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            logger.warning(f"🔌 Cliente desconectado, mensaje de {message_data.session_id} cancelado")
+            return Response(status_code=499)
+
+
+@app.post("/webhook/n8n_message/stream")
+async def receive_n8n_message_stream(message_data: N8NMessage):
+    """
+    🌊 Igual que /webhook/n8n_message pero entrega la respuesta en streaming (NDJSON)
+    
+    Líneas {"type": "delta", "text": ...} mientras OpenAI genera y una línea
+    final {"type": "final", ...} con la misma respuesta que el webhook normal.
+    {"type": "reset"} pide descartar los deltas recibidos: el modelo habló
+    antes de usar una herramienta y la respuesta final viene después.
+    Si el cliente se desconecta, se cancela el procesamiento.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def on_delta(text: str) -> None:
+        await queue.put({"type": "delta", "text": text})
+    
+    async def on_reset() -> None:
+        await queue.put({"type": "reset"})
+    
+    async def produce() -> None:
+        try:
+            result = await _process_n8n_message(message_data, on_delta=on_delta, on_reset=on_reset)
+            await queue.put(dict(result, type="final"))
+        except Exception as e:
+            logger.error(f"Error en webhook de texto en streaming: {e}", exc_info=True)
+            await queue.put({"type": "error", "status": "error"})
+        finally:
+            await queue.put(None)
+    
+    async def events():
+        task = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        finally:
+            # Desconexión del cliente: Starlette cancela este generador
+            if not task.done():
+                task.cancel()
+                logger.warning(f"🔌 Cliente desconectado, streaming de {message_data.session_id} cancelado")
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+async def _process_n8n_message(message_data: N8NMessage, on_delta=None, on_reset=None) -> Dict[str, Any]:
+    """
+    📨 Procesa un mensaje de texto de n8n (estado, contexto, IA, historial)
+    
+    Args:
+        message_data: Mensaje recibido
+        on_delta: Callback opcional para los tokens de la respuesta (streaming)
+        on_reset: Callback opcional para descartar los tokens previos a una herramienta
     """
     # ===== PASO 1: EXTRAER DATOS BÁSICOS =====
     conversation_id = message_data.session_id
@@ -335,31 +497,25 @@ async def receive_n8n_message(message_data: N8NMessage):
     
     logger.debug(f"🧹 Datos limpiados - Campos antes: {len(raw_data)}, después: {len(cleaned_data)}")
     
-    # ===== PASO 3: DETERMINAR SI ES PRIMERA INTERACCIÓN =====
-    is_first_interaction = conversation_id not in conversation_histories
-    
-    # ===== PASO 4: INICIALIZAR ESTADO SI ES PRIMERA INTERACCIÓN =====
+    # ===== PASO 3 y 4: CREAR ESTADO SI ES PRIMERA INTERACCIÓN (atómico entre workers) =====
+    is_first_interaction = await conversation_store_async.create(conversation_id, {
+        "first_message_ts": time.time(),
+        "last_activity_ts": time.time(),
+        "pulse_sent": False,
+        "ended": False,
+        "canal": canal,
+        "metadata": cleaned_data.get("user_profile", {}),
+        "plataforma_info": cleaned_data.get("plataforma_info", {}),
+        "client_info": {},  # Se llenará abajo
+        "message_count": {"user": 0, "assistant": 0},
+        "word_count": {"user": 0, "assistant": 0},
+        "origen_url": cleaned_data.get("origen_url"),
+        "timestamp_inicio": cleaned_data.get("timestamp")
+    })
+
     if is_first_interaction:
         logger.info(f"🆕 Primera interacción para {conversation_id}")
-        conversation_histories[conversation_id] = []
-        full_conversation_histories[conversation_id] = []
-        
-        # Inicializar estado completo
-        TEXT_CHAT_STATE[conversation_id] = {
-            "first_message_ts": time.time(),
-            "last_activity_ts": time.time(),
-            "pulse_sent": False,
-            "ended": False,
-            "canal": canal,
-            "metadata": cleaned_data.get("user_profile", {}),
-            "plataforma_info": cleaned_data.get("plataforma_info", {}),
-            "client_info": {},  # Se llenará abajo
-            "message_count": {"user": 0, "assistant": 0},
-            "word_count": {"user": 0, "assistant": 0},
-            "origen_url": cleaned_data.get("origen_url"),
-            "timestamp_inicio": cleaned_data.get("timestamp")
-        }
-        
+
         # ===== PASO 5: CONSTRUIR CLIENT_INFO =====
         # IMPORTANTE: Extraer datos de AMBAS fuentes:
         # 1. user_profile (datos actuales del mensaje)
@@ -436,7 +592,7 @@ async def receive_n8n_message(message_data: N8NMessage):
                 client_info["sentimiento"] = contexto_db["sentimiento"]
 
         # Guardar en estado
-        TEXT_CHAT_STATE[conversation_id]["client_info"] = client_info
+        await conversation_store_async.update_state(conversation_id, {"client_info": client_info})
 
         logger.info(f"📝 Client info construido con {len(client_info)} campos: {list(client_info.keys())}")
     else:
@@ -444,27 +600,16 @@ async def receive_n8n_message(message_data: N8NMessage):
         client_info = None  # NO usar contexto en mensajes posteriores
     
     # ===== PASO 6: GESTIONAR HISTORIAL =====
-    history = conversation_histories[conversation_id]
-    
-    # Limitar historial a 20 mensajes
-    if len(history) > 20:
-        history = history[-20:]
-        conversation_histories[conversation_id] = history
-    
-    # Agregar mensaje del usuario
-    full_conversation_histories[conversation_id].append({"role": "user", "content": current_message})
-    history.append({"role": "user", "content": current_message})
-    
-    # ===== PASO 7: ACTUALIZAR CONTADORES =====
-    state = TEXT_CHAT_STATE[conversation_id]
-    state["last_activity_ts"] = time.time()
+    # Solo los últimos TEXT_HISTORY_WINDOW mensajes (el completo queda en el almacén)
+    history = await conversation_store_async.recent(conversation_id, TEXT_HISTORY_WINDOW)
     
-    if "message_count" not in state:
-        state["message_count"] = {"user": 0, "assistant": 0}
-        state["word_count"] = {"user": 0, "assistant": 0}
-    
-    state["message_count"]["user"] += 1
-    state["word_count"]["user"] += len(current_message.split())
+    # ===== PASO 7: AGREGAR MENSAJE DEL USUARIO Y ACTUALIZAR CONTADORES =====
+    user_message = {"role": "user", "content": current_message}
+    await conversation_store_async.append(conversation_id, user_message, count=True)
+    last_activity_ts = time.time()
+    await conversation_store_async.update_state(conversation_id, {"last_activity_ts": last_activity_ts})
+    chat_timers.touch(conversation_id, last_activity_ts)   # pulso/cierre cuentan desde aquí
+    history.append(user_message)
     
     # ===== PASO 8: PROCESAR CON IA =====
     try:
@@ -472,7 +617,9 @@ async def receive_n8n_message(message_data: N8NMessage):
             user_id=user_id,
             current_user_message=current_message,
             history=history,
-            client_info=client_info  # Solo se pasa en primera interacción
+            client_info=client_info,  # Solo se pasa en primera interacción
+            on_delta=on_delta,
+            on_reset=on_reset,
         )
         
         ai_reply = response_data.get("reply_text", "No pude obtener una respuesta.")
@@ -493,20 +640,18 @@ async def receive_n8n_message(message_data: N8NMessage):
     
     # ===== PASO 9: AGREGAR RESPUESTA AL HISTORIAL =====
     if ai_reply:
-        full_conversation_histories[conversation_id].append({"role": "assistant", "content": ai_reply})
-        history.append({"role": "assistant", "content": ai_reply})
-        
-        # Actualizar contadores de respuesta
-        state["message_count"]["assistant"] += 1
-        state["word_count"]["assistant"] += len(ai_reply.split())
+        assistant_message = {"role": "assistant", "content": ai_reply}
+        await conversation_store_async.append(conversation_id, assistant_message, count=True)
+        history.append(assistant_message)
     
     # ===== PASO 10: DETECTAR FIN DE CONVERSACIÓN =====
     end_chat = bool(response_data.get("end_chat"))
     end_reason = response_data.get("end_reason")
     
-    if end_chat and not state.get("ended"):
-        state["ended"] = True
+    # claim_flag: solo un worker cierra la conversación
+    if end_chat and await conversation_store_async.claim_flag(conversation_id, "ended"):
         try:
+            state = await conversation_store_async.get_state(conversation_id) or {}
             await _end_text_conversation(conversation_id, state, reason=end_reason or "assistant_requested_end")
         except Exception as e:
             logger.error(f"Error en _end_text_conversation: {e}", exc_info=True)
@@ -541,7 +686,9 @@ async def n8n_process_appointment_request(
     logger.info(f"🗓️ Procesando solicitud: {user_query_for_date_time}")
     
     try:
-        result = buscarslot.process_appointment_request(
+        result = await tool_executor.run(
+            "process_appointment_request",
+            buscarslot.process_appointment_request,
             user_query_for_date_time=user_query_for_date_time,
             day_param=day_param,
             month_param=month_param,
@@ -558,6 +705,51 @@ async def n8n_process_appointment_request(
         return {"status": "ERROR", "message": str(e)}
 
 
+class AppointmentQuery(BaseModel):
+    """Una consulta de /n8n/process-appointment-request (mismos parámetros)"""
+    user_query_for_date_time: str
+    day_param: Optional[int] = None
+    month_param: Optional[Union[str, int]] = None
+    year_param: Optional[int] = None
+    fixed_weekday_param: Optional[str] = None
+    explicit_time_preference_param: Optional[str] = None
+    is_urgent_param: Optional[bool] = False
+    more_late_param: Optional[bool] = False
+    more_early_param: Optional[bool] = False
+
+
+@app.post("/n8n/process-appointment-request/batch")
+async def n8n_process_appointment_request_batch(queries: List[AppointmentQuery] = Body(..., embed=True)):
+    """
+    📦 Varias consultas de disponibilidad en una sola petición
+
+    Se evalúan contra una misma instantánea de la caché y los
+    resultados vuelven en el mismo orden que `queries`.
+    """
+    t0 = time.perf_counter()
+    logger.info(f"🗓️ Procesando lote de {len(queries)} solicitudes")
+
+    try:
+        results = await tool_executor.run(
+            "process_appointment_request_batch",
+            buscarslot.process_appointment_request_batch,
+            queries=[
+                {
+                    **query.dict(),
+                    "is_urgent_param": query.is_urgent_param or False,
+                    "more_late_param": query.more_late_param or False,
+                    "more_early_param": query.more_early_param or False,
+                }
+                for query in queries
+            ],
+        )
+        logger.info(f"[LATENCIA] Lote de {len(queries)} solicitudes en {1000*(time.perf_counter()-t0):.1f} ms")
+        return {"results": results}
+    except Exception as e:
+        logger.error(f"Error en appointment request batch: {e}", exc_info=True)
+        return {"status": "ERROR", "message": str(e)}
+
+
 @app.post("/n8n/create-calendar-event")
 async def n8n_create_calendar_event(
     name: str = Body(...),
@@ -570,7 +762,9 @@ async def n8n_create_calendar_event(
     logger.info(f"📅 Creando cita para {name}")
     
     try:
-        result = create_calendar_event(
+        result = await tool_executor.run(
+            "create_calendar_event",
+            create_calendar_event,
             name=name,
             phone=phone,
             reason=reason,
@@ -604,7 +798,9 @@ async def n8n_edit_calendar_event(
     logger.info(f"✏️ Editando evento {event_id}")
     
     try:
-        result = edit_calendar_event(
+        result = await tool_executor.run(
+            "edit_calendar_event",
+            edit_calendar_event,
             event_id=event_id,
             new_start_time_iso=new_start_time_iso,
             new_end_time_iso=new_end_time_iso,
@@ -634,7 +830,9 @@ async def n8n_delete_calendar_event(
     logger.info(f"🗑️ Eliminando evento {event_id}")
     
     try:
-        result = delete_calendar_event(
+        result = await tool_executor.run(
+            "delete_calendar_event",
+            delete_calendar_event,
             event_id=event_id,
             original_start_time_iso=original_start_time_iso
         )
@@ -657,7 +855,7 @@ async def n8n_search_calendar_event_by_phone(phone: str = Body(...)):
     logger.info(f"🔍 Buscando citas para teléfono: {phone}")
     
     try:
-        search_results = search_calendar_event_by_phone(phone=phone)
+        search_results = await tool_executor.run("search_calendar_event_by_phone", search_calendar_event_by_phone, phone=phone)
         return {"search_results": search_results}
     except Exception as e:
         logger.error(f"Error buscando citas: {e}", exc_info=True)
@@ -670,7 +868,7 @@ async def n8n_select_calendar_event_by_index(selected_index: int = Body(...)):
     logger.info(f"👆 Seleccionando cita índice: {selected_index}")
     
     try:
-        result = select_calendar_event_by_index(selected_index=selected_index)
+        result = await tool_executor.run("select_calendar_event_by_index", select_calendar_event_by_index, selected_index=selected_index)
         
         if "error" in result:
             return {"status": "ERROR", "message": result["error"]}
@@ -747,7 +945,8 @@ async def reload_cache():
     """
     t0 = time.perf_counter()
     try:
-        buscarslot.load_free_slots_to_cache()
+        if not await availability_cache.refresh_async(reason="admin"):
+            raise RuntimeError(availability_cache.get_stats()["last_error"] or "recarga fallida")
         
         logger.info(f"[LATENCIA] Admin reload-cache completado en {1000*(time.perf_counter()-t0):.1f} ms")
         return {
@@ -762,6 +961,129 @@ async def reload_cache():
         }
 
 
+@app.get("/admin/tts-cache")
+async def get_tts_cache_status():
+    """
+    📊 Estado de la caché de frases TTS (aciertos, fallos, ocupación)
+    """
+    t0 = time.perf_counter()
+    stats = phrase_cache.get_stats()
+    logger.info(f"[LATENCIA] Admin tts-cache consultado en {1000*(time.perf_counter()-t0):.1f} ms")
+    return stats
+
+
+@app.get("/admin/tts-ws-pool")
+async def get_tts_ws_pool_status():
+    """
+    📊 Estado del pool de WebSockets de ElevenLabs (tamaño, esperas, reconexiones)
+    """
+    t0 = time.perf_counter()
+    stats = eleven_ws_pool.get_stats()
+    logger.info(f"[LATENCIA] Admin tts-ws-pool consultado en {1000*(time.perf_counter()-t0):.1f} ms")
+    return stats
+
+
+@app.get("/admin/weather")
+async def get_weather_status():
+    """
+    📊 Estado de la caché de clima (antigüedad, refrescos, fallos)
+    """
+    t0 = time.perf_counter()
+    stats = weather_provider.get_stats()
+    logger.info(f"[LATENCIA] Admin weather consultado en {1000*(time.perf_counter()-t0):.1f} ms")
+    return stats
+
+
+@app.get("/admin/google-calendar")
+async def get_google_calendar_status():
+    """
+    📊 Cliente compartido de Google Calendar: construcciones, reutilizaciones y ahorro por llamada
+    """
+    t0 = time.perf_counter()
+    from google_calendar_service import calendar_service
+    stats = calendar_service.get_stats()
+    logger.info(f"[LATENCIA] Admin google-calendar consultado en {1000*(time.perf_counter()-t0):.1f} ms")
+    return stats
+
+
+@app.get("/admin/availability-cache")
+async def get_availability_cache_status():
+    """
+    📊 Caché de slots libres: edad, recargas, esperas unidas, escrituras directas y apartados
+    """
+    t0 = time.perf_counter()
+    stats = dict(availability_cache.get_stats(), holds=slot_holds.get_stats())
+    logger.info(f"[LATENCIA] Admin availability-cache consultado en {1000*(time.perf_counter()-t0):.1f} ms")
+    return stats
+
+
+@app.get("/admin/conversation-store")
+async def get_conversation_store_status():
+    """
+    📊 Almacén de conversaciones de texto: backend, TTL, escrituras, lecturas y temporizadores
+    """
+    t0 = time.perf_counter()
+    stats = dict(conversation_store.get_stats(), active=len(await conversation_store_async.conversation_ids()),
+                 timers=chat_timers.get_stats())
+    logger.info(f"[LATENCIA] Admin conversation-store consultado en {1000*(time.perf_counter()-t0):.1f} ms")
+    return stats
+
+
+@app.get("/admin/webhooks")
+async def get_webhooks_status():
+    """
+    📊 Webhooks salientes: cola, entregas, fallos, reintentos y latencia de entrega
+    """
+    t0 = time.perf_counter()
+    stats = webhook_dispatcher.get_stats()
+    logger.info(f"[LATENCIA] Admin webhooks consultado en {1000*(time.perf_counter()-t0):.1f} ms")
+    return stats
+
+
+@app.get("/admin/session-state")
+async def get_session_state_status():
+    """
+    📊 Estado por sesión: sesiones activas, cerradas y descartadas por inactividad
+    """
+    t0 = time.perf_counter()
+    stats = session_store.get_stats()
+    logger.info(f"[LATENCIA] Admin session-state consultado en {1000*(time.perf_counter()-t0):.1f} ms")
+    return stats
+
+
+@app.get("/admin/google-calendar-async")
+async def get_google_calendar_async_status():
+    """
+    📊 Cliente asíncrono de Google Calendar: llamadas, reintentos y latencias por operación
+    """
+    t0 = time.perf_counter()
+    stats = calendar_async.get_stats()
+    logger.info(f"[LATENCIA] Admin google-calendar-async consultado en {1000*(time.perf_counter()-t0):.1f} ms")
+    return stats
+
+
+@app.get("/admin/tool-executor")
+async def get_tool_executor_status():
+    """
+    📊 Pools de herramientas: espera en cola, tiempo de ejecución y timeouts por herramienta
+    """
+    t0 = time.perf_counter()
+    stats = tool_executor.get_stats()
+    logger.info(f"[LATENCIA] Admin tool-executor consultado en {1000*(time.perf_counter()-t0):.1f} ms")
+    return stats
+
+
+@app.get("/admin/stt-preconnect")
+async def get_stt_preconnect_status():
+    """
+    📊 Estado de las sesiones Deepgram pre-conectadas desde /twilio-voice
+    """
+    t0 = time.perf_counter()
+    stats = stt_preconnect.get_stats()
+    logger.info(f"[LATENCIA] Admin stt-preconnect consultado en {1000*(time.perf_counter()-t0):.1f} ms")
+    return stats
+
+
 @app.get("/admin/health-check")
 async def health_check():
     """
@@ -793,47 +1115,40 @@ async def health_check():
 
 # =================== UTILIDADES PARA CHATS DE TEXTO ===================
 
-async def _background_text_chat_monitor() -> None:
+async def _on_chat_timer(conversation_id: str, kind: str) -> None:
     """
-    Monitorea inactividad de chats de texto y ejecuta:
+    Vencimiento de un chat de texto (chat_timers):
     - Pulse a los 20 minutos sin actividad
     - Cierre a los 60 minutos sin actividad
+    Se revalida contra el almacén: si hubo actividad (p.ej. en otro worker) se reprograma.
     """
-    PULSE_AFTER_SECONDS = 20 * 60
-    CLOSE_AFTER_SECONDS = 60 * 60
-    CHECK_INTERVAL = 60
-
-    while True:
+    state = await conversation_store_async.get_state(conversation_id)
+    if not state or state.get("ended") or not state.get("last_activity_ts"):
+        chat_timers.cancel(conversation_id)
+        return
+
+    idle = time.time() - state["last_activity_ts"]
+    after = CHAT_TIMERS_CONFIG["PULSE_AFTER"] if kind == PULSE else CHAT_TIMERS_CONFIG["CLOSE_AFTER"]
+    if idle + 0.001 < after:
+        chat_timers.touch(conversation_id, state["last_activity_ts"], pulse_sent=bool(state.get("pulse_sent")))
+        return
+
+    # claim_flag: con varios workers, solo uno manda el pulso / cierra
+    if kind == PULSE:
+        if await conversation_store_async.claim_flag(conversation_id, "pulse_sent"):
+            try:
+                logger.info(f"⏰ [PULSE] Mensaje de pulse enviado a {conversation_id} después de 20min de inactividad")
+                await _send_text_pulse(conversation_id, state)
+            except Exception as e:
+                logger.error(f"Error enviando pulse: {e}")
+    elif await conversation_store_async.claim_flag(conversation_id, "ended"):
         try:
-            await asyncio.sleep(CHECK_INTERVAL)
-            now = time.time()
-            for conversation_id in list(TEXT_CHAT_STATE.keys()):
-                state = TEXT_CHAT_STATE.get(conversation_id) or {}
-                if state.get("ended"):
-                    continue
-                last_ts = state.get("last_activity_ts")
-                if not last_ts:
-                    continue
-                idle = now - last_ts
-                if idle >= PULSE_AFTER_SECONDS and not state.get("pulse_sent"):
-                    try:
-                        logger.info(f"⏰ [PULSE] Mensaje de pulse enviado a {conversation_id} después de 20min de inactividad")
-                        await _send_text_pulse(conversation_id, state)
-                        state["pulse_sent"] = True
-                    except Exception as e:
-                        logger.error(f"Error enviando pulse: {e}")
-                if idle >= CLOSE_AFTER_SECONDS:
-                    state["ended"] = True
-                    try:
-                        logger.info(f"🔚 [SESIÓN] Sesión terminada tras 60 min de inactividad de {conversation_id}")
-                        await _end_text_conversation(conversation_id, state, reason="timeout_inactivity")
-                    except Exception as e:
-                        logger.error(f"Error cerrando conversación por timeout: {e}")
-        except asyncio.CancelledError:
-            logger.info("Monitor de chats de texto cancelado")
-            break
+            logger.info(f"🔚 [SESIÓN] Sesión terminada tras 60 min de inactividad de {conversation_id}")
+            await _end_text_conversation(conversation_id, state, reason="timeout_inactivity")
         except Exception as e:
-            logger.error(f"Error en monitor de chats de texto: {e}")
+            logger.error(f"Error cerrando conversación por timeout: {e}")
+        # Conversaciones abandonadas sin temporizador (p.ej. otro worker caído)
+        await conversation_store_async.purge_expired()
 
 
 async def _send_text_pulse(conversation_id: str, state: Dict[str, Any]) -> None:
@@ -844,12 +1159,9 @@ async def _send_text_pulse(conversation_id: str, state: Dict[str, Any]) -> None:
     message = "Por aquí sigo si necesitas algo 😊"
     
     # Añadir el pulse al historial de la conversación
-    if conversation_id in conversation_histories:
+    if await conversation_store_async.exists(conversation_id):
         pulse_message = {"role": "assistant", "content": message}
-        # Agregar a historial completo
-        full_conversation_histories[conversation_id].append(pulse_message)
-        # Agregar a historial recortado
-        conversation_histories[conversation_id].append(pulse_message)
+        await conversation_store_async.append(conversation_id, pulse_message)
         logger.info(f"Pulse añadido al historial de {conversation_id}: '{message}'")
     else:
         logger.warning(f"No se encontró historial para {conversation_id}")
@@ -860,17 +1172,16 @@ async def _end_text_conversation(conversation_id: str, state: Dict[str, Any], re
     Envía a n8n el resumen completo de la conversación con TODA la metadata.
     """
     # Agregar mensaje final
-    if conversation_id in conversation_histories:
+    if await conversation_store_async.exists(conversation_id):
         final_message = "Ahora cerraré nuestra sesión. ¡Gracias! 😊"
         final_message_obj = {"role": "assistant", "content": final_message}
         
-        full_conversation_histories[conversation_id].append(final_message_obj)
-        conversation_histories[conversation_id].append(final_message_obj)
+        await conversation_store_async.append(conversation_id, final_message_obj)
         
         logger.info(f"💬 [MENSAJE FINAL] {conversation_id}: '{final_message}'")
     
     url = "https://n8n.aissistantpros.tech/webhook/conversation/end"
-    history = full_conversation_histories.get(conversation_id, [])
+    history = await conversation_store_async.history(conversation_id)
     
     # Calcular timestamps y duración
     first_ts = state.get("first_message_ts", time.time())
@@ -930,20 +1241,15 @@ async def _end_text_conversation(conversation_id: str, state: Dict[str, Any], re
     logger.info(f"📤 Enviando resumen completo de {conversation_id} a n8n")
     logger.info(f"   └─ Mensajes: {len(history)}, Duración: {duration_minutes} min, Canal: {state.get('canal')}")
     
-    try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.post(url, json=payload)
-            if resp.status_code >= 300:
-                logger.error(f"End webhook status {resp.status_code}: {resp.text[:200]}")
-            else:
-                logger.info(f"✅ Resumen completo enviado a n8n para {conversation_id}")
-    except Exception as e:
-        logger.error(f"Error enviando resumen a n8n: {e}")
+    # Solo se encola: el despachador reintenta y mide la entrega
+    webhook_dispatcher.enqueue(url, payload, label=f"conversation/end {conversation_id}")
     
     # Limpiar estado local
-    TEXT_CHAT_STATE.pop(conversation_id, None)
-    conversation_histories.pop(conversation_id, None)
-    full_conversation_histories.pop(conversation_id, None)
+    await conversation_store_async.delete(conversation_id)
+    chat_timers.cancel(conversation_id)
+    text_session_id = f"text:{metadata.get('user_id_canal') or 'unknown_user'}"  # mismo id que aiagent_text
+    session_store.end(text_session_id)
+    slot_holds.release_session(text_session_id)   # horarios ofrecidos en el chat vuelven a estar libres
     
     logger.info(f"🧹 Estado local limpiado para {conversation_id}")
 
@@ -0,0 +1,311 @@
+# outbound_audio.py
+# -*- coding: utf-8 -*-
+"""
+📤 PLANIFICADOR DE AUDIO SALIENTE HACIA TWILIO
+===============================================
+Una sola cola por llamada para TODO el audio que va a Twilio
+(ElevenLabs WebSocket, fallback HTTP y audio en caché).
+
+- Re-encuadra el audio en frames de 160 bytes (20 ms @ 8 kHz μ-law).
+- Agrupa hasta GROUP_FRAMES frames por paquete (100 ms).
+- Nunca va más de MAX_AHEAD_MS por delante del tiempo real, así el
+  buffer de Twilio tiene una profundidad predecible.
+- Orden estricto: un único emisor consume la cola en orden de llegada.
+- truncate() descarta al instante lo pendiente y limpia el buffer de Twilio.
+- Si el WebSocket falla al enviar, el planificador se cierra (como el
+  pacer HTTP anterior): no sigue vaciando la cola contra un socket muerto.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN DE PACING =====
+OUTBOUND_CONFIG = {
+    "FRAME_SIZE": 160,              # bytes - 20 ms @ 8 kHz μ-law
+    "FRAME_MS": 20,
+    "GROUP_FRAMES": 5,              # máx. 100 ms por paquete (recomendación Twilio)
+    "MAX_AHEAD_MS": 200,            # máx. audio adelantado al tiempo real
+    "SILENCE_BYTE": b"\xFF",        # silencio μ-law para completar el último frame
+}
+
+WebSocketSend = Callable[[str], Awaitable[None]]
+
+
+class _Mark:
+    """Marca en la cola: se envía a Twilio cuando todo el audio previo ya salió."""
+
+    __slots__ = ("name", "future")
+
+    def __init__(self, name: str, future: "asyncio.Future[bool]"):
+        self.name = name
+        self.future = future
+
+
+class OutboundAudioScheduler:
+    """
+    🎯 Cola de audio saliente con pacing en tiempo real
+
+    Uso:
+        scheduler.enqueue(chunk)          # síncrono, conserva el orden
+        scheduler.flush_partial()         # completa el último frame con silencio
+        await scheduler.wait_drained()    # espera a que todo haya salido
+        scheduler.truncate()              # barge-in / cancelación inmediata
+    """
+
+    def __init__(self, stream_sid: str, websocket_send: WebSocketSend,
+                 *, group_frames: int = OUTBOUND_CONFIG["GROUP_FRAMES"],
+                 max_ahead_ms: int = OUTBOUND_CONFIG["MAX_AHEAD_MS"]):
+        self.stream_sid = stream_sid
+        self.websocket_send = websocket_send
+        self.group_frames = group_frames
+        self.max_ahead = max_ahead_ms / 1000
+
+        self._queue: Deque[Union[bytes, _Mark]] = deque()
+        self._residual = b""              # bytes que aún no completan un frame
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._sender_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+        # Reloj de reproducción: instante en que Twilio terminará lo ya enviado
+        self._playhead = 0.0
+
+        # Métricas
+        self.frames_sent = 0
+        self.packets_sent = 0
+        self.frames_dropped = 0
+        self.truncations = 0
+        self.send_errors = 0
+
+    # ========== ENTRADA ==========
+
+    def enqueue(self, audio: bytes) -> None:
+        """
+        📥 Agrega audio μ-law (cualquier tamaño) respetando el orden de llamada
+        """
+        if self._closed or not audio:
+            return
+        data = self._residual + audio
+        frame_size = OUTBOUND_CONFIG["FRAME_SIZE"]
+        complete = len(data) - (len(data) % frame_size)
+        for start in range(0, complete, frame_size):
+            self._queue.append(data[start:start + frame_size])
+        self._residual = data[complete:]
+        if complete:
+            self._wake()
+
+    def flush_partial(self) -> None:
+        """
+        🚿 Fin de una locución: completa el frame incompleto con silencio
+        """
+        if self._residual:
+            pad = OUTBOUND_CONFIG["FRAME_SIZE"] - len(self._residual)
+            self._queue.append(self._residual + OUTBOUND_CONFIG["SILENCE_BYTE"] * pad)
+            self._residual = b""
+            self._wake()
+
+    def mark(self, name: str) -> "asyncio.Future[bool]":
+        """
+        🏷️ Encola una marca de Twilio tras el audio pendiente
+
+        Returns:
+            Future que se resuelve True cuando la marca sale, False si se truncó
+        """
+        future: "asyncio.Future[bool]" = asyncio.get_running_loop().create_future()
+        if self._closed:
+            future.set_result(False)
+            return future
+        self._queue.append(_Mark(name, future))
+        self._wake()
+        return future
+
+    # ========== CANCELACIÓN ==========
+
+    def truncate(self, *, clear_twilio: bool = True) -> int:
+        """
+        ✂️ Descarta al instante todo el audio pendiente
+
+        Returns:
+            Frames descartados
+        """
+        dropped = 0
+        while self._queue:
+            item = self._queue.popleft()
+            if isinstance(item, _Mark):
+                if not item.future.done():
+                    item.future.set_result(False)
+            else:
+                dropped += 1
+        self._residual = b""
+        self._playhead = 0.0
+        self.frames_dropped += dropped
+        self.truncations += 1
+        self._drained.set()
+        if clear_twilio and not self._closed:
+            asyncio.create_task(self._send_clear())
+        if dropped:
+            logger.info(f"✂️ Audio saliente truncado: {dropped} frames ({dropped * OUTBOUND_CONFIG['FRAME_MS']} ms)")
+        return dropped
+
+    async def wait_drained(self, timeout: Optional[float] = None, *, include_playback: bool = False) -> bool:
+        """
+        ⏳ Espera a que toda la cola se haya enviado a Twilio
+
+        Args:
+            include_playback: además espera a que Twilio termine de reproducirla
+        """
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        if include_playback:
+            remaining = self._playhead - time.perf_counter()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        return True
+
+    async def close(self) -> None:
+        """🔌 Detiene el emisor y descarta lo pendiente (fin de llamada)"""
+        self.truncate(clear_twilio=False)
+        self._closed = True
+        if self._sender_task and not self._sender_task.done():
+            self._sender_task.cancel()
+            try:
+                await self._sender_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._sender_task = None
+
+    # ========== ESTADO ==========
+
+    @property
+    def pending_ms(self) -> int:
+        """Audio aún en la cola local (sin enviar a Twilio)."""
+        frames = sum(1 for item in self._queue if not isinstance(item, _Mark))
+        return frames * OUTBOUND_CONFIG["FRAME_MS"]
+
+    @property
+    def ahead_ms(self) -> int:
+        """Audio enviado a Twilio que aún no se ha reproducido."""
+        return max(0, int(1000 * (self._playhead - time.perf_counter())))
+
+    @property
+    def closed(self) -> bool:
+        """True tras close() o tras un fallo de envío (ya no acepta audio)."""
+        return self._closed
+
+    def is_idle(self) -> bool:
+        return not self._queue and not self._residual
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "frames_sent": self.frames_sent,
+            "packets_sent": self.packets_sent,
+            "frames_dropped": self.frames_dropped,
+            "truncations": self.truncations,
+            "send_errors": self.send_errors,
+            "closed": self._closed,
+            "pending_ms": self.pending_ms,
+            "ahead_ms": self.ahead_ms,
+        }
+
+    # ========== EMISOR ==========
+
+    def _wake(self) -> None:
+        self._drained.clear()
+        self._wakeup.set()
+        if not self._sender_task or self._sender_task.done():
+            self._sender_task = asyncio.create_task(
+                self._sender_loop(), name=f"OutboundAudio_{self.stream_sid}"
+            )
+
+    async def _sender_loop(self) -> None:
+        frame_seconds = OUTBOUND_CONFIG["FRAME_MS"] / 1000
+        while not self._closed:
+            if not self._queue:
+                self._drained.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            head = self._queue[0]
+            if isinstance(head, _Mark):
+                self._queue.popleft()
+                if not await self._send_mark(head):
+                    self._stop_on_send_error(0)
+                continue
+
+            # Respetar el presupuesto de adelanto ANTES de sacar frames de la cola,
+            # así un truncate() durante la espera descarta también este paquete
+            now = time.perf_counter()
+            if self._playhead < now:
+                self._playhead = now
+            ahead = self._playhead - now
+            if ahead > self.max_ahead:
+                await asyncio.sleep(ahead - self.max_ahead)
+                continue
+
+            frames = []
+            while self._queue and len(frames) < self.group_frames and not isinstance(self._queue[0], _Mark):
+                frames.append(self._queue.popleft())
+
+            payload = base64.b64encode(b"".join(frames)).decode("ascii")
+            try:
+                await self.websocket_send(json.dumps({
+                    "event": "media",
+                    "streamSid": self.stream_sid,
+                    "media": {"payload": payload},
+                }))
+            except Exception as e:
+                logger.error(f"❌ Error enviando audio a Twilio: {e}")
+                self._stop_on_send_error(len(frames))
+                continue
+
+            self._playhead = max(self._playhead, time.perf_counter()) + len(frames) * frame_seconds
+            self.frames_sent += len(frames)
+            self.packets_sent += 1
+
+    def _stop_on_send_error(self, lost_frames: int) -> None:
+        """
+        WebSocket caído: se cierra el planificador, se descarta lo pendiente y
+        las marcas se resuelven False. El dueño lo ve en `closed` / send_errors.
+        """
+        self.send_errors += 1
+        self.frames_dropped += lost_frames
+        self.truncate(clear_twilio=False)
+        self._closed = True
+        logger.warning("🔌 Planificador de audio saliente detenido: el WebSocket de Twilio no acepta envíos")
+
+    async def _send_mark(self, mark: _Mark) -> bool:
+        try:
+            await self.websocket_send(json.dumps({
+                "event": "mark",
+                "streamSid": self.stream_sid,
+                "mark": {"name": mark.name},
+            }))
+            if not mark.future.done():
+                mark.future.set_result(True)
+            return True
+        except Exception as e:
+            logger.debug(f"No se pudo enviar mark '{mark.name}': {e}")
+            if not mark.future.done():
+                mark.future.set_result(False)
+            return False
+
+    async def _send_clear(self) -> None:
+        try:
+            await self.websocket_send(json.dumps({
+                "event": "clear",
+                "streamSid": self.stream_sid,
+            }))
+            logger.debug("🧹 Buffer de Twilio limpiado")
+        except Exception as e:
+            logger.error(f"❌ Error limpiando buffer Twilio: {e}")
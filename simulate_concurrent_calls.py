@@ -0,0 +1,111 @@
+# simulate_concurrent_calls.py
+# -*- coding: utf-8 -*-
+"""
+🧪 SIMULACIÓN: MUCHAS LLAMADAS SIMULTÁNEAS SOBRE state_store
+==============================================================
+Cada llamada simulada hace lo mismo que una real al editar una cita:
+
+1. Busca sus citas por teléfono (escribe events_found / current_event_id
+   en session_state, como utils.search_calendar_event_by_phone).
+2. Elige una con select_calendar_event_by_index.
+3. Lee current_event_id desde una herramienta (como editarcita/eliminarcita).
+4. Cuelga: session_store.end(call_sid), como CallOrchestrator._shutdown.
+
+Las herramientas corren en tool_executor (hilos, contexto copiado) con
+esperas aleatorias para intercalar llamadas. Si alguna llamada ve citas
+de otra, o el cierre de una borra la selección de otra, se reporta.
+
+Uso:
+    python simulate_concurrent_calls.py --calls 200 --rounds 5
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from typing import Dict, List
+
+from selectevent import select_calendar_event_by_index
+from state_store import current_session_id, session_state, session_store
+from tool_executor import tool_executor
+
+
+def fake_search_by_phone(phone: str, delay: float) -> List[Dict]:
+    """Igual que utils.search_calendar_event_by_phone, sin Google: guarda en session_state."""
+    time.sleep(delay)
+    events = [{"event_id": f"{phone}-evt{i}", "patient_name": f"Paciente {phone}"} for i in range(3)]
+    session_state["events_found"] = events
+    session_state["current_event_id"] = events[0]["event_id"]
+    return events
+
+
+def read_current_event_id(delay: float) -> Dict:
+    """Lo que hacen editarcita/eliminarcita antes de tocar Google."""
+    time.sleep(delay)
+    return {"current_event_id": session_state.get("current_event_id"),
+            "events_found": [e["event_id"] for e in session_state.get("events_found", [])]}
+
+
+async def simulated_call(call_number: int, round_number: int, errors: List[str]) -> None:
+    call_sid = f"CA{round_number:02d}{call_number:05d}"
+    phone = f"998{call_number:07d}"
+    current_session_id.set(call_sid)   # como CallOrchestrator al iniciar el stream
+    try:
+        await asyncio.sleep(random.uniform(0, 0.02))
+        await tool_executor.run("search_calendar_event_by_phone", fake_search_by_phone,
+                                phone=phone, delay=random.uniform(0, 0.01))
+        await asyncio.sleep(random.uniform(0, 0.02))
+        choice = random.randrange(3)
+        await tool_executor.run("select_calendar_event_by_index", select_calendar_event_by_index,
+                                selected_index=choice)
+        await asyncio.sleep(random.uniform(0, 0.02))
+        seen = await tool_executor.run("search_calendar_event_by_phone", read_current_event_id,
+                                       delay=random.uniform(0, 0.01))
+
+        expected = f"{phone}-evt{choice}"
+        if seen["current_event_id"] != expected:
+            errors.append(f"{call_sid}: esperaba {expected}, vio {seen['current_event_id']}")
+        foreign = [e for e in seen["events_found"] if not e.startswith(phone)]
+        if foreign:
+            errors.append(f"{call_sid}: ve citas ajenas {foreign[:2]}")
+    finally:
+        session_store.end(call_sid)         # como CallOrchestrator._shutdown
+
+
+async def main_async(calls: int, rounds: int) -> int:
+    errors: List[str] = []
+    t0 = time.perf_counter()
+    for round_number in range(rounds):
+        await asyncio.gather(*[simulated_call(i, round_number, errors) for i in range(calls)])
+    wall = time.perf_counter() - t0
+
+    stats = session_store.get_stats()
+    print(f"📞 {calls * rounds} llamadas ({calls} simultáneas x {rounds} rondas) en {wall:.2f}s")
+    print(f"   state_store: {stats}")
+    if stats["active"]:
+        errors.append(f"quedaron {stats['active']} sesiones sin limpiar")
+    if errors:
+        print(f"❌ {len(errors)} errores de aislamiento, ej.:")
+        for error in errors[:10]:
+            print(f"   - {error}")
+        return 1
+    print("✅ Sin cruces entre llamadas")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200, help="llamadas simultáneas por ronda")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    code = asyncio.run(main_async(args.calls, args.rounds))
+    tool_executor.shutdown()
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# slot_index.py
+# -*- coding: utf-8 -*-
+"""
+🧮 ÍNDICE COMPACTO DE SLOTS LIBRES
+===================================
+free_slots_cache guarda, por día, listas de "HH:MM". Buscar un hueco
+recorría hasta 120 días copiando listas y llamando a strptime por slot
+(franja, regla de 6 h, franjas alternativas).
+
+Este índice se reconstruye en cada publicación de la caché y guarda:
+- Por día, un entero con un bit por slot de SLOT_TIMES (bit i = slot i).
+- Máscaras de franja precalculadas (mañana, mediodía, tarde).
+- "Siguiente día con disponibilidad" por franja: saltar los días
+  vacíos es una lectura de arreglo.
+
+Así, evaluar un día son unas cuantas operaciones AND/OR.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+# Franjas en minutos desde medianoche (mismos límites que _slots_for_franja)
+FRANJA_RANGES: Dict[str, tuple] = {
+    "mañana": (0, 11 * 60 + 45),
+    "mediodia": (11 * 60, 13 * 60 + 15),
+    "tarde": (12 * 60 + 30, 24 * 60),
+}
+
+
+def _minutes(hhmm: str) -> int:
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class SlotIndex:
+    """
+    📇 Instantánea inmutable de la disponibilidad en bits
+
+    Uso:
+        index = SlotIndex.build(free_slots_cache, ["10:00", "10:30", ...])
+        mask = index.day_mask(fecha) & index.franja_masks["tarde"]
+        index.slots(mask)   # → ["16:30", "17:30"]
+    """
+
+    def __init__(self, slot_starts: List[str], base_date: Optional[date], masks: List[int]):
+        self.slot_starts = sorted(slot_starts, key=_minutes)
+        self.slot_minutes = [_minutes(s) for s in self.slot_starts]
+        self.bit_of = {s: 1 << i for i, s in enumerate(self.slot_starts)}
+        self.all_mask = (1 << len(self.slot_starts)) - 1
+        self.franja_masks: Dict[Optional[str], int] = {
+            franja: sum(1 << i for i, m in enumerate(self.slot_minutes) if lo <= m <= hi)
+            for franja, (lo, hi) in FRANJA_RANGES.items()
+        }
+        self.franja_masks[None] = self.all_mask
+        self.base_date = base_date
+        self.masks = masks
+        # Lista de slots por máscara (5 slots → 32 combinaciones)
+        self._slots_by_mask = [
+            [s for i, s in enumerate(self.slot_starts) if mask >> i & 1]
+            for mask in range(self.all_mask + 1)
+        ]
+        # next_day[franja][i] = primer día j >= i con algún slot en esa franja (len si no hay)
+        self.next_day: Dict[Optional[str], List[int]] = {}
+        for franja, franja_mask in self.franja_masks.items():
+            nxt = [len(masks)] * (len(masks) + 1)
+            for i in range(len(masks) - 1, -1, -1):
+                nxt[i] = i if masks[i] & franja_mask else nxt[i + 1]
+            self.next_day[franja] = nxt
+
+    @classmethod
+    def build(cls, cache: Dict[str, List[str]], slot_starts: Iterable[str]) -> "SlotIndex":
+        """Construye el índice a partir de free_slots_cache (día → ["HH:MM", ...])."""
+        index = cls(list(slot_starts), None, [])
+        if not cache:
+            return index
+        days = sorted(cache)
+        base = datetime.strptime(days[0], "%Y-%m-%d").date()
+        last = datetime.strptime(days[-1], "%Y-%m-%d").date()
+        masks = [0] * ((last - base).days + 1)
+        for key, slots in cache.items():
+            offset = (datetime.strptime(key, "%Y-%m-%d").date() - base).days
+            masks[offset] = index.mask_of(slots)
+        return cls(index.slot_starts, base, masks)
+
+    # ========== CONSULTAS ==========
+
+    def mask_of(self, slots: Iterable[str]) -> int:
+        """Máscara de una colección de "HH:MM" (los que no son slot se ignoran)."""
+        mask = 0
+        for slot in slots:
+            mask |= self.bit_of.get(slot, 0)
+        return mask
+
+    def slots(self, mask: int) -> List[str]:
+        """Slots (ordenados) de una máscara. Devuelve una lista nueva."""
+        return list(self._slots_by_mask[mask])
+
+    def _offset(self, day: date) -> int:
+        return (day - self.base_date).days if self.base_date else -1
+
+    def day_mask(self, day: date) -> int:
+        offset = self._offset(day)
+        return self.masks[offset] if 0 <= offset < len(self.masks) else 0
+
+    def next_available_day(self, day: date, franja: Optional[str] = None) -> Optional[date]:
+        """Primer día >= day con algún slot libre en la franja (None si no hay en el horizonte)."""
+        if self.base_date is None:
+            return None
+        offset = max(self._offset(day), 0)
+        if offset >= len(self.masks):
+            return None
+        found = self.next_day[franja][offset]
+        return self.base_date + timedelta(days=found) if found < len(self.masks) else None
+
+    def minutes_mask(self, min_minutes: int) -> int:
+        """Slots que empiezan a partir de min_minutes (regla de anticipación del día de hoy)."""
+        return sum(1 << i for i, m in enumerate(self.slot_minutes) if m >= min_minutes)
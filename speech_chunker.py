@@ -0,0 +1,210 @@
+# speech_chunker.py
+# -*- coding: utf-8 -*-
+"""
+✂️ SEGMENTADOR INCREMENTAL DE TEXTO PARA TTS
+=============================================
+Recibe los tokens de Groq conforme llegan y devuelve oraciones o
+cláusulas completas listas para enviarse a ElevenLabs.
+
+- Los segmentos de herramientas ([tool(...)], <function=...>,
+  <|python_tag|>, JSON de función, end_call(...)) se retienen y
+  NUNCA se devuelven como texto hablable.
+- El primer segmento se corta antes (en comas) para que el tiempo
+  al primer audio siga al TTFT de Groq.
+"""
+
+import logging
+import re
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN DE SEGMENTACIÓN =====
+CHUNKER_CONFIG = {
+    "FIRST_CHUNK_MIN_CHARS": 12,    # Mínimo para cortar el primer segmento en coma
+    "CLAUSE_MIN_CHARS": 40,         # Mínimo para cortar en ';' o ':'
+    "COMMA_MIN_CHARS": 90,          # Cortar en coma si el segmento ya es largo
+}
+
+# Fin de oración: . ! ? … seguido de espacio (evita cortar "4.800" o "10:30")
+SENTENCE_END = re.compile(r'[.!?…]+["»”)]?\s+')
+CLAUSE_END = re.compile(r'[;:]\s+')
+COMMA_END = re.compile(r',\s+')
+WHITESPACE = re.compile(r'\s+')
+
+# Aperturas de segmentos de herramienta y su cierre
+_TAG_OPENERS = ("<function", "<|python_tag|>")
+_END_CALL_OPENER = "end_call"
+
+
+class SpeechChunker:
+    """
+    🎯 Acumula deltas del LLM y emite segmentos hablables
+
+    Uso:
+        chunker = SpeechChunker()
+        for delta in stream:
+            for segment in chunker.feed(delta):
+                await tts.add_text_chunk(segment)
+        for segment in chunker.flush():
+            await tts.add_text_chunk(segment)
+    """
+
+    def __init__(self):
+        self._raw = ""            # Texto aún no clasificado (puede contener herramienta abierta)
+        self._speakable = ""      # Texto limpio pendiente de emitir
+        self.emitted_count = 0
+        self.delivered_count = 0  # Segmentos ya entregados al TTS por el consumidor
+        self.held_segments = 0
+
+    # ========== API PÚBLICA ==========
+
+    def feed(self, delta: str) -> List[str]:
+        """
+        📥 Agrega un delta del stream y devuelve los segmentos completos
+        """
+        if not delta:
+            return []
+        self._raw += delta
+        self._drain_raw()
+        return self._extract_segments(final=False)
+
+    def flush(self) -> List[str]:
+        """
+        🚿 Fin del stream: emite lo pendiente y descarta herramientas sin cerrar
+        """
+        self._drain_raw(final=True)
+        if self._raw:
+            logger.debug(f"✂️ Segmento de herramienta sin cerrar descartado: '{self._raw[:60]}'")
+            self.held_segments += 1
+            self._raw = ""
+        return self._extract_segments(final=True)
+
+    # ========== CLASIFICACIÓN DE TEXTO ==========
+
+    def _drain_raw(self, final: bool = False) -> None:
+        """
+        Mueve a _speakable todo el texto seguro y elimina los segmentos
+        de herramienta ya cerrados. Lo que quede en _raw es una herramienta
+        abierta (o un posible inicio de ella) que aún no podemos decidir.
+        """
+        while self._raw:
+            start, end = self._find_tool_segment(self._raw, final)
+            if start is None:
+                self._speakable += self._raw
+                self._raw = ""
+                return
+            self._speakable += self._raw[:start]
+            if end is None:
+                # Herramienta abierta: esperar más tokens
+                self._raw = self._raw[start:]
+                return
+            logger.debug(f"✂️ Segmento de herramienta retenido: '{self._raw[start:end][:60]}'")
+            self.held_segments += 1
+            self._raw = self._raw[end:]
+
+    def _find_tool_segment(self, text: str, final: bool) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Busca el primer segmento de herramienta en el texto.
+
+        Returns:
+            (None, None) si no hay ninguno; (inicio, None) si está abierto;
+            (inicio, fin) si está completo.
+        """
+        for i, ch in enumerate(text):
+            if ch == "[":
+                close = text.find("]", i)
+                return i, (close + 1 if close != -1 else None)
+
+            if ch == "{":
+                close = self._matching_brace(text, i)
+                return i, close
+
+            if ch == "<":
+                rest = text[i:]
+                if rest.startswith("<function"):
+                    close = rest.find("</function>")
+                    if close != -1:
+                        return i, i + close + len("</function>")
+                    return i, None
+                if rest.startswith("<|python_tag|>"):
+                    # El formato python_tag se extiende hasta el final de la respuesta
+                    return i, None
+                if not final and any(op.startswith(rest) for op in _TAG_OPENERS):
+                    # Posible inicio de etiqueta: retener hasta saber
+                    return i, None
+                continue
+
+            if ch == "e" and text.startswith(_END_CALL_OPENER, i):
+                if i > 0 and (text[i - 1].isalnum() or text[i - 1] == "_"):
+                    continue
+                paren = text.find(")", i)
+                return i, (paren + 1 if paren != -1 else None)
+
+            if ch == "e" and not final and _END_CALL_OPENER.startswith(text[i:]):
+                if i == 0 or not (text[i - 1].isalnum() or text[i - 1] == "_"):
+                    return i, None
+
+        return None, None
+
+    @staticmethod
+    def _matching_brace(text: str, start: int) -> Optional[int]:
+        """Devuelve el índice posterior a la llave que cierra text[start]."""
+        depth = 0
+        for j in range(start, len(text)):
+            if text[j] == "{":
+                depth += 1
+            elif text[j] == "}":
+                depth -= 1
+                if depth == 0:
+                    return j + 1
+        return None
+
+    # ========== EXTRACCIÓN DE SEGMENTOS ==========
+
+    def _extract_segments(self, final: bool) -> List[str]:
+        segments: List[str] = []
+        while True:
+            cut = self._next_cut()
+            if cut is None:
+                break
+            segment = WHITESPACE.sub(" ", self._speakable[:cut]).strip()
+            self._speakable = self._speakable[cut:]
+            if self._is_speakable(segment):
+                segments.append(segment)
+                self.emitted_count += 1
+
+        if final:
+            tail = WHITESPACE.sub(" ", self._speakable).strip()
+            self._speakable = ""
+            if self._is_speakable(tail):
+                segments.append(tail)
+                self.emitted_count += 1
+
+        return segments
+
+    def _next_cut(self) -> Optional[int]:
+        """Posición de corte del siguiente segmento completo, o None."""
+        text = self._speakable
+        match = SENTENCE_END.search(text)
+        if match:
+            return match.end()
+
+        match = CLAUSE_END.search(text)
+        if match and match.start() >= CHUNKER_CONFIG["CLAUSE_MIN_CHARS"]:
+            return match.end()
+
+        comma_min = (
+            CHUNKER_CONFIG["FIRST_CHUNK_MIN_CHARS"]
+            if self.emitted_count == 0
+            else CHUNKER_CONFIG["COMMA_MIN_CHARS"]
+        )
+        for match in COMMA_END.finditer(text):
+            if match.start() >= comma_min:
+                return match.end()
+        return None
+
+    @staticmethod
+    def _is_speakable(segment: str) -> bool:
+        """Evita enviar segmentos formados solo por puntuación."""
+        return any(ch.isalnum() for ch in segment)
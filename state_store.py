@@ -1,19 +1,143 @@
 # state_store.py
-# Memoriza datos durante UNA llamada (se reinicia cuando Twilio abre un WS nuevo)
+# Memoriza datos por sesión (una llamada o una conversación de texto)
 import time
 import logging
-from typing import Dict, Any, Optional, Union
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, Optional, Union
 
 logger = logging.getLogger(__name__)
 
-# Definir session_state como un diccionario que puede contener cualquier tipo de valor
-session_state: Dict[str, Any] = {
-    "events_found": [],       # lista completa de citas encontradas
-    "current_event_id": None  # la cita que el usuario confirmó
+# ===== CONFIGURACIÓN =====
+SESSION_STATE_CONFIG = {
+    "IDLE_TTL": 2 * 3600,       # sesiones sin actividad se descartan (llamadas que no cerraron bien)
+    "SWEEP_INTERVAL": 300,      # cada cuánto se revisan las inactivas
 }
 
-# Anotación de tipo explícita para ayudar al linter
-__all__ = ["session_state"]
+# Sesión (call_sid / id de conversación) del turno en curso. tool_executor
+# copia el contexto al hilo, así las herramientas saben a quién atienden.
+current_session_id: ContextVar[Optional[str]] = ContextVar("current_session_id", default=None)
+
+# Clave del estado cuando no hay sesión (endpoints /n8n/* sin llamada ni chat)
+NO_SESSION = "__sin_sesion__"
+
+
+def _new_state() -> Dict[str, Any]:
+    return {
+        "events_found": [],       # lista completa de citas encontradas
+        "current_event_id": None  # la cita que el usuario confirmó
+    }
+
+
+class SessionStateStore:
+    """
+    🗃️ Estado por sesión (una llamada o una conversación de texto)
+
+    Antes era un solo dict global: el cierre de una llamada borraba la
+    cita seleccionada de otra y las búsquedas se mezclaban. Ahora cada
+    sesión tiene su dict; end() lo descarta al colgar y las sesiones
+    inactivas por más de IDLE_TTL se barren solas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._last_used: Dict[str, float] = {}
+        self._last_sweep = time.monotonic()
+
+        # Métricas
+        self.created = 0
+        self.ended = 0
+        self.expired = 0
+
+    def get(self, session_id: Optional[str]) -> Dict[str, Any]:
+        """Dict de la sesión (se crea si no existe)."""
+        key = session_id or NO_SESSION
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep > SESSION_STATE_CONFIG["SWEEP_INTERVAL"]:
+                self._sweep(now)
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _new_state()
+                self.created += 1
+            self._last_used[key] = now
+            return state
+
+    def end(self, session_id: Optional[str]) -> None:
+        """Descarta el estado de la sesión (fin de llamada / conversación)."""
+        if not session_id:
+            return
+        with self._lock:
+            if self._states.pop(session_id, None) is not None:
+                self.ended += 1
+            self._last_used.pop(session_id, None)
+
+    def _sweep(self, now: float) -> None:
+        self._last_sweep = now
+        idle = [key for key, used in self._last_used.items() if now - used > SESSION_STATE_CONFIG["IDLE_TTL"]]
+        for key in idle:
+            self._states.pop(key, None)
+            self._last_used.pop(key, None)
+        if idle:
+            self.expired += len(idle)
+            logger.info(f"🧹 {len(idle)} sesiones inactivas descartadas de state_store")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = len(self._states)
+        return {"active": active, "created": self.created, "ended": self.ended, "expired": self.expired}
+
+
+class _CurrentSessionState(MutableMapping):
+    """
+    Vista de `session_state` que apunta al dict de la sesión en curso
+    (current_session_id). Así crearcita/editarcita/utils siguen usando
+    session_state["..."] sin saber de sesiones.
+    """
+
+    def _state(self) -> Dict[str, Any]:
+        return session_store.get(current_session_id.get())
+
+    def __getitem__(self, key: str) -> Any:
+        return self._state()[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._state()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._state()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._state()))
+
+    def __len__(self) -> int:
+        return len(self._state())
+
+    def clear(self) -> None:
+        """Reinicia SOLO la sesión en curso."""
+        state = self._state()
+        state.clear()
+        state.update(_new_state())
+
+
+@contextmanager
+def session_scope(session_id: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """Fija la sesión en curso dentro del bloque (herramientas, pruebas, scripts)."""
+    token = current_session_id.set(session_id)
+    try:
+        yield session_store.get(session_id)
+    finally:
+        current_session_id.reset(token)
+
+
+# ===== INSTANCIA GLOBAL =====
+session_store = SessionStateStore()
+session_state: MutableMapping = _CurrentSessionState()
+
+__all__ = ["session_state", "session_store", "session_scope", "current_session_id"]
 
 def emit_latency_event(session_id: str, event_name: str, metadata: Optional[dict] = None) -> None:
     """
@@ -24,13 +148,7 @@ def emit_latency_event(session_id: str, event_name: str, metadata: Optional[dict
         event_name: Nombre del evento (chunk_received, parse_start, etc.)
         metadata: Datos adicionales del evento
     """
-    if session_id not in session_state:
-        session_state[session_id] = {"events": []}
-    
-    if "events" not in session_state[session_id]:
-        session_state[session_id]["events"] = []
-    
-    session_state[session_id]["events"].append({
+    session_store.get(session_id).setdefault("events", []).append({
         "event": event_name,
         "timestamp": time.perf_counter(),
         "metadata": metadata or {}
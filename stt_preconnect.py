@@ -0,0 +1,172 @@
+# stt_preconnect.py
+# -*- coding: utf-8 -*-
+"""
+🎤 PRE-CONEXIÓN DE DEEPGRAM POR CallSid
+========================================
+Abre la sesión de Deepgram en cuanto Twilio llama a /twilio-voice,
+antes de que llegue el WebSocket de media.
+
+- El webhook llama a open(call_sid) y responde el TwiML sin esperar.
+- Al llegar el evento 'start', AudioManager llama a claim(call_sid) y
+  recibe un DeepgramSTTStreamer ya conectado con sus callbacks puestos.
+- Las sesiones no reclamadas se cierran solas tras PRECONNECT_TTL.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+from deepgram_stt_streamer import DeepgramSTTStreamer
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN =====
+PRECONNECT_CONFIG = {
+    "PRECONNECT_TTL": 30.0,         # segundos máximos esperando el WebSocket de media
+    "CLAIM_TIMEOUT": 2.0,           # espera máxima si la conexión aún se está abriendo
+}
+
+
+class _PendingSession:
+    """Sesión de Deepgram abierta para una llamada que aún no reclama su STT."""
+
+    def __init__(self, streamer: DeepgramSTTStreamer):
+        self.streamer = streamer
+        self.created_at = time.perf_counter()
+        self.connect_task: Optional[asyncio.Task] = None
+        self.expire_task: Optional[asyncio.Task] = None
+
+
+class STTPreconnectRegistry:
+    """
+    🎯 Registro de sesiones Deepgram pre-abiertas, indexado por CallSid
+    """
+
+    def __init__(self, ttl: float = PRECONNECT_CONFIG["PRECONNECT_TTL"]):
+        self.ttl = ttl
+        self._sessions: Dict[str, _PendingSession] = {}
+
+        # Métricas
+        self.opened = 0
+        self.claimed = 0
+        self.misses = 0
+        self.expired = 0
+        self.failed = 0
+
+    # ========== APERTURA (webhook /twilio-voice) ==========
+
+    def open(self, call_sid: str) -> None:
+        """
+        🚀 Empieza a conectar Deepgram para la llamada (no bloquea)
+        """
+        if not call_sid or call_sid in self._sessions:
+            return
+
+        # Callbacks provisionales: no llega audio hasta que se reclame la sesión
+        streamer = DeepgramSTTStreamer(callback=lambda transcript, is_final: None)
+        session = _PendingSession(streamer)
+        session.connect_task = asyncio.create_task(
+            self._connect(call_sid, session), name=f"STTPreconnect_{call_sid}"
+        )
+        session.expire_task = asyncio.create_task(self._expire_later(call_sid, session))
+        self._sessions[call_sid] = session
+        self.opened += 1
+
+    async def _connect(self, call_sid: str, session: _PendingSession) -> None:
+        t0 = time.perf_counter()
+        await session.streamer.start_streaming()
+        if session.streamer._started:
+            logger.info(f"[LATENCIA] Deepgram pre-conectado para {call_sid} en "
+                        f"{1000*(time.perf_counter()-t0):.1f} ms")
+        else:
+            self.failed += 1
+            logger.warning(f"⚠️ No se pudo pre-conectar Deepgram para {call_sid}")
+
+    async def _expire_later(self, call_sid: str, session: _PendingSession) -> None:
+        try:
+            await asyncio.sleep(self.ttl)
+        except asyncio.CancelledError:
+            return
+        if self._sessions.get(call_sid) is session:
+            del self._sessions[call_sid]
+            self.expired += 1
+            logger.info(f"⌛ Sesión Deepgram pre-conectada de {call_sid} no reclamada, cerrando")
+            await self._close_session(session)
+
+    # ========== RECLAMO (evento 'start' del WebSocket) ==========
+
+    async def claim(self, call_sid: Optional[str], callback: Callable[[str, bool], None],
+                    on_disconnect: Optional[Callable] = None,
+                    timeout: float = PRECONNECT_CONFIG["CLAIM_TIMEOUT"]) -> Optional[DeepgramSTTStreamer]:
+        """
+        📥 Entrega la sesión pre-abierta de la llamada con los callbacks reales
+
+        Returns:
+            Streamer ya conectado, o None si no hay sesión válida
+        """
+        session = self._sessions.pop(call_sid, None) if call_sid else None
+        if not session:
+            self.misses += 1
+            return None
+
+        if session.expire_task:
+            session.expire_task.cancel()
+
+        if session.connect_task and not session.connect_task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(session.connect_task), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⏰ Deepgram pre-conectado de {call_sid} no abrió a tiempo")
+            except Exception as e:
+                logger.error(f"❌ Error esperando Deepgram pre-conectado: {e}")
+
+        streamer = session.streamer
+        if not streamer._started:
+            self.misses += 1
+            await self._close_session(session)
+            return None
+
+        streamer.callback = callback
+        streamer.on_disconnect_callback = on_disconnect
+        self.claimed += 1
+        logger.info(f"[LATENCIA] Deepgram pre-conectado reclamado {1000*(time.perf_counter()-session.created_at):.1f} ms "
+                    f"después del webhook ({call_sid})")
+        return streamer
+
+    # ========== CIERRE ==========
+
+    @staticmethod
+    async def _close_session(session: _PendingSession) -> None:
+        if session.connect_task and not session.connect_task.done():
+            session.connect_task.cancel()
+        try:
+            await session.streamer.close()
+        except Exception as e:
+            logger.debug(f"Error cerrando sesión Deepgram pre-conectada: {e}")
+
+    async def close_all(self) -> None:
+        """🔌 Cierra todas las sesiones pendientes (apagado del servidor)"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            if session.expire_task:
+                session.expire_task.cancel()
+        await asyncio.gather(*[self._close_session(s) for s in sessions], return_exceptions=True)
+
+    # ========== MÉTRICAS ==========
+
+    def get_stats(self) -> Dict[str, Any]:
+        """📊 Sesiones pendientes y aprovechamiento de la pre-conexión"""
+        return {
+            "pending": len(self._sessions),
+            "opened": self.opened,
+            "claimed": self.claimed,
+            "misses": self.misses,
+            "expired": self.expired,
+            "failed": self.failed,
+        }
+
+
+# Instancia global del proceso
+stt_preconnect = STTPreconnectRegistry()
@@ -160,6 +160,20 @@ TEMPLATES = {
 }
 
 
+def get_static_phrases() -> List[str]:
+    """
+    Devuelve las plantillas que no tienen placeholders (texto 100% fijo).
+    Se usan para pre-renderizar su audio al arrancar.
+    """
+    phrases: List[str] = []
+    for statuses in TEMPLATES.values():
+        for options in statuses.values():
+            for template in options:
+                if "{" not in template and template not in phrases:
+                    phrases.append(template)
+    return phrases
+
+
 def generate_synthetic_response(tool_name: str, result: Dict[str, Any]) -> str:
     """
     Genera una respuesta sintética basada en el resultado de una herramienta.
@@ -0,0 +1,269 @@
+# tool_executor.py
+# -*- coding: utf-8 -*-
+"""
+🧰 EJECUCIÓN DE HERRAMIENTAS FUERA DEL EVENT LOOP
+==================================================
+Las herramientas del agente (Google Calendar, Google Sheets, cálculo
+local) son funciones bloqueantes. Si corren en el event loop, un viaje
+a Google congela el audio de TODAS las llamadas activas.
+
+Este módulo las ejecuta en pools de hilos acotados por categoría:
+- "calendar": Google Calendar (crear/editar/eliminar/buscar, slots)
+- "sheets":   Google Sheets (registro de leads)
+- "local":    cálculo local sin red
+
+Cada herramienta tiene timeout y límite de concurrencia propios, y se
+publican métricas de espera en cola, tiempo de ejecución y timeouts.
+Lo comparten el agente de voz (aiagent.py) y el de texto (aiagent_text.py).
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN =====
+TOOL_EXECUTOR_CONFIG = {
+    # Hilos por categoría
+    "POOLS": {
+        "calendar": int(os.getenv("TOOL_POOL_CALENDAR", "8")),
+        "sheets": int(os.getenv("TOOL_POOL_SHEETS", "2")),
+        "local": int(os.getenv("TOOL_POOL_LOCAL", "4")),
+    },
+    "DEFAULT_CATEGORY": "local",
+    "DEFAULT_TIMEOUT": 10.0,        # segundos
+    "DEFAULT_MAX_CONCURRENCY": 4,   # ejecuciones simultáneas por herramienta
+    "LATENCY_HISTORY": 100,         # muestras guardadas por herramienta
+}
+
+
+@dataclass(frozen=True)
+class ToolPolicy:
+    """📋 Dónde y cómo se ejecuta una herramienta"""
+    category: str = TOOL_EXECUTOR_CONFIG["DEFAULT_CATEGORY"]
+    timeout: float = TOOL_EXECUTOR_CONFIG["DEFAULT_TIMEOUT"]
+    max_concurrency: int = TOOL_EXECUTOR_CONFIG["DEFAULT_MAX_CONCURRENCY"]
+
+
+# Políticas por nombre de herramienta (voz y texto usan los mismos nombres)
+TOOL_POLICIES: Dict[str, ToolPolicy] = {
+    "process_appointment_request": ToolPolicy("calendar", timeout=12.0, max_concurrency=6),
+    "process_appointment_request_batch": ToolPolicy("calendar", timeout=20.0, max_concurrency=2),
+    "create_calendar_event": ToolPolicy("calendar", timeout=10.0, max_concurrency=4),
+    "edit_calendar_event": ToolPolicy("calendar", timeout=10.0, max_concurrency=4),
+    "delete_calendar_event": ToolPolicy("calendar", timeout=10.0, max_concurrency=4),
+    "search_calendar_event_by_phone": ToolPolicy("calendar", timeout=8.0, max_concurrency=6),
+    "registrar_lead": ToolPolicy("sheets", timeout=10.0, max_concurrency=2),
+    "select_calendar_event_by_index": ToolPolicy("local", timeout=2.0),
+    "get_consultorio_data": ToolPolicy("local", timeout=2.0),
+    "get_cancun_weather": ToolPolicy("local", timeout=5.0),
+    "detect_intent": ToolPolicy("local", timeout=1.0),
+}
+
+
+class _ToolMetrics:
+    """📊 Contadores y latencias de una herramienta"""
+
+    def __init__(self):
+        history = TOOL_EXECUTOR_CONFIG["LATENCY_HISTORY"]
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.in_flight = 0
+        self.queue_wait_ms: Deque[float] = deque(maxlen=history)
+        self.run_ms: Deque[float] = deque(maxlen=history)
+
+    @staticmethod
+    def _summary(samples: Deque[float]) -> Dict[str, Optional[float]]:
+        if not samples:
+            return {"avg": None, "max": None}
+        return {"avg": round(sum(samples) / len(samples), 1), "max": round(max(samples), 1)}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "in_flight": self.in_flight,
+            "queue_wait_ms": self._summary(self.queue_wait_ms),
+            "run_ms": self._summary(self.run_ms),
+        }
+
+
+class ToolExecutor:
+    """
+    🎯 Ejecuta herramientas bloqueantes en pools de hilos por categoría
+
+    Uso:
+        result = await tool_executor.run("create_calendar_event", func, **kwargs)
+
+    Lanza asyncio.TimeoutError si se excede el timeout de la herramienta.
+    Un hilo no se puede matar: al expirar, el resultado se descarta y el
+    cupo de concurrencia se libera solo cuando el hilo termina de verdad.
+    """
+
+    def __init__(self, pools: Optional[Dict[str, int]] = None,
+                 policies: Optional[Dict[str, ToolPolicy]] = None):
+        self.pool_sizes = dict(pools or TOOL_EXECUTOR_CONFIG["POOLS"])
+        self.policies = dict(policies or TOOL_POLICIES)
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._metrics: Dict[str, _ToolMetrics] = {}
+
+    # ========== CONFIGURACIÓN ==========
+
+    def policy_for(self, tool_name: str) -> ToolPolicy:
+        return self.policies.get(tool_name, ToolPolicy())
+
+    def _pool(self, category: str) -> ThreadPoolExecutor:
+        pool = self._pools.get(category)
+        if pool is None:
+            workers = self.pool_sizes.get(category, self.pool_sizes[TOOL_EXECUTOR_CONFIG["DEFAULT_CATEGORY"]])
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"tool-{category}")
+            self._pools[category] = pool
+        return pool
+
+    def _semaphore(self, tool_name: str, policy: ToolPolicy) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(tool_name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(policy.max_concurrency)
+            self._semaphores[tool_name] = semaphore
+        return semaphore
+
+    def _metrics_for(self, tool_name: str) -> _ToolMetrics:
+        metrics = self._metrics.get(tool_name)
+        if metrics is None:
+            metrics = self._metrics[tool_name] = _ToolMetrics()
+        return metrics
+
+    # ========== EJECUCIÓN ==========
+
+    async def run(self, tool_name: str, func: Callable[..., Any], /, **kwargs: Any) -> Any:
+        """
+        🚀 Ejecuta una herramienta respetando su política
+
+        Args:
+            tool_name: Nombre de la herramienta (para política y métricas)
+            func: Función síncrona o corrutina
+            **kwargs: Argumentos de la herramienta
+
+        Returns:
+            Resultado de la herramienta
+        """
+        policy = self.policy_for(tool_name)
+        metrics = self._metrics_for(tool_name)
+        metrics.calls += 1
+
+        if asyncio.iscoroutinefunction(func):
+            # Las corrutinas ya no bloquean el loop: solo timeout y métricas
+            t_start = time.perf_counter()
+            metrics.in_flight += 1
+            try:
+                return await asyncio.wait_for(func(**kwargs), timeout=policy.timeout)
+            except asyncio.TimeoutError:
+                metrics.timeouts += 1
+                raise
+            except asyncio.CancelledError:
+                metrics.cancelled += 1
+                raise
+            except Exception:
+                metrics.errors += 1
+                raise
+            finally:
+                metrics.in_flight -= 1
+                metrics.run_ms.append(1000 * (time.perf_counter() - t_start))
+
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(tool_name, policy)
+        t_submit = time.perf_counter()
+        deadline = t_submit + policy.timeout
+        timing: Dict[str, float] = {}
+
+        def _call() -> Any:
+            timing["start"] = time.perf_counter()
+            try:
+                return func(**kwargs)
+            finally:
+                timing["end"] = time.perf_counter()
+
+        try:
+            # La espera por cupo cuenta dentro del timeout de la herramienta
+            await asyncio.wait_for(semaphore.acquire(), timeout=policy.timeout)
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            metrics.queue_wait_ms.append(1000 * (time.perf_counter() - t_submit))
+            logger.warning(f"⏰ [PERF] Herramienta '{tool_name}' sin cupo tras {policy.timeout:.1f}s")
+            raise
+
+        # Propaga contextvars (sesión, logging) al hilo
+        context = contextvars.copy_context()
+        work = self._pool(policy.category).submit(context.run, _call)
+        metrics.in_flight += 1
+
+        def _release() -> None:
+            # El cupo se libera cuando el hilo termina, aunque ya hubiera timeout
+            metrics.in_flight -= 1
+            semaphore.release()
+            if "start" in timing:
+                metrics.queue_wait_ms.append(1000 * (timing["start"] - t_submit))
+                metrics.run_ms.append(1000 * (timing.get("end", time.perf_counter()) - timing["start"]))
+
+        work.add_done_callback(lambda _w: loop.call_soon_threadsafe(_release))
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(work, loop=loop)),
+                timeout=max(0.0, deadline - time.perf_counter()),
+            )
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            # Si aún no empezó, se quita de la cola del pool
+            work.cancel()
+            logger.warning(f"⏰ [PERF] Herramienta '{tool_name}' excedió {policy.timeout:.1f}s ({policy.category})")
+            raise
+        except asyncio.CancelledError:
+            metrics.cancelled += 1
+            work.cancel()
+            raise
+        except Exception:
+            metrics.errors += 1
+            raise
+
+    # ========== ESTADO ==========
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "pools": {
+                category: {
+                    "workers": self.pool_sizes.get(category),
+                    "queued": pool._work_queue.qsize(),
+                }
+                for category, pool in self._pools.items()
+            },
+            "tools": {
+                name: dict(metrics.to_dict(), category=self.policy_for(name).category,
+                           timeout_s=self.policy_for(name).timeout,
+                           max_concurrency=self.policy_for(name).max_concurrency)
+                for name, metrics in self._metrics.items()
+            },
+        }
+
+    def shutdown(self) -> None:
+        """🔌 Cierra los pools (apagado del servidor)"""
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools.clear()
+        self._semaphores.clear()
+
+
+# ===== INSTANCIA GLOBAL =====
+tool_executor = ToolExecutor()
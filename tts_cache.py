@@ -0,0 +1,322 @@
+# tts_cache.py
+# -*- coding: utf-8 -*-
+"""
+💾 CACHÉ DE AUDIO TTS PRE-RENDERIZADO
+======================================
+Guarda audio μ-law 8 kHz listo para Twilio, en memoria y en disco,
+identificado por (voice_id, model_id, voice_settings, texto).
+
+- Se renderiza UNA vez (al arrancar o en el primer uso) vía HTTP.
+- Las llamadas lo reproducen sin ida y vuelta a ElevenLabs.
+- Si cambia la voz, el modelo o los ajustes, la clave cambia sola.
+
+Además incluye la caché de frases (LRU con presupuesto de bytes) para
+respuestas sintéticas, despedidas, disculpas y frases cortas dinámicas.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from eleven_ws_tts_client import DEFAULT_MODEL_ID, DEFAULT_VOICE_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN =====
+TTS_CACHE_CONFIG = {
+    "CACHE_DIR": os.getenv("TTS_CACHE_DIR", "audio/tts_cache"),
+    "RENDER_TIMEOUT": 30.0,         # segundos por frase al pre-renderizar
+    "MIN_AUDIO_BYTES": 800,         # < 100 ms de audio = render inválido
+    "WARM_CONCURRENCY": 3,          # renders simultáneos al calentar
+    "PHRASE_MAX_BYTES": int(os.getenv("TTS_PHRASE_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+    "PHRASE_MAX_CHARS": 160,        # solo frases cortas se guardan dinámicamente
+}
+
+
+class TTSAssetCache:
+    """
+    🎯 Caché de assets de audio (saludo y frases fijas)
+
+    Memoria → disco → render HTTP (una sola vez por clave).
+    """
+
+    def __init__(self, cache_dir: str = TTS_CACHE_CONFIG["CACHE_DIR"]):
+        self.cache_dir = cache_dir
+        self._memory: Dict[str, bytes] = {}
+        self._render_locks: Dict[str, asyncio.Lock] = {}
+
+    # ========== CLAVES ==========
+
+    @staticmethod
+    def make_key(text: str, voice_id: Optional[str] = None, model_id: str = DEFAULT_MODEL_ID,
+                 voice_settings: Optional[dict] = None) -> str:
+        """
+        🔑 Clave estable para (voz, modelo, ajustes, texto)
+        """
+        raw = json.dumps(
+            {
+                "voice_id": voice_id or os.getenv("ELEVEN_LABS_VOICE_ID", ""),
+                "model_id": model_id,
+                "voice_settings": voice_settings if voice_settings is not None else DEFAULT_VOICE_SETTINGS,
+                "text": text,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.ulaw")
+
+    # ========== LECTURA ==========
+
+    def get(self, text: str, *, voice_id: Optional[str] = None, model_id: str = DEFAULT_MODEL_ID,
+            voice_settings: Optional[dict] = None) -> Optional[bytes]:
+        """
+        📖 Devuelve el audio si ya está en memoria o en disco (sin red)
+        """
+        key = self.make_key(text, voice_id, model_id, voice_settings)
+        audio = self._memory.get(key)
+        if audio is not None:
+            return audio
+
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    audio = f.read()
+                if len(audio) >= TTS_CACHE_CONFIG["MIN_AUDIO_BYTES"]:
+                    self._memory[key] = audio
+                    logger.info(f"💾 Audio cargado de disco ({len(audio)} bytes): '{text[:40]}...'")
+                    return audio
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo leer audio en caché {path}: {e}")
+        return None
+
+    # ========== RENDER ==========
+
+    async def get_or_render(self, text: str, *, voice_id: Optional[str] = None,
+                            model_id: str = DEFAULT_MODEL_ID,
+                            voice_settings: Optional[dict] = None) -> Optional[bytes]:
+        """
+        🎨 Devuelve el audio, renderizándolo por HTTP si aún no existe
+
+        Varias llamadas simultáneas con la misma clave esperan un único render.
+        """
+        audio = self.get(text, voice_id=voice_id, model_id=model_id, voice_settings=voice_settings)
+        if audio is not None:
+            return audio
+
+        key = self.make_key(text, voice_id, model_id, voice_settings)
+        lock = self._render_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                return audio
+
+            from eleven_http_client import fetch_tts_audio
+
+            t0 = time.perf_counter()
+            try:
+                audio = await asyncio.wait_for(
+                    asyncio.to_thread(
+                        fetch_tts_audio,
+                        text,
+                        voice_id=voice_id,
+                        model_id=model_id,
+                        voice_settings=voice_settings if voice_settings is not None else DEFAULT_VOICE_SETTINGS,
+                    ),
+                    timeout=TTS_CACHE_CONFIG["RENDER_TIMEOUT"],
+                )
+            except Exception as e:
+                logger.error(f"❌ Error pre-renderizando audio '{text[:40]}...': {e}")
+                return None
+
+            if not audio or len(audio) < TTS_CACHE_CONFIG["MIN_AUDIO_BYTES"]:
+                logger.error(f"❌ Render vacío o demasiado corto para '{text[:40]}...'")
+                return None
+
+            self._memory[key] = audio
+            self._write_to_disk(key, audio)
+            logger.info(f"[LATENCIA] Audio pre-renderizado y cacheado en {1000*(time.perf_counter()-t0):.1f} ms "
+                        f"({len(audio)} bytes): '{text[:40]}...'")
+            return audio
+
+    def _write_to_disk(self, key: str, audio: bytes) -> None:
+        """Escritura atómica (tmp + rename) para no dejar archivos a medias."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._disk_path(key)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar audio en disco: {e}")
+
+    async def warm(self, texts: Iterable[str]) -> int:
+        """
+        🔥 Pre-renderiza una lista de textos (al arrancar el servidor)
+
+        Returns:
+            Número de textos disponibles en caché tras el calentamiento
+        """
+        t0 = time.perf_counter()
+        semaphore = asyncio.Semaphore(TTS_CACHE_CONFIG["WARM_CONCURRENCY"])
+
+        async def _warm_one(text: str) -> bool:
+            async with semaphore:
+                return await self.get_or_render(text) is not None
+
+        results = await asyncio.gather(*[_warm_one(text) for text in texts])
+        ready = sum(1 for ok in results if ok)
+        logger.info(f"🔥 Caché de audio calentada: {ready} frase(s) en {1000*(time.perf_counter()-t0):.1f} ms")
+        return ready
+
+
+class PhraseAudioCache:
+    """
+    🗂️ Caché LRU de frases habladas con presupuesto de bytes
+
+    - Clave: texto normalizado (minúsculas, espacios colapsados) + voz.
+    - Se calienta al arrancar con todas las frases fijas.
+    - Guarda frases cortas dinámicas tras sintetizarlas por WebSocket.
+    - Un acierto se reproduce sin latencia de ElevenLabs.
+    """
+
+    def __init__(self, max_bytes: int = TTS_CACHE_CONFIG["PHRASE_MAX_BYTES"],
+                 asset_cache: Optional[TTSAssetCache] = None):
+        self.max_bytes = max_bytes
+        self.asset_cache = asset_cache
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dynamic_stored = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normaliza el texto para que variaciones triviales compartan audio."""
+        return re.sub(r"\s+", " ", text).strip().casefold()
+
+    def _key(self, text: str) -> str:
+        return TTSAssetCache.make_key(self.normalize(text))
+
+    # ========== LECTURA / ESCRITURA ==========
+
+    def get(self, text: str) -> Optional[bytes]:
+        """
+        📖 Busca la frase; cuenta acierto/fallo y la marca como reciente
+        """
+        key = self._key(text)
+        audio = self._entries.get(key)
+        if audio is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return audio
+
+    def put(self, text: str, audio: bytes, *, dynamic: bool = False) -> bool:
+        """
+        💾 Guarda una frase respetando el presupuesto (expulsa las menos usadas)
+        """
+        if not audio or len(audio) < TTS_CACHE_CONFIG["MIN_AUDIO_BYTES"]:
+            return False
+        if dynamic and len(text) > TTS_CACHE_CONFIG["PHRASE_MAX_CHARS"]:
+            return False
+        if len(audio) > self.max_bytes:
+            return False
+
+        key = self._key(text)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+
+        self._entries[key] = audio
+        self._bytes += len(audio)
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+        if dynamic and previous is None:
+            self.dynamic_stored += 1
+            logger.debug(f"💾 Frase dinámica cacheada ({len(audio)} bytes): '{text[:40]}...'")
+        return True
+
+    def accepts_dynamic(self, text: str) -> bool:
+        """¿Vale la pena capturar el audio de este texto al sintetizarlo?"""
+        return 0 < len(text.strip()) <= TTS_CACHE_CONFIG["PHRASE_MAX_CHARS"]
+
+    # ========== CALENTAMIENTO ==========
+
+    async def warm(self, texts: Iterable[str]) -> int:
+        """
+        🔥 Carga frases fijas (disco o render HTTP) en la LRU
+        """
+        if not self.asset_cache:
+            return 0
+        t0 = time.perf_counter()
+        semaphore = asyncio.Semaphore(TTS_CACHE_CONFIG["WARM_CONCURRENCY"])
+
+        async def _warm_one(text: str) -> bool:
+            async with semaphore:
+                audio = await self.asset_cache.get_or_render(text)
+            return audio is not None and self.put(text, audio)
+
+        unique_texts = list(dict.fromkeys(texts))
+        results = await asyncio.gather(*[_warm_one(text) for text in unique_texts])
+        ready = sum(1 for ok in results if ok)
+        logger.info(f"🔥 Caché de frases calentada: {ready}/{len(unique_texts)} frases, "
+                    f"{self._bytes} bytes en {1000*(time.perf_counter()-t0):.1f} ms")
+        return ready
+
+    # ========== MÉTRICAS ==========
+
+    def get_stats(self) -> Dict[str, Any]:
+        """📊 Contadores de aciertos/fallos y ocupación"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "dynamic_stored": self.dynamic_stored,
+        }
+
+
+def get_static_phrases() -> List[str]:
+    """
+    📋 Todas las frases fijas que puede decir el asistente por voz
+
+    Import perezoso para no crear dependencias circulares con los módulos
+    que a su vez usan esta caché.
+    """
+    from synthetic_responses import get_static_phrases as synthetic_static_phrases
+    from utils import FAREWELL_TEXT
+    from aiagent import GROQ_ERROR_TEXT, GENERIC_TOOL_RESPONSE_TEXT
+    from conversation_flow import TECHNICAL_ERROR_TEXT
+
+    return [
+        FAREWELL_TEXT,
+        GROQ_ERROR_TEXT,
+        GENERIC_TOOL_RESPONSE_TEXT,
+        TECHNICAL_ERROR_TEXT,
+        *synthetic_static_phrases(),
+    ]
+
+
+# Instancias globales del proceso (el saludo es idéntico en todas las llamadas)
+greeting_cache = TTSAssetCache()
+phrase_cache = PhraseAudioCache(asset_cache=greeting_cache)
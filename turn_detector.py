@@ -0,0 +1,159 @@
+# turn_detector.py
+# -*- coding: utf-8 -*-
+"""
+🏁 DETECTOR ADAPTATIVO DE FIN DE TURNO
+=======================================
+Decide cuánto esperar antes de enviar a la IA lo que dijo el usuario,
+combinando:
+
+- Señales de Deepgram: speech_final (endpointing) y UtteranceEnd.
+- Si el texto final parece completo (puntuación, sin conector colgando).
+- Estadísticas del llamante: pausas dentro de su turno y velocidad al hablar.
+
+El temporizador fijo de ConversationFlow queda solo como respaldo.
+"""
+
+import logging
+import re
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN =====
+TURN_CONFIG = {
+    "COMPLETE_WAIT": 0.15,          # texto completo + speech_final
+    "INCOMPLETE_WAIT": 0.6,         # texto que parece seguir
+    "UTTERANCE_END_WAIT": 0.05,     # Deepgram ya vio ~1 s sin palabras
+    "MIN_WAIT": 0.1,
+    "MAX_WAIT": 1.0,                # nunca más que el respaldo fijo
+    "GAP_HISTORY": 30,              # pausas intra-turno recordadas por llamada
+    "GAP_MARGIN": 0.1,              # margen sobre la pausa típica del llamante
+    "REFERENCE_WPS": 2.5,           # palabras/seg de un hablante promedio
+    "RATE_FACTOR_MIN": 0.8,
+    "RATE_FACTOR_MAX": 1.5,
+    "PHONE_MIN_DIGITS": 10,         # en modo teléfono, no cortar antes de 10 dígitos
+}
+
+# Palabras que, al final de una frase, indican que el usuario no ha terminado
+TRAILING_CONNECTORS = {
+    "y", "e", "o", "u", "pero", "que", "de", "del", "a", "al", "en", "con",
+    "para", "por", "porque", "pues", "como", "cuando", "si", "el", "la", "los",
+    "las", "un", "una", "mi", "su", "este", "esta", "eh", "em",
+    "and", "but", "or", "the", "to", "of",
+}
+_LAST_WORD = re.compile(r"(\w+)\W*$", re.UNICODE)
+_DIGIT = re.compile(r"\d")
+
+
+class TurnDetector:
+    """
+    🎯 Calcula la espera de fin de turno para UNA llamada
+    """
+
+    def __init__(self):
+        self._gaps: Deque[float] = deque(maxlen=TURN_CONFIG["GAP_HISTORY"])
+        self._words = 0
+        self._speech_seconds = 0.0
+
+        # Métricas
+        self.commits: Dict[str, int] = {}
+        self.commit_latencies_ms: Deque[float] = deque(maxlen=50)
+
+    # ========== APRENDIZAJE DEL LLAMANTE ==========
+
+    def observe_gap(self, seconds: float) -> None:
+        """⏸️ Pausa entre dos finales dentro del mismo turno"""
+        if 0 < seconds < 5:
+            self._gaps.append(seconds)
+
+    def observe_final(self, transcript: str, duration: Optional[float]) -> None:
+        """🗣️ Final de Deepgram: acumula palabras y duración para la velocidad"""
+        if duration and duration > 0:
+            self._words += len(transcript.split())
+            self._speech_seconds += duration
+
+    @property
+    def words_per_second(self) -> Optional[float]:
+        if self._speech_seconds < 1.0:
+            return None
+        return self._words / self._speech_seconds
+
+    def _rate_factor(self) -> float:
+        """Hablantes lentos reciben más margen; rápidos, menos."""
+        wps = self.words_per_second
+        if not wps:
+            return 1.0
+        factor = TURN_CONFIG["REFERENCE_WPS"] / wps
+        return max(TURN_CONFIG["RATE_FACTOR_MIN"], min(TURN_CONFIG["RATE_FACTOR_MAX"], factor))
+
+    def _typical_gap(self) -> Optional[float]:
+        """Percentil 90 de las pausas intra-turno del llamante."""
+        if len(self._gaps) < 3:
+            return None
+        ordered = sorted(self._gaps)
+        return ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
+
+    # ========== DECISIÓN ==========
+
+    @staticmethod
+    def looks_complete(text: str) -> bool:
+        """¿La frase termina de forma natural (puntuación y sin conector colgando)?"""
+        text = text.strip()
+        if not text:
+            return False
+        if text[-1] in ",;:-":
+            return False
+        match = _LAST_WORD.search(text.casefold())
+        if match and match.group(1) in TRAILING_CONNECTORS:
+            return False
+        return text[-1] in ".?!…"
+
+    def commit_delay(self, signal: str, pending_text: str, *, phone_mode: bool = False) -> Optional[float]:
+        """
+        ⏱️ Segundos a esperar antes de confirmar el turno tras una señal
+
+        Args:
+            signal: "speech_final" o "utterance_end"
+            pending_text: texto final acumulado del turno
+            phone_mode: el usuario está dictando un teléfono
+
+        Returns:
+            Espera en segundos, o None para dejar actuar solo al respaldo
+        """
+        if not pending_text.strip():
+            return None
+
+        if phone_mode and len(_DIGIT.findall(pending_text)) < TURN_CONFIG["PHONE_MIN_DIGITS"]:
+            return None
+
+        complete = self.looks_complete(pending_text)
+        if signal == "utterance_end":
+            base = TURN_CONFIG["UTTERANCE_END_WAIT"] if complete else TURN_CONFIG["INCOMPLETE_WAIT"] / 2
+        elif complete:
+            base = TURN_CONFIG["COMPLETE_WAIT"]
+        else:
+            base = TURN_CONFIG["INCOMPLETE_WAIT"]
+            typical = self._typical_gap()
+            if typical is not None:
+                # Esperar un poco más que las pausas normales de este llamante
+                base = max(base, typical + TURN_CONFIG["GAP_MARGIN"])
+
+        delay = base * self._rate_factor()
+        return max(TURN_CONFIG["MIN_WAIT"] if signal != "utterance_end" else 0.0,
+                   min(TURN_CONFIG["MAX_WAIT"], delay))
+
+    # ========== MÉTRICAS ==========
+
+    def record_commit(self, reason: str, latency_ms: float) -> None:
+        self.commits[reason] = self.commits.get(reason, 0) + 1
+        self.commit_latencies_ms.append(latency_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        latencies = list(self.commit_latencies_ms)
+        return {
+            "commits": dict(self.commits),
+            "avg_commit_latency_ms": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "words_per_second": round(self.words_per_second, 2) if self.words_per_second else None,
+            "typical_gap_s": round(self._typical_gap(), 2) if self._typical_gap() else None,
+        }
@@ -0,0 +1,90 @@
+# ulaw_utils.py
+# -*- coding: utf-8 -*-
+"""
+🔢 UTILIDADES μ-LAW (G.711) SIN DEPENDENCIAS
+=============================================
+Tablas precalculadas para trabajar con el audio de Twilio
+(μ-law 8 kHz) sin depender de `audioop`, que ya no existe en
+Python 3.13.
+"""
+
+import math
+from functools import lru_cache
+from typing import List
+
+ULAW_SILENCE = 0xFF
+_ULAW_BIAS = 0x84
+_ULAW_CLIP = 8159
+
+
+def _ulaw_to_linear(byte: int) -> int:
+    """Decodifica un byte μ-law a PCM lineal de 16 bits (G.711)."""
+    byte = ~byte & 0xFF
+    sign = byte & 0x80
+    exponent = (byte >> 4) & 0x07
+    mantissa = byte & 0x0F
+    sample = (((mantissa << 3) + _ULAW_BIAS) << exponent) - _ULAW_BIAS
+    return -sample if sign else sample
+
+
+def _linear_to_ulaw(sample: int) -> int:
+    """Codifica una muestra PCM lineal de 16 bits a un byte μ-law (G.711, como audioop)."""
+    pcm = sample >> 2                      # G.711 trabaja con 14 bits
+    if pcm < 0:
+        pcm = -pcm
+        mask = 0x7F
+    else:
+        mask = 0xFF
+    pcm = min(pcm, _ULAW_CLIP) + (_ULAW_BIAS >> 2)
+    segment = 0
+    while segment < 8 and pcm > (0x40 << segment) - 1:
+        segment += 1
+    if segment >= 8:
+        return 0x7F ^ mask
+    return ((segment << 4) | ((pcm >> (segment + 1)) & 0x0F)) ^ mask
+
+
+# Tabla byte μ-law → muestra lineal (256 entradas, se calcula una vez)
+ULAW_TO_LINEAR: List[int] = [_ulaw_to_linear(b) for b in range(256)]
+
+# Cuadrado de cada muestra, para calcular energía sin multiplicar en el loop
+_ULAW_SQUARED: List[int] = [s * s for s in ULAW_TO_LINEAR]
+
+_FULL_SCALE = 32768.0
+
+
+def frame_rms(audio: bytes) -> float:
+    """RMS lineal (0..32768) de un bloque de audio μ-law."""
+    if not audio:
+        return 0.0
+    squared = _ULAW_SQUARED
+    return math.sqrt(sum(squared[b] for b in audio) / len(audio))
+
+
+def frame_dbfs(audio: bytes) -> float:
+    """Nivel del bloque en dBFS (0 = máximo, silencio ≈ -inf → -100)."""
+    rms = frame_rms(audio)
+    if rms <= 0:
+        return -100.0
+    return 20.0 * math.log10(rms / _FULL_SCALE)
+
+
+@lru_cache(maxsize=8)
+def ulaw_gain_table(gain: float) -> bytes:
+    """
+    Tabla de traducción byte→byte que aplica una ganancia a audio μ-law.
+
+    Uso: ``audio.translate(ulaw_gain_table(1.5))``. Sustituye a
+    ``audioop.mul`` (eliminado en Python 3.13) sin decodificar a PCM.
+    """
+    return bytes(
+        _linear_to_ulaw(math.floor(max(-32768.0, min(32767.0, ULAW_TO_LINEAR[b] * gain))))
+        for b in range(256)
+    )
+
+
+def apply_ulaw_gain(audio: bytes, gain: float) -> bytes:
+    """Aplica ganancia a audio μ-law (1.0 = sin cambio)."""
+    if gain == 1.0 or not audio:
+        return audio
+    return audio.translate(ulaw_gain_table(gain))
@@ -18,7 +18,7 @@ from googleapiclient.discovery import build
 from google.oauth2.service_account import Credentials
 import re
 from typing import Dict, Optional, List, Any # Añadido Any y List
-from state_store import session_state
+from state_store import session_state, session_store
 from twilio.rest import Client
 import time
 
@@ -201,26 +201,15 @@ def format_date_nicely(target_date_obj: date, time_keyword: Optional[str] = None
 
 
 def initialize_google_calendar():
-    """Inicializa el servicio de Google Calendar."""
+    """
+    Devuelve el servicio de Google Calendar.
+
+    Ya no reconstruye credenciales ni discovery en cada llamada: usa el
+    cliente compartido (token en caché, un cliente por hilo con keep-alive).
+    """
     try:
-        logger.info("🔍 Inicializando Google Calendar...")
-        credentials_info = {
-            "type": "service_account",
-            "project_id": GOOGLE_PROJECT_ID,
-            "private_key_id": GOOGLE_PRIVATE_KEY_ID,
-            "private_key": GOOGLE_PRIVATE_KEY,
-            "client_email": GOOGLE_CLIENT_EMAIL,
-            "client_id": GOOGLE_CLIENT_ID,
-            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-            "token_uri": "https://oauth2.googleapis.com/token",
-            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-            "client_x509_cert_url": GOOGLE_CLIENT_CERT_URL
-        }
-        credentials = Credentials.from_service_account_info(
-            credentials_info,
-            scopes=["https://www.googleapis.com/auth/calendar"]
-        )
-        return build("calendar", "v3", credentials=credentials)
+        from google_calendar_service import calendar_service
+        return calendar_service.get_service()
     except Exception as e:
         logger.error(f"❌ Error en Google Calendar: {str(e)}")
         raise
@@ -288,12 +277,7 @@ def search_calendar_event_by_phone(phone: str) -> List[Dict[str, Any]]:
     logger.info(f"Iniciando búsqueda de citas para el teléfono: {phone}")
     try:
         service = initialize_google_calendar()
-        # Google Calendar API espera la hora en UTC para timeMin
-        # Usamos la fecha actual de Cancún, convertida a inicio del día en UTC para no perder eventos del día
-        now_cancun = get_cancun_time()
-        start_of_today_cancun = now_cancun.replace(hour=0, minute=0, second=0, microsecond=0)
-        time_min_utc_iso = start_of_today_cancun.astimezone(pytz.utc).isoformat()
-
+        time_min_utc_iso = _search_time_min_utc()
         logger.debug(f"Buscando eventos en Google Calendar para el teléfono: {phone} desde {time_min_utc_iso} (UTC).")
 
         events_result = service.events().list(
@@ -304,84 +288,116 @@ def search_calendar_event_by_phone(phone: str) -> List[Dict[str, Any]]:
             orderBy="startTime"
         ).execute()
         
-        items = events_result.get("items", [])
-        logger.info(f"Google Calendar API encontró {len(items)} eventos crudos para el teléfono {phone}.")
-
-        parsed_events: List[Dict[str, Any]] = []
-        for evt_idx, evt in enumerate(items):
-            logger.debug(f"Procesando evento crudo #{evt_idx + 1}: ID {evt.get('id')}, Summary: {evt.get('summary')}")
-            summary = evt.get("summary", "Paciente Desconocido")
-            description = evt.get("description", "")
-            
-            motive = None
-            phone_in_desc = None
-            
-            lines = description.split("\n")
-            for line in lines:
-                line_lower = line.lower()
-                # Búsqueda más robusta para teléfono y motivo
-                if re.search(r"tel[eé]fono\s*:", line_lower):
-                    phone_in_desc = re.sub(r"[^\d\s\+\-\(\)]", "", line.split(":", 1)[-1]).strip() # Limpia un poco más
-                    phone_in_desc = re.sub(r"\s+", "", phone_in_desc) # Quita espacios internos
-                if re.search(r"motivo\s*:", line_lower):
-                    motive = line.split(":", 1)[-1].strip()
-
-            start_utc_str = evt.get("start", {}).get("dateTime")
-            # end_utc_str = evt.get("end", {}).get("dateTime") # No se usa en el dict de salida actualmente
-
-            start_cancun_dt_obj: Optional[datetime] = None
-            start_cancun_pretty_str: str = "Fecha/hora no disponible"
-            start_cancun_iso_for_tool_str: Optional[str] = None
-
-            if start_utc_str:
-                try:
-                    start_cancun_dt_obj = convert_utc_to_cancun(start_utc_str)
-                    start_cancun_iso_for_tool_str = start_cancun_dt_obj.isoformat()
-                    start_cancun_pretty_str = format_date_nicely(
-                        start_cancun_dt_obj.date(), 
-                        specific_time_hhmm=start_cancun_dt_obj.strftime("%H:%M")
-                    )
-                except Exception as e_conv:
-                    logger.error(f"Error convirtiendo/formateando fecha para evento ID {evt.get('id')}, start_utc_str '{start_utc_str}': {e_conv}")
-            else:
-                logger.warning(f"Evento ID {evt.get('id')} no tiene start.dateTime.")
-
-
-            cita_parseada = {
-                "event_id": evt.get("id"), # ID real de Google Calendar
-                "patient_name": summary,   # Nombre del paciente (del campo summary de Google)
-                "start_time_iso_utc": start_utc_str, # Hora de inicio original en UTC
-                "start_time_cancun_iso": start_cancun_iso_for_tool_str, # Hora de inicio en Cancún ISO (para herramientas)
-                "start_time_cancun_pretty": start_cancun_pretty_str, # Hora de inicio formateada (para leer al usuario)
-                "appointment_reason": motive if motive else "No especificado", # Motivo extraído
-                "phone_in_description": phone_in_desc # Teléfono de la descripción
-            }
-            # Guarda el ID real para que la tool de borrado lo use si GPT manda un placeholder
-            session_state["last_event_found"] = cita_parseada["event_id"]
-
-
-            parsed_events.append(cita_parseada)
-            logger.debug(f"Evento parseado y añadido: {cita_parseada}")
-
-            
-            # Guardar la lista completa y un ID por defecto en la memoria de la llamada
-            session_state["events_found"] = parsed_events
-            if parsed_events:
-                session_state["current_event_id"] = parsed_events[0]["event_id"]  # la primera por defecto
-           
-
-        if not parsed_events:
-            logger.info(f"No se encontraron citas parseables para el teléfono {phone} que cumplan los criterios.")
-        else:
-            logger.info(f"Se parsearon {len(parsed_events)} citas para el teléfono {phone}.")
-            
-        return parsed_events
+        return _parse_search_results(phone, events_result.get("items", []))
 
     except Exception as e:
         logger.error(f"❌ Error general en search_calendar_event_by_phone para el teléfono {phone}: {str(e)}", exc_info=True)
         return [] # Devolver lista vacía en caso de error mayor
 
 
+async def search_calendar_event_by_phone_async(phone: str) -> List[Dict[str, Any]]:
+    """Igual que search_calendar_event_by_phone, pero con el cliente asíncrono (calendar_async)."""
+    from calendar_async import calendar_async
+
+    logger.info(f"Iniciando búsqueda de citas para el teléfono: {phone}")
+    try:
+        events_result = await calendar_async.events_list(
+            GOOGLE_CALENDAR_ID,
+            q=phone,
+            timeMin=_search_time_min_utc(),
+            singleEvents=True,
+            orderBy="startTime"
+        )
+        return _parse_search_results(phone, events_result.get("items", []))
+
+    except Exception as e:
+        logger.error(f"❌ Error general en search_calendar_event_by_phone_async para el teléfono {phone}: {str(e)}", exc_info=True)
+        return []
+
+
+def _search_time_min_utc() -> str:
+    # Google Calendar API espera la hora en UTC para timeMin
+    # Usamos la fecha actual de Cancún, convertida a inicio del día en UTC para no perder eventos del día
+    now_cancun = get_cancun_time()
+    start_of_today_cancun = now_cancun.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start_of_today_cancun.astimezone(pytz.utc).isoformat()
+
+
+def _parse_search_results(phone: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convierte los eventos crudos de Google en la estructura que recibe la IA."""
+    logger.info(f"Google Calendar API encontró {len(items)} eventos crudos para el teléfono {phone}.")
+
+    parsed_events: List[Dict[str, Any]] = []
+    for evt_idx, evt in enumerate(items):
+        logger.debug(f"Procesando evento crudo #{evt_idx + 1}: ID {evt.get('id')}, Summary: {evt.get('summary')}")
+        summary = evt.get("summary", "Paciente Desconocido")
+        description = evt.get("description", "")
+        
+        motive = None
+        phone_in_desc = None
+        
+        lines = description.split("\n")
+        for line in lines:
+            line_lower = line.lower()
+            # Búsqueda más robusta para teléfono y motivo
+            if re.search(r"tel[eé]fono\s*:", line_lower):
+                phone_in_desc = re.sub(r"[^\d\s\+\-\(\)]", "", line.split(":", 1)[-1]).strip() # Limpia un poco más
+                phone_in_desc = re.sub(r"\s+", "", phone_in_desc) # Quita espacios internos
+            if re.search(r"motivo\s*:", line_lower):
+                motive = line.split(":", 1)[-1].strip()
+
+        start_utc_str = evt.get("start", {}).get("dateTime")
+        # end_utc_str = evt.get("end", {}).get("dateTime") # No se usa en el dict de salida actualmente
+
+        start_cancun_dt_obj: Optional[datetime] = None
+        start_cancun_pretty_str: str = "Fecha/hora no disponible"
+        start_cancun_iso_for_tool_str: Optional[str] = None
+
+        if start_utc_str:
+            try:
+                start_cancun_dt_obj = convert_utc_to_cancun(start_utc_str)
+                start_cancun_iso_for_tool_str = start_cancun_dt_obj.isoformat()
+                start_cancun_pretty_str = format_date_nicely(
+                    start_cancun_dt_obj.date(), 
+                    specific_time_hhmm=start_cancun_dt_obj.strftime("%H:%M")
+                )
+            except Exception as e_conv:
+                logger.error(f"Error convirtiendo/formateando fecha para evento ID {evt.get('id')}, start_utc_str '{start_utc_str}': {e_conv}")
+        else:
+            logger.warning(f"Evento ID {evt.get('id')} no tiene start.dateTime.")
+
+
+        cita_parseada = {
+            "event_id": evt.get("id"), # ID real de Google Calendar
+            "patient_name": summary,   # Nombre del paciente (del campo summary de Google)
+            "start_time_iso_utc": start_utc_str, # Hora de inicio original en UTC
+            "start_time_cancun_iso": start_cancun_iso_for_tool_str, # Hora de inicio en Cancún ISO (para herramientas)
+            "start_time_cancun_pretty": start_cancun_pretty_str, # Hora de inicio formateada (para leer al usuario)
+            "appointment_reason": motive if motive else "No especificado", # Motivo extraído
+            "phone_in_description": phone_in_desc # Teléfono de la descripción
+        }
+        # Guarda el ID real para que la tool de borrado lo use si GPT manda un placeholder
+        session_state["last_event_found"] = cita_parseada["event_id"]
+
+
+        parsed_events.append(cita_parseada)
+        logger.debug(f"Evento parseado y añadido: {cita_parseada}")
+
+        
+        # Guardar la lista completa y un ID por defecto en la memoria de la llamada
+        session_state["events_found"] = parsed_events
+        if parsed_events:
+            session_state["current_event_id"] = parsed_events[0]["event_id"]  # la primera por defecto
+       
+
+    if not parsed_events:
+        logger.info(f"No se encontraron citas parseables para el teléfono {phone} que cumplan los criterios.")
+    else:
+        logger.info(f"Se parsearon {len(parsed_events)} citas para el teléfono {phone}.")
+        
+    return parsed_events
+
+
 
 
 
@@ -434,6 +450,9 @@ async def terminar_llamada_twilio(call_sid: str, motivo: str = "completed"):
 
 
 
+# Despedida fija de las llamadas (se pre-renderiza en la caché de audio)
+FAREWELL_TEXT = "Fue un placer atenderle. Que tenga un excelente día. ¡Hasta luego!"
+
 
 async def cierre_con_despedida(manager, reason: str, delay: float = 5.0):
     """
@@ -452,7 +471,7 @@ async def cierre_con_despedida(manager, reason: str, delay: float = 5.0):
         delay: Tiempo de espera para reproducción (default: 5.0s)
     """
     import asyncio
-    FAREWELL = "Fue un placer atenderle. Que tenga un excelente día. ¡Hasta luego!"
+    FAREWELL = FAREWELL_TEXT
     
     logger.info(f"🔚 Iniciando cierre elegante de llamada - Razón: {reason}")
     t0 = time.perf_counter()
@@ -536,9 +555,12 @@ async def cierre_con_despedida(manager, reason: str, delay: float = 5.0):
             except Exception as e:
                 logger.error(f"❌ Error cancelando tarea de monitoreo: {e}")
         
-        # Limpiar session_state
+        # Descartar el estado de ESTA llamada (no el de las demás)
         try:
-            session_state.clear()
+            session_store.end(getattr(getattr(manager, 'call_state', None), 'call_sid', None))
+            if getattr(manager, 'conversation_flow', None):
+                from aiagent import ai_agent
+                ai_agent.release_session(manager.conversation_flow.session_id)
             logger.info("✅ Session state limpiado")
         except Exception as e:
             logger.error(f"❌ Error limpiando session state: {e}")
@@ -2,9 +2,18 @@
 # -*- coding: utf-8 -*-
 """
 Módulo para obtener información del clima utilizando OpenWeatherMap.
+
+El clima se mantiene en memoria (WeatherProvider) y se refresca en segundo
+plano: el camino de cada turno de voz solo lee memoria y nunca espera a
+OpenWeatherMap, aunque esté lento o caído.
 """
 
+import asyncio
 import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
 import requests # Asegúrate que 'requests' esté en tu requirements.txt
 from decouple import config
 from datetime import datetime
@@ -18,9 +27,20 @@ OPENWEATHERMAP_API_KEY = config("OPENWEATHERMAP_API_KEY", default=None)
 # ID de la ciudad de Cancún en OpenWeatherMap. Puedes encontrar otros IDs en su sitio.
 CANCUN_CITY_ID = "3530103"
 
-def get_cancun_weather() -> dict:
+# ===== CONFIGURACIÓN DE CACHÉ =====
+WEATHER_CONFIG = {
+    "TTL": int(os.getenv("WEATHER_TTL_SECONDS", "600")),   # dato fresco 10 min
+    "MAX_STALE": 3 * 3600,          # más viejo que esto → "no disponible"
+    "REFRESH_INTERVAL": 600,        # refresco periódico en segundo plano
+    "ERROR_RETRY": 60,              # reintento tras un fallo
+}
+
+CLIMA_NO_DISPONIBLE = "Información del clima no disponible en este momento."
+
+
+def fetch_cancun_weather() -> dict:
     """
-    Obtiene el clima actual para Cancún desde OpenWeatherMap.
+    Obtiene el clima actual para Cancún desde OpenWeatherMap (bloqueante, va a la red).
 
     Retorna:
         dict: Un diccionario con la información del clima o un mensaje de error.
@@ -100,3 +120,179 @@ def get_cancun_weather() -> dict:
         logger.error(f"Error inesperado al procesar datos del clima: {e_general}", exc_info=True)
         return {"error": "Ocurrió un error inesperado al procesar la información del clima."}
 
+
+def get_cancun_weather() -> dict:
+    """
+    Clima actual de Cancún (herramienta de los agentes).
+
+    Devuelve el dato en memoria del WeatherProvider; solo va a la red si
+    todavía no hay ningún dato (p.ej. antes del primer refresco).
+    """
+    cached = weather_provider.get_weather()
+    if cached is not None:
+        return cached
+    weather = fetch_cancun_weather()
+    weather_provider.store(weather)
+    return weather
+
+
+def format_clima_contextual(weather: Optional[dict]) -> str:
+    """Texto de clima para el system message del agente de voz."""
+    if weather and 'cancun_weather' in weather and 'current' in weather['cancun_weather']:
+        current = weather['cancun_weather']['current']
+        return f"""El clima en Cancún es:
+Temperatura: {current.get('temperature', 'N/A')}
+Sensación térmica: {current.get('feels_like', 'N/A')}
+Condición: {current.get('description', 'N/A')}
+Humedad: {current.get('humidity', 'N/A')}
+Velocidad del viento: {current.get('wind_speed', 'N/A')}"""
+    # Si hay error, usar mensaje genérico
+    return CLIMA_NO_DISPONIBLE
+
+
+class WeatherProvider:
+    """
+    🌤️ Clima de Cancún en memoria con refresco en segundo plano
+
+    - TTL: dentro del TTL el dato se sirve tal cual.
+    - Stale-while-revalidate: pasado el TTL se sigue sirviendo el último
+      dato bueno y se dispara un refresco en segundo plano.
+    - Un fallo nunca reemplaza un dato bueno; solo se reintenta antes.
+    """
+
+    def __init__(self):
+        self._weather: Optional[dict] = None          # último dato bueno
+        self._fetched_at: Optional[float] = None
+        self._clima_contextual = CLIMA_NO_DISPONIBLE  # pre-renderizado
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_error: Optional[str] = None
+
+        # Métricas
+        self.refreshes = 0
+        self.failures = 0
+        self.stale_served = 0
+
+    # ========== LECTURA (solo memoria) ==========
+
+    @property
+    def age(self) -> Optional[float]:
+        return time.time() - self._fetched_at if self._fetched_at else None
+
+    def _usable(self) -> bool:
+        """¿Hay dato servible? Si está vencido, pide un refresco en segundo plano."""
+        age = self.age
+        if age is None or age > WEATHER_CONFIG["MAX_STALE"]:
+            self._request_refresh()
+            return False
+        if age > WEATHER_CONFIG["TTL"]:
+            self.stale_served += 1
+            self._request_refresh()
+        return True
+
+    def get_weather(self) -> Optional[dict]:
+        """Último dato bueno (o None si no hay / demasiado viejo). Nunca bloquea."""
+        return self._weather if self._usable() else None
+
+    def get_clima_contextual(self) -> str:
+        """Texto de clima ya formateado para el prompt. Nunca bloquea."""
+        return self._clima_contextual if self._usable() else CLIMA_NO_DISPONIBLE
+
+    # ========== ESCRITURA ==========
+
+    def store(self, weather: dict) -> bool:
+        """Guarda un resultado de OpenWeatherMap (los errores no pisan el dato bueno)."""
+        if not weather or "error" in weather:
+            self.failures += 1
+            self._last_error = (weather or {}).get("error", "respuesta vacía")
+            return False
+        self._weather = weather
+        self._fetched_at = time.time()
+        self._clima_contextual = format_clima_contextual(weather)
+        self._last_error = None
+        self.refreshes += 1
+        return True
+
+    async def refresh(self) -> bool:
+        """🔄 Consulta OpenWeatherMap en un hilo y actualiza la memoria"""
+        t0 = time.perf_counter()
+        weather = await asyncio.to_thread(fetch_cancun_weather)
+        ok = self.store(weather)
+        if ok:
+            logger.info(f"[LATENCIA] Clima refrescado en segundo plano en {1000*(time.perf_counter()-t0):.1f} ms")
+        else:
+            logger.warning(f"⚠️ No se pudo refrescar el clima ({self._last_error}); se mantiene el último dato")
+        return ok
+
+    def _request_refresh(self) -> None:
+        """Dispara un refresco en segundo plano si no hay uno en curso."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._schedule_refresh()
+        else:
+            # Llamado desde un hilo (herramienta en el pool): pasar al loop
+            loop.call_soon_threadsafe(self._schedule_refresh)
+
+    def _schedule_refresh(self) -> None:
+        if self._refresh_task and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.create_task(self._safe_refresh(), name="WeatherRefresh")
+
+    async def _safe_refresh(self) -> bool:
+        try:
+            return await self.refresh()
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"❌ Error refrescando clima: {e}")
+            return False
+
+    # ========== CICLO DE VIDA ==========
+
+    async def start(self) -> None:
+        """🚀 Primer refresco y tarea periódica (llamar en el startup del servidor)"""
+        if self._loop_task and not self._loop_task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_task = asyncio.create_task(self._refresh_loop(), name="WeatherRefreshLoop")
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            # Reutiliza un refresco bajo demanda si ya hay uno en curso
+            self._schedule_refresh()
+            ok = await self._refresh_task
+            await asyncio.sleep(WEATHER_CONFIG["REFRESH_INTERVAL"] if ok else WEATHER_CONFIG["ERROR_RETRY"])
+
+    async def stop(self) -> None:
+        """🔌 Detiene el refresco en segundo plano"""
+        for task in (self._loop_task, self._refresh_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._loop_task = None
+        self._refresh_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        age = self.age
+        return {
+            "has_data": self._weather is not None,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "fresh": age is not None and age <= WEATHER_CONFIG["TTL"],
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "stale_served": self.stale_served,
+            "last_error": self._last_error,
+        }
+
+
+# ===== INSTANCIA GLOBAL =====
+weather_provider = WeatherProvider()
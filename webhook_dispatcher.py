@@ -0,0 +1,281 @@
+# webhook_dispatcher.py
+# -*- coding: utf-8 -*-
+"""
+📮 DESPACHADOR DE WEBHOOKS SALIENTES (n8n)
+===========================================
+Antes cada cierre de conversación abría su propio httpx.AsyncClient
+(handshake TLS nuevo hacia n8n) y, si el POST fallaba, el resumen se
+perdía con una sola línea de log.
+
+Ahora:
+- Un solo cliente httpx compartido (HTTP/2 si `h2` está instalado,
+  keep-alive) para todos los webhooks.
+- Cola asíncrona acotada: quien envía solo encola y sigue; si la cola
+  está llena se descarta y se cuenta.
+- N workers fijos = tope de envíos simultáneos.
+- Reintentos con backoff exponencial + jitter en 408/429/5xx y errores
+  de red (respeta Retry-After). El reintento espera FUERA del worker,
+  así un n8n caído no bloquea los demás envíos.
+- Gzip opcional del cuerpo cuando supera un umbral (historiales largos).
+- Métricas: entregados, fallidos, descartados, reintentos, latencia de
+  entrega (desde que se encola) y bytes ahorrados por gzip.
+- Al apagar se intenta vaciar la cola durante unos segundos.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional, Set
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# ===== CONFIGURACIÓN =====
+WEBHOOK_DISPATCHER_CONFIG = {
+    "TIMEOUT": 15.0,
+    "MAX_CONNECTIONS": 10,
+    "QUEUE_SIZE": 1000,
+    "CONCURRENCY": 4,                # workers = envíos simultáneos
+    "MAX_RETRIES": 5,
+    "BACKOFF_BASE": 0.5,             # segundos, se duplica en cada intento
+    "BACKOFF_MAX": 30.0,
+    "GZIP_ENABLED": os.getenv("WEBHOOK_GZIP_ENABLED", "false").lower() == "true",
+    "GZIP_MIN_BYTES": int(os.getenv("WEBHOOK_GZIP_MIN_BYTES", "16384")),
+    "DRAIN_TIMEOUT": 10.0,           # segundos para vaciar la cola al apagar
+    "LATENCY_HISTORY": 200,
+}
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class WebhookDelivery:
+    """Un envío pendiente (el cuerpo ya serializado y, si aplica, comprimido)"""
+    url: str
+    body: bytes
+    headers: Dict[str, str]
+    label: str
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    attempts: int = 0
+
+
+class WebhookDispatcher:
+    """
+    📬 Cola + workers para POSTs a webhooks con reintentos
+
+    Uso:
+        await webhook_dispatcher.start()
+        webhook_dispatcher.enqueue(url, payload, label="conversation/end")   # no espera
+        await webhook_dispatcher.stop()                                       # vacía la cola
+    """
+
+    def __init__(self):
+        self._http: Optional[httpx.AsyncClient] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: Set[asyncio.Task] = set()
+        self._retry_tasks: Set[asyncio.Task] = set()
+        self._in_flight = 0
+
+        # Métricas
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+        self.gzipped = 0
+        self.gzip_saved_bytes = 0
+        self.last_error: Optional[str] = None
+        self._delivery_ms: Deque[float] = deque(maxlen=WEBHOOK_DISPATCHER_CONFIG["LATENCY_HISTORY"])
+
+    # ----- HTTP -----
+
+    @staticmethod
+    def _http2_available() -> bool:
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                http2=self._http2_available(),
+                timeout=WEBHOOK_DISPATCHER_CONFIG["TIMEOUT"],
+                limits=httpx.Limits(
+                    max_connections=WEBHOOK_DISPATCHER_CONFIG["MAX_CONNECTIONS"],
+                    max_keepalive_connections=WEBHOOK_DISPATCHER_CONFIG["MAX_CONNECTIONS"],
+                ),
+            )
+        return self._http
+
+    # ========== CICLO DE VIDA ==========
+
+    async def start(self) -> None:
+        """Crea la cola y los workers (idempotente)."""
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=WEBHOOK_DISPATCHER_CONFIG["QUEUE_SIZE"])
+        while len(self._workers) < WEBHOOK_DISPATCHER_CONFIG["CONCURRENCY"]:
+            task = asyncio.create_task(self._worker(), name=f"WebhookWorker_{len(self._workers)}")
+            self._workers.add(task)
+            task.add_done_callback(self._workers.discard)
+
+    async def stop(self) -> None:
+        """Intenta vaciar la cola (DRAIN_TIMEOUT) y cierra workers y cliente."""
+        if self._queue is not None and self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=WEBHOOK_DISPATCHER_CONFIG["DRAIN_TIMEOUT"])
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Webhooks: {self._queue.qsize()} envíos sin vaciar al apagar")
+        pending_retries = len(self._retry_tasks)
+        if pending_retries:
+            logger.warning(f"⚠️ Webhooks: {pending_retries} reintentos pendientes descartados al apagar")
+        for task in list(self._workers) + list(self._retry_tasks):
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._retry_tasks, return_exceptions=True)
+        self._queue = None
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+
+    # ========== ENCOLAR ==========
+
+    def enqueue(self, url: str, payload: Dict[str, Any], label: str = "") -> bool:
+        """
+        📤 Encola un POST JSON y regresa de inmediato
+
+        Returns:
+            False si la cola está llena (el envío se descarta)
+        """
+        self._ensure_started()
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if WEBHOOK_DISPATCHER_CONFIG["GZIP_ENABLED"] and len(body) >= WEBHOOK_DISPATCHER_CONFIG["GZIP_MIN_BYTES"]:
+            compressed = gzip.compress(body, compresslevel=5)
+            self.gzipped += 1
+            self.gzip_saved_bytes += len(body) - len(compressed)
+            body = compressed
+            headers["Content-Encoding"] = "gzip"
+
+        delivery = WebhookDelivery(url=url, body=body, headers=headers, label=label or url)
+        try:
+            self._queue.put_nowait(delivery)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"❌ Cola de webhooks llena: se descarta {delivery.label}")
+            return False
+        self.enqueued += 1
+        return True
+
+    # ========== ENVÍO ==========
+
+    async def _worker(self) -> None:
+        while True:
+            delivery = await self._queue.get()
+            self._in_flight += 1
+            try:
+                await self._deliver(delivery)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                self.last_error = str(e)
+                logger.error(f"❌ Error inesperado enviando webhook {delivery.label}: {e}")
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _deliver(self, delivery: WebhookDelivery) -> None:
+        delivery.attempts += 1
+        t0 = time.perf_counter()
+        response = None
+        try:
+            response = await self._client().post(delivery.url, content=delivery.body, headers=delivery.headers)
+            status = response.status_code
+            error = None if status < 300 else f"HTTP {status}: {response.text[:200]}"
+        except httpx.TransportError as e:
+            status = 0
+            error = f"red: {e}"
+        logger.debug(f"[PERF] Webhook {delivery.label} HTTP {status} en {1000*(time.perf_counter()-t0):.1f} ms "
+                      f"(intento {delivery.attempts})")
+
+        if error is None:
+            delivery_ms = 1000 * (time.perf_counter() - delivery.enqueued_at)
+            self._delivery_ms.append(delivery_ms)
+            self.delivered += 1
+            logger.info(f"✅ Webhook {delivery.label} entregado [LATENCIA] {delivery_ms:.1f} ms "
+                        f"({delivery.attempts} intento(s))")
+            return
+
+        retryable = status == 0 or status in RETRY_STATUSES
+        if not retryable or delivery.attempts > WEBHOOK_DISPATCHER_CONFIG["MAX_RETRIES"]:
+            self.failed += 1
+            self.last_error = error
+            logger.error(f"❌ Webhook {delivery.label} falló tras {delivery.attempts} intento(s): {error}")
+            return
+
+        delay = self._backoff(delivery.attempts - 1, response.headers.get("Retry-After") if response is not None else None)
+        self.retries += 1
+        logger.warning(f"🔁 Webhook {delivery.label}: {error[:80]}, reintento {delivery.attempts} en {delay*1000:.0f} ms")
+        task = asyncio.create_task(self._retry_later(delivery, delay), name=f"WebhookRetry_{delivery.label}")
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def _retry_later(self, delivery: WebhookDelivery, delay: float) -> None:
+        """Espera el backoff fuera del worker y vuelve a encolar."""
+        await asyncio.sleep(delay)
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait(delivery)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"❌ Cola de webhooks llena: se descarta el reintento de {delivery.label}")
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), WEBHOOK_DISPATCHER_CONFIG["BACKOFF_MAX"])
+            except ValueError:
+                pass
+        base = WEBHOOK_DISPATCHER_CONFIG["BACKOFF_BASE"] * (2 ** attempt)
+        return min(WEBHOOK_DISPATCHER_CONFIG["BACKOFF_MAX"], base) * random.uniform(0.5, 1.0)
+
+    # ========== MÉTRICAS ==========
+
+    def get_stats(self) -> Dict[str, Any]:
+        samples = sorted(self._delivery_ms)
+        return {
+            "http2": self._http2_available(),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self._in_flight,
+            "waiting_retry": len(self._retry_tasks),
+            "workers": len(self._workers),
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "retries": self.retries,
+            "delivery_p50_ms": round(samples[len(samples) // 2], 1) if samples else None,
+            "delivery_p95_ms": round(samples[int(len(samples) * 0.95)], 1) if samples else None,
+            "delivery_max_ms": round(samples[-1], 1) if samples else None,
+            "gzip_enabled": WEBHOOK_DISPATCHER_CONFIG["GZIP_ENABLED"],
+            "gzipped": self.gzipped,
+            "gzip_saved_bytes": self.gzip_saved_bytes,
+            "last_error": self.last_error,
+        }
+
+
+# ===== INSTANCIA GLOBAL =====
+webhook_dispatcher = WebhookDispatcher()